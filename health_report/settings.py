@@ -190,6 +190,14 @@ VL_MODEL_MAX_TOKENS = int(os.getenv('VL_MODEL_MAX_TOKENS', '4096'))
 # 统一的AI模型超时配置（秒）
 AI_MODEL_TIMEOUT = int(os.getenv('AI_MODEL_TIMEOUT', '300'))
 
+# 用户健康记录检索索引的存放目录（见 medical_records/record_index.py）
+USER_RECORD_INDEX_DIR = os.getenv('USER_RECORD_INDEX_DIR', str(BASE_DIR / 'record_index'))
+
+# 图片渲染件（多模态模型输入、缩略图、PDF 页面）缓存目录与容量上限（见 medical_records/image_pipeline.py）
+IMAGE_RENDITION_DIR = os.getenv('IMAGE_RENDITION_DIR', str(BASE_DIR / 'image_renditions'))
+IMAGE_RENDITION_MAX_BYTES = int(os.getenv('IMAGE_RENDITION_MAX_BYTES', str(512 * 1024 * 1024)))
+IMAGE_RENDITION_MAX_AGE_DAYS = int(os.getenv('IMAGE_RENDITION_MAX_AGE_DAYS', '7'))
+
 # Default Workflow
 DEFAULT_WORKFLOW = os.getenv('DEFAULT_WORKFLOW', 'ocr_llm')
 
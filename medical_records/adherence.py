@@ -0,0 +1,213 @@
+"""
+服药依从性统计服务
+按日期区间一次性聚合药单/药单组的已服药天数、连续服药天数和依从率，
+并提供批量打卡写入与列表渲染用的查询集注解
+"""
+
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db.models import Count, Prefetch
+
+from .agent_tool_cache import bump_data_version
+from .models import Medication, MedicationRecord
+
+
+def with_taken_days(queryset):
+    """为药单查询集附加已服药天数注解（Medication.days_taken 会优先读取），避免逐条 COUNT"""
+    return queryset.annotate(taken_days_count=Count('medicationrecord'))
+
+
+def with_group_medications(queryset, medication_queryset=None):
+    """为药单组查询集预取组内药单（带已服药天数注解），medication_count 直接读取预取结果"""
+    if medication_queryset is None:
+        medication_queryset = Medication.objects.all()
+    return queryset.prefetch_related(
+        Prefetch('medications', queryset=with_taken_days(medication_queryset))
+    )
+
+
+def bulk_checkin(medication_ids, record_date, frequency='daily', notes='', user_id=None):
+    """
+    批量打卡：一次查询已打卡药单，一次批量插入其余记录
+
+    bulk_create 不触发模型信号，传入 user_id 时使该用户的AI医生工具缓存失效
+
+    Returns:
+        (success_count, skipped_count)
+    """
+    medication_ids = list(dict.fromkeys(medication_ids))
+    if not medication_ids:
+        return 0, 0
+
+    existing_ids = set(MedicationRecord.objects.filter(
+        medication_id__in=medication_ids,
+        record_date=record_date
+    ).values_list('medication_id', flat=True))
+
+    new_records = [
+        MedicationRecord(
+            medication_id=medication_id,
+            record_date=record_date,
+            frequency=frequency,
+            notes=notes
+        )
+        for medication_id in medication_ids
+        if medication_id not in existing_ids
+    ]
+    # 并发重复打卡由 (medication, record_date) 唯一约束兜底
+    MedicationRecord.objects.bulk_create(new_records, ignore_conflicts=True)
+    if new_records:
+        bump_data_version(user_id)
+
+    return len(new_records), len(existing_ids)
+
+
+def _streaks(taken_dates, expected_days):
+    """根据应服药日期序列计算最长连续天数与当前连续天数"""
+    longest = current = 0
+    for day in expected_days:
+        if day in taken_dates:
+            current += 1
+            longest = max(longest, current)
+        else:
+            current = 0
+
+    # 当前连续天数：从区间最后一天往回数，最后一天尚未打卡时从前一天开始计算
+    ongoing = 0
+    days = list(reversed(expected_days))
+    if days and days[0] not in taken_dates:
+        days = days[1:]
+    for day in days:
+        if day not in taken_dates:
+            break
+        ongoing += 1
+
+    return longest, ongoing
+
+
+def _percentage(taken, expected):
+    if expected <= 0:
+        return 0
+    return round(taken / expected * 100, 1)
+
+
+def compute_adherence(user, start_date=None, end_date=None, medication_ids=None, group_ids=None, today=None):
+    """
+    计算日期区间内每个药单、每个药单组的服药依从性
+
+    固定两次查询：一次取区间内的药单，一次取区间内全部服药记录的 (药单ID, 日期)，
+    统计与连续天数在内存中完成，不随药单数量增加查询次数。
+
+    Args:
+        user: 用户对象
+        start_date: 区间开始日期（默认 end_date 前 29 天）
+        end_date: 区间结束日期（默认今天，且不会晚于今天）
+        medication_ids: 仅统计指定药单
+        group_ids: 仅统计指定药单组
+        today: 当前日期（测试用）
+
+    Returns:
+        {'start_date', 'end_date', 'medications': [...], 'groups': [...]}
+    """
+    today = today or date.today()
+    end_date = min(end_date or today, today)
+    start_date = start_date or (end_date - timedelta(days=29))
+
+    medications = Medication.objects.filter(
+        user=user,
+        start_date__lte=end_date,
+        end_date__gte=start_date,
+    )
+    if medication_ids is not None:
+        medications = medications.filter(id__in=medication_ids)
+    if group_ids is not None:
+        medications = medications.filter(group_id__in=group_ids)
+    medications = list(medications.order_by('start_date', 'id').values(
+        'id', 'medicine_name', 'start_date', 'end_date', 'is_active', 'group_id', 'group__name'
+    ))
+
+    taken_by_medication = defaultdict(set)
+    if medications:
+        records = MedicationRecord.objects.filter(
+            medication_id__in=[med['id'] for med in medications],
+            record_date__range=(start_date, end_date),
+        ).values_list('medication_id', 'record_date')
+        for medication_id, record_date in records:
+            taken_by_medication[medication_id].add(record_date)
+
+    medication_stats = []
+    groups = {}
+
+    for med in medications:
+        window_start = max(med['start_date'], start_date)
+        window_end = min(med['end_date'], end_date)
+        expected_days = [
+            window_start + timedelta(days=offset)
+            for offset in range((window_end - window_start).days + 1)
+        ]
+        taken_dates = {
+            day for day in taken_by_medication[med['id']]
+            if window_start <= day <= window_end
+        }
+        taken_days = len(taken_dates)
+        longest_streak, current_streak = _streaks(taken_dates, expected_days)
+
+        medication_stats.append({
+            'medication_id': med['id'],
+            'medicine_name': med['medicine_name'],
+            'group_id': med['group_id'],
+            'is_active': med['is_active'],
+            'expected_days': len(expected_days),
+            'taken_days': taken_days,
+            'missed_days': len(expected_days) - taken_days,
+            'adherence_percentage': _percentage(taken_days, len(expected_days)),
+            'longest_streak': longest_streak,
+            'current_streak': current_streak,
+        })
+
+        if med['group_id'] is None:
+            continue
+
+        group = groups.setdefault(med['group_id'], {
+            'group_id': med['group_id'],
+            'name': med['group__name'],
+            'medication_count': 0,
+            'expected_doses': 0,
+            'taken_doses': 0,
+            'expected_by_day': defaultdict(int),
+            'taken_by_day': defaultdict(int),
+        })
+        group['medication_count'] += 1
+        group['expected_doses'] += len(expected_days)
+        group['taken_doses'] += taken_days
+        for day in expected_days:
+            group['expected_by_day'][day] += 1
+        for day in taken_dates:
+            group['taken_by_day'][day] += 1
+
+    group_stats = []
+    for group in groups.values():
+        expected_by_day = group.pop('expected_by_day')
+        taken_by_day = group.pop('taken_by_day')
+        group_days = sorted(expected_by_day)
+        # 组内所有应服药物都已打卡的日期才算“全组完成”
+        full_days = {day for day in group_days if taken_by_day.get(day, 0) >= expected_by_day[day]}
+        longest_streak, current_streak = _streaks(full_days, group_days)
+
+        group.update({
+            'expected_days': len(group_days),
+            'taken_days': len(taken_by_day),
+            'full_days': len(full_days),
+            'adherence_percentage': _percentage(group['taken_doses'], group['expected_doses']),
+            'longest_streak': longest_streak,
+            'current_streak': current_streak,
+        })
+        group_stats.append(group)
+
+    return {
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': end_date.strftime('%Y-%m-%d'),
+        'medications': medication_stats,
+        'groups': group_stats,
+    }
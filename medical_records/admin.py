@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.contenttypes.admin import GenericTabularInline
 from .models import (
-    HealthCheckup, HealthIndicator, HealthAdvice,
+    HealthCheckup, HealthIndicator, HealthAdvice, IndicatorNameMapping, AnswerCacheEntry,
     DocumentProcessing, SystemSettings, Medication, MedicationRecord,
     HealthEvent, EventItem, EventTemplate, SymptomEntry, VitalEntry
 )
@@ -31,6 +31,21 @@ class HealthIndicatorAdmin(admin.ModelAdmin):
     ordering = ['-checkup__checkup_date']
 
 
+@admin.register(IndicatorNameMapping)
+class IndicatorNameMappingAdmin(admin.ModelAdmin):
+    list_display = ['user', 'source_key', 'target_name', 'updated_at']
+    search_fields = ['user__username', 'source_key', 'target_name']
+    ordering = ['-updated_at']
+
+
+@admin.register(AnswerCacheEntry)
+class AnswerCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['question', 'model_key', 'hit_count', 'last_hit_at', 'expires_at']
+    list_filter = ['model_key', 'created_at']
+    search_fields = ['question', 'answer']
+    ordering = ['-created_at']
+
+
 @admin.register(HealthAdvice)
 class HealthAdviceAdmin(admin.ModelAdmin):
     list_display = ['user', 'question_short', 'created_at']
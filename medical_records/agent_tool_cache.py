@@ -0,0 +1,178 @@
+"""
+AI医生Agent工具结果缓存与调用统计
+工具结果按 (用户, 工具, 参数, 数据版本) 缓存：同一回答内与相邻几轮对话中重复的工具调用不再查库、重新格式化。
+用户的体检、指标、用药、个人资料变更时（模型信号或批量写入处显式调用 bump_data_version）数据版本递增，旧缓存随之失效。
+"""
+
+import contextvars
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from datetime import date
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import HealthCheckup, HealthIndicator, Medication, MedicationRecord, UserProfile
+
+# 缓存有效期（秒）：多进程部署且未配置共享缓存时，其他进程的数据变更最迟在此时间后生效
+TOOL_CACHE_TIMEOUT = 600
+# 保留调用统计的对话数上限
+MAX_TRACKED_CONVERSATIONS = 256
+
+_current_stats = contextvars.ContextVar('agent_tool_stats', default=None)
+_stats = OrderedDict()
+_stats_lock = threading.Lock()
+
+
+def _version_key(user_id):
+    return f'agent_tools:version:{user_id}'
+
+
+def data_version(user_id):
+    """用户健康数据的版本号"""
+    return cache.get(_version_key(user_id), 0)
+
+
+def bump_data_version(user_id):
+    """用户健康数据已变更，使其工具缓存失效"""
+    if not user_id:
+        return
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), 1, None)
+
+
+class ToolStats:
+    """单个对话的工具调用统计"""
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.hits = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, tool_name, hit):
+        with self._lock:
+            self.calls[tool_name] += 1
+            if hit:
+                self.hits[tool_name] += 1
+
+    def as_dict(self):
+        with self._lock:
+            tools = {
+                name: {
+                    'calls': calls,
+                    'hits': self.hits[name],
+                    'hit_rate': round(self.hits[name] / calls, 3),
+                }
+                for name, calls in self.calls.items()
+            }
+        total_calls = sum(item['calls'] for item in tools.values())
+        total_hits = sum(item['hits'] for item in tools.values())
+        return {
+            'calls': total_calls,
+            'hits': total_hits,
+            'hit_rate': round(total_hits / total_calls, 3) if total_calls else 0.0,
+            'tools': tools,
+        }
+
+
+@contextmanager
+def track_tool_calls(conversation_id=None):
+    """
+    在此范围内统计工具调用（按对话累计）；conversation_id 为空时统计只属于本次调用
+
+    Yields:
+        ToolStats
+    """
+    if conversation_id is None:
+        stats = ToolStats()
+    else:
+        with _stats_lock:
+            stats = _stats.get(conversation_id)
+            if stats is None:
+                stats = _stats[conversation_id] = ToolStats()
+                while len(_stats) > MAX_TRACKED_CONVERSATIONS:
+                    _stats.popitem(last=False)
+            else:
+                _stats.move_to_end(conversation_id)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def get_tool_stats(conversation_id=None):
+    """对话的工具调用统计；不指定对话时返回所有已记录对话的统计"""
+    with _stats_lock:
+        if conversation_id is not None:
+            stats = _stats.get(conversation_id)
+            return stats.as_dict() if stats else None
+        items = list(_stats.items())
+    return {conv_id: stats.as_dict() for conv_id, stats in items}
+
+
+def cached_tool(error_message):
+    """
+    工具结果缓存装饰器：被装饰函数的第一个参数必须是 user_id
+
+    结果缓存到数据版本变化、日期变化或超时为止；执行出错时返回 "{error_message}: 错误" 且不缓存
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(user_id, *args, **kwargs):
+            stats = _current_stats.get()
+            try:
+                args_digest = hashlib.sha1(
+                    json.dumps([args, kwargs], sort_keys=True, default=str).encode('utf-8')
+                ).hexdigest()
+                key = (f'agent_tools:{user_id}:{func.__name__}:'
+                       f'{data_version(user_id)}:{date.today().isoformat()}:{args_digest}')
+                result = cache.get(key)
+                if result is not None:
+                    if stats:
+                        stats.record(func.__name__, hit=True)
+                    return result
+
+                result = func(user_id, *args, **kwargs)
+                cache.set(key, result, TOOL_CACHE_TIMEOUT)
+                if stats:
+                    stats.record(func.__name__, hit=False)
+                return result
+            except Exception as e:
+                if stats:
+                    stats.record(func.__name__, hit=False)
+                return f"{error_message}: {str(e)}"
+        return wrapper
+    return decorator
+
+
+# ==================== 数据变更时递增版本 ====================
+
+@receiver([post_save, post_delete], sender=HealthCheckup)
+@receiver([post_save, post_delete], sender=Medication)
+@receiver([post_save, post_delete], sender=UserProfile)
+def _bump_on_owned_change(sender, instance, **kwargs):
+    bump_data_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=HealthIndicator)
+def _bump_on_indicator_change(sender, instance, **kwargs):
+    try:
+        bump_data_version(instance.checkup.user_id)
+    except HealthCheckup.DoesNotExist:
+        pass
+
+
+@receiver([post_save, post_delete], sender=MedicationRecord)
+def _bump_on_medication_record_change(sender, instance, **kwargs):
+    try:
+        bump_data_version(instance.medication.user_id)
+    except Medication.DoesNotExist:
+        pass
@@ -7,15 +7,14 @@ AI Doctor Agent - 基于LangChain的智能健康咨询Agent
 3. 汇总所有信息后给出全面的健康建议
 """
 
-from langchain.agents import create_agent
-from langchain.tools import tool
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
 from typing import List, Dict, Optional
 from .models import (
     HealthCheckup, HealthIndicator, HealthAdvice,
     Conversation, Medication, MedicationRecord, UserProfile
 )
+from .health_knowledge import format_knowledge, format_symptom_guidance
+from .lazy_imports import as_tools
+from .llm_clients import agent_provider, get_chat_model
 import json
 
 
@@ -80,7 +79,6 @@ def format_conversation_history(conversation_context):
 
 # ==================== Agent 工具定义 ====================
 
-@tool
 def get_user_profile() -> str:
     """
     获取用户的个人基本信息（年龄、性别等）
@@ -96,7 +94,6 @@ def get_user_profile() -> str:
     return "需要通过context获取当前用户信息"
 
 
-@tool
 def get_recent_checkups(limit: int = 3) -> str:
     """
     获取用户最近的体检报告摘要信息
@@ -113,7 +110,6 @@ def get_recent_checkups(limit: int = 3) -> str:
     return "需要通过context获取当前用户的体检报告"
 
 
-@tool
 def get_medication_info() -> str:
     """
     获取用户当前正在服用的药物信息
@@ -127,7 +123,6 @@ def get_medication_info() -> str:
     return "需要通过context获取当前用户的用药信息"
 
 
-@tool
 def get_health_indicators(checkup_ids: List[int]) -> str:
     """
     获取指定体检报告的详细健康指标数据
@@ -144,7 +139,6 @@ def get_health_indicators(checkup_ids: List[int]) -> str:
     return f"需要获取体检报告 {checkup_ids} 的详细指标数据"
 
 
-@tool
 def get_conversation_history(conversation_id: Optional[int] = None, limit: int = 10) -> str:
     """
     获取用户的对话历史记录
@@ -162,25 +156,23 @@ def get_conversation_history(conversation_id: Optional[int] = None, limit: int =
     return "需要通过context获取当前用户的对话历史"
 
 
-@tool
 def search_similar_cases(symptoms: str, limit: int = 5) -> str:
     """
-    根据症状描述搜索相似的健康案例（仅用于参考，不做诊断）
+    根据症状描述查询本地知识库中的常见原因、自我处理方法和就医警示（仅用于参考，不做诊断）
 
     Args:
         symptoms: 症状描述
-        limit: 返回案例数量限制
+        limit: 返回条目数量限制
 
     Returns:
-        str: 相似案例的参考信息
+        str: 症状相关的参考信息
     """
-    return f"根据症状 '{symptoms}' 搜索到的参考案例信息（此为模拟功能）"
+    return format_symptom_guidance(symptoms, limit)
 
 
-@tool
 def check_health_knowledge(keyword: str) -> str:
     """
-    查询健康知识库中的相关信息
+    查询本地健康知识库：体检指标的参考范围与临床意义、常见疾病和症状的生活方式建议
 
     Args:
         keyword: 要查询的关键词，如"高血压"、"糖尿病"等
@@ -188,7 +180,7 @@ def check_health_knowledge(keyword: str) -> str:
     Returns:
         str: 健康知识的文本描述
     """
-    return f"关于 '{keyword}' 的健康知识信息（此为模拟功能）"
+    return format_knowledge(keyword)
 
 
 # ==================== Agent 服务类 ====================
@@ -217,7 +209,7 @@ class AIDoctorAgentService:
         self.max_tokens = int(SystemSettings.get_setting('ai_doctor_max_tokens', '4000'))
 
         # 工具列表
-        self.tools = [
+        self.tools = as_tools([
             get_user_profile,
             get_recent_checkups,
             get_medication_info,
@@ -225,39 +217,19 @@ class AIDoctorAgentService:
             get_conversation_history,
             search_similar_cases,
             check_health_knowledge,
-        ]
+        ])
 
     def _get_llm(self):
-        """获取配置的LLM实例"""
-        if self.provider == 'openai' or not self.api_url:
-            # 使用OpenAI兼容格式
-            return ChatOpenAI(
-                model=self.model_name,
-                api_key=self.api_key,
-                base_url=self.api_url,
-                temperature=0.7,
-                max_tokens=self.max_tokens,
-                timeout=self.timeout,
-            )
-        elif self.provider == 'anthropic':
-            # 使用Anthropic格式
-            return ChatAnthropic(
-                model=self.model_name,
-                api_key=self.api_key,
-                temperature=0.7,
-                max_tokens=self.max_tokens,
-                timeout=self.timeout,
-            )
-        else:
-            # 默认使用OpenAI兼容格式
-            return ChatOpenAI(
-                model=self.model_name,
-                api_key=self.api_key,
-                base_url=self.api_url,
-                temperature=0.7,
-                max_tokens=self.max_tokens,
-                timeout=self.timeout,
-            )
+        """获取配置的LLM实例（进程内按配置复用）"""
+        return get_chat_model(
+            agent_provider(self.provider, self.api_url),
+            self.model_name,
+            api_key=self.api_key,
+            api_url=self.api_url,
+            temperature=0.7,
+            max_tokens=self.max_tokens,
+            timeout=self.timeout,
+        )
 
     def _create_user_context_middleware(self):
         """创建用户上下文中间件，用于注入用户信息到工具调用"""
@@ -504,43 +476,12 @@ class AIDoctorAgentService:
         return format_conversation_history(context)
 
     def _search_similar_cases_impl(self, symptoms: str) -> str:
-        """搜索相似案例（模拟功能）"""
-        # 这里可以接入真实的医学知识库或案例数据库
-        return f"""
-根据症状 "{symptoms}" 的参考信息：
-
-【注意事项】
-以下信息仅供参考，不能替代专业医生诊断。如身体不适，请及时就医。
-
-【一般性建议】
-1. 如症状持续或加重，建议及时就医
-2. 注意休息，保持良好的作息习惯
-3. 避免自行用药，应遵医嘱
-
-【紧急情况】
-如出现以下情况，请立即就医：
-- 呼吸困难
-- 剧烈胸痛
-- 意识模糊
-- 严重出血
-
-此为模拟功能，实际应用中可接入医学知识库API
-"""
+        """根据症状查询本地知识库"""
+        return format_symptom_guidance(symptoms)
 
     def _check_health_knowledge_impl(self, keyword: str) -> str:
-        """查询健康知识（模拟功能）"""
-        # 这里可以接入真实的健康知识库API
-        return f"""
-关于 "{keyword}" 的健康知识：
-
-【温馨提示】
-以下内容仅供参考，具体诊疗请遵医嘱。
-
-此为模拟功能，实际应用中可接入健康知识库API，如：
-- 权威医学数据库
-- 健康科普内容库
-- 医学指南和专家共识
-"""
+        """查询本地健康知识库"""
+        return format_knowledge(keyword)
 
     # ==================== Agent执行 ====================
 
@@ -4,22 +4,21 @@ AI Doctor Agent - 真正的LangChain Agent实现
 这个版本使用真正的LangChain Agent，能够自主调用工具
 """
 
-from langchain.agents import create_agent
-from langchain.tools import tool
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
 from typing import List, Dict, Optional
 from .models import (
     HealthCheckup, HealthIndicator, HealthAdvice,
     Conversation, Medication, MedicationRecord, UserProfile
 )
+from .lazy_imports import as_tools, load
+from .agent_tool_cache import cached_tool, track_tool_calls
+from .llm_clients import agent_provider, get_chat_model, get_or_build
 import json
 
 
 # ==================== Agent 工具实现 ====================
 # 这些工具会被Agent真正调用
 
-@tool
+@cached_tool('获取用户信息失败')
 def get_user_profile(user_id: int) -> str:
     """
     获取用户的个人基本信息（年龄、性别等）
@@ -30,41 +29,37 @@ def get_user_profile(user_id: int) -> str:
     Returns:
         str: 用户个人信息的文本描述
     """
-    try:
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-
-        user = User.objects.get(id=user_id)
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
 
-        try:
-            profile = user.userprofile
-            info = []
+    user = User.objects.get(id=user_id)
 
-            if profile.gender:
-                info.append(f"性别: {profile.get_gender_display()}")
+    try:
+        profile = user.userprofile
+        info = []
 
-            if profile.age:
-                info.append(f"年龄: {profile.age}岁")
+        if profile.gender:
+            info.append(f"性别: {profile.get_gender_display()}")
 
-            if profile.birth_date:
-                info.append(f"出生日期: {profile.birth_date.strftime('%Y-%m-%d')}")
+        if profile.age:
+            info.append(f"年龄: {profile.age}岁")
 
-            if profile.phone:
-                info.append(f"联系电话: {profile.phone}")
+        if profile.birth_date:
+            info.append(f"出生日期: {profile.birth_date.strftime('%Y-%m-%d')}")
 
-            if profile.address:
-                info.append(f"地址: {profile.address}")
+        if profile.phone:
+            info.append(f"联系电话: {profile.phone}")
 
-            return " | ".join(info) if info else "用户暂无详细个人信息"
+        if profile.address:
+            info.append(f"地址: {profile.address}")
 
-        except UserProfile.DoesNotExist:
-            return "用户暂无个人信息记录"
+        return " | ".join(info) if info else "用户暂无详细个人信息"
 
-    except Exception as e:
-        return f"获取用户信息失败: {str(e)}"
+    except UserProfile.DoesNotExist:
+        return "用户暂无个人信息记录"
 
 
-@tool
+@cached_tool('获取体检报告失败')
 def get_recent_checkups(user_id: int, limit: int = 3) -> str:
     """
     获取用户最近的体检报告摘要信息
@@ -76,41 +71,37 @@ def get_recent_checkups(user_id: int, limit: int = 3) -> str:
     Returns:
         str: 体检报告摘要信息，包含日期、医院、异常指标等
     """
-    try:
-        checkups = HealthCheckup.objects.filter(
-            user_id=user_id
-        ).order_by('-checkup_date')[:limit]
-
-        if not checkups:
-            return "用户暂无体检报告记录"
+    checkups = HealthCheckup.objects.filter(
+        user_id=user_id
+    ).order_by('-checkup_date')[:limit]
 
-        result = []
-        for checkup in checkups:
-            # 获取异常指标数量
-            abnormal_count = HealthIndicator.objects.filter(
-                checkup=checkup,
-                status='abnormal'
-            ).count()
+    if not checkups:
+        return "用户暂无体检报告记录"
 
-            attention_count = HealthIndicator.objects.filter(
-                checkup=checkup,
-                status='attention'
-            ).count()
+    result = []
+    for checkup in checkups:
+        # 获取异常指标数量
+        abnormal_count = HealthIndicator.objects.filter(
+            checkup=checkup,
+            status='abnormal'
+        ).count()
 
-            info = f"报告{checkup.id}: {checkup.checkup_date.strftime('%Y-%m-%d')} @ {checkup.hospital}"
+        attention_count = HealthIndicator.objects.filter(
+            checkup=checkup,
+            status='attention'
+        ).count()
 
-            if abnormal_count > 0 or attention_count > 0:
-                info += f" (异常: {abnormal_count}, 关注: {attention_count})"
+        info = f"报告{checkup.id}: {checkup.checkup_date.strftime('%Y-%m-%d')} @ {checkup.hospital}"
 
-            result.append(info)
+        if abnormal_count > 0 or attention_count > 0:
+            info += f" (异常: {abnormal_count}, 关注: {attention_count})"
 
-        return "\n".join(result)
+        result.append(info)
 
-    except Exception as e:
-        return f"获取体检报告失败: {str(e)}"
+    return "\n".join(result)
 
 
-@tool
+@cached_tool('获取用药信息失败')
 def get_medication_info(user_id: int) -> str:
     """
     获取用户当前正在服用的药物信息
@@ -121,46 +112,42 @@ def get_medication_info(user_id: int) -> str:
     Returns:
         str: 用药信息的文本描述，包括药名、剂量、服用周期等
     """
-    try:
-        from datetime import date
-
-        medications = Medication.objects.filter(
-            user_id=user_id,
-            is_active=True,
-            start_date__lte=date.today(),
-            end_date__gte=date.today()
-        ).order_by('-created_at')
+    from datetime import date
 
-        if not medications:
-            return "用户当前无正在服用的药物"
+    medications = Medication.objects.filter(
+        user_id=user_id,
+        is_active=True,
+        start_date__lte=date.today(),
+        end_date__gte=date.today()
+    ).order_by('-created_at')
 
-        result = []
-        for med in medications:
-            info = f"- {med.medicine_name}"
-            info += f" | 剂量: {med.dosage}"
-            info += f" | 周期: {med.start_date} 至 {med.end_date}"
+    if not medications:
+        return "用户当前无正在服用的药物"
 
-            # 获取最近服药记录
-            records = MedicationRecord.objects.filter(
-                medication=med
-            ).order_by('-record_date')[:5]
+    result = []
+    for med in medications:
+        info = f"- {med.medicine_name}"
+        info += f" | 剂量: {med.dosage}"
+        info += f" | 周期: {med.start_date} 至 {med.end_date}"
 
-            if records:
-                record_info = ", ".join([r.record_date.strftime('%m-%d') for r in records])
-                info += f" | 最近服药: {record_info}"
+        # 获取最近服药记录
+        records = MedicationRecord.objects.filter(
+            medication=med
+        ).order_by('-record_date')[:5]
 
-            if med.notes:
-                info += f" | 备注: {med.notes}"
+        if records:
+            record_info = ", ".join([r.record_date.strftime('%m-%d') for r in records])
+            info += f" | 最近服药: {record_info}"
 
-            result.append(info)
+        if med.notes:
+            info += f" | 备注: {med.notes}"
 
-        return "\n".join(result)
+        result.append(info)
 
-    except Exception as e:
-        return f"获取用药信息失败: {str(e)}"
+    return "\n".join(result)
 
 
-@tool
+@cached_tool('获取详细指标失败')
 def get_health_indicators_detail(user_id: int, checkup_ids: List[int]) -> str:
     """
     获取指定体检报告的详细健康指标数据
@@ -172,74 +159,145 @@ def get_health_indicators_detail(user_id: int, checkup_ids: List[int]) -> str:
     Returns:
         str: 详细健康指标的文本描述
     """
-    try:
-        checkups = HealthCheckup.objects.filter(
-            id__in=checkup_ids,
-            user_id=user_id
-        ).order_by('-checkup_date')
-
-        if not checkups:
-            return f"未找到指定的体检报告: {checkup_ids}"
-
-        result = []
-
-        for checkup in checkups:
-            result.append(f"\n=== 体检报告 {checkup.id} ===")
-            result.append(f"日期: {checkup.checkup_date.strftime('%Y-%m-%d')}")
-            result.append(f"医院: {checkup.hospital}")
-
-            indicators = HealthIndicator.objects.filter(checkup=checkup)
-
-            # 按类型分组
-            by_type = {}
-            for ind in indicators:
-                if ind.indicator_type not in by_type:
-                    by_type[ind.indicator_type] = []
-                by_type[ind.indicator_type].append(ind)
-
-            for ind_type, inds in by_type.items():
-                result.append(f"\n{ind_type}:")
-                for ind in inds:
-                    line = f"  {ind.indicator_name}: {ind.value}"
-                    if ind.unit:
-                        line += f" {ind.unit}"
-                    if ind.status == 'abnormal':
-                        line += f" [异常] 参考值: {ind.reference_range}"
-                    result.append(line)
-
-        return "\n".join(result)
+    checkups = HealthCheckup.objects.filter(
+        id__in=checkup_ids,
+        user_id=user_id
+    ).order_by('-checkup_date')
+
+    if not checkups:
+        return f"未找到指定的体检报告: {checkup_ids}"
+
+    result = []
+
+    for checkup in checkups:
+        result.append(f"\n=== 体检报告 {checkup.id} ===")
+        result.append(f"日期: {checkup.checkup_date.strftime('%Y-%m-%d')}")
+        result.append(f"医院: {checkup.hospital}")
+
+        indicators = HealthIndicator.objects.filter(checkup=checkup)
+
+        # 按类型分组
+        by_type = {}
+        for ind in indicators:
+            if ind.indicator_type not in by_type:
+                by_type[ind.indicator_type] = []
+            by_type[ind.indicator_type].append(ind)
+
+        for ind_type, inds in by_type.items():
+            result.append(f"\n{ind_type}:")
+            for ind in inds:
+                line = f"  {ind.indicator_name}: {ind.value}"
+                if ind.unit:
+                    line += f" {ind.unit}"
+                if ind.status == 'abnormal':
+                    line += f" [异常] 参考值: {ind.reference_range}"
+                result.append(line)
+
+    return "\n".join(result)
+
 
+def search_user_records(user_id: int, query: str, k: int = 5) -> str:
+    """
+    在用户的全部健康记录中检索与问题最相关的记录（体检指标、体检备注、症状日志、用药备注、以往问答）
+
+    适合查找较早的指标、某个症状或药物的历史记录，比获取整份体检报告更精准、更省篇幅
+
+    Args:
+        user_id: 用户ID
+        query: 检索内容，如"转氨酶"、"头痛"、"二甲双胍"
+        k: 返回条数，默认5，最多20
+
+    Returns:
+        str: 按相关度排列的记录，每条一行
+    """
+    from .record_index import format_search_results, search_records
+
+    # 不经 cached_tool 缓存：症状日志与以往问答不改变数据版本，索引自身按 REFRESH_INTERVAL 增量更新
+    try:
+        results = search_records(user_id, query, max(1, min(int(k), 20)))
     except Exception as e:
-        return f"获取详细指标失败: {str(e)}"
+        return f"检索用户记录失败: {str(e)}"
+    if not results:
+        return f"未找到与 '{query}' 相关的记录"
+    return f"与 '{query}' 最相关的 {len(results)} 条记录：\n" + format_search_results(results)
 
 
-@tool
 def check_health_knowledge(keyword: str) -> str:
     """
-    查询健康知识库中的相关信息
+    查询本地健康知识库：体检指标的参考范围与临床意义、常见疾病和症状的生活方式建议与就医提示
 
     Args:
-        keyword: 要查询的关键词，如"高血压"、"糖尿病"等
+        keyword: 要查询的关键词，如"高血压"、"尿酸"、"ALT"、"头晕"等
 
     Returns:
         str: 健康知识的文本描述
     """
-    return f"""
-关于 '{keyword}' 的健康知识：
+    from .health_knowledge import format_knowledge
 
-【温馨提示】
-以下内容仅供参考，具体诊疗请遵医嘱。
+    return format_knowledge(keyword)
 
-【建议】
-- 如有相关症状，建议及时就医咨询专业医生
-- 定期体检，监测相关健康指标
-- 保持健康生活方式
 
-此功能可接入医学知识库API获取更详细的信息
+# ==================== Agent服务类 ====================
+
+AGENT_SYSTEM_PROMPT = """
+你是一个专业的AI健康咨询助手。你会：
+
+1. 主动使用工具获取用户的健康信息（个人资料、体检报告、用药记录等）
+2. 分析所有信息后给出全面的健康建议
+3. 如果信息不足，主动调用工具获取更多信息
+   需要较早的指标、症状、用药备注或以往问答时，用 search_user_records 检索相关记录，不必获取整份报告
+4. 给出具体、可操作的健康指导
+
+注意事项：
+- 工具调用要精准，只调用必要的工具
+- 姿态基于实际数据给出建议，不要编造信息
+- 始终提醒用户，建议仅供参考，具体诊疗请遵医嘱
 """
 
+AGENT_SETTING_DEFAULTS = {
+    'ai_doctor_provider': 'openai',
+    'ai_doctor_api_url': None,
+    'ai_doctor_api_key': None,
+    'ai_doctor_model_name': None,
+    'ai_model_timeout': '300',
+    'ai_doctor_max_tokens': '4000',
+}
+
+
+def get_compiled_agent(config):
+    """
+    获取（复用）编译好的Agent
+
+    Agent 与用户无关（用户ID随消息传入工具），按模型配置缓存，配置变更后自动重建
+    """
+    def build():
+        llm = get_chat_model(
+            agent_provider(config['provider'], config['api_url']),
+            config['model_name'],
+            api_key=config['api_key'],
+            api_url=config['api_url'],
+            temperature=0.7,
+            max_tokens=config['max_tokens'],
+            timeout=config['timeout'],
+        )
+        tools = as_tools([
+            get_user_profile,
+            get_recent_checkups,
+            get_medication_info,
+            get_health_indicators_detail,
+            search_user_records,
+            check_health_knowledge,
+        ])
+        agent = load('langchain.create_agent')(
+            model=llm,
+            tools=tools,
+            system_prompt=AGENT_SYSTEM_PROMPT
+        )
+        print(f"[Real Agent] ✓ 真正的LangChain Agent创建成功!")
+        return llm, tools, agent
+
+    return get_or_build('ai_doctor_agent', config, build)
 
-# ==================== Agent服务类 ====================
 
 class RealAIDoctorAgent:
     """真正的AI医生Agent - 使用LangChain create_agent"""
@@ -248,6 +306,8 @@ class RealAIDoctorAgent:
         """
         初始化Agent
 
+        编译好的Agent与LLM客户端在进程内按配置复用，这里只读取一次配置并绑定用户与对话
+
         Args:
             user: Django用户对象
             conversation: 对话对象（可选）
@@ -255,93 +315,30 @@ class RealAIDoctorAgent:
         self.user = user
         self.conversation = conversation
 
-        # 获取AI医生配置
+        # 获取AI医生配置（一次查询）
         from .models import SystemSettings
-        self.provider = SystemSettings.get_setting('ai_doctor_provider', 'openai')
-        self.api_url = SystemSettings.get_setting('ai_doctor_api_url')
-        self.api_key = SystemSettings.get_setting('ai_doctor_api_key')
-        self.model_name = SystemSettings.get_setting('ai_doctor_model_name')
-        self.timeout = int(SystemSettings.get_setting('ai_model_timeout', '300'))
-        self.max_tokens = int(SystemSettings.get_setting('ai_doctor_max_tokens', '4000'))
-
-        # 创建工具列表（这些是真正可调用的工具）
-        self.tools = [
-            get_user_profile,
-            get_recent_checkups,
-            get_medication_info,
-            get_health_indicators_detail,
-            check_health_knowledge,
-        ]
-
-        # 创建LLM
-        self.llm = self._get_llm()
+        settings = SystemSettings.get_settings(AGENT_SETTING_DEFAULTS)
+        self.provider = settings['ai_doctor_provider']
+        self.api_url = settings['ai_doctor_api_url']
+        self.api_key = settings['ai_doctor_api_key']
+        self.model_name = settings['ai_doctor_model_name']
+        self.timeout = int(settings['ai_model_timeout'])
+        self.max_tokens = int(settings['ai_doctor_max_tokens'])
 
-        # 创建Agent（真正的LangChain Agent）
         try:
-            system_prompt = """
-你是一个专业的AI健康咨询助手。你会：
-
-1. 主动使用工具获取用户的健康信息（个人资料、体检报告、用药记录等）
-2. 分析所有信息后给出全面的健康建议
-3. 如果信息不足，主动调用工具获取更多信息
-4. 给出具体、可操作的健康指导
-
-注意事项：
-- 工具调用要精准，只调用必要的工具
-- 姿态基于实际数据给出建议，不要编造信息
-- 始终提醒用户，建议仅供参考，具体诊疗请遵医嘱
-"""
-
-            self.agent = create_agent(
-                model=self.llm,
-                tools=self.tools,
-                system_prompt=system_prompt
-            )
-            print(f"[Real Agent] ✓ 真正的LangChain Agent创建成功!")
+            self.llm, self.tools, self.agent = get_compiled_agent({
+                'provider': self.provider,
+                'api_url': self.api_url,
+                'api_key': self.api_key,
+                'model_name': self.model_name,
+                'timeout': self.timeout,
+                'max_tokens': self.max_tokens,
+            })
         except Exception as e:
             print(f"[Real Agent] ✗ Agent创建失败: {e}")
             import traceback
             traceback.print_exc()
-            self.agent = None
-
-    def _get_llm(self):
-        """获取配置的LLM实例"""
-        # 修复API URL - 移除末尾的 /chat/completions（如果存在）
-        # LangChain会自动添加
-        base_url = self.api_url
-        if base_url:
-            # 如果URL已包含 /chat/completions，需要移除
-            if '/chat/completions' in base_url:
-                base_url = base_url.split('/chat/completions')[0]
-            # 移除末尾斜杠
-            base_url = base_url.rstrip('/')
-
-        if self.provider == 'openai' or not self.api_url:
-            return ChatOpenAI(
-                model=self.model_name,
-                api_key=self.api_key,
-                base_url=base_url,
-                temperature=0.7,
-                max_tokens=self.max_tokens,
-                timeout=self.timeout,
-            )
-        elif self.provider == 'anthropic':
-            return ChatAnthropic(
-                model=self.model_name,
-                api_key=self.api_key,
-                temperature=0.7,
-                max_tokens=self.max_tokens,
-                timeout=self.timeout,
-            )
-        else:
-            return ChatOpenAI(
-                model=self.model_name,
-                api_key=self.api_key,
-                base_url=base_url,
-                temperature=0.7,
-                max_tokens=self.max_tokens,
-                timeout=self.timeout,
-            )
+            self.llm = self.tools = self.agent = None
 
     def ask_question(self, user_question: str, selected_reports=None, selected_medications=None) -> Dict:
         """
@@ -436,9 +433,12 @@ class RealAIDoctorAgent:
 
             # 使用LangChain的invoke方法
             # Agent会自主决定调用哪些工具
-            response = self.agent.invoke({
-                "messages": [{"role": "user", "content": initial_message}]
-            })
+            # 工具调用计数与缓存命中按对话累计
+            conversation_id = self.conversation.id if self.conversation else None
+            with track_tool_calls(conversation_id) as tool_stats:
+                response = self.agent.invoke({
+                    "messages": [{"role": "user", "content": initial_message}]
+                })
 
             # 提取最终回答
             if hasattr(response, 'messages'):
@@ -450,12 +450,16 @@ class RealAIDoctorAgent:
 
             print(f"[Real Agent] ✓ 回答生成成功，长度: {len(answer)} 字符")
 
+            stats = tool_stats.as_dict()
+            print(f"[Real Agent] 工具调用 {stats['calls']} 次，缓存命中 {stats['hits']} 次（命中率 {stats['hit_rate']:.0%}）")
+
             return {
                 'answer': answer,
                 'prompt': initial_message,
                 'success': True,
                 'is_continuation': is_continuation,
-                'conversation_history_count': len(conversation_history) if is_continuation else 0
+                'conversation_history_count': len(conversation_history) if is_continuation else 0,
+                'tool_stats': stats
             }
 
         except Exception as e:
@@ -0,0 +1,146 @@
+"""
+AI医生通用问题答案缓存（可选，系统设置 ai_answer_cache_enabled 开启）
+只缓存与用户自身数据无关的问题：新对话、未附带体检报告/药单/健康事件数据时才会查找或写入。
+问题规范化（全角转半角、去标点空白与口语词）后与同一作用域内已缓存的问题完全一致才命中：
+医学问题中一字之差（高/低血压、孕妇/儿童、能/不能）含义就可能相反，不做相似度匹配。
+作用域由模型配置与去掉问题后的提示词共同决定，
+提示词模板、个人信息（性别、年龄）或模型变化后不会命中旧答案。每条缓存有过期时间，超出容量时淘汰最久未命中的。
+"""
+
+import hashlib
+import unicodedata
+from datetime import timedelta
+
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import AnswerCacheEntry, SystemSettings
+
+ANSWER_CACHE_SETTING_DEFAULTS = {
+    'ai_answer_cache_enabled': 'false',
+    'ai_answer_cache_ttl_hours': '72',
+}
+# 单个作用域的缓存条数上限，以及全部缓存的条数上限
+MAX_ENTRIES_PER_SCOPE = 500
+MAX_ENTRIES = 5000
+# 命中时每个 SSE 片段的字符数
+STREAM_CHUNK_CHARS = 40
+
+_FILLER_WORDS = ('我想问一下', '我想问', '想问一下', '我想知道', '想知道', '请问', '请教', '医生', '你好', '您好', '一下')
+_TRAILING_PARTICLES = '吗呢啊呀吧'
+
+
+def normalize_question(question):
+    """问题规范化：全角转半角、忽略大小写，去掉标点、空白和口语化的客套词"""
+    text = unicodedata.normalize('NFKC', question or '').casefold()
+    text = ''.join(
+        ch for ch in text
+        if not ch.isspace() and unicodedata.category(ch)[0] not in ('P', 'S')
+    )
+    for word in _FILLER_WORDS:
+        text = text.replace(word, '')
+    return text.rstrip(_TRAILING_PARTICLES)[:500]
+
+
+class AnswerCache:
+    """一次问答请求的答案缓存；通过 for_request 获取，不适用时为 None"""
+
+    def __init__(self, scope_key, model_key, question, ttl_hours):
+        self.scope_key = scope_key
+        self.model_key = model_key
+        self.question = question
+        self.normalized = normalize_question(question)
+        self.ttl_hours = ttl_hours
+
+    @classmethod
+    def for_request(cls, question, prompt, provider, model_name, api_url=None, includes_user_data=False):
+        """
+        获取本次问答的答案缓存
+
+        Args:
+            prompt: 发送给模型的完整提示词（包含问题），去掉问题后作为提示词版本的一部分
+            includes_user_data: 是否附带了用户自己的体检报告、药单、健康事件或对话历史，
+                为 True 时不使用缓存
+
+        Returns:
+            AnswerCache 或 None（未开启、附带用户数据或问题过短时）
+        """
+        if includes_user_data:
+            return None
+        config = SystemSettings.get_settings(ANSWER_CACHE_SETTING_DEFAULTS)
+        if config['ai_answer_cache_enabled'].lower() != 'true':
+            return None
+        if len(normalize_question(question)) < 2:
+            return None
+
+        model_key = f'{provider}:{model_name}'[:200]
+        template = prompt.replace(question, '')
+        scope_key = hashlib.sha256(
+            '\n'.join([model_key, api_url or '', template]).encode('utf-8')
+        ).hexdigest()
+        return cls(
+            scope_key,
+            model_key,
+            question,
+            ttl_hours=float(config['ai_answer_cache_ttl_hours']),
+        )
+
+    def lookup(self):
+        """
+        查找规范化后完全相同的问题的缓存答案
+
+        Returns:
+            (答案, 相似度) 或 None；只有完全一致才命中，相似度恒为 1.0（保留字段供前端显示）
+        """
+        now = timezone.now()
+        entry = (
+            AnswerCacheEntry.objects
+            .filter(scope_key=self.scope_key, normalized_question=self.normalized, expires_at__gt=now)
+            .order_by('-created_at')
+            .values_list('id', 'answer')
+            .first()
+        )
+        if entry is None or not entry[1]:
+            return None
+        AnswerCacheEntry.objects.filter(id=entry[0]).update(hit_count=F('hit_count') + 1, last_hit_at=now)
+        return entry[1], 1.0
+
+    def store(self, answer):
+        """缓存新生成的答案，并清理过期与超出容量的条目"""
+        if not answer:
+            return
+        now = timezone.now()
+        AnswerCacheEntry.objects.create(
+            scope_key=self.scope_key,
+            model_key=self.model_key,
+            question=self.question,
+            normalized_question=self.normalized,
+            answer=answer,
+            expires_at=now + timedelta(hours=self.ttl_hours),
+        )
+        evict_answer_cache(self.scope_key)
+
+
+def evict_answer_cache(scope_key=None):
+    """删除过期条目；作用域或总数超出上限时淘汰最久未命中的条目"""
+    AnswerCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+
+    def trim(queryset, limit):
+        stale_ids = list(
+            queryset.annotate(last_used=Coalesce('last_hit_at', 'created_at'))
+            .order_by('-last_used')
+            .values_list('id', flat=True)[limit:]
+        )
+        if stale_ids:
+            AnswerCacheEntry.objects.filter(id__in=stale_ids).delete()
+
+    if scope_key:
+        trim(AnswerCacheEntry.objects.filter(scope_key=scope_key), MAX_ENTRIES_PER_SCOPE)
+    trim(AnswerCacheEntry.objects.all(), MAX_ENTRIES)
+
+
+def iter_answer_chunks(answer, size=STREAM_CHUNK_CHARS):
+    """将缓存答案切成小段，按流式输出的格式逐段发送"""
+    for start in range(0, len(answer), size):
+        yield answer[start:start + size]
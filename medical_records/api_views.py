@@ -1,6 +1,5 @@
 import json
 import os
-import re
 import tempfile
 from datetime import datetime, timedelta
 from django.http import JsonResponse
@@ -8,6 +7,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
@@ -16,6 +16,14 @@ from .models import (HealthCheckup, DocumentProcessing, HealthIndicator, Convers
                     Medication, MedicationRecord, MedicationGroup, HealthEvent, EventItem, CareGoal, CareAction, CarePlan)
 from .forms import HealthCheckupForm
 from .services import DocumentProcessingService
+from .json_extraction import JSONScanner, select_object
+from .data_integration import iter_integration_batches, merge_changes, plan_integration, remember_name_mappings
+from .llm_clients import get_chat_model
+from .agent_tool_cache import bump_data_version, get_tool_stats
+from .indicator_units import canonicalize_indicators
+from .reference_ranges import STATUS_SOURCE_FIELDS, apply_reference_status, profile_context
+from .answer_cache import AnswerCache, iter_answer_chunks
+from .image_pipeline import record_checkup_sources
 from .utils import convert_image_to_pdf, is_image_file
 from .llm_prompts import (
     DATA_INTEGRATION_SYSTEM_PROMPT,
@@ -23,7 +31,6 @@ from .llm_prompts import (
     AI_DOCTOR_SYSTEM_PROMPT,
     AI_DOCTOR_USER_PROMPT_TEMPLATE_WITH_DATA,
     AI_DOCTOR_USER_PROMPT_TEMPLATE_WITHOUT_DATA,
-    build_data_integration_prompt,
     build_ai_doctor_prompt
 )
 from .views import call_ai_doctor_api
@@ -59,44 +66,6 @@ def _safe_get_request_json(request):
         return {}
 
 
-def extract_json_objects(text):
-    """从文本中提取所有完整的JSON对象"""
-    json_objects = []
-    bracket_count = 0
-    in_string = False
-    escape_char = False
-    start_pos = -1
-
-    for i, char in enumerate(text):
-        if escape_char:
-            escape_char = False
-            continue
-
-        if char == '\\':
-            escape_char = True
-            continue
-
-        if char == '"' and not escape_char:
-            in_string = not in_string
-            continue
-
-        if in_string:
-            continue
-
-        if char == '{':
-            if bracket_count == 0:
-                start_pos = i
-            bracket_count += 1
-        elif char == '}':
-            bracket_count -= 1
-            if bracket_count == 0 and start_pos != -1:
-                json_str = text[start_pos:i+1]
-                json_objects.append(json_str)
-                start_pos = -1
-
-    return json_objects
-
-
 @csrf_exempt
 @require_http_methods(["POST"])
 @login_required
@@ -221,6 +190,8 @@ def upload_and_process(request):
                     # 将图片文件转换为PDF字节数据
                     from .utils import convert_image_file_to_pdf
                     pdf_data = convert_image_file_to_pdf(temp_image_path)
+                    # 记录原图，删除报告时清理其渲染件
+                    record_checkup_sources(health_checkup.id, [temp_image_path])
 
                     # 创建临时PDF文件
                     pdf_extension = '.pdf'
@@ -386,12 +357,12 @@ def stream_ai_summary(request):
                 yield f"data: {json.dumps({'prompt': prompt}, ensure_ascii=False)}\n\n"
 
                 if provider == 'gemini':
-                    from langchain_google_genai import ChatGoogleGenerativeAI
                     from langchain_core.messages import HumanMessage, AIMessage
 
-                    llm = ChatGoogleGenerativeAI(
-                        model=model_name,
-                        google_api_key=api_key,
+                    llm = get_chat_model(
+                        'gemini',
+                        model_name,
+                        api_key=api_key,
                         temperature=0.7,
                         timeout=timeout,
                         streaming=True
@@ -426,19 +397,13 @@ def stream_ai_summary(request):
                     yield f"data: {json.dumps({'done': True}, ensure_ascii=False)}\n\n"
 
                 else:
-                    from langchain_openai import ChatOpenAI
                     from langchain_core.messages import HumanMessage, AIMessage
 
-                    base_url = api_url
-                    if '/chat/completions' in base_url:
-                        base_url = base_url.split('/chat/completions')[0].rstrip('/')
-                    elif base_url.endswith('/'):
-                        base_url = base_url.rstrip('/')
-
-                    llm = ChatOpenAI(
-                        model=model_name,
+                    llm = get_chat_model(
+                        'openai',
+                        model_name,
                         api_key=api_key or 'not-needed',
-                        base_url=base_url,
+                        api_url=api_url,
                         temperature=0.3,
                         max_tokens=max_tokens,
                         timeout=timeout,
@@ -602,12 +567,12 @@ def stream_event_ai_summary(request):
                 yield f"data: {json.dumps({'prompt': prompt}, ensure_ascii=False)}\n\n"
 
                 if provider == 'gemini':
-                    from langchain_google_genai import ChatGoogleGenerativeAI
                     from langchain_core.messages import HumanMessage, AIMessage
 
-                    llm = ChatGoogleGenerativeAI(
-                        model=model_name,
-                        google_api_key=api_key,
+                    llm = get_chat_model(
+                        'gemini',
+                        model_name,
+                        api_key=api_key,
                         temperature=0.7,
                         timeout=timeout,
                         streaming=True
@@ -637,19 +602,13 @@ def stream_event_ai_summary(request):
                     yield f"data: {json.dumps({'done': True}, ensure_ascii=False)}\n\n"
 
                 else:
-                    from langchain_openai import ChatOpenAI
                     from langchain_core.messages import HumanMessage, AIMessage
 
-                    base_url = api_url
-                    if '/chat/completions' in base_url:
-                        base_url = base_url.split('/chat/completions')[0].rstrip('/')
-                    elif base_url.endswith('/'):
-                        base_url = base_url.rstrip('/')
-
-                    llm = ChatOpenAI(
-                        model=model_name,
+                    llm = get_chat_model(
+                        'openai',
+                        model_name,
                         api_key=api_key or 'not-needed',
-                        base_url=base_url,
+                        api_url=api_url,
                         temperature=0.3,
                         max_tokens=max_tokens,
                         timeout=timeout,
@@ -847,12 +806,12 @@ def stream_checkup_ai_summary(request):
                 yield f"data: {json.dumps({'prompt': prompt}, ensure_ascii=False)}\n\n"
 
                 if provider == 'gemini':
-                    from langchain_google_genai import ChatGoogleGenerativeAI
                     from langchain_core.messages import HumanMessage, AIMessage
 
-                    llm = ChatGoogleGenerativeAI(
-                        model=model_name,
-                        google_api_key=api_key,
+                    llm = get_chat_model(
+                        'gemini',
+                        model_name,
+                        api_key=api_key,
                         temperature=0.7,
                         timeout=timeout,
                         streaming=True
@@ -882,19 +841,13 @@ def stream_checkup_ai_summary(request):
                     yield f"data: {json.dumps({'done': True}, ensure_ascii=False)}\n\n"
 
                 else:
-                    from langchain_openai import ChatOpenAI
                     from langchain_core.messages import HumanMessage, AIMessage
 
-                    base_url = api_url
-                    if '/chat/completions' in base_url:
-                        base_url = base_url.split('/chat/completions')[0].rstrip('/')
-                    elif base_url.endswith('/'):
-                        base_url = base_url.rstrip('/')
-
-                    llm = ChatOpenAI(
-                        model=model_name,
+                    llm = get_chat_model(
+                        'openai',
+                        model_name,
                         api_key=api_key or 'not-needed',
-                        base_url=base_url,
+                        api_url=api_url,
                         temperature=0.3,
                         max_tokens=max_tokens,
                         timeout=timeout,
@@ -1327,6 +1280,26 @@ def get_conversation_messages(request, conversation_id):
         }, status=500)
 
 
+@require_http_methods(["GET"])
+@login_required
+def get_conversation_tool_stats(request, conversation_id):
+    """获取对话中AI医生工具调用次数与缓存命中率（本进程内统计）"""
+    try:
+        conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
+
+        return JsonResponse({
+            'success': True,
+            'conversation_id': conversation.id,
+            'stats': get_tool_stats(conversation.id) or {'calls': 0, 'hits': 0, 'hit_rate': 0.0, 'tools': {}}
+        })
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'获取工具调用统计失败: {str(e)}'
+        }, status=500)
+
+
 @require_http_methods(["POST"])
 @login_required
 def create_new_conversation(request):
@@ -1571,10 +1544,7 @@ def integrate_data(request):
 
     try:
         import json
-        import re
         import time
-        from .services import call_llm_for_integration
-        from .models import SystemSettings
 
         logger.info(f"\n{'='*80}")
         logger.info(f"[数据整合] API调用开始")
@@ -1616,149 +1586,44 @@ def integrate_data(request):
         logger.info(f"[数据整合] ✓ 报告验证通过")
 
         # 获取所有指标
-        indicators = HealthIndicator.objects.filter(
+        indicators = list(HealthIndicator.objects.filter(
             checkup__in=checkups
-        ).select_related('checkup')
-
-        logger.info(f"[数据整合] 获取到指标总数: {indicators.count()}")
-
-        # 按指标名称分组（模糊匹配）
-        indicators_by_name = {}
-        for indicator in indicators:
-            name_key = indicator.indicator_name.lower().strip()
-            if name_key not in indicators_by_name:
-                indicators_by_name[name_key] = []
-            indicators_by_name[name_key].append(indicator)
-
-        logger.info(f"[数据整合] 指标分组数: {len(indicators_by_name)}")
-
-        # 准备发送给LLM的数据
-        indicators_summary = []
-
-        for name_key, inds in indicators_by_name.items():
-            # 收集该指标的所有变体
-            variants = []
-
-            for ind in inds:
-                variants.append({
-                    'id': ind.id,
-                    'name': ind.indicator_name,
-                    'value': ind.value,
-                    'unit': ind.unit,
-                    'reference_range': ind.reference_range,  # 仅用于LLM参考，不返回
-                    'status': ind.status,
-                    'type': ind.indicator_type
-                })
-
-            indicators_summary.append({
-                'key': name_key,
-                'variants': variants
-            })
-
-        # 构建Prompt，使用统一的提示词配置
-        indicators_data_json = json.dumps(indicators_summary, ensure_ascii=False, indent=2)
-        system_prompt, user_prompt = build_data_integration_prompt(indicators_data_json, user_prompt)
+        ).select_related('checkup'))
+        indicators_by_id = {indicator.id: indicator for indicator in indicators}
 
-        logger.info(f"[数据整合] Prompt构建完成，长度: {len(user_prompt)} 字符")
-        logger.info(f"[数据整合] 开始调用LLM...")
+        logger.info(f"[数据整合] 获取到指标总数: {len(indicators)}")
 
-        # 获取LLM提供商配置
-        llm_config = SystemSettings.get_llm_config()
-        llm_provider = llm_config.get('provider', 'openai')
-        logger.info(f"[数据整合] LLM提供商: {llm_provider}")
+        # 本地预处理：套用已确认的命名映射、按相似名称聚类，只有存在歧义的簇交给LLM
+        plan = plan_integration(request.user, indicators, user_prompt)
+        logger.info(
+            f"[数据整合] 指标分组数: {plan.group_count}，聚类后 {plan.cluster_count} 簇，"
+            f"需LLM判断 {plan.ambiguous_count} 簇（{len(plan.batches)} 批），本地变更 {len(plan.local_changes)} 条"
+        )
 
-        # 调用LLM
-        try:
-            llm_start = time.time()
-
-            if llm_provider == 'gemini':
-                # 使用 Gemini API
-                logger.info(f"[数据整合] 使用 Gemini API")
-                from .services import call_gemini_api
-                # Gemini不使用system_message，直接使用prompt
-                timeout = int(SystemSettings.get_setting('ai_model_timeout', '300'))
-                llm_response = call_gemini_api(user_prompt, timeout=timeout)
+        # 分批并行调用LLM
+        llm_changes = []
+        batch_errors = []
+        llm_start = time.time()
+        for index, llm_response, batch_changes, error in iter_integration_batches(plan, user_prompt):
+            if error:
+                logger.info(f"[数据整合] ✗ 第{index + 1}批失败: {error}")
+                batch_errors.append({'batch': index + 1, 'error': error})
             else:
-                # 使用 OpenAI 兼容格式
-                logger.info(f"[数据整合] 使用 OpenAI 兼容格式")
-                # 使用统一的AI模型超时配置
-                timeout = int(SystemSettings.get_setting('ai_model_timeout', '300'))
-                llm_response = call_llm_for_integration(system_prompt, user_prompt, timeout=timeout)
-
-            llm_end = time.time()
-            logger.info(f"[数据整合] ✓ LLM调用完成，耗时: {llm_end - llm_start:.2f}秒")
-        except Exception as e:
-            logger.info(f"[数据整合] ✗ LLM调用失败: {str(e)}")
+                logger.info(f"[数据整合] ✓ 第{index + 1}批完成，变更 {len(batch_changes)} 条")
+                llm_changes.extend(batch_changes)
+
+        if plan.batches:
+            logger.info(f"[数据整合] ✓ LLM调用完成，耗时: {time.time() - llm_start:.2f}秒")
+        if plan.batches and len(batch_errors) == len(plan.batches):
             return JsonResponse({
                 'success': False,
-                'error': f'调用LLM失败: {str(e)}'
+                'error': f"调用LLM失败: {batch_errors[0]['error']}"
             }, status=500)
 
-        # 解析LLM响应
+        # 合并本地变更与LLM变更
         try:
-            logger.info(f"[数据整合] 开始解析LLM响应...")
-
-            # 清理LLM响应中的thinking标签和思考过程
-            cleaned_response = llm_response.strip()
-
-            # 移除markdown代码块标记
-            if cleaned_response.startswith('```'):
-                logger.info(f"[数据整合] 检测到markdown标记，正在清理...")
-                cleaned_response = re.sub(r'^```\w*\n?', '', cleaned_response)
-                cleaned_response = re.sub(r'\n?```$', '', cleaned_response)
-                logger.info(f"[数据整合] Markdown清理完成")
-
-            # 移除thinking标签和思考过程
-            thinking_patterns = [
-                (r'<thought>[\s\S]*?</thought>', '', re.IGNORECASE),
-                (r'<thinking>[\s\S]*?</thinking>', '', re.IGNORECASE),
-                (r'<think>[\s\S]*?</think>', '', re.IGNORECASE),
-                (r'思考过程[:：][\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-                (r'分析[:：][\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-                (r'让我先分析[\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-                (r'分析如下[:：][\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-            ]
-
-            for pattern, replacement, *flags in thinking_patterns:
-                flags = flags[0] if flags else 0
-                old_text = cleaned_response
-                cleaned_response = re.sub(pattern, replacement, cleaned_response, flags=flags)
-                if old_text != cleaned_response:
-                    logger.info(f"[数据整合] 清理thinking标签/思考过程: 移除了 {len(old_text) - len(cleaned_response)} 个字符")
-
-            cleaned_response = cleaned_response.strip()
-
-            # 智能提取JSON对象
-            result_json = None
-
-            # 方法1: 尝试直接解析
-            try:
-                result_json = json.loads(cleaned_response)
-                logger.info(f"[数据整合] ✓ JSON解析成功（直接解析）")
-            except json.JSONDecodeError:
-                logger.info(f"[数据整合] 直接解析失败，尝试提取JSON对象...")
-
-            # 方法2: 提取所有JSON对象，找到包含changes的有效JSON
-            if not result_json:
-                json_objects = extract_json_objects(cleaned_response)
-                logger.info(f"[数据整合] 找到 {len(json_objects)} 个JSON对象")
-
-                for i, json_str in enumerate(json_objects):
-                    try:
-                        parsed = json.loads(json_str)
-                        if 'changes' in parsed:
-                            result_json = parsed
-                            logger.info(f"[数据整合] ✓ JSON提取成功（对象{i+1}，包含changes字段）")
-                            break
-                    except json.JSONDecodeError:
-                        continue
-
-            if not result_json:
-                logger.info(f"[数据整合] ✗ 无法提取有效的JSON")
-                raise Exception("无法从LLM响应中提取有效的JSON对象")
-
-            changes = result_json.get('changes', [])
-            logger.info(f"[数据整合] LLM返回的变更数量: {len(changes)}")
+            changes = merge_changes(plan.local_changes, llm_changes)
+            logger.info(f"[数据整合] 合并后的变更数量: {len(changes)}")
 
             # 验证返回的changes格式
             validated_changes = []
@@ -1773,13 +1638,12 @@ def integrate_data(request):
                     logger.info(f"[数据整合] 跳过无效变更（无indicator_id）")
                     continue
 
-                # 打印LLM返回的原始数据
-                logger.info(f"[数据整合] 处理指标{indicator_id}，LLM返回: {change}")
+                # 打印变更的原始数据
+                logger.info(f"[数据整合] 处理指标{indicator_id}，变更: {change}")
 
-                # 验证indicator_id存在
-                try:
-                    indicator = HealthIndicator.objects.get(id=indicator_id)
-                except HealthIndicator.DoesNotExist:
+                # 验证indicator_id属于所选报告
+                indicator = indicators_by_id.get(indicator_id)
+                if indicator is None:
                     logger.info(f"[数据整合] 跳过无效变更（indicator_id={indicator_id}不存在）")
                     continue
 
@@ -1868,45 +1732,25 @@ def integrate_data(request):
 
             return JsonResponse({
                 'success': True,
-                'total_indicators': indicators.count(),
-                'unique_groups': len(indicators_by_name),
+                'total_indicators': len(indicators),
+                'unique_groups': plan.group_count,
+                'llm_groups': plan.ambiguous_count,  # 交给LLM判断的簇数，其余在本地完成
+                'llm_batches': len(plan.batches),
+                'batch_errors': batch_errors,
                 'changed_count': len(validated_changes),
                 'unchanged_count': len(unchanged_indicators),
                 'changes': validated_changes,  # 只包含变更的
                 'all_indicators': all_indicators  # 包含所有指标
             })
 
-        except json.JSONDecodeError as e:
-            logger.info(f"[数据整合] ✗ JSON解析错误: {str(e)}")
-            logger.info(f"[数据整合] LLM响应内容:\n{llm_response[:1000]}")
-
-            # 检查响应是否可能被截断
-            response_len = len(llm_response)
-            logger.info(f"[数据整合] 响应总长度: {response_len} 字符")
-
-            # 检查响应末尾是否为不完整的JSON
-            trimmed = llm_response.strip()
-            if not trimmed.endswith('}') and not trimmed.endswith(']'):
-                logger.info(f"[数据整合] ⚠️  检测到响应可能被截断（不以}}或]结尾）")
-                error_msg = f'LLM响应被截断，max_tokens设置可能不足。当前响应长度: {response_len} 字符。建议增加max_tokens参数或减少数据量。错误详情: {str(e)}'
-            else:
-                error_msg = f'LLM返回格式错误: {str(e)}'
-
-            return JsonResponse({
-                'success': False,
-                'error': error_msg,
-                'response_length': response_len,
-                'llm_response_preview': llm_response[:1000]
-            }, status=500)
         except Exception as e:
             import traceback
             logger.info(f"[数据整合] ✗ 处理失败: {str(e)}")
             logger.info(f"[数据整合] 错误追踪:\n{traceback.format_exc()[:1000]}")
             return JsonResponse({
                 'success': False,
-                'error': f'解析LLM响应失败: {str(e)}',
-                'traceback': traceback.format_exc()[:1000],
-                'llm_response': llm_response[:1000]
+                'error': f'处理整合结果失败: {str(e)}',
+                'traceback': traceback.format_exc()[:1000]
             }, status=500)
 
     except Exception as e:
@@ -1923,7 +1767,12 @@ def integrate_data(request):
 @require_http_methods(["POST"])
 @login_required
 def apply_integration(request):
-    """应用数据整合结果到数据库（仅更新指标，不合并报告）"""
+    """
+    应用数据整合结果到数据库（仅更新指标，不合并报告）
+
+    一次 in_bulk 取出全部目标指标，在内存中校验归属并修改，事务内 bulk_update 写回；
+    返回每条变更的处理结果与耗时
+    """
     try:
         from django.db import transaction
         import time
@@ -1944,99 +1793,122 @@ def apply_integration(request):
                 'error': '没有要应用的更改'
             }, status=400)
 
-        updated_count = 0
-        update_details = []
-        skipped_count = 0
-
-        with transaction.atomic():
-            print(f"[应用更新] 开始事务处理...")
-            start_time = time.time()
+        start_time = time.time()
 
-            for idx, change in enumerate(changes, 1):
-                indicator_id = change.get('indicator_id')
-                change_data = change.get('changes', {})
+        def parse_id(change):
+            try:
+                return int(change.get('indicator_id'))
+            except (AttributeError, TypeError, ValueError):
+                return None
+
+        # 一次查询取出全部目标指标（含所属报告，用于归属校验与结果展示）
+        indicator_ids = [parse_id(change) for change in changes]
+        indicators = HealthIndicator.objects.select_related('checkup').in_bulk(
+            [indicator_id for indicator_id in indicator_ids if indicator_id is not None]
+        )
 
-                print(f"[应用更新] {idx}/{len(changes)} 处理指标 {indicator_id}...")
+        updated = {}
+        update_fields = set()
+        update_details = []
+        results = []
+        renames = []
+        # 体检日期 -> (性别, 年龄)，重新判定状态时使用
+        profiles = {}
+
+        for idx, (change, indicator_id) in enumerate(zip(changes, indicator_ids), 1):
+            change_data = (change.get('changes') if isinstance(change, dict) else None) or {}
+
+            indicator = indicators.get(indicator_id)
+            if indicator is None or indicator.checkup.user_id != request.user.id:
+                print(f"[应用更新] {idx}/{len(changes)} 指标 {indicator_id} ✗ 跳过（指标不存在）")
+                results.append({'indicator_id': indicator_id, 'status': 'skipped', 'error': '指标不存在或无权访问'})
+                continue
 
-                try:
-                    indicator = HealthIndicator.objects.get(
-                        id=indicator_id,
-                        checkup__user=request.user
-                    )
-                except HealthIndicator.DoesNotExist:
-                    print(f"[应用更新]   ✗ 跳过（指标不存在）")
-                    skipped_count += 1
-                    continue
+            before_state = {
+                'indicator_name': indicator.indicator_name,
+                'value': indicator.value,
+                'unit': indicator.unit,
+                'reference_range': indicator.reference_range,
+                'status': indicator.status,
+                'indicator_type': indicator.indicator_type
+            }
 
-                before_state = {
+            # 与逐条保存时的规则一致：名称/值/状态/分类为空时不修改，单位/参考范围允许置空
+            fields = []
+            for field in ('indicator_name', 'value', 'status', 'indicator_type'):
+                if change_data.get(field):
+                    setattr(indicator, field, change_data[field])
+                    fields.append(field)
+            for field in ('unit', 'reference_range'):
+                if change_data.get(field) is not None:
+                    setattr(indicator, field, change_data[field])
+                    fields.append(field)
+
+            if 'indicator_name' in fields and before_state['indicator_name'] != indicator.indicator_name:
+                renames.append((before_state['indicator_name'], indicator.indicator_name))
+
+            # 未指定状态时，名称/值/单位/参考范围变化后按参考范围重新判定
+            if 'status' not in fields and STATUS_SOURCE_FIELDS.intersection(fields):
+                checkup_date = indicator.checkup.checkup_date
+                if checkup_date not in profiles:
+                    profiles[checkup_date] = profile_context(request.user.id, checkup_date)
+                if apply_reference_status([indicator], *profiles[checkup_date]):
+                    fields.append('status')
+
+            updated[indicator.id] = indicator
+            update_fields.update(fields)
+            results.append({'indicator_id': indicator_id, 'status': 'updated', 'fields': fields})
+
+            update_details.append({
+                'indicator_id': indicator_id,
+                'checkup_date': indicator.checkup.checkup_date.strftime('%Y-%m-%d'),
+                'hospital': indicator.checkup.hospital,
+                'before': before_state,
+                'after': {
                     'indicator_name': indicator.indicator_name,
                     'value': indicator.value,
                     'unit': indicator.unit,
                     'reference_range': indicator.reference_range,
                     'status': indicator.status,
                     'indicator_type': indicator.indicator_type
-                }
-
-                print(f"[应用更新]   原始: {indicator.indicator_name} = {indicator.value} {indicator.unit or ''}")
-
-                if change_data.get('indicator_name'):
-                    print(f"[应用更新]   -> 名称: {indicator.indicator_name} -> {change_data['indicator_name']}")
-                    indicator.indicator_name = change_data['indicator_name']
-
-                if change_data.get('value'):
-                    print(f"[应用更新]   -> 值: {indicator.value} -> {change_data['value']}")
-                    indicator.value = change_data['value']
-
-                if change_data.get('unit') is not None:
-                    print(f"[应用更新]   -> 单位: {indicator.unit} -> {change_data['unit']}")
-                    indicator.unit = change_data['unit']
-
-                if change_data.get('reference_range') is not None:
-                    print(f"[应用更新]   -> 参考范围: {indicator.reference_range} -> {change_data['reference_range']}")
-                    indicator.reference_range = change_data['reference_range']
+                },
+                'reason': change.get('reason', '')
+            })
 
-                if change_data.get('status'):
-                    print(f"[应用更新]   -> 状态: {indicator.status} -> {change_data['status']}")
-                    indicator.status = change_data['status']
+        # bulk_update 不调用 save()，名称/值/单位变化时在这里重新换算标准单位
+        if update_fields & HealthIndicator.CANONICAL_SOURCE_FIELDS:
+            canonicalize_indicators(updated.values())
+            update_fields.update({'canonical_value', 'canonical_unit'})
 
-                if change_data.get('indicator_type'):
-                    print(f"[应用更新]   -> 分类: {indicator.indicator_type} -> {change_data['indicator_type']}")
-                    indicator.indicator_type = change_data['indicator_type']
+        with transaction.atomic():
+            if updated and update_fields:
+                HealthIndicator.objects.bulk_update(list(updated.values()), sorted(update_fields), batch_size=500)
 
-                indicator.save()
-                updated_count += 1
-                print(f"[应用更新]   ✓ 保存成功")
+            # 记录已确认的命名映射，后续整合直接复用
+            remembered = remember_name_mappings(request.user, renames)
+            print(f"[应用更新] 记录命名映射: {remembered} 条")
 
-                update_details.append({
-                    'indicator_id': indicator_id,
-                    'checkup_date': indicator.checkup.checkup_date.strftime('%Y-%m-%d'),
-                    'hospital': indicator.checkup.hospital,
-                    'before': before_state,
-                    'after': {
-                        'indicator_name': indicator.indicator_name,
-                        'value': indicator.value,
-                        'unit': indicator.unit,
-                        'reference_range': indicator.reference_range,
-                        'status': indicator.status,
-                        'indicator_type': indicator.indicator_type
-                    },
-                    'reason': change.get('reason', '')
-                })
+        # bulk_update 不触发模型信号，使AI医生工具缓存失效
+        if updated:
+            bump_data_version(request.user.id)
 
-            print(f"[应用更新] 数据整合模式：仅更新指标，不合并报告、不打包ZIP、不删除记录")
+        print(f"[应用更新] 数据整合模式：仅更新指标，不合并报告、不打包ZIP、不删除记录")
 
-        end_time = time.time()
-        duration = end_time - start_time
+        duration = time.time() - start_time
+        skipped_count = sum(1 for result in results if result['status'] == 'skipped')
 
         print(f"[应用更新] ✓ 所有更新完成")
-        print(f"[应用更新] 成功更新: {updated_count} 个指标，跳过: {skipped_count} 个")
+        print(f"[应用更新] 成功更新: {len(updated)} 个指标，跳过: {skipped_count} 个")
         print(f"[应用更新] 耗时: {duration:.2f}秒")
         print(f"{'='*80}\n")
 
         return JsonResponse({
             'success': True,
-            'updated_count': updated_count,
-            'update_details': update_details
+            'updated_count': len(updated),
+            'skipped_count': skipped_count,
+            'update_details': update_details,
+            'results': results,  # 每条变更的处理结果，顺序与请求一致
+            'elapsed_ms': round(duration * 1000, 1)
         })
 
     except Exception as e:
@@ -2482,6 +2354,15 @@ def stream_ai_advice(request):
             # 用于保存到数据库
             prompt = f"[系统提示]\n{system_prompt}\n\n[用户消息]\n{user_message}"
 
+        # 通用问题答案缓存：附带了用户自己的报告、药单或对话历史时不使用
+        answer_cache = None
+        if data.get('use_answer_cache', True):
+            answer_cache = AnswerCache.for_request(
+                question, prompt, provider, model_name, api_url=api_url,
+                includes_user_data=bool(is_continuation or has_health_data or medication_data_text)
+            )
+        cached = answer_cache.lookup() if answer_cache else None
+
         # 生成流式响应
         def generate():
             """生成流式响应"""
@@ -2494,15 +2375,24 @@ def stream_ai_advice(request):
                 # 首先发送prompt内容
                 yield f"data: {json.dumps({'prompt': prompt}, ensure_ascii=False)}\n\n"
 
+                if cached:
+                    # 命中缓存：直接按流式格式输出缓存答案
+                    cached_answer, similarity = cached
+                    print(f"[AI医生-流式] 命中答案缓存，相似度 {similarity}")
+                    for content in iter_answer_chunks(cached_answer):
+                        full_response += content
+                        yield f"data: {json.dumps({'content': content, 'done': False}, ensure_ascii=False)}\n\n"
+                    yield f"data: {json.dumps({'done': True, 'cached': True, 'similarity': similarity}, ensure_ascii=False)}\n\n"
+
                 # 根据提供商选择不同的流式调用方式
-                if provider == 'gemini':
+                elif provider == 'gemini':
                     # 使用 LangChain 的 ChatGoogleGenerativeAI
-                    from langchain_google_genai import ChatGoogleGenerativeAI
                     from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 
-                    llm = ChatGoogleGenerativeAI(
-                        model=model_name,
-                        google_api_key=api_key,
+                    llm = get_chat_model(
+                        'gemini',
+                        model_name,
+                        api_key=api_key,
                         temperature=0.7,
                         timeout=timeout,
                         streaming=True
@@ -2550,25 +2440,13 @@ def stream_ai_advice(request):
 
                 else:
                     # 使用 OpenAI 兼容格式（LangChain）
-                    from langchain_openai import ChatOpenAI
                     from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 
-                    # 处理 API URL，避免重复路径
-                    # LangChain 会自动添加 /chat/completions，所以如果 URL 中已包含，需要移除
-                    base_url = api_url
-                    if '/chat/completions' in base_url:
-                        # 如果 URL 已包含 /chat/completions，移除它（包括可能的 /v1 前缀）
-                        base_url = base_url.split('/chat/completions')[0].rstrip('/')
-                    elif base_url.endswith('/'):
-                        # 移除末尾的斜杠
-                        base_url = base_url.rstrip('/')
-
-                    # 初始化LangChain LLM
-                    llm = ChatOpenAI(
-                        model=model_name,
-                        # 兼容本地OpenAI兼容服务：允许未配置API Key
+                    llm = get_chat_model(
+                        'openai',
+                        model_name,
                         api_key=api_key or 'not-needed',
-                        base_url=base_url,
+                        api_url=api_url,
                         temperature=0.3,
                         max_tokens=max_tokens,
                         timeout=timeout,
@@ -2598,6 +2476,9 @@ def stream_ai_advice(request):
                     # 流式输出完成
                     yield f"data: {json.dumps({'done': True}, ensure_ascii=False)}\n\n"
 
+                if answer_cache and not cached and full_response:
+                    answer_cache.store(full_response)
+
             except Exception as e:
                 # 发送错误信息
                 error_msg = str(e)
@@ -3099,49 +2980,53 @@ def stream_advice_sync(request):
         user_message = "\n".join(user_message_parts)
         prompt = f"{system_prompt}\n\n{user_message}"
 
-        print(f"[小程序-同步AI] 开始调用LLM，问题长度: {len(question)}")
-
-        # 调用LLM（非流式）
-        from langchain_core.messages import HumanMessage
-
-        if provider == 'gemini':
-            from langchain_google_genai import ChatGoogleGenerativeAI
-
-            llm = ChatGoogleGenerativeAI(
-                model=model_name,
-                google_api_key=api_key,
-                temperature=0.3,
-                timeout=timeout,
-                streaming=False
+        # 通用问题答案缓存：附带了用户自己的报告、药单或对话历史时不使用
+        answer_cache = None
+        if data.get('use_answer_cache', True):
+            answer_cache = AnswerCache.for_request(
+                question, prompt, provider, model_name, api_url=api_url,
+                includes_user_data=bool(is_continuation or has_health_data or medication_data_text)
             )
+        cached = answer_cache.lookup() if answer_cache else None
+
+        if cached:
+            full_response, similarity = cached
+            print(f"[小程序-同步AI] 命中答案缓存，相似度 {similarity}")
         else:
-            from langchain_openai import ChatOpenAI
-
-            # 处理 API URL
-            base_url = api_url
-            if '/chat/completions' in base_url:
-                base_url = base_url.split('/chat/completions')[0].rstrip('/')
-            elif base_url.endswith('/'):
-                base_url = base_url.rstrip('/')
-
-            # 初始化LangChain LLM（非流式）
-            llm = ChatOpenAI(
-                model=model_name,
-                # 兼容本地OpenAI兼容服务：允许未配置API Key
-                api_key=api_key or 'not-needed',
-                base_url=base_url,
-                temperature=0.3,
-                max_tokens=max_tokens,
-                timeout=timeout,
-                streaming=False
-            )
+            print(f"[小程序-同步AI] 开始调用LLM，问题长度: {len(question)}")
+
+            # 调用LLM（非流式）
+            from langchain_core.messages import HumanMessage
+
+            if provider == 'gemini':
+                llm = get_chat_model(
+                    'gemini',
+                    model_name,
+                    api_key=api_key,
+                    temperature=0.3,
+                    timeout=timeout,
+                    streaming=False
+                )
+            else:
+                llm = get_chat_model(
+                    'openai',
+                    model_name,
+                    api_key=api_key or 'not-needed',
+                    api_url=api_url,
+                    temperature=0.3,
+                    max_tokens=max_tokens,
+                    timeout=timeout,
+                    streaming=False
+                )
 
-        # 调用LLM
-        messages = [HumanMessage(content=prompt)]
-        result = llm.invoke(messages)
-        full_response = result.content
+            # 调用LLM
+            messages = [HumanMessage(content=prompt)]
+            result = llm.invoke(messages)
+            full_response = result.content
 
-        print(f"[小程序-同步AI] LLM响应成功，长度: {len(full_response)}")
+            print(f"[小程序-同步AI] LLM响应成功，长度: {len(full_response)}")
+            if answer_cache:
+                answer_cache.store(full_response)
 
         # 保存到数据库
         if not conversation:
@@ -3171,7 +3056,8 @@ def stream_advice_sync(request):
             'answer': full_response,
             'prompt': prompt,
             'conversation_id': conversation.id,
-            'advice_id': advice.id
+            'advice_id': advice.id,
+            'cached': bool(cached)
         })
 
     except Exception as e:
@@ -3183,6 +3069,11 @@ def stream_advice_sync(request):
         }, status=500)
 
 
+# 流式上传时边解析边保存：每攒够这么多指标，或距上次保存超过这么多秒，就保存一批
+STREAM_INDICATOR_BATCH_SIZE = 5
+STREAM_INDICATOR_FLUSH_SECONDS = 2
+
+
 @login_required
 def stream_upload_and_process(request):
     """流式上传并处理体检报告（带实时进度反馈）"""
@@ -3294,6 +3185,7 @@ def stream_upload_and_process(request):
 
                     from .utils import convert_image_file_to_pdf
                     pdf_data = convert_image_file_to_pdf(temp_image_path)
+                    record_checkup_sources(health_checkup.id, [temp_image_path])
 
                     with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
                         tmp_file.write(pdf_data)
@@ -3406,6 +3298,45 @@ def stream_upload_and_process(request):
                 # 发送AI分析开始消息
                 yield f"data: {json.dumps({'status': 'ai_start', 'message': '🤖 AI正在分析数据...'}, ensure_ascii=False)}\n\n"
 
+                # 边接收边解析：indicators 数组中的指标对象一闭合就进入待保存队列，
+                # 攒够一批（或间隔一段时间）即保存并推送给前端，响应被截断时已解析的指标也不会丢失
+                pending_indicators = []
+                saved_indicators = []
+                last_flush = time.time()
+
+                def discard_saved():
+                    """孤立的思考结束标签之前的内容是思考草稿，丢弃已保存的指标"""
+                    pending_indicators.clear()
+                    if saved_indicators:
+                        HealthIndicator.objects.filter(id__in=[i.id for i in saved_indicators]).delete()
+                        saved_indicators.clear()
+
+                scanner = JSONScanner(item_key='indicators', on_item=pending_indicators.append,
+                                      on_reset=discard_saved)
+
+                def flush_indicators(force=False):
+                    nonlocal last_flush
+                    if not pending_indicators:
+                        return
+                    if not force and len(pending_indicators) < STREAM_INDICATOR_BATCH_SIZE \
+                            and time.time() - last_flush < STREAM_INDICATOR_FLUSH_SECONDS:
+                        return
+                    batch = pending_indicators[:]
+                    pending_indicators.clear()
+                    last_flush = time.time()
+                    saved = service.save_indicator_batch(batch, start_index=len(saved_indicators))
+                    saved_indicators.extend(saved)
+                    if saved:
+                        names = '、'.join(i.indicator_name for i in saved[:5])
+                        more = f' 等{len(saved)}项' if len(saved) > 5 else ''
+                        yield f"data: {json.dumps({'status': 'indicators_saved', 'message': f'💾 已保存 {len(saved_indicators)} 个指标（{names}{more}）', 'saved_count': len(saved_indicators), 'indicators': [{'id': i.id, 'indicator_name': i.indicator_name, 'value': i.value, 'unit': i.unit, 'reference_range': i.reference_range, 'status': i.status, 'indicator_type': i.indicator_type} for i in saved]}, ensure_ascii=False)}\n\n"
+
+                def consume_tokens(content):
+                    """扫描新到达的token，推送给前端，并保存已完整的指标"""
+                    yield f"data: {json.dumps({'status': 'llm_token', 'token': content}, ensure_ascii=False)}\n\n"
+                    scanner.feed(content)
+                    yield from flush_indicators()
+
                 # 执行AI分析 - 使用流式输出
                 try:
                     # 获取LLM配置
@@ -3418,6 +3349,7 @@ def stream_upload_and_process(request):
 
                     timeout = int(SystemSettings.get_setting('ai_model_timeout', '300'))
                     llm_response = ""
+                    service.update_progress('saving_data', 70, "AI分析中，边解析边保存指标...")
 
                     if llm_provider == 'gemini':
                         # 获取Gemini配置
@@ -3429,12 +3361,12 @@ def stream_upload_and_process(request):
                             raise Exception("Gemini API密钥未配置")
 
                         # 使用流式调用
-                        from langchain_google_genai import ChatGoogleGenerativeAI
                         from langchain_core.messages import HumanMessage
 
-                        llm = ChatGoogleGenerativeAI(
-                            model=model_name,
-                            google_api_key=api_key,
+                        llm = get_chat_model(
+                            'gemini',
+                            model_name,
+                            api_key=api_key,
                             temperature=0.1,
                             timeout=timeout,
                             streaming=True
@@ -3471,7 +3403,7 @@ def stream_upload_and_process(request):
 
                                 if content:
                                     # 实时发送token给前端
-                                    yield f"data: {json.dumps({'status': 'llm_token', 'token': content}, ensure_ascii=False)}\n\n"
+                                    yield from consume_tokens(content)
                                 else:
                                     print(f"[智能上传] 第{chunk_count}个chunk的content为空")
 
@@ -3491,21 +3423,13 @@ def stream_upload_and_process(request):
                             raise Exception("OpenAI兼容API配置不完整")
 
                         # 使用流式调用OpenAI兼容模式
-                        from langchain_openai import ChatOpenAI
                         from langchain_core.messages import HumanMessage
 
-                        # 处理 API URL
-                        base_url = api_url
-                        if '/chat/completions' in base_url:
-                            # 如果 URL 已包含 /chat/completions，移除它（包括可能的 /v1 前缀）
-                            base_url = base_url.split('/chat/completions')[0].rstrip('/')
-                        elif base_url.endswith('/'):
-                            base_url = base_url.rstrip('/')
-
-                        llm = ChatOpenAI(
-                            model=model_name,
+                        llm = get_chat_model(
+                            'openai',
+                            model_name,
                             api_key=api_key,
-                            base_url=base_url,
+                            api_url=api_url,
                             temperature=0.1,
                             timeout=timeout,
                             streaming=True
@@ -3519,7 +3443,7 @@ def stream_upload_and_process(request):
                                 content = chunk.content
                                 llm_response += content
                                 # 实时发送token给前端
-                                yield f"data: {json.dumps({'status': 'llm_token', 'token': content}, ensure_ascii=False)}\n\n"
+                                yield from consume_tokens(content)
 
                     # 解析LLM响应
                     print(f"[智能上传] LLM响应长度: {len(llm_response)} 字符")
@@ -3528,15 +3452,11 @@ def stream_upload_and_process(request):
                     if not llm_response or len(llm_response.strip()) == 0:
                         raise Exception("LLM返回空响应，请检查API配置和网络连接")
 
-                    # 清理响应中的markdown代码块标记
-                    cleaned_response = llm_response.strip()
-                    if cleaned_response.startswith('```'):
-                        import re
-                        cleaned_response = re.sub(r'^```\w*\n?', '', cleaned_response)
-                        cleaned_response = re.sub(r'\n?```$', '', cleaned_response)
-
-                    # 解析JSON
-                    structured_data = json.loads(cleaned_response)
+                    # 输入结束：修复截断的JSON，保存剩余指标
+                    structured_data = select_object(scanner.close(), required_key='indicators')
+                    yield from flush_indicators(force=True)
+                    if structured_data is None:
+                        raise Exception("无法从LLM响应中提取有效的JSON对象")
 
                     # 保存LLM原始结果用于调试
                     service.document_processing.ai_result = structured_data
@@ -3550,14 +3470,23 @@ def stream_upload_and_process(request):
                     import traceback
                     error_trace = traceback.format_exc()
                     response_preview = llm_response[:500] if llm_response else '无响应'
-                    yield f"data: {json.dumps({'error': f'AI分析失败: {str(e)}', 'response_preview': response_preview, 'response_length': len(llm_response) if llm_response else 0}, ensure_ascii=False)}\n\n"
+                    try:
+                        yield from flush_indicators(force=True)
+                    except Exception as flush_error:
+                        print(f"[智能上传] 保存剩余指标失败: {flush_error}")
+                    if saved_indicators:
+                        # 流中断：保留中断前已解析并保存的指标
+                        service.update_progress('completed', 100, f"AI分析中断，已保存{len(saved_indicators)}个指标")
+                    yield f"data: {json.dumps({'error': f'AI分析失败: {str(e)}', 'response_preview': response_preview, 'response_length': len(llm_response) if llm_response else 0, 'checkup_id': health_checkup.id, 'indicators_count': len(saved_indicators)}, ensure_ascii=False)}\n\n"
                     return
 
-                # 发送保存开始消息
-                yield f"data: {json.dumps({'status': 'saving_start', 'message': '💾 正在保存到数据库...'}, ensure_ascii=False)}\n\n"
-
-                # 保存数据
-                saved_count = service.save_health_indicators(structured_data)
+                if saved_indicators:
+                    saved_count = len(saved_indicators)
+                    service.update_progress('completed', 100, f"处理完成 - 保存了{saved_count}个指标")
+                else:
+                    # 指标不在标准的 indicators 数组中（未能边接收边保存），整体保存一次
+                    yield f"data: {json.dumps({'status': 'saving_start', 'message': '💾 正在保存到数据库...'}, ensure_ascii=False)}\n\n"
+                    saved_count = service.save_health_indicators(structured_data) or 0
 
                 # 计算处理时间
                 end_time = time.time()
@@ -3588,7 +3517,6 @@ def stream_upload_and_process(request):
 def stream_integrate_data(request):
     """流式数据整合（带实时AI思考过程）"""
     from django.http import StreamingHttpResponse
-    import time
 
     if request.method != 'POST':
         return JsonResponse({
@@ -3599,8 +3527,6 @@ def stream_integrate_data(request):
     def generate():
         try:
             import json
-            import re
-            from .services import call_llm_for_integration, call_gemini_api
             from .models import SystemSettings
 
             # 获取请求数据
@@ -3625,210 +3551,51 @@ def stream_integrate_data(request):
                 return
 
             # 获取所有指标
-            indicators = HealthIndicator.objects.filter(
+            indicators = list(HealthIndicator.objects.filter(
                 checkup__in=checkups
-            ).select_related('checkup')
-
-            yield f"data: {json.dumps({'status': 'loading_data', 'message': f'加载了 {indicators.count()} 个指标'}, ensure_ascii=False)}\n\n"
-
-            # 按指标名称分组
-            indicators_by_name = {}
-            for indicator in indicators:
-                name_key = indicator.indicator_name.lower().strip()
-                if name_key not in indicators_by_name:
-                    indicators_by_name[name_key] = []
-                indicators_by_name[name_key].append(indicator)
-
-            yield f"data: {json.dumps({'status': 'grouping', 'message': f'分组完成，共 {len(indicators_by_name)} 组指标'}, ensure_ascii=False)}\n\n"
-
-            # 准备发送给LLM的数据
-            indicators_summary = []
-            for name_key, inds in indicators_by_name.items():
-                variants = []
-                for ind in inds:
-                    variants.append({
-                        'id': ind.id,
-                        'name': ind.indicator_name,
-                        'value': ind.value,
-                        'unit': ind.unit,
-                        'reference_range': ind.reference_range,
-                        'status': ind.status,
-                        'type': ind.indicator_type
-                    })
-                indicators_summary.append({
-                    'key': name_key,
-                    'variants': variants
-                })
+            ).select_related('checkup'))
+            indicators_by_id = {indicator.id: indicator for indicator in indicators}
 
-            # 构建Prompt，使用统一的提示词配置
-            indicators_data_json = json.dumps(indicators_summary, ensure_ascii=False, indent=2)
-            system_prompt, user_prompt = build_data_integration_prompt(indicators_data_json, user_prompt)
+            yield f"data: {json.dumps({'status': 'loading_data', 'message': f'加载了 {len(indicators)} 个指标'}, ensure_ascii=False)}\n\n"
 
-            yield f"data: {json.dumps({'status': 'prompt_ready', 'message': f'📋 Prompt构建完成，长度: {len(user_prompt)} 字符'}, ensure_ascii=False)}\n\n"
-
-            # 获取LLM提供商配置
-            llm_config = SystemSettings.get_llm_config()
-            llm_provider = llm_config.get('provider', 'openai')
-
-            yield f"data: {json.dumps({'status': 'calling_llm', 'message': f'🤖 正在调用 {llm_provider.upper()} API...'}, ensure_ascii=False)}\n\n"
-
-            # 调用LLM
-            timeout = int(SystemSettings.get_setting('ai_model_timeout', '300'))
-
-            try:
-                if llm_provider == 'gemini':
-                    # 获取Gemini配置
-                    gemini_config = SystemSettings.get_gemini_config()
-                    api_key = gemini_config.get('api_key', '')
-                    model_name = gemini_config.get('model_name', 'gemini-2.5-flash-exp')
-                    api_url = gemini_config.get('api_url', '')
-
-                    if not api_key:
-                        raise Exception("Gemini API密钥未配置")
-
-                    # 判断是否为百川API
-                    is_baichuan = (
-                        llm_provider == 'baichuan' or
-                        (api_url and 'baichuan' in api_url.lower()) or
-                        (model_name and 'Baichuan' in model_name)
-                    )
+            # 本地预处理：套用已确认的命名映射、按相似名称聚类，只有存在歧义的簇交给LLM
+            plan = plan_integration(request.user, indicators, user_prompt)
 
-                    yield f"data: {json.dumps({'status': 'llm_thinking', 'message': '💭 Gemini正在分析数据...'}, ensure_ascii=False)}\n\n"
+            yield f"data: {json.dumps({'status': 'grouping', 'message': f'分组完成，共 {plan.group_count} 组指标，本地确定 {len(plan.local_changes)} 项变更'}, ensure_ascii=False)}\n\n"
 
-                    # 使用流式调用
-                    from langchain_google_genai import ChatGoogleGenerativeAI
-                    from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+            yield f"data: {json.dumps({'status': 'prompt_ready', 'message': f'📋 {plan.ambiguous_count} 组相近指标需AI判断，分为 {len(plan.batches)} 批（{plan.llm_indicator_count} 个指标）'}, ensure_ascii=False)}\n\n"
 
-                    llm = ChatGoogleGenerativeAI(
-                        model=model_name,
-                        google_api_key=api_key,
-                        temperature=0.7,
-                        timeout=timeout,
-                        streaming=True
-                    )
+            llm_changes = []
+            batch_errors = []
+            if plan.batches:
+                llm_provider = SystemSettings.get_llm_config().get('provider', 'openai')
+                yield f"data: {json.dumps({'status': 'calling_llm', 'message': f'🤖 正在并行调用 {llm_provider.upper()} API...'}, ensure_ascii=False)}\n\n"
+                yield f"data: {json.dumps({'status': 'llm_thinking', 'message': '💭 LLM正在分析数据...'}, ensure_ascii=False)}\n\n"
 
-                    # 根据是否为百川API使用不同的消息格式
-                    if is_baichuan:
-                        messages = [AIMessage(content=system_prompt), HumanMessage(content=user_prompt)]
+                # 各批并行执行，按完成顺序整批输出响应，避免多路token交错
+                for index, llm_response, batch_changes, error in iter_integration_batches(plan, user_prompt):
+                    if error:
+                        batch_errors.append({'batch': index + 1, 'error': error})
+                        token = f"[第{index + 1}/{len(plan.batches)}批] 失败: {error}\n"
                     else:
-                        messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
-                    llm_response = ""
-
-                    # 流式输出token
-                    for chunk in llm.stream(messages):
-                        if hasattr(chunk, 'content') and chunk.content:
-                            # Gemini 返回的 content 可能是列表或字符串
-                            chunk_content = chunk.content
-
-                            # 如果是列表，提取文本内容
-                            if isinstance(chunk_content, list):
-                                content_text = ""
-                                for item in chunk_content:
-                                    if isinstance(item, str):
-                                        content_text += item
-                                    elif hasattr(item, 'text'):
-                                        content_text += item.text
-                                    elif isinstance(item, dict) and 'text' in item:
-                                        content_text += item['text']
-                                content = content_text
-                            else:
-                                # 如果已经是字符串，直接使用
-                                content = str(chunk_content)
-
-                            llm_response += content
+                        llm_changes.extend(batch_changes)
+                        token = f"[第{index + 1}/{len(plan.batches)}批]\n{llm_response}\n"
+                    yield f"data: {json.dumps({'status': 'llm_token', 'token': token}, ensure_ascii=False)}\n\n"
 
-                            if content:
-                                # 实时发送token给前端
-                                yield f"data: {json.dumps({'status': 'llm_token', 'token': content}, ensure_ascii=False)}\n\n"
-
-                    # 检查响应是否为空
-                    if not llm_response or len(llm_response.strip()) == 0:
-                        raise Exception("Gemini返回空响应，请检查API配置和网络连接")
-                else:
-                    # 获取OpenAI兼容配置
-                    api_key = llm_config.get('api_key', '')
-                    api_url = llm_config.get('api_url', '')
-                    model_name = llm_config.get('model_name', 'gpt-4o-mini')
-
-                    if not api_key or not api_url:
-                        raise Exception("OpenAI兼容API配置不完整")
-
-                    yield f"data: {json.dumps({'status': 'llm_thinking', 'message': '💭 LLM正在分析数据...'}, ensure_ascii=False)}\n\n"
-
-                    # 使用流式调用OpenAI兼容模式
-                    from langchain_openai import ChatOpenAI
-                    from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-
-                    # 判断是否为百川API
-                    is_baichuan = (
-                        llm_provider == 'baichuan' or
-                        (api_url and 'baichuan' in api_url.lower()) or
-                        (model_name and 'Baichuan' in model_name)
-                    )
-
-                    # 处理 API URL
-                    base_url = api_url
-                    if '/chat/completions' in base_url:
-                        # 如果 URL 已包含 /chat/completions，移除它（包括可能的 /v1 前缀）
-                        base_url = base_url.split('/chat/completions')[0].rstrip('/')
-                    elif base_url.endswith('/'):
-                        base_url = base_url.rstrip('/')
-
-                    llm = ChatOpenAI(
-                        model=model_name,
-                        api_key=api_key,
-                        base_url=base_url,
-                        temperature=0.7,
-                        timeout=timeout,
-                        streaming=True
-                    )
-
-                    # 根据是否为百川API使用不同的消息格式
-                    if is_baichuan:
-                        messages = [AIMessage(content=system_prompt), HumanMessage(content=user_prompt)]
-                    else:
-                        messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
-                    llm_response = ""
-
-                    # 流式输出token
-                    for chunk in llm.stream(messages):
-                        if hasattr(chunk, 'content') and chunk.content:
-                            content = chunk.content
-                            llm_response += content
-                            # 实时发送token给前端
-                            yield f"data: {json.dumps({'status': 'llm_token', 'token': content}, ensure_ascii=False)}\n\n"
+                if len(batch_errors) == len(plan.batches):
+                    error_message = f"调用LLM失败: {batch_errors[0]['error']}"
+                    yield f"data: {json.dumps({'error': error_message}, ensure_ascii=False)}\n\n"
+                    return
 
-                yield f"data: {json.dumps({'status': 'llm_complete', 'message': f'✅ LLM返回响应，长度: {len(llm_response)} 字符'}, ensure_ascii=False)}\n\n"
+                yield f"data: {json.dumps({'status': 'llm_complete', 'message': f'✅ LLM完成 {len(plan.batches) - len(batch_errors)}/{len(plan.batches)} 批'}, ensure_ascii=False)}\n\n"
 
-            except Exception as e:
-                yield f"data: {json.dumps({'error': f'调用LLM失败: {str(e)}'}, ensure_ascii=False)}\n\n"
-                return
-
-            # 解析LLM响应
+            # 合并本地变更与LLM变更
             try:
-                yield f"data: {json.dumps({'status': 'parsing', 'message': '📊 正在解析LLM响应...'}, ensure_ascii=False)}\n\n"
-
-                cleaned_response = llm_response.strip()
-                print(f"[数据整合] 原始响应长度: {len(llm_response)} 字符")
-                print(f"[数据整合] 清理后响应长度: {len(cleaned_response)} 字符")
-                print(f"[数据整合] 响应前500字符: {cleaned_response[:500]}")
+                yield f"data: {json.dumps({'status': 'parsing', 'message': '📊 正在合并整合结果...'}, ensure_ascii=False)}\n\n"
 
-                if not cleaned_response:
-                    raise Exception("LLM返回空响应")
+                changes = merge_changes(plan.local_changes, llm_changes)
 
-                if cleaned_response.startswith('```'):
-                    cleaned_response = re.sub(r'^```\w*\n?', '', cleaned_response)
-                    cleaned_response = re.sub(r'\n?```$', '', cleaned_response)
-
-                json_match = re.search(r'\{[\s\S]*\}', cleaned_response)
-                if json_match:
-                    result_json = json.loads(json_match.group())
-                else:
-                    result_json = json.loads(cleaned_response)
-
-                changes = result_json.get('changes', [])
-
-                yield f"data: {json.dumps({'status': 'parsed', 'message': f'✅ 解析完成，LLM建议更新 {len(changes)} 个指标'}, ensure_ascii=False)}\n\n"
+                yield f"data: {json.dumps({'status': 'parsed', 'message': f'✅ 合并完成，建议更新 {len(changes)} 个指标'}, ensure_ascii=False)}\n\n"
 
                 # 验证变更
                 validated_changes = []
@@ -3840,9 +3607,8 @@ def stream_integrate_data(request):
                     if not indicator_id:
                         continue
 
-                    try:
-                        indicator = HealthIndicator.objects.get(id=indicator_id)
-                    except HealthIndicator.DoesNotExist:
+                    indicator = indicators_by_id.get(indicator_id)
+                    if indicator is None:
                         continue
 
                     original_data = {
@@ -3898,12 +3664,10 @@ def stream_integrate_data(request):
                 all_indicators = validated_changes + unchanged_indicators
 
                 # 发送最终结果
-                yield f"data: {json.dumps({'status': 'done', 'message': '✅ 整合完成！', 'total_indicators': indicators.count(), 'unique_groups': len(indicators_by_name), 'changed_count': len(validated_changes), 'unchanged_count': len(unchanged_indicators), 'changes': validated_changes, 'all_indicators': all_indicators}, ensure_ascii=False)}\n\n"
+                yield f"data: {json.dumps({'status': 'done', 'message': '✅ 整合完成！', 'total_indicators': len(indicators), 'unique_groups': plan.group_count, 'llm_groups': plan.ambiguous_count, 'llm_batches': len(plan.batches), 'batch_errors': batch_errors, 'changed_count': len(validated_changes), 'unchanged_count': len(unchanged_indicators), 'changes': validated_changes, 'all_indicators': all_indicators}, ensure_ascii=False)}\n\n"
 
-            except json.JSONDecodeError as e:
-                yield f"data: {json.dumps({'error': f'JSON解析错误: {str(e)}', 'response_preview': llm_response[:1000], 'response_length': len(llm_response)}, ensure_ascii=False)}\n\n"
             except Exception as e:
-                yield f"data: {json.dumps({'error': f'解析失败: {str(e)}', 'response_preview': llm_response[:500] if llm_response else '无响应'}, ensure_ascii=False)}\n\n"
+                yield f"data: {json.dumps({'error': f'处理整合结果失败: {str(e)}'}, ensure_ascii=False)}\n\n"
 
         except Exception as e:
             import traceback
@@ -4124,7 +3888,8 @@ def api_medications(request):
     if request.method == 'GET':
         # 获取用户的所有药单
         from .models import Medication
-        medications = Medication.objects.filter(user=request.user).order_by('-created_at')
+        from .adherence import with_taken_days
+        medications = with_taken_days(Medication.objects.filter(user=request.user).order_by('-created_at'))
 
         medication_list = []
         for med in medications:
@@ -4412,6 +4177,44 @@ def api_medication_records(request, medication_id):
     })
 
 
+@csrf_exempt
+@require_http_methods(["GET"])
+@login_required
+def api_medication_adherence(request):
+    """
+    获取服药依从性统计
+
+    查询参数：
+    - start_date / end_date: 统计区间（YYYY-MM-DD，默认最近30天）
+    - medication_id / group_id: 仅统计指定药单或药单组（可选）
+    """
+    from .adherence import compute_adherence
+
+    try:
+        start_date = request.GET.get('start_date')
+        end_date = request.GET.get('end_date')
+        medication_id = request.GET.get('medication_id')
+        group_id = request.GET.get('group_id')
+
+        stats = compute_adherence(
+            request.user,
+            start_date=datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+            end_date=datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None,
+            medication_ids=[int(medication_id)] if medication_id else None,
+            group_ids=[int(group_id)] if group_id else None,
+        )
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': '参数格式错误'
+        }, status=400)
+
+    return JsonResponse({
+        'success': True,
+        **stats
+    })
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 @login_required
@@ -4464,11 +4267,12 @@ def api_conversation_resources(request, conversation_id):
             try:
                 medication_ids = json.loads(latest_advice.selected_medications)
                 if medication_ids:
-                    medications_qs = Medication.objects.filter(
+                    from .adherence import with_taken_days
+                    medications_qs = with_taken_days(Medication.objects.filter(
                         id__in=medication_ids,
                         user=request.user,
                         is_active=True
-                    )
+                    ))
                     for med in medications_qs:
                         medications.append({
                             'id': med.id,
@@ -5052,16 +4856,22 @@ def upload_avatar(request):
         avatars_dir = os.path.join(settings.MEDIA_ROOT, 'avatars')
         os.makedirs(avatars_dir, exist_ok=True)
 
+        # 按 EXIF 方向旋正并缩小为缩略图（JPEG）后保存
+        from .image_pipeline import render
+        try:
+            avatar_data = render(avatar_file, 'thumbnail')
+        except Exception as e:
+            print(f"头像图片处理失败: {str(e)}")
+            return JsonResponse({'success': False, 'error': '无法识别的图片文件'}, status=400)
+
         # 生成唯一文件名
         import uuid
-        file_ext = os.path.splitext(avatar_file.name)[1]
-        unique_filename = f"{request.user.id}_{uuid.uuid4().hex[:8]}{file_ext}"
+        unique_filename = f"{request.user.id}_{uuid.uuid4().hex[:8]}.jpg"
         file_path = os.path.join(avatars_dir, unique_filename)
 
         # 保存文件
-        with open(file_path, 'wb+') as destination:
-            for chunk in avatar_file.chunks():
-                destination.write(chunk)
+        with open(file_path, 'wb') as destination:
+            destination.write(avatar_data)
 
         # 构建 URL
         avatar_url = f"{settings.MEDIA_URL}avatars/{unique_filename}"
@@ -5094,143 +4904,84 @@ def api_medication_recognize_image(request):
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': '只支持 POST 请求'}, status=405)
 
+    from .medication_jobs import MedicationRecognitionError, recognize_image, save_upload, validate_image
+    import tempfile
+    import shutil
+
     try:
         if 'image' not in request.FILES:
             return JsonResponse({'success': False, 'error': '未找到上传的图片'}, status=400)
 
         image_file = request.FILES['image']
-
-        allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp']
-        if image_file.content_type not in allowed_types:
-            return JsonResponse({'success': False, 'error': '只支持 JPG、PNG、GIF、WEBP 格式的图片'}, status=400)
-
-        max_size = 10 * 1024 * 1024
-        if image_file.size > max_size:
-            return JsonResponse({'success': False, 'error': '图片大小不能超过 10MB'}, status=400)
-
-        from django.conf import settings
-        import uuid
-        import tempfile
-        import os
+        validate_image(image_file)
 
         temp_dir = tempfile.mkdtemp()
-        file_ext = os.path.splitext(image_file.name)[1]
-        temp_file_path = os.path.join(temp_dir, f"medication_{uuid.uuid4().hex}{file_ext}")
-
-        with open(temp_file_path, 'wb+') as destination:
-            for chunk in image_file.chunks():
-                destination.write(chunk)
-
-        from .services import MedicationRecognitionService
-        from .models import MedicationGroup, Medication
-
-        service = MedicationRecognitionService()
-        result = service.recognize_medication_image(temp_file_path)
-
         try:
-            os.unlink(temp_file_path)
-            os.rmdir(temp_dir)
-        except:
-            pass
-
-        medications_data = result.get('medications', [])
-        summary = result.get('summary', '')
+            payload = recognize_image(request.user, save_upload(image_file, temp_dir))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
 
-        if not medications_data:
+        if payload is None:
             return JsonResponse({
                 'success': False,
                 'error': '未能从图片中识别出药物信息'
             }, status=400)
 
-        group_name = f"药单组 {timezone.now().strftime('%Y-%m-%d %H:%M')}"
-        medication_group = MedicationGroup.objects.create(
-            user=request.user,
-            name=group_name,
-            ai_summary=summary,
-            raw_result=result
-        )
-
-        if image_file:
-            medication_group.source_image.save(
-                f"medication_{uuid.uuid4().hex}{file_ext}",
-                image_file,
-                save=True
-            )
-
-        created_medications = []
-        from datetime import datetime as dt
-
-        for med_data in medications_data:
-            medicine_name = med_data.get('medicine_name', '').strip()
-            dosage = med_data.get('dosage', '').strip()
-
-            if not medicine_name:
-                continue
-
-            start_date_str = med_data.get('start_date')
-            end_date_str = med_data.get('end_date')
-
-            try:
-                if start_date_str and start_date_str != 'null':
-                    start_date = dt.strptime(start_date_str, '%Y-%m-%d').date()
-                else:
-                    start_date = timezone.now().date()
-            except:
-                start_date = timezone.now().date()
-
-            try:
-                if end_date_str and end_date_str != 'null':
-                    end_date = dt.strptime(end_date_str, '%Y-%m-%d').date()
-                else:
-                    end_date = start_date + timedelta(days=7)
-            except:
-                end_date = start_date + timedelta(days=7)
+        return JsonResponse({'success': True, **payload})
 
-            notes = med_data.get('notes', '')
-            if notes == 'null':
-                notes = ''
+    except MedicationRecognitionError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status_code)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({
+            'success': False,
+            'error': f'识别失败: {str(e)}'
+        }, status=500)
 
-            medication = Medication.objects.create(
-                user=request.user,
-                group=medication_group,
-                medicine_name=medicine_name,
-                dosage=dosage or '按医嘱服用',
-                start_date=start_date,
-                end_date=end_date,
-                notes=notes
-            )
 
-            created_medications.append({
-                'id': medication.id,
-                'medicine_name': medication.medicine_name,
-                'dosage': medication.dosage,
-                'start_date': medication.start_date.strftime('%Y-%m-%d'),
-                'end_date': medication.end_date.strftime('%Y-%m-%d'),
-                'notes': medication.notes,
-                'total_days': medication.total_days,
-            })
+@csrf_exempt
+@require_http_methods(["POST"])
+@login_required
+def api_medication_recognize_jobs(request):
+    """
+    提交药单图片识别任务（支持多张图片，字段名 images，也兼容单张 image）
 
-        return JsonResponse({
-            'success': True,
-            'group': {
-                'id': medication_group.id,
-                'name': medication_group.name,
-                'ai_summary': medication_group.ai_summary,
-                'medication_count': len(created_medications),
-                'created_at': medication_group.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            },
-            'medications': created_medications,
-            'raw_result': result
-        })
+    多张图片在后台并行识别，立即返回 job_id；轮询状态接口，每张图片识别完成后即可在 items 中拿到其药单组
+    """
+    from .medication_jobs import MedicationRecognitionError, submit_recognition_job
 
+    image_files = request.FILES.getlist('images') or request.FILES.getlist('image')
+    try:
+        job = submit_recognition_job(request.user, image_files)
+    except MedicationRecognitionError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status_code)
     except Exception as e:
         import traceback
         traceback.print_exc()
         return JsonResponse({
             'success': False,
-            'error': f'识别失败: {str(e)}'
+            'error': f'提交识别任务失败: {str(e)}'
         }, status=500)
 
+    return JsonResponse({'success': True, 'job': job}, status=202)
+
+
+@require_http_methods(["GET"])
+@login_required
+def api_medication_recognize_job_status(request, job_id):
+    """查询药单图片识别任务状态与已完成的识别结果"""
+    from .medication_jobs import get_recognition_job
+
+    job = get_recognition_job(request.user, job_id)
+    if job is None:
+        return JsonResponse({
+            'success': False,
+            'error': '识别任务不存在或已过期'
+        }, status=404)
+
+    return JsonResponse({'success': True, 'job': job})
+
 
 @csrf_exempt
 @login_required
@@ -5239,13 +4990,14 @@ def api_medication_groups(request):
     if request.method != 'GET':
         return JsonResponse({'success': False, 'error': '只支持 GET 请求'}, status=405)
 
-    from .models import MedicationGroup, Medication
+    from .models import MedicationGroup
+    from .adherence import with_group_medications
 
-    groups = MedicationGroup.objects.filter(user=request.user).order_by('-created_at')
+    groups = with_group_medications(MedicationGroup.objects.filter(user=request.user).order_by('-created_at'))
 
     group_list = []
     for group in groups:
-        medications = Medication.objects.filter(group=group)
+        medications = group.medications.all()
         medication_list = []
         for med in medications:
             medication_list.append({
@@ -5292,7 +5044,8 @@ def api_medication_group_detail(request, group_id):
         }, status=404)
 
     if request.method == 'GET':
-        medications = Medication.objects.filter(group=group)
+        from .adherence import with_taken_days
+        medications = with_taken_days(Medication.objects.filter(group=group))
         medication_list = []
         for med in medications:
             medication_list.append({
@@ -5392,7 +5145,8 @@ def api_medication_group_create(request):
 @login_required
 def api_medication_group_checkin(request, group_id):
     """药单组批量签到"""
-    from .models import MedicationGroup, Medication, MedicationRecord
+    from .models import MedicationGroup, Medication
+    from .adherence import bulk_checkin
 
     try:
         group = MedicationGroup.objects.get(id=group_id, user=request.user)
@@ -5413,27 +5167,13 @@ def api_medication_group_checkin(request, group_id):
 
         record_date_obj = datetime.strptime(record_date, '%Y-%m-%d').date()
 
-        medications = Medication.objects.filter(group=group, is_active=True)
-
-        success_count = 0
-        skipped_count = 0
+        medication_ids = Medication.objects.filter(
+            group=group, is_active=True
+        ).values_list('id', flat=True)
 
-        for med in medications:
-            existing = MedicationRecord.objects.filter(
-                medication=med,
-                record_date=record_date_obj
-            ).first()
-
-            if existing:
-                skipped_count += 1
-            else:
-                MedicationRecord.objects.create(
-                    medication=med,
-                    record_date=record_date_obj,
-                    frequency=frequency,
-                    notes=notes
-                )
-                success_count += 1
+        success_count, skipped_count = bulk_checkin(
+            medication_ids, record_date_obj, frequency=frequency, notes=notes, user_id=request.user.id
+        )
 
         return JsonResponse({
             'success': True,
@@ -5455,72 +5195,87 @@ def api_medication_group_checkin(request, group_id):
 @require_http_methods(["POST"])
 @login_required
 def api_medication_auto_cluster(request):
-    """按时间自动聚类药单"""
+    """按时间自动聚类药单（dry_run=true 时只返回拟分组结果，不写库）"""
+    from django.db import transaction
     from .models import MedicationGroup, Medication
-    from collections import defaultdict
+    from .clustering import merge_intervals
 
     try:
         data = json.loads(request.body)
-        days_threshold = data.get('days_threshold', 3)
+        days_threshold = int(data.get('days_threshold', 3))
+        dry_run = data.get('dry_run', False)
+        if not isinstance(dry_run, bool):
+            dry_run = str(dry_run).strip().lower() in ('1', 'true', 'yes')
 
-        ungrouped_medications = Medication.objects.filter(
+        ungrouped_medications = list(Medication.objects.filter(
             user=request.user,
             group__isnull=True
-        ).order_by('start_date')
+        ).only('id', 'medicine_name', 'start_date'))
 
-        if not ungrouped_medications.exists():
+        if not ungrouped_medications:
             return JsonResponse({
                 'success': True,
                 'message': '没有需要聚类的药单',
-                'groups_created': 0
+                'groups_created': 0,
+                'dry_run': dry_run,
+                'groups': []
             })
 
-        clusters = defaultdict(list)
-        current_cluster_start = None
-        current_cluster_meds = []
-
-        for med in ungrouped_medications:
-            if current_cluster_start is None:
-                current_cluster_start = med.start_date
-                current_cluster_meds = [med]
-            else:
-                days_diff = (med.start_date - current_cluster_start).days
-                if days_diff <= days_threshold:
-                    current_cluster_meds.append(med)
-                else:
-                    if len(current_cluster_meds) > 0:
-                        cluster_key = current_cluster_start.strftime('%Y-%m-%d')
-                        clusters[cluster_key] = current_cluster_meds
-                    current_cluster_start = med.start_date
-                    current_cluster_meds = [med]
+        # 按起始日期排序扫描，起始日期与簇内最早起始日期相差不超过阈值的药单归为一簇
+        clusters = [
+            (cluster_start, meds)
+            for cluster_start, _, meds in merge_intervals(
+                ungrouped_medications,
+                start_key=lambda m: m.start_date,
+                gap_days=days_threshold,
+                anchor='start',
+            )
+            if len(meds) >= 2
+        ]
+
+        proposed_groups = [
+            {
+                'name': f"药单组 {cluster_start.strftime('%Y-%m-%d')}",
+                'start_date': cluster_start.strftime('%Y-%m-%d'),
+                'medication_ids': [med.id for med in meds],
+                'medicine_names': [med.medicine_name for med in meds],
+            }
+            for cluster_start, meds in clusters
+        ]
 
-        if current_cluster_meds:
-            cluster_key = current_cluster_start.strftime('%Y-%m-%d')
-            clusters[cluster_key] = current_cluster_meds
+        if dry_run:
+            return JsonResponse({
+                'success': True,
+                'message': f'预计创建 {len(proposed_groups)} 个药单组',
+                'groups_created': 0,
+                'dry_run': True,
+                'groups': proposed_groups
+            })
 
         groups_created = 0
+        now = timezone.now()
 
-        for cluster_date, meds in clusters.items():
-            if len(meds) < 2:
-                continue
-
-            group_name = f'药单组 {cluster_date}'
-            group = MedicationGroup.objects.create(
-                user=request.user,
-                name=group_name,
-                ai_summary=f'自动聚类：包含 {len(meds)} 个药物，起始日期接近'
-            )
-
-            for med in meds:
-                med.group = group
-                med.save()
-
-            groups_created += 1
+        with transaction.atomic():
+            for proposal in proposed_groups:
+                group = MedicationGroup.objects.create(
+                    user=request.user,
+                    name=proposal['name'],
+                    ai_summary=f"自动聚类：包含 {len(proposal['medication_ids'])} 个药物，起始日期接近"
+                )
+                Medication.objects.filter(
+                    id__in=proposal['medication_ids'],
+                    user=request.user,
+                    group__isnull=True
+                ).update(group=group, updated_at=now)
+                proposal['group_id'] = group.id
+                groups_created += 1
 
         return JsonResponse({
             'success': True,
             'message': f'自动聚类完成，创建了 {groups_created} 个药单组',
-            'groups_created': groups_created
+            'groups_created': groups_created,
+            'dry_run': False,
+            'groups': proposed_groups
         })
 
     except Exception as e:
@@ -5538,11 +5293,12 @@ def api_medication_auto_cluster(request):
 def api_medications_without_group(request):
     """获取未分组的药单列表"""
     from .models import Medication
+    from .adherence import with_taken_days
 
-    medications = Medication.objects.filter(
+    medications = with_taken_days(Medication.objects.filter(
         user=request.user,
         group__isnull=True
-    ).order_by('-created_at')
+    ).order_by('-created_at'))
 
     medication_list = []
     for med in medications:
@@ -5908,6 +5664,8 @@ def api_vital_logs(request):
                 'vital_type': log.vital_type,
                 'vital_type_display': log.get_vital_type_display(),
                 'value': log.value,
+                'numeric_value': log.numeric_value,
+                'numeric_value_secondary': log.numeric_value_secondary,
                 'unit': log.unit or '',
                 'notes': log.notes or '',
                 'related_checkup_id': log.related_checkup_id,
@@ -5966,6 +5724,8 @@ def api_vital_logs(request):
                     'vital_type': log.vital_type,
                     'vital_type_display': log.get_vital_type_display(),
                     'value': log.value,
+                    'numeric_value': log.numeric_value,
+                    'numeric_value_secondary': log.numeric_value_secondary,
                     'unit': log.unit or '',
                     'notes': log.notes or '',
                 }
@@ -6010,6 +5770,8 @@ def api_vital_log_detail(request, log_id):
                 'vital_type': log.vital_type,
                 'vital_type_display': log.get_vital_type_display(),
                 'value': log.value,
+                'numeric_value': log.numeric_value,
+                'numeric_value_secondary': log.numeric_value_secondary,
                 'unit': log.unit or '',
                 'notes': log.notes or '',
                 'related_checkup_id': log.related_checkup_id,
@@ -6050,6 +5812,8 @@ def api_vital_log_detail(request, log_id):
                     'vital_type': log.vital_type,
                     'vital_type_display': log.get_vital_type_display(),
                     'value': log.value,
+                    'numeric_value': log.numeric_value,
+                    'numeric_value_secondary': log.numeric_value_secondary,
                     'unit': log.unit or '',
                     'notes': log.notes or '',
                 }
@@ -6073,6 +5837,50 @@ def api_vital_log_detail(request, log_id):
         })
 
 
+@csrf_exempt
+@require_http_methods(["GET"])
+@login_required
+def api_vital_series(request):
+    """
+    获取降采样后的体征序列（用于图表）
+
+    查询参数：
+    - vital_type: 体征类型（必填）
+    - start_date / end_date: 日期范围（默认最近一年）
+    - max_points: 最多返回点数（默认300）
+    """
+    from .models import VitalEntry
+    from .vitals import get_vital_series
+
+    vital_type = request.GET.get('vital_type', '').strip()
+    if vital_type not in dict(VitalEntry.VITAL_TYPE_CHOICES):
+        return JsonResponse({
+            'success': False,
+            'error': '体征类型无效'
+        }, status=400)
+
+    try:
+        start_date = request.GET.get('start_date')
+        end_date = request.GET.get('end_date')
+        series = get_vital_series(
+            request.user,
+            vital_type,
+            start_date=datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+            end_date=datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None,
+            max_points=request.GET.get('max_points') or None,
+        )
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': '参数格式错误'
+        }, status=400)
+
+    return JsonResponse({
+        'success': True,
+        **series
+    })
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 @login_required
@@ -6095,6 +5903,158 @@ def api_vital_types(request):
     })
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+@login_required
+def api_health_logs_batch(request):
+    """
+    批量提交症状/体征日志
+
+    请求体：
+    - symptoms: 症状日志数组（字段同单条创建）
+    - vitals: 体征日志数组（字段同单条创建）
+    - attach_to_events: 是否挂接到当天的自动事件（默认 true）
+
+    返回逐行结果，校验失败的行不会影响其它行写入
+    """
+    from .health_logs import bulk_create_health_logs
+
+    try:
+        data = json.loads(request.body)
+    except (TypeError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'error': '请求数据格式错误'
+        }, status=400)
+
+    symptoms = data.get('symptoms') or []
+    vitals = data.get('vitals') or []
+    if not isinstance(symptoms, list) or not isinstance(vitals, list):
+        return JsonResponse({
+            'success': False,
+            'error': 'symptoms 和 vitals 必须为数组'
+        }, status=400)
+
+    try:
+        results = bulk_create_health_logs(
+            request.user,
+            symptoms=symptoms,
+            vitals=vitals,
+            attach_events=data.get('attach_to_events', True),
+        )
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({
+            'success': False,
+            'error': f'批量创建日志失败: {str(e)}'
+        }, status=500)
+
+    return JsonResponse({
+        'success': True,
+        'message': f"已创建 {results['created_count']} 条日志，失败 {results['failed_count']} 条",
+        **results
+    }, status=201 if results['created_count'] else 200)
+
+
+# ============================================================================
+# 导出任务 API
+# ============================================================================
+
+def _export_job_payload(request, job):
+    """为已完成的导出任务附加下载地址"""
+    if job['status'] == 'completed':
+        job['download_url'] = request.build_absolute_uri(
+            reverse('medical_records:api_export_job_download', args=[job['job_id']])
+        )
+    return job
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@login_required
+def api_export_jobs(request):
+    """
+    提交导出任务
+
+    请求体：
+    - export_type: checkups / health_trends / conversation / ai_summary / event_summary
+    - format: pdf / word
+    - checkup_ids / conversation_id / event_id: 对应导出类型所需参数
+
+    数据未变化时直接返回已生成的文件（status=completed, cached=true）；
+    否则返回 job_id，通过状态接口轮询，完成后访问 download_url 下载
+    """
+    from .export_jobs import ExportError, request_export
+
+    try:
+        data = json.loads(request.body)
+    except (TypeError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'error': '请求数据格式错误'
+        }, status=400)
+
+    try:
+        job = request_export(request.user, data.get('export_type'), data.get('format', 'pdf'), data)
+    except ExportError as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=e.status_code)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({
+            'success': False,
+            'error': f'提交导出任务失败: {str(e)}'
+        }, status=500)
+
+    return JsonResponse({
+        'success': True,
+        'job': _export_job_payload(request, job)
+    }, status=200 if job['status'] == 'completed' else 202)
+
+
+@require_http_methods(["GET"])
+@login_required
+def api_export_job_status(request, job_id):
+    """查询导出任务状态"""
+    from .export_jobs import get_export_job
+
+    job = get_export_job(request.user, job_id)
+    if job is None:
+        return JsonResponse({
+            'success': False,
+            'error': '导出任务不存在或已过期'
+        }, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'job': _export_job_payload(request, job)
+    })
+
+
+@require_http_methods(["GET"])
+@login_required
+def api_export_job_download(request, job_id):
+    """下载导出文件"""
+    from .export_jobs import export_job_download_response
+
+    response = export_job_download_response(request.user, job_id)
+    if response is None:
+        return JsonResponse({
+            'success': False,
+            'error': '导出文件不存在或尚未生成'
+        }, status=404)
+    return response
+
+
 # ============================================================================
 # 健康管理计划 API (CarePlan, CareGoal, CareAction)
 # ============================================================================
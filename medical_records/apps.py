@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class MedicalRecordsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'medical_records'
+
+    def ready(self):
+        # 注册数据变更信号（使AI医生工具缓存失效）
+        from . import agent_tool_cache  # noqa: F401
+        # 注册数据删除信号（清理导出产物、图片渲染件与记录检索索引）
+        from . import export_artifacts  # noqa: F401
+        from . import image_pipeline  # noqa: F401
+        from . import record_index  # noqa: F401
@@ -0,0 +1,58 @@
+"""
+时间区间聚类工具
+药单分组、健康事件聚类共用的排序扫描（sort-and-sweep）区间合并算法
+"""
+
+
+def merge_intervals(items, start_key, end_key=None, gap_days=0, anchor='end'):
+    """
+    按时间区间合并记录，O(n log n)
+
+    先按开始日期排序，再单次扫描：若当前记录的开始日期与当前簇的锚点
+    间隔不超过 gap_days（或区间重叠），则并入当前簇并延长簇的结束日期，
+    否则开启新簇。
+    anchor='end' 时锚点为簇的结束日期，相邻记录可逐个串联成一簇（适合连续发生的事件）；
+    anchor='start' 时锚点为簇内第一条记录的开始日期，簇内开始日期的跨度不超过 gap_days。
+
+    Args:
+        items: 任意对象序列
+        start_key: 取开始日期的函数
+        end_key: 取结束日期的函数，为空时视为单日记录（结束日期=开始日期）
+        gap_days: 允许的最大间隔天数
+        anchor: 'end' 或 'start'，见上
+
+    Returns:
+        [(start_date, end_date, [item, ...]), ...]，按开始日期升序
+    """
+    if anchor not in ('end', 'start'):
+        raise ValueError(f"anchor 只能为 'end' 或 'start': {anchor}")
+    if end_key is None:
+        end_key = start_key
+
+    ordered = sorted(items, key=start_key)
+    clusters = []
+    cluster_start = cluster_end = None
+    members = []
+
+    for item in ordered:
+        item_start = start_key(item)
+        item_end = end_key(item) or item_start
+        if item_end < item_start:
+            item_end = item_start
+
+        reference = cluster_end if anchor == 'end' else cluster_start
+        if members and (item_start - reference).days <= gap_days:
+            members.append(item)
+            if item_end > cluster_end:
+                cluster_end = item_end
+            continue
+
+        if members:
+            clusters.append((cluster_start, cluster_end, members))
+        cluster_start, cluster_end = item_start, item_end
+        members = [item]
+
+    if members:
+        clusters.append((cluster_start, cluster_end, members))
+
+    return clusters
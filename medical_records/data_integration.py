@@ -0,0 +1,333 @@
+"""
+数据整合的本地预处理与分批调用（map-reduce）
+先在本地按规范化名称与字符串相似度对指标名聚类，并套用用户已确认的命名映射；
+只有存在歧义的簇（多个相近名称、单位或分类不一致）才分批并行交给大模型判断，
+各批结果按指标ID合并。整合结果被应用后，命名映射写入 IndicatorNameMapping 供后续复用。
+"""
+
+import json
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from difflib import SequenceMatcher
+
+from django.db import connections
+from django.utils import timezone
+
+from .json_extraction import extract_json
+from .llm_prompts import build_data_integration_prompt
+from .models import IndicatorNameMapping, SystemSettings
+from .report_chunking import canonical_indicator_name
+
+# 规范化名称的相似度阈值（SequenceMatcher.ratio），达到即归为同一簇
+SIMILARITY_THRESHOLD = 0.75
+# 每批发送给大模型的指标条数上限（同一簇不拆开）
+DEFAULT_BATCH_INDICATORS = 80
+
+LOCAL_FORMAT_REASON = '名称格式统一'
+CACHED_MAPPING_REASON = '沿用已确认命名'
+
+_ALIAS_SEPARATORS = str.maketrans({c: ' ' for c in '()（）[]【】/、,，;；'})
+
+
+def _aliases(key):
+    """名称中括号/斜杠分隔出的别名，如 '血红蛋白(hgb)' -> {'血红蛋白', 'hgb'}"""
+    return {part for part in key.translate(_ALIAS_SEPARATORS).split() if len(part) >= 2}
+
+
+def _bigrams(key):
+    if len(key) < 2:
+        return {key}
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+def _similar(a, b):
+    """两个规范化名称是否相近：互为包含（较短者不少于2个字符）或相似度达到阈值"""
+    shorter, longer = (a, b) if len(a) <= len(b) else (b, a)
+    if len(shorter) >= 2 and shorter in longer:
+        return True
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    return (matcher.real_quick_ratio() >= SIMILARITY_THRESHOLD
+            and matcher.quick_ratio() >= SIMILARITY_THRESHOLD
+            and matcher.ratio() >= SIMILARITY_THRESHOLD)
+
+
+def cluster_names(keys):
+    """
+    对规范化名称聚类（并查集）
+
+    只比较共享别名或字符二元组的名称对，避免全量两两比较
+
+    Returns:
+        list[list[str]]: 各簇包含的名称，顺序与输入一致
+    """
+    keys = list(dict.fromkeys(keys))
+    parent = {key: key for key in keys}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def union(a, b):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[root_b] = root_a
+
+    by_alias = defaultdict(list)
+    by_bigram = defaultdict(list)
+    for key in keys:
+        for alias in _aliases(key):
+            by_alias[alias].append(key)
+        for gram in _bigrams(key):
+            by_bigram[gram].append(key)
+
+    for members in by_alias.values():
+        for other in members[1:]:
+            union(members[0], other)
+
+    compared = set()
+    for members in by_bigram.values():
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                pair = (a, b) if a < b else (b, a)
+                if pair in compared or find(a) == find(b):
+                    continue
+                compared.add(pair)
+                if _similar(a, b):
+                    union(a, b)
+
+    clusters = defaultdict(list)
+    for key in keys:
+        clusters[find(key)].append(key)
+    return list(clusters.values())
+
+
+def load_name_mappings(user):
+    """用户已确认的命名映射 {规范化原名称: 统一名称}"""
+    return dict(IndicatorNameMapping.objects.filter(user=user).values_list('source_key', 'target_name'))
+
+
+def remember_name_mappings(user, renames):
+    """
+    记录已应用的改名，供后续整合复用
+
+    Args:
+        renames: [(原名称, 新名称)]；统一名称本身也记为已确认
+    """
+    mappings = {}
+    for source, target in renames:
+        if not source or not target:
+            continue
+        mappings[canonical_indicator_name(source)] = target
+        mappings.setdefault(canonical_indicator_name(target), target)
+    if not mappings:
+        return 0
+
+    existing = {
+        mapping.source_key: mapping
+        for mapping in IndicatorNameMapping.objects.filter(user=user, source_key__in=list(mappings))
+    }
+    to_update = []
+    to_create = []
+    now = timezone.now()
+    for key, target in mappings.items():
+        mapping = existing.get(key)
+        if mapping is None:
+            to_create.append(IndicatorNameMapping(user=user, source_key=key, target_name=target))
+        elif mapping.target_name != target:
+            mapping.target_name = target
+            # bulk_update 不会自动更新 auto_now 字段
+            mapping.updated_at = now
+            to_update.append(mapping)
+    IndicatorNameMapping.objects.bulk_create(to_create, ignore_conflicts=True)
+    IndicatorNameMapping.objects.bulk_update(to_update, ['target_name', 'updated_at'])
+    return len(to_create) + len(to_update)
+
+
+class IntegrationPlan:
+    """
+    一次数据整合的本地预处理结果
+
+    Attributes:
+        local_changes: 本地即可确定的变更（与大模型返回的 changes 格式相同）
+        batches: 需要大模型判断的分批数据，每批为 [{'key', 'variants'}]
+        group_count: 规范化后的指标名称组数
+        cluster_count: 相似名称聚类后的簇数
+        ambiguous_count: 交给大模型的簇数
+    """
+
+    def __init__(self):
+        self.local_changes = []
+        self.batches = []
+        self.group_count = 0
+        self.cluster_count = 0
+        self.ambiguous_count = 0
+
+    @property
+    def llm_indicator_count(self):
+        return sum(len(group['variants']) for batch in self.batches for group in batch)
+
+
+def _variant(indicator, name):
+    return {
+        'id': indicator.id,
+        'name': name,
+        'value': indicator.value,
+        'unit': indicator.unit,
+        'reference_range': indicator.reference_range,  # 仅用于LLM参考，不返回
+        'status': indicator.status,
+        'type': indicator.indicator_type
+    }
+
+
+def _linked_by_mappings(cluster, mappings):
+    """
+    簇内的多个名称是否由已确认映射明确指向同一统一名称
+
+    各名称分别是已确认的统一名称只说明它们各自有效，不代表是同一项目（如高密度与低密度脂蛋白胆固醇）
+    """
+    if not all(key in mappings for key in cluster):
+        return False
+    return len({canonical_indicator_name(mappings[key]) for key in cluster}) == 1
+
+
+def plan_integration(user, indicators, user_prompt='', batch_indicators=DEFAULT_BATCH_INDICATORS):
+    """
+    本地预处理：套用已确认映射、按名称聚类，划分本地变更与需要大模型判断的批次
+
+    有用户自定义要求时，所有簇都交给大模型（要求可能涉及任意指标），仍分批并行
+    """
+    plan = IntegrationPlan()
+    mappings = load_name_mappings(user)
+
+    # 先套用已确认映射，再按规范化名称分组
+    groups = defaultdict(list)
+    for indicator in indicators:
+        name = mappings.get(canonical_indicator_name(indicator.indicator_name), indicator.indicator_name)
+        if name != indicator.indicator_name:
+            plan.local_changes.append({
+                'indicator_id': indicator.id,
+                'indicator_name': name,
+                'reason': CACHED_MAPPING_REASON
+            })
+        groups[canonical_indicator_name(name)].append((indicator, name))
+    plan.group_count = len(groups)
+
+    clusters = cluster_names(groups)
+    plan.cluster_count = len(clusters)
+
+    pending = []
+    for cluster in clusters:
+        members = [item for key in cluster for item in groups[key]]
+        units = {(indicator.unit or '').strip() for indicator, _ in members}
+        types = {indicator.indicator_type for indicator, _ in members}
+        ambiguous = (
+            bool(user_prompt)
+            or (len(cluster) > 1 and not _linked_by_mappings(cluster, mappings))
+            or len(units) > 1
+            or len(types) > 1
+        )
+        if ambiguous:
+            pending.append({
+                'key': ' / '.join(cluster),
+                'variants': [_variant(indicator, name) for indicator, name in members]
+            })
+            continue
+
+        # 单一名称（或已确认映射为同一名称）且单位、分类一致：只需把格式不同的写法统一为最常见的写法
+        names = Counter(name for _, name in members)
+        if len(names) > 1:
+            preferred = names.most_common(1)[0][0]
+            for indicator, name in members:
+                if name != preferred:
+                    plan.local_changes.append({
+                        'indicator_id': indicator.id,
+                        'indicator_name': preferred,
+                        'reason': LOCAL_FORMAT_REASON
+                    })
+
+    plan.ambiguous_count = len(pending)
+
+    batch, size = [], 0
+    for group in pending:
+        if batch and size + len(group['variants']) > batch_indicators:
+            plan.batches.append(batch)
+            batch, size = [], 0
+        batch.append(group)
+        size += len(group['variants'])
+    if batch:
+        plan.batches.append(batch)
+    return plan
+
+
+def _call_integration_llm(system_prompt, prompt, provider, timeout):
+    from .services import call_gemini_api, call_llm_for_integration
+
+    try:
+        if provider == 'gemini':
+            # Gemini不使用system_message，直接使用prompt
+            return call_gemini_api(prompt, timeout=timeout)
+        return call_llm_for_integration(system_prompt, prompt, timeout=timeout)
+    finally:
+        # 工作线程结束前关闭本线程的数据库连接（调用中会读取系统设置）
+        connections.close_all()
+
+
+def _run_batch(batch, user_prompt, provider, timeout):
+    indicators_data = json.dumps(batch, ensure_ascii=False, separators=(',', ':'))
+    system_prompt, prompt = build_data_integration_prompt(indicators_data, user_prompt)
+    response = _call_integration_llm(system_prompt, prompt, provider, timeout)
+
+    result_json = extract_json(response, required_key='changes')
+    if not result_json:
+        raise Exception("无法从LLM响应中提取有效的JSON对象")
+
+    # 只接受本批内的指标，防止模型编造或越界的ID
+    batch_ids = {variant['id'] for group in batch for variant in group['variants']}
+    changes = [
+        change for change in result_json.get('changes', [])
+        if isinstance(change, dict) and change.get('indicator_id') in batch_ids
+    ]
+    return response, changes
+
+
+def iter_integration_batches(plan, user_prompt=''):
+    """
+    并行调用大模型处理各批，按完成顺序产出 (批序号, 响应文本, changes, 错误信息)
+
+    并发数取系统设置 llm_max_concurrency
+    """
+    if not plan.batches:
+        return
+    provider = SystemSettings.get_llm_config().get('provider', 'openai')
+    timeout = int(SystemSettings.get_setting('ai_model_timeout', '300'))
+    workers = max(1, min(int(SystemSettings.get_setting('llm_max_concurrency', '3')), len(plan.batches)))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_run_batch, batch, user_prompt, provider, timeout): index
+            for index, batch in enumerate(plan.batches)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                response, changes = future.result()
+                yield index, response, changes, None
+            except Exception as e:
+                yield index, '', [], str(e)
+
+
+def merge_changes(local_changes, llm_changes):
+    """按指标ID合并本地变更与大模型变更，大模型的字段覆盖本地字段"""
+    merged = {}
+    for change in list(local_changes) + list(llm_changes):
+        indicator_id = change.get('indicator_id')
+        if indicator_id in merged:
+            existing = merged[indicator_id]
+            reasons = [r for r in (existing.get('reason'), change.get('reason')) if r]
+            existing.update(change)
+            existing['reason'] = '；'.join(dict.fromkeys(reasons))
+        else:
+            merged[indicator_id] = dict(change)
+    return list(merged.values())
@@ -0,0 +1,318 @@
+"""
+重复体检报告检测
+每份报告计算紧凑签名：(指标名, 检测值) 集合的 MinHash，加上报告文件的 SHA-256。
+通过 LSH 分桶索引找出候选对（无需两两比较），再按估计的 Jaccard 相似度确认；
+日期、机构写法略有不同的批量重复上传也能识别。
+合并重复报告：指标改挂与源报告删除在一个短事务中按集合完成；源文件打包在事务提交后流式写入存储。
+"""
+
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import zipfile
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
+
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count
+
+from .models import HealthCheckup, HealthIndicator, SymptomEntry, VitalEntry
+from .report_chunking import canonical_indicator_name
+
+NUM_PERM = 64
+BANDS = 16                       # 16 段 × 4 行：相似度约 0.6 以上的报告对大概率落入同一桶
+ROWS = NUM_PERM // BANDS
+SIMILARITY_THRESHOLD = 0.6
+MAX_DATE_GAP_DAYS = 30           # 内容相似的报告，日期相差超过该天数视为不同次体检
+MIN_SHINGLES = 3                 # 指标过少时 MinHash 不可靠，只参与文件哈希与日期机构匹配
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+
+@lru_cache(maxsize=65536)
+def _shingle_hashes(shingle):
+    """单个特征在各置换下的哈希值（同名同值的指标在不同报告间反复出现，结果缓存）"""
+    base = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+    return tuple((a * base + b) % _MERSENNE_PRIME for a, b in _PERMUTATIONS)
+
+
+def _shingle(name, value):
+    value = ''.join(str(value or '').split()).casefold()
+    return f'{canonical_indicator_name(name)}={value}'
+
+
+def minhash_signature(pairs):
+    """(指标名, 检测值) 集合的 MinHash 签名；集合为空时返回 None"""
+    shingles = {_shingle(name, value) for name, value in pairs}
+    if not shingles:
+        return None
+    columns = zip(*(_shingle_hashes(shingle) for shingle in shingles))
+    return tuple(min(column) for column in columns)
+
+
+def estimate_similarity(sig_a, sig_b):
+    """由 MinHash 签名估计 Jaccard 相似度"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+def file_sha256(field_file):
+    """报告文件内容的 SHA-256；文件缺失时返回空字符串"""
+    h = hashlib.sha256()
+    try:
+        with field_file.open('rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+    except (OSError, ValueError):
+        return ''
+    return h.hexdigest()
+
+
+def _normalize_hospital(hospital):
+    return canonical_indicator_name(hospital)
+
+
+def find_duplicate_groups(user, threshold=SIMILARITY_THRESHOLD, max_date_gap_days=MAX_DATE_GAP_DAYS):
+    """
+    检测用户的重复体检报告
+
+    判定为重复的报告对（取并集后分组）：
+        - 报告文件内容相同
+        - 日期相同且机构名称规范化后相同（原有规则）
+        - 指标内容估计相似度不低于 threshold，且日期相差不超过 max_date_gap_days
+
+    查询次数固定：报告（附带指标数）一次、指标一次；尚未计算文件哈希的报告额外一次批量写回
+
+    Returns:
+        list[dict]: 每组 {'date', 'hospital', 'checkups', 'count', 'similarity', 'reasons'}，
+        组内报告按日期、上传时间倒序
+    """
+    checkups = list(
+        HealthCheckup.objects.filter(user=user)
+        .annotate(indicators_count=Count('indicators'))
+        .order_by('-checkup_date', '-created_at')
+    )
+    if len(checkups) < 2:
+        return []
+
+    pairs = defaultdict(list)
+    for checkup_id, name, value in HealthIndicator.objects.filter(
+        checkup__user=user
+    ).values_list('checkup_id', 'indicator_name', 'value'):
+        pairs[checkup_id].append((name, value))
+
+    # 文件哈希按需计算并缓存
+    missing_hash = []
+    for checkup in checkups:
+        if checkup.report_file and not checkup.report_file_hash:
+            checkup.report_file_hash = file_sha256(checkup.report_file)
+            if checkup.report_file_hash:
+                missing_hash.append(checkup)
+    if missing_hash:
+        HealthCheckup.objects.bulk_update(missing_hash, ['report_file_hash'], batch_size=500)
+
+    parent = {checkup.id: checkup.id for checkup in checkups}
+
+    def find(checkup_id):
+        while parent[checkup_id] != checkup_id:
+            parent[checkup_id] = parent[parent[checkup_id]]
+            checkup_id = parent[checkup_id]
+        return checkup_id
+
+    reasons = defaultdict(set)
+    similarities = {}
+
+    def link(a, b, reason, similarity=None):
+        root_a, root_b = find(a.id), find(b.id)
+        if root_a != root_b:
+            parent[root_b] = root_a
+        key = (min(a.id, b.id), max(a.id, b.id))
+        reasons[key].add(reason)
+        if similarity is not None:
+            similarities[key] = similarity
+
+    # 精确索引：文件哈希、(日期, 机构)
+    exact_buckets = defaultdict(list)
+    for checkup in checkups:
+        if checkup.report_file_hash:
+            exact_buckets[('file', checkup.report_file_hash)].append(checkup)
+        exact_buckets[('date_hospital', checkup.checkup_date, _normalize_hospital(checkup.hospital))].append(checkup)
+    for key, members in exact_buckets.items():
+        for other in members[1:]:
+            link(members[0], other, 'same_file' if key[0] == 'file' else 'same_date_hospital')
+
+    # LSH 索引：签名分段，任一段完全相同即为候选对
+    signatures = {}
+    lsh_buckets = defaultdict(list)
+    for checkup in checkups:
+        checkup_pairs = pairs.get(checkup.id, ())
+        if len(checkup_pairs) < MIN_SHINGLES:
+            continue
+        signature = minhash_signature(checkup_pairs)
+        signatures[checkup.id] = signature
+        for band in range(BANDS):
+            lsh_buckets[(band, signature[band * ROWS:(band + 1) * ROWS])].append(checkup)
+
+    max_gap = timedelta(days=max_date_gap_days)
+    checked = set()
+    for members in lsh_buckets.values():
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                key = (min(a.id, b.id), max(a.id, b.id))
+                if key in checked:
+                    continue
+                checked.add(key)
+                if abs(a.checkup_date - b.checkup_date) > max_gap:
+                    continue
+                similarity = estimate_similarity(signatures[a.id], signatures[b.id])
+                if similarity >= threshold:
+                    link(a, b, 'similar_content', similarity)
+
+    groups = defaultdict(list)
+    for checkup in checkups:
+        groups[find(checkup.id)].append(checkup)
+
+    duplicate_groups = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        member_ids = {checkup.id for checkup in members}
+        group_reasons = set()
+        group_similarity = None
+        for (a, b), pair_reasons in reasons.items():
+            if a in member_ids:
+                group_reasons |= pair_reasons
+                if (a, b) in similarities:
+                    group_similarity = max(group_similarity or 0, similarities[(a, b)])
+        first = members[0]
+        duplicate_groups.append({
+            'date': first.checkup_date.strftime('%Y-%m-%d'),
+            'hospital': first.hospital,
+            'checkups': [
+                {
+                    'id': checkup.id,
+                    'checkup_date': checkup.checkup_date.strftime('%Y-%m-%d'),
+                    'hospital': checkup.hospital,
+                    'notes': checkup.notes,
+                    'indicators_count': checkup.indicators_count,
+                    'created_at': checkup.created_at.strftime('%Y-%m-%d %H:%M')
+                }
+                for checkup in members
+            ],
+            'count': len(members),
+            'similarity': round(group_similarity, 2) if group_similarity is not None else None,
+            'reasons': sorted(group_reasons)
+        })
+    return duplicate_groups
+
+
+# 合并时打包源文件：不超过该大小的压缩包在内存中生成，更大的自动转存到临时文件
+ZIP_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _safe_filename(name):
+    return "".join(c for c in name if c.isalnum() or c in '._- ')
+
+
+def _archive_name(checkup):
+    return _safe_filename(
+        f"{checkup.checkup_date}_{checkup.hospital or '未知机构'}_{os.path.basename(checkup.report_file.name)}"
+    )
+
+
+def _archive_report_files(target, checkups):
+    """
+    把各报告的文件流式打包为 ZIP 并保存为目标报告的文件（逐块复制，内存占用与文件大小无关）
+
+    Returns:
+        (是否生成压缩包, 错误信息列表)
+    """
+    errors = []
+    used_names = set()
+    added = 0
+    with tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_SIZE) as spool:
+        with zipfile.ZipFile(spool, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for checkup in checkups:
+                name = _archive_name(checkup)
+                stem, ext = os.path.splitext(name)
+                index = 1
+                while name in used_names:
+                    index += 1
+                    name = f"{stem}_{index}{ext}"
+                try:
+                    with checkup.report_file.open('rb') as source, zip_file.open(name, 'w', force_zip64=True) as target_entry:
+                        shutil.copyfileobj(source, target_entry, _COPY_CHUNK_SIZE)
+                except (OSError, ValueError) as e:
+                    errors.append(f"读取文件失败: {str(e)}")
+                    continue
+                used_names.add(name)
+                added += 1
+
+        if not added:
+            return False, errors
+
+        spool.seek(0)
+        zip_filename = _safe_filename(f"merged_{target.checkup_date}_{target.hospital or '整合报告'}.zip")
+        target.report_file.save(zip_filename, File(spool), save=False)
+    target.save(update_fields=['report_file'])
+    return True, errors
+
+
+def merge_checkups(user, target_checkup, source_checkup_ids):
+    """
+    把源报告合并到目标报告
+
+    事务内只做集合操作：指标、症状与体征的关联改挂到目标报告，备注追加到目标报告，删除源报告；
+    源报告的文件在存储中保留，事务提交后与目标报告的文件一起流式打包为目标报告的新文件
+    （只有一个文件时直接改挂，不打包）。
+
+    Returns:
+        dict: {'merged_count', 'indicators_moved', 'zip_created', 'errors'}；没有可合并的源报告时 merged_count 为 0
+    """
+    with transaction.atomic():
+        sources = list(
+            HealthCheckup.objects.select_for_update()
+            .filter(id__in=source_checkup_ids, user=user)
+            .exclude(id=target_checkup.id)
+            .order_by('checkup_date', 'id')
+        )
+        if not sources:
+            return {'merged_count': 0, 'indicators_moved': 0, 'zip_created': False, 'errors': []}
+        source_ids = [checkup.id for checkup in sources]
+
+        indicators_moved = HealthIndicator.objects.filter(checkup_id__in=source_ids).update(checkup=target_checkup)
+        SymptomEntry.objects.filter(related_checkup_id__in=source_ids).update(related_checkup=target_checkup)
+        VitalEntry.objects.filter(related_checkup_id__in=source_ids).update(related_checkup=target_checkup)
+
+        notes = [target_checkup.notes] if target_checkup.notes else []
+        notes.extend(f"[来自合并] {checkup.notes}" for checkup in sources if checkup.notes)
+        target_checkup.notes = '\n'.join(notes) or target_checkup.notes
+        target_checkup.save(update_fields=['notes'])
+
+        HealthCheckup.objects.filter(id__in=source_ids).delete()
+
+    # 以下在事务外进行，文件读写不占用数据库锁
+    with_files = [checkup for checkup in [target_checkup, *sources] if checkup.report_file]
+    zip_created = False
+    errors = []
+    if len(with_files) == 1 and not target_checkup.report_file:
+        target_checkup.report_file.name = with_files[0].report_file.name
+        target_checkup.save(update_fields=['report_file'])
+    elif len(with_files) > 1:
+        try:
+            zip_created, errors = _archive_report_files(target_checkup, with_files)
+        except Exception as e:
+            errors.append(f"创建ZIP失败: {str(e)}")
+
+    return {
+        'merged_count': len(sources),
+        'indicators_moved': indicators_moved,
+        'zip_created': zip_created,
+        'errors': errors,
+    }
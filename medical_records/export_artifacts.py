@@ -0,0 +1,103 @@
+"""
+导出产物的存储与清理（不导入 ReportLab / python-docx，应用启动时即可注册信号）
+- 产物保存在 exports/<user_id>/ 下，生成后超过 EXPORT_ARTIFACT_MAX_AGE_HOURS 即过期：
+  访问时发现过期直接删除，生成新产物时顺带清理该用户的过期产物，cleanup_export_artifacts 命令清理全部用户
+- 用户、体检报告、对话或健康事件被删除时，删除该用户的全部导出产物（其中可能包含已删除的数据）
+"""
+
+import logging
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Conversation, HealthCheckup, HealthEvent
+
+logger = logging.getLogger(__name__)
+
+# 导出文件在存储中的目录，按用户分子目录
+EXPORT_DIR = 'exports'
+# 产物保留时间，与后台任务记录的保留时间（task_manager.cleanup_old_tasks）一致
+EXPORT_ARTIFACT_MAX_AGE_HOURS = 24
+
+
+def user_dir(user_id):
+    return f'{EXPORT_DIR}/{user_id}'
+
+
+def _list_files(directory):
+    try:
+        return default_storage.listdir(directory)
+    except FileNotFoundError:
+        return [], []
+
+
+def is_expired(path, now=None):
+    """产物是否已超过保留时间；存储不支持修改时间时视为未过期"""
+    try:
+        modified = default_storage.get_modified_time(path)
+    except (NotImplementedError, FileNotFoundError, OSError):
+        return False
+    return modified < (now or timezone.now()) - timedelta(hours=EXPORT_ARTIFACT_MAX_AGE_HOURS)
+
+
+def artifact_available(path):
+    """产物存在且未过期；已过期的产物在此删除"""
+    if not default_storage.exists(path):
+        return False
+    if is_expired(path):
+        default_storage.delete(path)
+        return False
+    return True
+
+
+def purge_expired_artifacts(user_id):
+    """删除该用户已过期的产物，返回删除数"""
+    directory = user_dir(user_id)
+    now = timezone.now()
+    removed = 0
+    for name in _list_files(directory)[1]:
+        path = f'{directory}/{name}'
+        if is_expired(path, now):
+            default_storage.delete(path)
+            removed += 1
+    return removed
+
+
+def delete_user_artifacts(user_id):
+    """删除该用户的全部产物，返回删除数"""
+    directory = user_dir(user_id)
+    files = _list_files(directory)[1]
+    for name in files:
+        default_storage.delete(f'{directory}/{name}')
+    return len(files)
+
+
+def artifact_user_ids():
+    """存储中有导出产物的用户ID"""
+    return [int(name) for name in _list_files(EXPORT_DIR)[0] if name.isdigit()]
+
+
+@receiver(post_delete, sender=User)
+def _delete_artifacts_of_user(sender, instance, **kwargs):
+    _delete_artifacts_quietly(instance.id)
+
+
+@receiver(post_delete, sender=HealthCheckup)
+@receiver(post_delete, sender=Conversation)
+@receiver(post_delete, sender=HealthEvent)
+def _delete_artifacts_on_data_delete(sender, instance, **kwargs):
+    _delete_artifacts_quietly(instance.user_id)
+
+
+def _delete_artifacts_quietly(user_id):
+    try:
+        removed = delete_user_artifacts(user_id)
+    except Exception as e:
+        logger.warning(f"[导出] user={user_id} 删除导出文件失败: {e}")
+        return
+    if removed:
+        logger.info(f"[导出] user={user_id} 数据已删除，清理 {removed} 个导出文件")
@@ -0,0 +1,362 @@
+"""
+导出任务
+导出文件在后台任务中生成，按 (用户, 导出类型, 导出参数, 数据版本) 派生的键保存到存储；
+数据未变化时重复导出直接返回已生成的文件，不再重新渲染。产物的过期与清理见 export_artifacts
+"""
+
+import hashlib
+import json
+import logging
+import re
+import tempfile
+import threading
+from datetime import datetime
+from urllib.parse import quote
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import FileResponse
+
+from .background_tasks import task_manager
+from .export_artifacts import artifact_available, purge_expired_artifacts, user_dir
+from .export_utils import (
+    EXPORT_FORMATS,
+    EXPORT_ITERATOR_CHUNK_SIZE,
+    EXPORT_SPOOL_MAX_SIZE,
+    AISummaryExporter,
+    CheckupReportsExporter,
+    ConversationExporter,
+    EventAiSummaryExporter,
+    HealthTrendsExporter,
+    write_export,
+)
+from .models import Conversation, HealthAdvice, HealthCheckup, HealthEvent, HealthIndicator
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_PATTERN = re.compile(r'^(?P<export_type>[a-z_]+)-(?P<format>pdf|word)-(?P<digest>[0-9a-f]{32})$')
+
+INDICATOR_VERSION_FIELDS = (
+    'id', 'checkup_id', 'indicator_type', 'indicator_name',
+    'value', 'unit', 'reference_range', 'status',
+)
+
+_jobs_lock = threading.Lock()
+
+
+class ExportError(ValueError):
+    """导出参数无效"""
+    status_code = 400
+
+
+class ExportNotFound(ExportError):
+    """导出对象不存在或无权访问"""
+    status_code = 404
+
+
+def _digest(*row_sources):
+    """对若干行序列计算摘要，作为数据版本"""
+    h = hashlib.sha256()
+    for rows in row_sources:
+        for row in rows:
+            h.update(repr(row).encode('utf-8'))
+            h.update(b'\n')
+    return h.hexdigest()
+
+
+# ==================== 各导出类型：参数校验 / 数据版本 / 导出器 ====================
+
+def _checkups_params(user, data):
+    raw_ids = data.get('checkup_ids') or []
+    if isinstance(raw_ids, str):
+        raw_ids = raw_ids.split(',')
+    checkup_ids = {int(i) for i in raw_ids if str(i).strip().isdigit()}
+    if not checkup_ids:
+        raise ExportError('无效的报告ID')
+    owned = sorted(HealthCheckup.objects.filter(
+        user=user, id__in=checkup_ids
+    ).values_list('id', flat=True))
+    if not owned:
+        raise ExportNotFound('未找到指定的报告')
+    return {'checkup_ids': owned}
+
+
+def _checkups_version(user, params):
+    checkup_ids = params['checkup_ids']
+    return _digest(
+        [user.username],
+        HealthCheckup.objects.filter(id__in=checkup_ids).order_by('id').values_list('id', 'checkup_date'),
+        HealthIndicator.objects.filter(checkup_id__in=checkup_ids).order_by('id')
+        .values_list(*INDICATOR_VERSION_FIELDS).iterator(chunk_size=EXPORT_ITERATOR_CHUNK_SIZE),
+    )
+
+
+def _checkups_exporter(user, params):
+    return CheckupReportsExporter(
+        HealthCheckup.objects.filter(user=user, id__in=params['checkup_ids']).order_by('-checkup_date')
+    )
+
+
+def _trends_params(user, data):
+    return {}
+
+
+def _trends_version(user, params):
+    return _digest(
+        HealthCheckup.objects.filter(user=user).order_by('id').values_list('id', 'checkup_date'),
+        HealthIndicator.objects.filter(checkup__user=user).order_by('id')
+        .values_list(*INDICATOR_VERSION_FIELDS).iterator(chunk_size=EXPORT_ITERATOR_CHUNK_SIZE),
+    )
+
+
+def _get_conversation(user, data):
+    conversation_id = str(data.get('conversation_id') or '')
+    if not conversation_id.isdigit():
+        raise ExportError('无效的对话ID')
+    conversation = Conversation.objects.filter(id=int(conversation_id), user=user).first()
+    if conversation is None:
+        raise ExportNotFound('对话不存在')
+    return conversation
+
+
+def _conversation_params(user, data):
+    return {'conversation_id': _get_conversation(user, data).id}
+
+
+def _conversation_version(user, params):
+    conversation_id = params['conversation_id']
+    return _digest(
+        Conversation.objects.filter(id=conversation_id).values_list('title', 'created_at', 'updated_at'),
+        HealthAdvice.get_conversation_messages(conversation_id)
+        .values_list('id', 'question', 'answer').iterator(chunk_size=EXPORT_ITERATOR_CHUNK_SIZE),
+    )
+
+
+def _ai_summary_params(user, data):
+    conversation = _get_conversation(user, data)
+    if not conversation.ai_summary:
+        raise ExportError('该对话暂无AI总结，请先生成AI总结')
+    return {'conversation_id': conversation.id}
+
+
+def _ai_summary_version(user, params):
+    conversation_id = params['conversation_id']
+    return _digest(
+        Conversation.objects.filter(id=conversation_id).values_list(
+            'title', 'created_at', 'updated_at', 'ai_summary', 'ai_summary_created_at'
+        ),
+        [HealthAdvice.get_conversation_messages(conversation_id).count()],
+    )
+
+
+def _event_summary_params(user, data):
+    event_id = str(data.get('event_id') or '')
+    if not event_id.isdigit():
+        raise ExportError('无效的事件ID')
+    event = HealthEvent.objects.filter(id=int(event_id), user=user).first()
+    if event is None:
+        raise ExportNotFound('事件不存在')
+    if not event.ai_summary:
+        raise ExportError('该事件暂无AI分析，请先生成AI分析')
+    return {'event_id': event.id}
+
+
+def _event_summary_version(user, params):
+    return _digest(
+        HealthEvent.objects.filter(id=params['event_id']).values_list(
+            'name', 'event_type', 'start_date', 'end_date', 'status',
+            'description', 'ai_summary', 'ai_summary_created_at'
+        ),
+    )
+
+
+EXPORT_TYPES = {
+    'checkups': {
+        'label': '体检报告汇总',
+        'params': _checkups_params,
+        'version': _checkups_version,
+        'exporter': _checkups_exporter,
+    },
+    'health_trends': {
+        'label': '健康趋势分析',
+        'params': _trends_params,
+        'version': _trends_version,
+        'exporter': lambda user, params: HealthTrendsExporter(user),
+    },
+    'conversation': {
+        'label': 'AI健康咨询',
+        'params': _conversation_params,
+        'version': _conversation_version,
+        'exporter': lambda user, params: ConversationExporter(params['conversation_id']),
+    },
+    'ai_summary': {
+        'label': 'AI对话总结',
+        'params': _ai_summary_params,
+        'version': _ai_summary_version,
+        'exporter': lambda user, params: AISummaryExporter(params['conversation_id']),
+    },
+    'event_summary': {
+        'label': '健康事件分析',
+        'params': _event_summary_params,
+        'version': _event_summary_version,
+        'exporter': lambda user, params: EventAiSummaryExporter(params['event_id']),
+    },
+}
+
+
+# ==================== 产物存储 ====================
+
+def _artifact_path(user_id, job_id, export_format):
+    extension = EXPORT_FORMATS[export_format][0]
+    return f'{user_dir(user_id)}/{job_id}.{extension}'
+
+
+def _task_id(user_id, job_id):
+    return f'export_{user_id}_{job_id}'
+
+
+def _prepare(user, export_type, export_format, data):
+    """校验参数并计算任务ID（即产物键）"""
+    spec = EXPORT_TYPES.get(export_type)
+    if spec is None:
+        raise ExportError(f'不支持的导出类型: {export_type}')
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f'不支持的导出格式: {export_format}')
+
+    params = spec['params'](user, data or {})
+    params_digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+    version = spec['version'](user, params)
+    # 前 12 位区分导出参数，后 20 位区分数据版本；同参数的旧版本产物在生成新版本时清理
+    job_id = f'{export_type}-{export_format}-{params_digest[:12]}{version[:20]}'
+    return job_id, params
+
+
+def _remove_stale_artifacts(user_id, job_id):
+    """删除同一导出（相同类型、格式、参数）的旧数据版本产物"""
+    prefix = job_id[:-20]
+    try:
+        _, files = default_storage.listdir(user_dir(user_id))
+    except FileNotFoundError:
+        return
+    for name in files:
+        if name.startswith(prefix) and not name.startswith(job_id):
+            default_storage.delete(f'{user_dir(user_id)}/{name}')
+
+
+def _render_artifact(user_id, export_type, export_format, params, job_id):
+    """渲染导出文件并保存到存储"""
+    path = _artifact_path(user_id, job_id, export_format)
+    if artifact_available(path):
+        return {'path': path}
+
+    user = User.objects.get(id=user_id)
+    exporter = EXPORT_TYPES[export_type]['exporter'](user, params)
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE) as tmp:
+        write_export(exporter, export_format, tmp)
+        tmp.seek(0)
+        if not default_storage.exists(path):
+            default_storage.save(path, File(tmp, name=path))
+
+    _remove_stale_artifacts(user_id, job_id)
+    purge_expired_artifacts(user_id)
+    logger.info(f"[导出] user={user_id} 生成导出文件 {path}")
+    return {'path': path}
+
+
+def _job_info(job_id, status, cached=False, task=None):
+    export_type, export_format = job_id.split('-')[:2]
+    info = {
+        'job_id': job_id,
+        'export_type': export_type,
+        'format': export_format,
+        'status': status,
+        'cached': cached,
+        'progress': 100 if status == 'completed' else 0,
+        'message': '导出文件已生成' if status == 'completed' else '',
+    }
+    if task and status != 'completed':
+        info['progress'] = task.get('progress', 0)
+        info['message'] = task.get('message', '')
+        if task.get('error'):
+            info['error'] = task['error']
+    return info
+
+
+# ==================== 对外接口 ====================
+
+def request_export(user, export_type, export_format, data=None):
+    """
+    提交导出任务
+
+    数据未变化且文件已生成时直接返回 completed（cached=True）；
+    同一导出已在生成中时返回该任务，不重复提交。
+
+    Returns:
+        任务信息字典：job_id、status（pending/processing/completed/failed）、cached、progress、message
+
+    Raises:
+        ExportError: 参数无效（ExportNotFound 表示导出对象不存在）
+    """
+    job_id, params = _prepare(user, export_type, export_format, data)
+    path = _artifact_path(user.id, job_id, export_format)
+    task_id = _task_id(user.id, job_id)
+
+    with _jobs_lock:
+        task = task_manager.get_task_status(task_id)
+        if task and task['status'] in ('pending', 'processing'):
+            return _job_info(job_id, task['status'], task=task)
+        if artifact_available(path):
+            return _job_info(job_id, 'completed', cached=True)
+
+        task = task_manager.create_task(
+            task_id, _render_artifact, user.id, export_type, export_format, params, job_id
+        )
+        task['message'] = '导出任务已提交，正在生成文件'
+    return _job_info(job_id, task['status'], task=task)
+
+
+def get_export_job(user, job_id):
+    """查询导出任务状态，任务不存在（或不属于该用户）时返回 None"""
+    match = JOB_ID_PATTERN.match(job_id or '')
+    if not match:
+        return None
+
+    task = task_manager.get_task_status(_task_id(user.id, job_id))
+    if task and task['status'] != 'completed':
+        return _job_info(job_id, task['status'], task=task)
+    # 任务记录只保存在当前进程内，重启或其他进程生成的产物以存储为准
+    if artifact_available(_artifact_path(user.id, job_id, match.group('format'))):
+        return _job_info(job_id, 'completed', cached=task is None, task=task)
+    return None
+
+
+def _artifact_response(path, export_type, export_format):
+    extension, content_type = EXPORT_FORMATS[export_format]
+    filename = f"{EXPORT_TYPES[export_type]['label']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    response = FileResponse(default_storage.open(path, 'rb'), content_type=content_type)
+    response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    return response
+
+
+def export_job_download_response(user, job_id):
+    """下载已完成任务的导出文件，文件不存在时返回 None"""
+    match = JOB_ID_PATTERN.match(job_id or '')
+    if not match or match.group('export_type') not in EXPORT_TYPES:
+        return None
+    path = _artifact_path(user.id, job_id, match.group('format'))
+    if not artifact_available(path):
+        return None
+    return _artifact_response(path, match.group('export_type'), match.group('format'))
+
+
+def export_download_response(user, export_type, export_format, data=None):
+    """
+    同步导出：数据未变化时直接返回已生成的文件，否则当场生成并保存后返回
+
+    Raises:
+        ExportError: 参数无效（ExportNotFound 表示导出对象不存在）
+    """
+    job_id, params = _prepare(user, export_type, export_format, data)
+    result = _render_artifact(user.id, export_type, export_format, params, job_id)
+    return _artifact_response(result['path'], export_type, export_format)
@@ -1,9 +1,11 @@
 """导出工具 - 用于生成PDF和Word文档"""
 import os
 import re
+import tempfile
 from datetime import datetime
+from itertools import groupby
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import FileResponse
 from urllib.parse import quote
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -18,7 +20,8 @@ from docx.shared import Pt, Inches, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
-from .models import Conversation, HealthAdvice, HealthIndicator, HealthCheckup
+from . import lazy_imports
+from .models import Conversation, HealthAdvice, HealthIndicator, HealthCheckup, HealthEvent
 
 
 def register_chinese_font():
@@ -60,8 +63,96 @@ def register_chinese_font():
     return font_registered
 
 
-# 尝试注册中文字体
-CHINESE_FONT_AVAILABLE = register_chinese_font()
+# 中文字体在首次生成 PDF 时才注册（TTC 字体解析较慢，不放在导入阶段）
+lazy_imports.register('reportlab.chinese_font', register_chinese_font)
+
+
+def chinese_font_available():
+    """中文字体是否可用（首次调用时注册字体，结果缓存）"""
+    return lazy_imports.load('reportlab.chinese_font')
+
+
+PDF_CONTENT_TYPE = 'application/pdf'
+WORD_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# 导出文件超过该大小后落盘到临时文件，避免大文件常驻内存
+EXPORT_SPOOL_MAX_SIZE = 4 * 1024 * 1024
+# 逐行读取指标/消息时每批从数据库取回的条数
+EXPORT_ITERATOR_CHUNK_SIZE = 500
+
+
+class LazyStory(list):
+    """
+    按需从生成器拉取 flowable 的 ReportLab story
+
+    ReportLab 排版时每次只处理 story 头部的 flowable 并将其删除，
+    这里只预读少量 flowable，已排版的随即释放，内存占用与导出篇幅无关。
+    """
+
+    def __init__(self, flowables, prefetch=50):
+        super().__init__()
+        self._source = iter(flowables)
+        self._prefetch = prefetch
+
+    def _fill(self, needed=0):
+        target = max(needed, self._prefetch)
+        while self._source is not None and list.__len__(self) < target:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        if isinstance(index, int) and index >= 0:
+            self._fill(index + 1)
+        return list.__getitem__(self, index)
+
+
+def build_pdf(output, flowables, **doc_kwargs):
+    """以流式 story 生成 PDF 写入 output"""
+    doc = SimpleDocTemplate(output, pagesize=A4, **doc_kwargs)
+    doc.build(LazyStory(flowables))
+
+
+def file_download_response(write, content_type, filename):
+    """
+    生成下载响应
+
+    write(fileobj) 将文档写入临时文件（超过 EXPORT_SPOOL_MAX_SIZE 自动落盘），
+    再由 FileResponse 分块流式返回，不在内存中保留完整文件。
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE)
+    try:
+        write(spool)
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+
+    response = FileResponse(spool, content_type=content_type)
+    # 对中文文件名进行编码，兼容不同浏览器
+    response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    return response
+
+
+EXPORT_FORMATS = {
+    'pdf': ('pdf', PDF_CONTENT_TYPE),
+    'word': ('docx', WORD_CONTENT_TYPE),
+}
+
+
+def write_export(exporter, export_format, output):
+    """将导出器的 PDF/Word 内容写入文件对象 output（export_format 为 'pdf' 或 'word'）"""
+    if export_format == 'pdf':
+        exporter._write_pdf(output)
+    elif export_format == 'word':
+        exporter._write_word(output)
+    else:
+        raise ValueError(f'不支持的导出格式: {export_format}')
 
 
 def markdown_to_pdf_text(text):
@@ -255,31 +346,72 @@ def add_markdown_paragraphs(doc, markdown_text):
         i += 1
 
 
+# 导出表格所需的指标字段，按此顺序以元组读取
+INDICATOR_ROW_FIELDS = (
+    'indicator_type', 'indicator_name', 'checkup__checkup_date',
+    'value', 'unit', 'reference_range', 'status',
+)
+
+INDICATOR_STATUS_LABELS = {'normal': '正常', 'abnormal': '异常', 'attention': '关注'}
+
+
+def iter_indicator_groups(indicators):
+    """
+    逐行读取指标并按 类型 → 名称 两级分组
+
+    indicators 为指标查询集，按 (类型, 名称, 体检日期) 排序后以 values_list 元组
+    （字段见 INDICATOR_ROW_FIELDS）单次查询读取，不构造模型实例，
+    返回 (indicator_type, ((indicator_name, 行元组迭代器), ...)) 的惰性序列。
+    """
+    rows = indicators.order_by(
+        'indicator_type', 'indicator_name', 'checkup__checkup_date', 'id'
+    ).values_list(*INDICATOR_ROW_FIELDS).iterator(chunk_size=EXPORT_ITERATOR_CHUNK_SIZE)
+    for indicator_type, type_rows in groupby(rows, key=lambda row: row[0]):
+        yield indicator_type, groupby(type_rows, key=lambda row: row[1])
+
+
+def indicator_table_rows(rows, date_format='%Y-%m-%d'):
+    """将指标行元组转为表格单元格文本，逐行返回 ([日期, 检测值, 单位, 参考范围, 状态], 原始状态)"""
+    for _, _, checkup_date, value, unit, reference_range, status in rows:
+        yield [
+            checkup_date.strftime(date_format),
+            str(value) if value else '-',
+            unit or '-',
+            reference_range or '-',
+            INDICATOR_STATUS_LABELS.get(status, status),
+        ], status
+
+
 class ConversationExporter:
     """对话导出器"""
 
     def __init__(self, conversation_id):
         self.conversation = Conversation.objects.get(id=conversation_id)
         self.messages = HealthAdvice.get_conversation_messages(conversation_id)
+        self.message_count = self.messages.count()
         self.title = self.conversation.title
 
+    def _iter_messages(self):
+        """逐条读取消息，不缓存整个对话"""
+        return self.messages.only('question', 'answer').iterator(chunk_size=EXPORT_ITERATOR_CHUNK_SIZE)
+
     def export_to_pdf(self):
         """导出为PDF"""
-        response = HttpResponse(content_type='application/pdf')
         filename = f"AI健康咨询_{datetime.now().strftime('%Y年%m月%d日_%H%M')}.pdf"
-        # 对中文文件名进行编码，兼容不同浏览器
-        encoded_filename = quote(filename)
-        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        return file_download_response(self._write_pdf, PDF_CONTENT_TYPE, filename)
 
+    def _write_pdf(self, output):
         # 创建PDF文档
-        doc = SimpleDocTemplate(response, pagesize=A4,
-                               leftMargin=2*cm, rightMargin=2*cm,
-                               topMargin=2*cm, bottomMargin=2*cm)
-        story = []
+        build_pdf(output, self._pdf_story(),
+                  leftMargin=2*cm, rightMargin=2*cm,
+                  topMargin=2*cm, bottomMargin=2*cm)
+
+    def _pdf_story(self):
+        """逐个生成 PDF 内容"""
         styles = getSampleStyleSheet()
 
         # 创建样式（使用中文字体）
-        if CHINESE_FONT_AVAILABLE:
+        if chinese_font_available():
             # 有中文字体时使用中文字体
             title_style = ParagraphStyle(
                 'ChineseTitle',
@@ -340,14 +472,14 @@ class ConversationExporter:
             label_font = 'Helvetica-Bold'
 
         # 标题
-        story.append(Paragraph(self.title, title_style))
-        story.append(Spacer(1, 0.5 * cm))
+        yield Paragraph(self.title, title_style)
+        yield Spacer(1, 0.5 * cm)
 
         # 对话信息表格
         info_data = [
             ['创建时间', self.conversation.created_at.strftime('%Y年%m月%d日 %H:%M:%S')],
             ['更新时间', self.conversation.updated_at.strftime('%Y年%m月%d日 %H:%M:%S')],
-            ['消息数量', str(len(self.messages)) + ' 条'],
+            ['消息数量', str(self.message_count) + ' 条'],
         ]
 
         info_table = Table(info_data, colWidths=[4*cm, 11*cm])
@@ -355,7 +487,7 @@ class ConversationExporter:
             ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
             ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
             ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), label_font if CHINESE_FONT_AVAILABLE else 'Helvetica'),
+            ('FONTNAME', (0, 0), (-1, -1), label_font if chinese_font_available() else 'Helvetica'),
             ('FONTSIZE', (0, 0), (-1, -1), 10),
             ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
             ('TOPPADDING', (0, 0), (-1, -1), 8),
@@ -363,39 +495,33 @@ class ConversationExporter:
             ('RIGHTPADDING', (0, 0), (-1, -1), 8),
             ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
         ]))
-        story.append(info_table)
-        story.append(Spacer(1, 1 * cm))
+        yield info_table
+        yield Spacer(1, 1 * cm)
 
         # 对话内容
-        for idx, msg in enumerate(self.messages, 1):
+        for idx, msg in enumerate(self._iter_messages(), 1):
             # 问题标题
-            story.append(Paragraph(f"问题 {idx}:", question_style))
+            yield Paragraph(f"问题 {idx}:", question_style)
 
             # 问题内容（支持 Markdown 格式）
             question_html = markdown_to_pdf_text(msg.question)
-            story.append(Paragraph(question_html, normal_style))
-            story.append(Spacer(1, 0.3 * cm))
+            yield Paragraph(question_html, normal_style)
+            yield Spacer(1, 0.3 * cm)
 
             # 回答标题
-            story.append(Paragraph(f"回答 {idx}:", answer_style))
+            yield Paragraph(f"回答 {idx}:", answer_style)
 
             # 回答内容（支持 Markdown 格式）
             answer_html = markdown_to_pdf_text(msg.answer)
-            story.append(Paragraph(answer_html, normal_style))
-            story.append(Spacer(1, 0.8 * cm))
-
-        # 构建PDF
-        doc.build(story)
-        return response
+            yield Paragraph(answer_html, normal_style)
+            yield Spacer(1, 0.8 * cm)
 
     def export_to_word(self):
         """导出为Word"""
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
         filename = f"AI健康咨询_{datetime.now().strftime('%Y年%m月%d日_%H%M')}.docx"
-        # 对中文文件名进行编码，兼容不同浏览器
-        encoded_filename = quote(filename)
-        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        return file_download_response(self._write_word, WORD_CONTENT_TYPE, filename)
 
+    def _write_word(self, output):
         # 创建Word文档
         doc = Document()
 
@@ -420,7 +546,7 @@ class ConversationExporter:
         info_data = [
             ['创建时间', self.conversation.created_at.strftime('%Y-%m-%d %H:%M:%S')],
             ['更新时间', self.conversation.updated_at.strftime('%Y-%m-%d %H:%M:%S')],
-            ['消息数量', str(len(self.messages))],
+            ['消息数量', str(self.message_count)],
         ]
 
         for i, (label, value) in enumerate(info_data):
@@ -433,7 +559,7 @@ class ConversationExporter:
         doc.add_paragraph()
 
         # 对话内容
-        for idx, msg in enumerate(self.messages, 1):
+        for idx, msg in enumerate(self._iter_messages(), 1):
             # 问题
             q_heading = doc.add_heading(f'问题 {idx}:', level=3)
             q_heading.runs[0].font.color.rgb = RGBColor(0, 102, 204)
@@ -491,13 +617,11 @@ class ConversationExporter:
                             pass
 
             # 添加分隔线
-            if idx < len(self.messages):
+            if idx < self.message_count:
                 sep_para = doc.add_paragraph('_' * 80)
                 sep_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
-        # 保存到响应
-        doc.save(response)
-        return response
+        doc.save(output)
 
 
 class AISummaryExporter:
@@ -505,25 +629,24 @@ class AISummaryExporter:
 
     def __init__(self, conversation_id):
         self.conversation = Conversation.objects.get(id=conversation_id)
-        self.messages = HealthAdvice.get_conversation_messages(conversation_id)
+        self.message_count = HealthAdvice.get_conversation_messages(conversation_id).count()
         self.title = self.conversation.title
         self.ai_summary = self.conversation.ai_summary
         self.ai_summary_created_at = self.conversation.ai_summary_created_at
 
     def export_to_pdf(self):
         """导出AI总结为PDF"""
-        response = HttpResponse(content_type='application/pdf')
         filename = f"AI对话总结_{datetime.now().strftime('%Y年%m月%d日_%H%M')}.pdf"
-        encoded_filename = quote(filename)
-        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        return file_download_response(self._write_pdf, PDF_CONTENT_TYPE, filename)
 
-        doc = SimpleDocTemplate(response, pagesize=A4,
+    def _write_pdf(self, output):
+        doc = SimpleDocTemplate(output, pagesize=A4,
                                leftMargin=2*cm, rightMargin=2*cm,
                                topMargin=2*cm, bottomMargin=2*cm)
         story = []
         styles = getSampleStyleSheet()
 
-        if CHINESE_FONT_AVAILABLE:
+        if chinese_font_available():
             title_style = ParagraphStyle(
                 'ChineseTitle',
                 parent=styles['Heading1'],
@@ -563,7 +686,7 @@ class AISummaryExporter:
         info_data = [
             ['对话创建时间', self.conversation.created_at.strftime('%Y年%m月%d日 %H:%M')],
             ['对话更新时间', self.conversation.updated_at.strftime('%Y年%m月%d日 %H:%M')],
-            ['消息数量', f'{len(self.messages)} 条'],
+            ['消息数量', f'{self.message_count} 条'],
         ]
         if self.ai_summary_created_at:
             info_data.append(['总结生成时间', self.ai_summary_created_at.strftime('%Y年%m月%d日 %H:%M')])
@@ -573,7 +696,7 @@ class AISummaryExporter:
             ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
             ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
             ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), label_font if CHINESE_FONT_AVAILABLE else 'Helvetica'),
+            ('FONTNAME', (0, 0), (-1, -1), label_font if chinese_font_available() else 'Helvetica'),
             ('FONTSIZE', (0, 0), (-1, -1), 10),
             ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
             ('TOPPADDING', (0, 0), (-1, -1), 8),
@@ -591,15 +714,13 @@ class AISummaryExporter:
             story.append(Paragraph('暂无AI总结内容', normal_style))
 
         doc.build(story)
-        return response
 
     def export_to_word(self):
         """导出AI总结为Word"""
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
         filename = f"AI对话总结_{datetime.now().strftime('%Y年%m月%d日_%H%M')}.docx"
-        encoded_filename = quote(filename)
-        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        return file_download_response(self._write_word, WORD_CONTENT_TYPE, filename)
 
+    def _write_word(self, output):
         doc = Document()
         style = doc.styles['Normal']
         font = style.font
@@ -619,7 +740,7 @@ class AISummaryExporter:
         info_data = [
             ['对话创建时间', self.conversation.created_at.strftime('%Y-%m-%d %H:%M')],
             ['对话更新时间', self.conversation.updated_at.strftime('%Y-%m-%d %H:%M')],
-            ['消息数量', str(len(self.messages))],
+            ['消息数量', str(self.message_count)],
         ]
         if self.ai_summary_created_at:
             info_data.append(['总结生成时间', self.ai_summary_created_at.strftime('%Y-%m-%d %H:%M')])
@@ -641,8 +762,7 @@ class AISummaryExporter:
         else:
             doc.add_paragraph('暂无AI总结内容')
 
-        doc.save(response)
-        return response
+        doc.save(output)
 
 
 class EventAiSummaryExporter:
@@ -655,18 +775,17 @@ class EventAiSummaryExporter:
 
     def export_to_pdf(self):
         """导出事件AI分析为PDF"""
-        response = HttpResponse(content_type='application/pdf')
         filename = f"健康事件分析_{datetime.now().strftime('%Y年%m月%d日_%H%M')}.pdf"
-        encoded_filename = quote(filename)
-        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        return file_download_response(self._write_pdf, PDF_CONTENT_TYPE, filename)
 
-        doc = SimpleDocTemplate(response, pagesize=A4,
+    def _write_pdf(self, output):
+        doc = SimpleDocTemplate(output, pagesize=A4,
                                leftMargin=2*cm, rightMargin=2*cm,
                                topMargin=2*cm, bottomMargin=2*cm)
         story = []
         styles = getSampleStyleSheet()
 
-        if CHINESE_FONT_AVAILABLE:
+        if chinese_font_available():
             title_style = ParagraphStyle(
                 'ChineseTitle',
                 parent=styles['Heading1'],
@@ -721,7 +840,7 @@ class EventAiSummaryExporter:
             ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0f0f0')),
             ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
             ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), label_font if CHINESE_FONT_AVAILABLE else 'Helvetica'),
+            ('FONTNAME', (0, 0), (-1, -1), label_font if chinese_font_available() else 'Helvetica'),
             ('FONTSIZE', (0, 0), (-1, -1), 10),
             ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
             ('TOPPADDING', (0, 0), (-1, -1), 8),
@@ -745,15 +864,13 @@ class EventAiSummaryExporter:
             story.append(Paragraph('暂无AI分析内容', normal_style))
 
         doc.build(story)
-        return response
 
     def export_to_word(self):
         """导出事件AI分析为Word"""
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
         filename = f"健康事件分析_{datetime.now().strftime('%Y年%m月%d日_%H%M')}.docx"
-        encoded_filename = quote(filename)
-        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        return file_download_response(self._write_word, WORD_CONTENT_TYPE, filename)
 
+    def _write_word(self, output):
         doc = Document()
         style = doc.styles['Normal']
         font = style.font
@@ -805,8 +922,7 @@ class EventAiSummaryExporter:
         else:
             doc.add_paragraph('暂无AI分析内容')
 
-        doc.save(response)
-        return response
+        doc.save(output)
 
 
 class HealthTrendsExporter:
@@ -814,41 +930,28 @@ class HealthTrendsExporter:
 
     def __init__(self, user):
         self.user = user
-        self.indicators = self._get_indicators_by_type()
 
-    def _get_indicators_by_type(self):
-        """按类型分组获取健康指标"""
-        from .models import HealthIndicator
-
-        all_indicators = HealthIndicator.objects.filter(
-            checkup__user=self.user
-        ).select_related('checkup').order_by('checkup__checkup_date', 'indicator_name')
-
-        # 按类型分组
-        grouped = {}
-        for indicator in all_indicators:
-            if indicator.indicator_type not in grouped:
-                grouped[indicator.indicator_type] = []
-            grouped[indicator.indicator_type].append(indicator)
-
-        return grouped
+    def _iter_indicators_by_type(self):
+        """按类型、名称分组逐行读取健康指标"""
+        return iter_indicator_groups(HealthIndicator.objects.filter(checkup__user=self.user))
 
     def export_to_pdf(self):
         """导出为PDF"""
-        response = HttpResponse(content_type='application/pdf')
         filename = f"健康趋势分析_{datetime.now().strftime('%Y年%m月%d日_%H%M')}.pdf"
-        encoded_filename = quote(filename)
-        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        return file_download_response(self._write_pdf, PDF_CONTENT_TYPE, filename)
 
+    def _write_pdf(self, output):
         # 创建PDF文档
-        doc = SimpleDocTemplate(response, pagesize=A4,
-                               leftMargin=1.5*cm, rightMargin=1.5*cm,
-                               topMargin=2*cm, bottomMargin=2*cm)
-        story = []
+        build_pdf(output, self._pdf_story(),
+                  leftMargin=1.5*cm, rightMargin=1.5*cm,
+                  topMargin=2*cm, bottomMargin=2*cm)
+
+    def _pdf_story(self):
+        """逐个生成 PDF 内容，每个指标的表格在排版到时才构建"""
         styles = getSampleStyleSheet()
 
         # 样式设置
-        if CHINESE_FONT_AVAILABLE:
+        if chinese_font_available():
             title_style = ParagraphStyle(
                 'Title',
                 parent=styles['Heading1'],
@@ -884,9 +987,9 @@ class HealthTrendsExporter:
             table_font = 'Helvetica'
 
         # 标题
-        story.append(Paragraph("健康趋势分析报告", title_style))
-        story.append(Paragraph(f"生成时间：{datetime.now().strftime('%Y年%m月%d日 %H:%M')}", normal_style))
-        story.append(Spacer(1, 0.5 * cm))
+        yield Paragraph("健康趋势分析报告", title_style)
+        yield Paragraph(f"生成时间：{datetime.now().strftime('%Y年%m月%d日 %H:%M')}", normal_style)
+        yield Spacer(1, 0.5 * cm)
 
         # 按类型导出数据
         type_names = {
@@ -908,56 +1011,44 @@ class HealthTrendsExporter:
         }
 
         first_category = True
-        for indicator_type, indicators in self.indicators.items():
-            if not indicators:
-                continue
-
+        for indicator_type, indicator_groups in self._iter_indicators_by_type():
             if not first_category:
-                story.append(PageBreak())
+                yield PageBreak()
             first_category = False
 
             # 分类标题
             type_name = type_names.get(indicator_type, indicator_type)
-            story.append(Paragraph(type_name, category_style))
-
-            # 按指标名称分组
-            indicator_groups = {}
-            for ind in indicators:
-                if ind.indicator_name not in indicator_groups:
-                    indicator_groups[ind.indicator_name] = []
-                indicator_groups[ind.indicator_name].append(ind)
+            yield Paragraph(type_name, category_style)
 
             # 为每个指标创建表格
-            for indicator_name, ind_list in indicator_groups.items():
+            for indicator_name, ind_list in indicator_groups:
                 # 表格标题
-                story.append(Paragraph(f"【{indicator_name}】", ParagraphStyle(
+                yield Paragraph(f"【{indicator_name}】", ParagraphStyle(
                     'IndicatorTitle',
                     parent=category_style,
-                    fontName=table_font if CHINESE_FONT_AVAILABLE else 'Helvetica-Bold',
+                    fontName=table_font if chinese_font_available() else 'Helvetica-Bold',
                     fontSize=12,
                     textColor=colors.HexColor('#333333'),
                     spaceBefore=10,
                     spaceAfter=5
-                )))
+                ))
 
-                # 准备表格数据
+                # 准备表格数据，同时收集状态行着色
                 table_data = [['体检日期', '检测值', '单位', '参考范围', '状态']]
-                for ind in ind_list:
-                    date_str = ind.checkup.checkup_date.strftime('%Y-%m-%d')
-                    value = ind.value or '-'
-                    unit = ind.unit or '-'
-                    ref_range = ind.reference_range or '-'
-                    status_map = {'normal': '正常', 'abnormal': '异常', 'attention': '关注'}
-                    status = status_map.get(ind.status, ind.status)
-
-                    table_data.append([date_str, value, unit, ref_range, status])
+                status_styles = []
+                for i, (cells, status) in enumerate(indicator_table_rows(ind_list), start=1):
+                    table_data.append(cells)
+                    if status == 'abnormal':
+                        status_styles.append(('TEXTCOLOR', (0, i), (-1, i), colors.red))
+                    elif status == 'attention':
+                        status_styles.append(('TEXTCOLOR', (0, i), (-1, i), colors.HexColor('#ff9800')))
 
                 # 创建表格
                 table = Table(table_data, colWidths=[2.5*cm, 2*cm, 2*cm, 4*cm, 1.5*cm])
                 table.setStyle(TableStyle([
                     ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
                     ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('FONTNAME', (0, 0), (-1, -1), table_font if CHINESE_FONT_AVAILABLE else 'Helvetica'),
+                    ('FONTNAME', (0, 0), (-1, -1), table_font if chinese_font_available() else 'Helvetica'),
                     ('FONTSIZE', (0, 0), (-1, -1), 9),
                     ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
                     ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
@@ -965,30 +1056,17 @@ class HealthTrendsExporter:
                     ('TOPPADDING', (0, 0), (-1, -1), 6),
                     ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
                     ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
-                ]))
+                ] + status_styles))
 
-                # 状态列着色
-                for i, row in enumerate(table_data[1:], start=1):
-                    status = row[4]
-                    if status == '异常':
-                        table.setStyle(TableStyle([('TEXTCOLOR', (0, i), (-1, i), colors.red)]))
-                    elif status == '关注':
-                        table.setStyle(TableStyle([('TEXTCOLOR', (0, i), (-1, i), colors.HexColor('#ff9800'))]))
-
-                story.append(table)
-                story.append(Spacer(1, 0.3 * cm))
-
-        # 构建PDF
-        doc.build(story)
-        return response
+                yield table
+                yield Spacer(1, 0.3 * cm)
 
     def export_to_word(self):
         """导出为Word"""
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
         filename = f"健康趋势分析_{datetime.now().strftime('%Y年%m月%d日_%H%M')}.docx"
-        encoded_filename = quote(filename)
-        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        return file_download_response(self._write_word, WORD_CONTENT_TYPE, filename)
 
+    def _write_word(self, output):
         # 创建Word文档
         doc = Document()
 
@@ -1035,24 +1113,14 @@ class HealthTrendsExporter:
         }
 
         # 按类型导出数据
-        for indicator_type, indicators in self.indicators.items():
-            if not indicators:
-                continue
-
+        for indicator_type, indicator_groups in self._iter_indicators_by_type():
             # 分类标题
             type_name = type_names.get(indicator_type, indicator_type)
             category_heading = doc.add_heading(type_name, level=2)
             category_heading.runs[0].font.color.rgb = RGBColor(0, 102, 204)
 
-            # 按指标名称分组
-            indicator_groups = {}
-            for ind in indicators:
-                if ind.indicator_name not in indicator_groups:
-                    indicator_groups[ind.indicator_name] = []
-                indicator_groups[ind.indicator_name].append(ind)
-
             # 为每个指标创建表格
-            for indicator_name, ind_list in indicator_groups.items():
+            for indicator_name, ind_list in indicator_groups:
                 # 指标名称
                 ind_heading = doc.add_heading(f'【{indicator_name}】', level=3)
 
@@ -1068,30 +1136,18 @@ class HealthTrendsExporter:
                     header_cells[i].paragraphs[0].runs[0].font.bold = True
 
                 # 数据行
-                for ind in ind_list:
+                for cells, status in indicator_table_rows(ind_list, date_format='%Y年%m月%d日'):
                     row_cells = table.add_row().cells
-                    date_str = ind.checkup.checkup_date.strftime('%Y年%m月%d日')
-                    value = ind.value or '-'
-                    unit = ind.unit or '-'
-                    ref_range = ind.reference_range or '-'
-                    status_map = {'normal': '正常', 'abnormal': '异常', 'attention': '关注'}
-                    status = status_map.get(ind.status, ind.status)
-
-                    row_cells[0].text = date_str
-                    row_cells[1].text = str(value)
-                    row_cells[2].text = unit
-                    row_cells[3].text = ref_range
-                    row_cells[4].text = status
+                    for cell, text in zip(row_cells, cells):
+                        cell.text = text
 
                     # 设置状态颜色
-                    if ind.status in status_colors:
-                        row_cells[4].paragraphs[0].runs[0].font.color.rgb = status_colors[ind.status]
+                    if status in status_colors:
+                        row_cells[4].paragraphs[0].runs[0].font.color.rgb = status_colors[status]
 
                 doc.add_paragraph()  # 空行
 
-        # 保存到响应
-        doc.save(response)
-        return response
+        doc.save(output)
 
 
 class CheckupReportsExporter:
@@ -1102,32 +1158,31 @@ class CheckupReportsExporter:
         初始化导出器
         :param checkups: HealthCheckup QuerySet 或列表
         """
+        if hasattr(checkups, 'select_related'):
+            checkups = checkups.select_related('user')
         self.checkups = checkups
         self.user = checkups[0].user if checkups else None
 
-        # 收集所有体检报告的指标数据
-        self.indicators = {}
-        for checkup in checkups:
-            for indicator in checkup.indicators.all().order_by('indicator_type', 'indicator_name'):
-                if indicator.indicator_type not in self.indicators:
-                    self.indicators[indicator.indicator_type] = []
-                self.indicators[indicator.indicator_type].append(indicator)
+    def _iter_indicators_by_type(self):
+        """按类型、名称分组逐行读取所选体检报告的指标"""
+        return iter_indicator_groups(HealthIndicator.objects.filter(checkup__in=self.checkups))
 
     def export_to_pdf(self):
         """导出为PDF"""
-        response = HttpResponse(content_type='application/pdf')
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'体检报告汇总_{timestamp}.pdf'
-        encoded_filename = quote(filename)
-        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        return file_download_response(self._write_pdf, PDF_CONTENT_TYPE, filename)
 
+    def _write_pdf(self, output):
         # 创建PDF文档
-        doc = SimpleDocTemplate(response, pagesize=A4)
-        story = []
+        build_pdf(output, self._pdf_story())
+
+    def _pdf_story(self):
+        """逐个生成 PDF 内容，每个指标的表格在排版到时才构建"""
         styles = getSampleStyleSheet()
 
         # 自定义样式
-        if CHINESE_FONT_AVAILABLE:
+        if chinese_font_available():
             title_style = ParagraphStyle(
                 'CustomTitle',
                 parent=styles['Heading1'],
@@ -1159,15 +1214,14 @@ class CheckupReportsExporter:
             normal_style = styles['Normal']
 
         # 标题
-        title = Paragraph("体检报告汇总", title_style)
-        story.append(title)
-        story.append(Spacer(1, 0.5*cm))
+        yield Paragraph("体检报告汇总", title_style)
+        yield Spacer(1, 0.5*cm)
 
         # 汇总信息
         if self.user:
             info_text = f"用户：{self.user.username} | 共 {len(self.checkups)} 份报告"
-            story.append(Paragraph(info_text, normal_style))
-            story.append(Spacer(1, 0.5*cm))
+            yield Paragraph(info_text, normal_style)
+            yield Spacer(1, 0.5*cm)
 
         # 类型名称映射
         type_names = {
@@ -1194,38 +1248,19 @@ class CheckupReportsExporter:
         }
 
         # 按类型导出数据
-        for indicator_type, indicators in self.indicators.items():
-            if not indicators:
-                continue
-
+        for indicator_type, indicator_groups in self._iter_indicators_by_type():
             # 分类标题
             type_name = type_names.get(indicator_type, indicator_type)
-            story.append(Paragraph(type_name, heading_style))
-
-            # 按指标名称分组
-            indicator_groups = {}
-            for ind in indicators:
-                if ind.indicator_name not in indicator_groups:
-                    indicator_groups[ind.indicator_name] = []
-                indicator_groups[ind.indicator_name].append(ind)
+            yield Paragraph(type_name, heading_style)
 
             # 为每个指标创建表格
-            for indicator_name, ind_list in indicator_groups.items():
+            for indicator_name, ind_list in indicator_groups:
                 # 指标名称
-                story.append(Paragraph(f"<b>{indicator_name}</b>", normal_style))
+                yield Paragraph(f"<b>{indicator_name}</b>", normal_style)
 
                 # 准备表格数据
                 table_data = [['体检日期', '检测值', '单位', '参考范围', '状态']]
-
-                for ind in ind_list:
-                    date_str = ind.checkup.checkup_date.strftime('%Y-%m-%d')
-                    value = str(ind.value) if ind.value else '-'
-                    unit = ind.unit or '-'
-                    ref_range = ind.reference_range or '-'
-                    status_map = {'normal': '正常', 'abnormal': '异常', 'attention': '关注'}
-                    status = status_map.get(ind.status, ind.status)
-
-                    table_data.append([date_str, value, unit, ref_range, status])
+                table_data.extend(cells for cells, _ in indicator_table_rows(ind_list))
 
                 # 创建表格
                 table = Table(table_data, colWidths=[3*cm, 2.5*cm, 2*cm, 3*cm, 2*cm])
@@ -1233,33 +1268,28 @@ class CheckupReportsExporter:
                     ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
                     ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
                     ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'ChineseFont' if CHINESE_FONT_AVAILABLE else 'Helvetica-Bold'),
+                    ('FONTNAME', (0, 0), (-1, 0), 'ChineseFont' if chinese_font_available() else 'Helvetica-Bold'),
                     ('FONTSIZE', (0, 0), (-1, 0), 10),
                     ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
                     ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('FONTNAME', (0, 1), (-1, -1), 'ChineseFont' if CHINESE_FONT_AVAILABLE else 'Helvetica'),
+                    ('FONTNAME', (0, 1), (-1, -1), 'ChineseFont' if chinese_font_available() else 'Helvetica'),
                     ('FONTSIZE', (0, 1), (-1, -1), 9),
                     ('GRID', (0, 0), (-1, -1), 1, colors.black),
                     ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.whitesmoke]),
                 ]))
 
-                story.append(table)
-                story.append(Spacer(1, 0.3*cm))
+                yield table
+                yield Spacer(1, 0.3*cm)
 
-            story.append(PageBreak())
-
-        # 生成PDF
-        doc.build(story)
-        return response
+            yield PageBreak()
 
     def export_to_word(self):
         """导出为Word"""
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'体检报告汇总_{timestamp}.docx'
-        encoded_filename = quote(filename)
-        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+        return file_download_response(self._write_word, WORD_CONTENT_TYPE, filename)
 
+    def _write_word(self, output):
         # 创建Word文档
         doc = Document()
 
@@ -1309,24 +1339,14 @@ class CheckupReportsExporter:
         }
 
         # 按类型导出数据
-        for indicator_type, indicators in self.indicators.items():
-            if not indicators:
-                continue
-
+        for indicator_type, indicator_groups in self._iter_indicators_by_type():
             # 分类标题
             type_name = type_names.get(indicator_type, indicator_type)
             category_heading = doc.add_heading(type_name, level=2)
             category_heading.runs[0].font.color.rgb = RGBColor(0, 102, 204)
 
-            # 按指标名称分组
-            indicator_groups = {}
-            for ind in indicators:
-                if ind.indicator_name not in indicator_groups:
-                    indicator_groups[ind.indicator_name] = []
-                indicator_groups[ind.indicator_name].append(ind)
-
             # 为每个指标创建表格
-            for indicator_name, ind_list in indicator_groups.items():
+            for indicator_name, ind_list in indicator_groups:
                 # 指标名称
                 ind_heading = doc.add_heading(f'【{indicator_name}】', level=3)
 
@@ -1342,27 +1362,15 @@ class CheckupReportsExporter:
                     header_cells[i].paragraphs[0].runs[0].font.bold = True
 
                 # 数据行
-                for ind in ind_list:
+                for cells, status in indicator_table_rows(ind_list, date_format='%Y年%m月%d日'):
                     row_cells = table.add_row().cells
-                    date_str = ind.checkup.checkup_date.strftime('%Y年%m月%d日')
-                    value = ind.value or '-'
-                    unit = ind.unit or '-'
-                    ref_range = ind.reference_range or '-'
-                    status_map = {'normal': '正常', 'abnormal': '异常', 'attention': '关注'}
-                    status = status_map.get(ind.status, ind.status)
-
-                    row_cells[0].text = date_str
-                    row_cells[1].text = str(value)
-                    row_cells[2].text = unit
-                    row_cells[3].text = ref_range
-                    row_cells[4].text = status
+                    for cell, text in zip(row_cells, cells):
+                        cell.text = text
 
                     # 设置状态颜色
-                    if ind.status in status_colors:
-                        row_cells[4].paragraphs[0].runs[0].font.color.rgb = status_colors[ind.status]
+                    if status in status_colors:
+                        row_cells[4].paragraphs[0].runs[0].font.color.rgb = status_colors[status]
 
                 doc.add_paragraph()  # 空行
 
-        # 保存到响应
-        doc.save(response)
-        return response
+        doc.save(output)
@@ -490,6 +490,13 @@ class SystemSettingsForm(forms.Form):
         help_text='仅适用于阿里云 Qwen 系列模型（Qwen3.5、Qwen3、Qwen3-Omni-Flash、Qwen3-VL）。开启后模型会在回复前进行思考，思考内容可通过 reasoning_content 字段查看。'
     )
 
+    ai_answer_cache_enabled = forms.BooleanField(
+        label='启用通用问题答案缓存',
+        required=False,
+        initial=False,
+        help_text='新对话中未选择体检报告、药单的通用健康问题，与已回答过的问题足够相似时直接返回缓存答案。提示词、个人信息或模型变化后不会命中旧答案。'
+    )
+
     # Google Gemini设置
     gemini_api_key = forms.CharField(
         label='Gemini API密钥',
@@ -608,6 +615,7 @@ class SystemSettingsForm(forms.Form):
         self.fields['ai_doctor_provider'].initial = SystemSettings.get_setting('ai_doctor_provider', 'openai')
         self.fields['ai_doctor_enable_thinking'].initial = SystemSettings.get_setting('ai_doctor_enable_thinking', 'false').lower() == 'true'
         self.fields['ai_doctor_thinking_mode'].initial = SystemSettings.get_setting('ai_doctor_thinking_mode', 'true')
+        self.fields['ai_answer_cache_enabled'].initial = SystemSettings.get_setting('ai_answer_cache_enabled', 'false').lower() == 'true'
 
         # 加载Gemini设置
         self.fields['gemini_api_key'].initial = SystemSettings.get_setting('gemini_api_key', '')
@@ -648,6 +656,7 @@ class SystemSettingsForm(forms.Form):
         SystemSettings.set_setting('ai_doctor_provider', self.cleaned_data['ai_doctor_provider'], 'AI医生服务提供商')
         SystemSettings.set_setting('ai_doctor_enable_thinking', 'true' if self.cleaned_data['ai_doctor_enable_thinking'] else 'false', 'AI医生启用思考模式')
         SystemSettings.set_setting('ai_doctor_thinking_mode', self.cleaned_data['ai_doctor_thinking_mode'], 'AI医生思考模式')
+        SystemSettings.set_setting('ai_answer_cache_enabled', 'true' if self.cleaned_data['ai_answer_cache_enabled'] else 'false', 'AI医生通用问题答案缓存')
 
         # 保存Gemini设置
         SystemSettings.set_setting('gemini_api_key', self.cleaned_data['gemini_api_key'], 'Gemini API密钥')
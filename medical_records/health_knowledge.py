@@ -0,0 +1,212 @@
+"""
+本地健康知识库（离线，随代码发布）
+数据见 knowledge/health_knowledge.json：常见体检指标的参考范围与临床意义、常见慢病与症状的生活方式建议。
+进程内首次使用时加载并建立索引（别名精确表 + 字符二元组倒排表），此后关键词查询只做内存查找，
+AI医生的 check_health_knowledge / search_similar_cases 工具直接返回有用的参考信息，无需额外调用大模型。
+"""
+
+import json
+import math
+import os
+import re
+from collections import defaultdict
+
+from .lazy_imports import load, register
+from .report_chunking import canonical_indicator_name
+
+KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'knowledge', 'health_knowledge.json')
+
+# 别名/标题中的二元组权重高于正文
+TITLE_WEIGHT = 3.0
+BODY_FIELDS = ('summary', 'high', 'low', 'see_doctor')
+LIST_FIELDS = ('advice', 'causes', 'red_flags', 'related')
+# 二元组检索的最低得分（过低的只是零星字符重合）
+MIN_SCORE = 0.15
+
+_ASCII_RE = re.compile(r'^[a-z0-9().%+\-γ/]+$')
+
+
+def _bigrams(text):
+    text = canonical_indicator_name(text)
+    if len(text) < 2:
+        return [text] if text else []
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+class KnowledgeBase:
+    """知识条目及其查询索引"""
+
+    def __init__(self, data):
+        self.version = data.get('version')
+        self.disclaimer = data.get('disclaimer', '')
+        self.entries = data.get('entries', [])
+        self.by_id = {entry['id']: entry for entry in self.entries}
+
+        # 别名精确表；包含匹配时按别名长度从长到短尝试，短的英文缩写要求词边界
+        self.by_alias = defaultdict(list)
+        for index, entry in enumerate(self.entries):
+            for alias in [entry['title'], *entry.get('aliases', [])]:
+                key = canonical_indicator_name(alias)
+                if key and index not in self.by_alias[key]:
+                    self.by_alias[key].append(index)
+        self.aliases = sorted(self.by_alias, key=len, reverse=True)
+
+        # 字符二元组倒排表（TF-IDF 权重，按条目归一化）
+        raw = []
+        df = defaultdict(int)
+        for entry in self.entries:
+            weights = defaultdict(float)
+            for alias in [entry['title'], *entry.get('aliases', [])]:
+                for gram in _bigrams(alias):
+                    weights[gram] += TITLE_WEIGHT
+            body = [entry.get(field) or '' for field in BODY_FIELDS]
+            for field in LIST_FIELDS:
+                body.extend(entry.get(field) or [])
+            for gram in _bigrams(' '.join(body)):
+                weights[gram] += 1.0
+            raw.append(weights)
+            for gram in weights:
+                df[gram] += 1
+
+        total = len(self.entries)
+        self.idf = {gram: math.log((total + 1) / (count + 1)) + 1 for gram, count in df.items()}
+        self.postings = defaultdict(list)
+        for index, weights in enumerate(raw):
+            vector = {gram: (1 + math.log(w)) * self.idf[gram] for gram, w in weights.items()}
+            norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+            for gram, value in vector.items():
+                self.postings[gram].append((index, value / norm))
+
+    @classmethod
+    def from_file(cls, path=KNOWLEDGE_FILE):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _alias_matches(self, text):
+        """text 中出现的别名对应的条目（较长的别名优先，已被更长别名覆盖的位置不再匹配）"""
+        matched = []
+        covered = []
+        for alias in self.aliases:
+            if len(alias) < 2:
+                continue
+            start = text.find(alias)
+            while start != -1:
+                end = start + len(alias)
+                boundary_ok = not _ASCII_RE.match(alias) or (
+                    (start == 0 or not text[start - 1].isascii() or not text[start - 1].isalnum())
+                    and (end == len(text) or not text[end].isascii() or not text[end].isalnum())
+                )
+                if boundary_ok and not any(s <= start and end <= e for s, e in covered):
+                    covered.append((start, end))
+                    for index in self.by_alias[alias]:
+                        if index not in matched:
+                            matched.append(index)
+                    break
+                start = text.find(alias, start + 1)
+        return matched
+
+    def _ranked(self, text):
+        query = defaultdict(float)
+        for gram in _bigrams(text):
+            if gram in self.idf:
+                query[gram] += 1.0
+        if not query:
+            return []
+        vector = {gram: (1 + math.log(w)) * self.idf[gram] for gram, w in query.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        scores = defaultdict(float)
+        for gram, value in vector.items():
+            for index, weight in self.postings[gram]:
+                scores[index] += value / norm * weight
+        return [index for index, score in sorted(scores.items(), key=lambda item: -item[1]) if score >= MIN_SCORE]
+
+    def lookup(self, keyword, limit=3, categories=None):
+        """
+        按关键词查找知识条目
+
+        先用别名精确匹配与关键词中包含的别名；都没有命中时才按字符二元组相似度查找
+
+        Args:
+            categories: 限定条目类别（'indicator' / 'condition' / 'symptom'），None 表示不限
+
+        Returns:
+            list[dict]: 知识条目
+        """
+        text = canonical_indicator_name(keyword)
+        if not text:
+            return []
+
+        result = []
+        for candidates in (self.by_alias.get(text, []), self._alias_matches(text), None):
+            if candidates is None:
+                if result:
+                    break
+                candidates = self._ranked(text)
+            for index in candidates:
+                entry = self.entries[index]
+                if categories and entry['category'] not in categories:
+                    continue
+                if entry not in result:
+                    result.append(entry)
+                if len(result) >= limit:
+                    return result
+        return result
+
+
+def format_entry(entry):
+    """知识条目的文本形式"""
+    lines = [f"【{entry['title']}】"]
+    if entry['category'] == 'symptom':
+        if entry.get('causes'):
+            lines.append("常见原因：" + "；".join(entry['causes']))
+        if entry.get('advice'):
+            lines.append("自我处理：")
+            lines.extend(f"- {item}" for item in entry['advice'])
+        if entry.get('red_flags'):
+            lines.append("出现以下情况应及时就医：")
+            lines.extend(f"- {item}" for item in entry['red_flags'])
+        return "\n".join(lines)
+
+    if entry.get('reference'):
+        lines.append(f"参考范围：{entry['reference']}")
+    if entry.get('summary'):
+        lines.append(f"说明：{entry['summary']}")
+    if entry.get('high'):
+        lines.append(f"{'偏高' if entry['category'] == 'indicator' else '异常'}：{entry['high']}")
+    if entry.get('low'):
+        lines.append(f"偏低：{entry['low']}")
+    if entry.get('advice'):
+        lines.append("建议：")
+        lines.extend(f"- {item}" for item in entry['advice'])
+    if entry.get('see_doctor'):
+        lines.append(f"何时就医：{entry['see_doctor']}")
+    if entry.get('related'):
+        lines.append("相关指标：" + "、".join(entry['related']))
+    return "\n".join(lines)
+
+
+def get_knowledge_base():
+    """进程内共享的知识库（首次调用时加载）"""
+    return load('health_knowledge.base')
+
+
+def format_knowledge(keyword, limit=3):
+    """关键词的健康知识文本；知识库中没有相关条目时给出说明"""
+    kb = get_knowledge_base()
+    entries = kb.lookup(keyword, limit)
+    if not entries:
+        return f"本地知识库中未找到与 '{keyword}' 相关的条目，请基于公认的医学常识回答，并建议用户咨询专业医生。"
+    return "\n\n".join(format_entry(entry) for entry in entries) + f"\n\n{kb.disclaimer}"
+
+
+def format_symptom_guidance(symptoms, limit=3):
+    """症状描述对应的常见原因、自我处理与就医警示"""
+    kb = get_knowledge_base()
+    entries = kb.lookup(symptoms, limit, categories=('symptom', 'condition'))
+    if not entries:
+        return (f"本地知识库中未找到与症状 '{symptoms}' 直接相关的条目。"
+                "如症状持续、加重，或出现呼吸困难、剧烈胸痛、意识模糊、严重出血等情况，请立即就医。")
+    return "\n\n".join(format_entry(entry) for entry in entries) + f"\n\n{kb.disclaimer}"
+
+
+register('health_knowledge.base', KnowledgeBase.from_file)
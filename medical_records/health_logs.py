@@ -0,0 +1,232 @@
+"""
+健康日志批量写入服务
+一次校验、批量插入症状/体征日志，并批量挂接到当天的自动事件
+"""
+
+from datetime import date, datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from .models import EventItem, HealthCheckup, HealthEvent, Medication, SymptomEntry, VitalEntry
+
+# 单次批量提交的最大条数
+MAX_BATCH_SIZE = 500
+
+SEVERITY_VALUES = {value for value, _ in SymptomEntry.SEVERITY_CHOICES}
+VITAL_TYPE_VALUES = {value for value, _ in VitalEntry.VITAL_TYPE_CHOICES}
+
+
+def attach_entries_to_daily_events(user, entries):
+    """
+    将一批症状/体征日志挂接到各自日期的自动事件
+
+    固定查询次数：一次查已有事件、一次批量创建缺失事件（及回查）、一次批量创建事件项目。
+    """
+    entries = [entry for entry in entries if entry.pk]
+    if not entries:
+        return
+
+    entry_dates = {entry.entry_date for entry in entries}
+
+    def load_events():
+        events = HealthEvent.objects.filter(
+            user=user,
+            start_date__in=entry_dates,
+            event_type='wellness',
+            is_auto_generated=True,
+        ).order_by('id')
+        by_date = {}
+        for event in events:
+            if event.end_date == event.start_date:
+                by_date.setdefault(event.start_date, event)
+        return by_date
+
+    events_by_date = load_events()
+    missing_dates = sorted(entry_dates - set(events_by_date))
+    if missing_dates:
+        HealthEvent.objects.bulk_create([
+            HealthEvent(
+                user=user,
+                name=f"{entry_date} 日志",
+                description='自动创建：症状/体征日志',
+                start_date=entry_date,
+                end_date=entry_date,
+                event_type='wellness',
+                is_auto_generated=True,
+            )
+            for entry_date in missing_dates
+        ])
+        events_by_date = load_events()
+
+    EventItem.objects.bulk_create([
+        EventItem(
+            event=events_by_date[entry.entry_date],
+            content_type=ContentType.objects.get_for_model(entry),
+            object_id=entry.pk,
+            added_by='auto',
+        )
+        for entry in entries
+    ], ignore_conflicts=True)
+
+
+def _parse_entry_date(raw):
+    if not raw:
+        return date.today()
+    return datetime.strptime(str(raw), '%Y-%m-%d').date()
+
+
+def _owned_ids(model, user, ids):
+    ids = {int(i) for i in ids if str(i).isdigit()}
+    if not ids:
+        return set()
+    return set(model.objects.filter(user=user, id__in=ids).values_list('id', flat=True))
+
+
+def _validate_related(item, owned_checkups, owned_medications):
+    """校验关联体检/药单是否属于当前用户，返回 (checkup_id, medication_id)"""
+    checkup_id = item.get('related_checkup_id') or None
+    medication_id = item.get('related_medication_id') or None
+    if checkup_id is not None and int(checkup_id) not in owned_checkups:
+        raise ValueError('关联体检不存在或无权访问')
+    if medication_id is not None and int(medication_id) not in owned_medications:
+        raise ValueError('关联药单不存在或无权访问')
+    return (int(checkup_id) if checkup_id is not None else None,
+            int(medication_id) if medication_id is not None else None)
+
+
+def _build_symptom(user, item, owned_checkups, owned_medications):
+    symptom = str(item.get('symptom') or '').strip()
+    if not symptom:
+        raise ValueError('症状名称不能为空')
+    try:
+        severity = int(item.get('severity', 3))
+    except (TypeError, ValueError):
+        raise ValueError('严重程度必须为1-5的整数')
+    if severity not in SEVERITY_VALUES:
+        raise ValueError('严重程度必须为1-5的整数')
+    checkup_id, medication_id = _validate_related(item, owned_checkups, owned_medications)
+    return SymptomEntry(
+        user=user,
+        entry_date=_parse_entry_date(item.get('entry_date')),
+        symptom=symptom[:200],
+        severity=severity,
+        notes=str(item.get('notes') or '').strip(),
+        related_checkup_id=checkup_id,
+        related_medication_id=medication_id,
+    )
+
+
+def _build_vital(user, item, owned_checkups, owned_medications):
+    vital_type = str(item.get('vital_type') or '').strip()
+    if not vital_type:
+        raise ValueError('体征类型不能为空')
+    if vital_type not in VITAL_TYPE_VALUES:
+        raise ValueError(f'不支持的体征类型: {vital_type}')
+    value = str(item.get('value') or '').strip()
+    if not value:
+        raise ValueError('数值不能为空')
+    checkup_id, medication_id = _validate_related(item, owned_checkups, owned_medications)
+    entry = VitalEntry(
+        user=user,
+        entry_date=_parse_entry_date(item.get('entry_date')),
+        vital_type=vital_type,
+        value=value[:100],
+        unit=str(item.get('unit') or '').strip()[:20],
+        notes=str(item.get('notes') or '').strip(),
+        related_checkup_id=checkup_id,
+        related_medication_id=medication_id,
+    )
+    # bulk_create 不会调用 save()，需手动解析数值列
+    entry.populate_numeric_values()
+    return entry
+
+
+def _serialize_symptom(entry):
+    return {
+        'id': entry.id,
+        'entry_date': entry.entry_date.strftime('%Y-%m-%d'),
+        'symptom': entry.symptom,
+        'severity': entry.severity,
+        'severity_display': entry.get_severity_display(),
+        'notes': entry.notes or '',
+    }
+
+
+def _serialize_vital(entry):
+    return {
+        'id': entry.id,
+        'entry_date': entry.entry_date.strftime('%Y-%m-%d'),
+        'vital_type': entry.vital_type,
+        'vital_type_display': entry.get_vital_type_display(),
+        'value': entry.value,
+        'numeric_value': entry.numeric_value,
+        'numeric_value_secondary': entry.numeric_value_secondary,
+        'unit': entry.unit or '',
+        'notes': entry.notes or '',
+    }
+
+
+def bulk_create_health_logs(user, symptoms=None, vitals=None, attach_events=True):
+    """
+    批量创建症状/体征日志
+
+    Args:
+        user: 用户对象
+        symptoms: 症状日志字典列表
+        vitals: 体征日志字典列表
+        attach_events: 是否挂接到当天的自动事件
+
+    Returns:
+        {'symptoms': [逐行结果], 'vitals': [逐行结果], 'created_count', 'failed_count'}
+        逐行结果为 {'index', 'success', 'log'} 或 {'index', 'success', 'error'}
+
+    Raises:
+        ValueError: 提交条数超过 MAX_BATCH_SIZE
+    """
+    symptoms = list(symptoms or [])
+    vitals = list(vitals or [])
+    if len(symptoms) + len(vitals) > MAX_BATCH_SIZE:
+        raise ValueError(f'单次最多提交 {MAX_BATCH_SIZE} 条日志')
+
+    # 一次性查出所有被引用的体检/药单归属
+    all_items = [item for item in symptoms + vitals if isinstance(item, dict)]
+    owned_checkups = _owned_ids(HealthCheckup, user, [item.get('related_checkup_id') for item in all_items])
+    owned_medications = _owned_ids(Medication, user, [item.get('related_medication_id') for item in all_items])
+
+    results = {'symptoms': [], 'vitals': []}
+    pending = {'symptoms': [], 'vitals': []}
+    builders = {
+        'symptoms': (symptoms, _build_symptom),
+        'vitals': (vitals, _build_vital),
+    }
+
+    for key, (items, builder) in builders.items():
+        for index, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError('日志格式错误')
+                entry = builder(user, item, owned_checkups, owned_medications)
+            except (TypeError, ValueError) as e:
+                results[key].append({'index': index, 'success': False, 'error': str(e)})
+                continue
+            pending[key].append((index, entry))
+
+    with transaction.atomic():
+        created = {
+            'symptoms': SymptomEntry.objects.bulk_create([entry for _, entry in pending['symptoms']]),
+            'vitals': VitalEntry.objects.bulk_create([entry for _, entry in pending['vitals']]),
+        }
+        if attach_events:
+            attach_entries_to_daily_events(user, created['symptoms'] + created['vitals'])
+
+    serializers = {'symptoms': _serialize_symptom, 'vitals': _serialize_vital}
+    for key in ('symptoms', 'vitals'):
+        for index, entry in pending[key]:
+            results[key].append({'index': index, 'success': True, 'log': serializers[key](entry)})
+        results[key].sort(key=lambda r: r['index'])
+
+    created_count = len(pending['symptoms']) + len(pending['vitals'])
+    results['created_count'] = created_count
+    results['failed_count'] = len(symptoms) + len(vitals) - created_count
+    return results
@@ -0,0 +1,369 @@
+"""
+图片预处理管线：上传图片的各种派生版本（渲染件）统一在这里生成
+- vlm：发送给多模态模型的 JPEG（长边不超过 1024）
+- thumbnail：缩略图 JPEG（头像等，长边不超过 512）
+- pdf：居中放在 A4 页面上的单页 PDF（非多模态工作流的 OCR 输入）
+原图只解码一次：JPEG 用 draft 模式在解码时按整数倍缩小，再按 EXIF 方向旋正、转为 RGB，
+多个渲染件从同一张解码结果由大到小依次缩放得到。
+渲染件按原图内容的 SHA-256 与渲染参数缓存在 IMAGE_RENDITION_DIR 下，同一张图片再次处理时直接读取缓存，不再解码原图；
+修改 RENDITIONS 中的尺寸或质量后旧缓存不再命中。
+缓存按最近使用时间（文件修改时间，读取时刷新）淘汰：超过 IMAGE_RENDITION_MAX_AGE_DAYS 未使用的删除，
+总大小超过 IMAGE_RENDITION_MAX_BYTES 时从最久未使用的开始删除；写入新渲染件后定期执行，
+也可用 cleanup_image_renditions 命令执行。体检报告或药单组被删除时，其文件的渲染件随之删除；
+体检报告另按处理时记录的原图哈希（HealthCheckup.source_image_hashes）删除，覆盖合并上传、PDF 页面图片等未保存为报告文件的原图。
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from . import lazy_imports
+from .models import HealthCheckup, MedicationGroup
+
+logger = logging.getLogger(__name__)
+
+Rendition = namedtuple('Rendition', ['max_size', 'extension', 'quality'])
+
+RENDITIONS = {
+    'vlm': Rendition(1024, 'jpg', 85),
+    'thumbnail': Rendition(512, 'jpg', 85),
+    # A4 按 300dpi 的长边像素，保证 OCR 的清晰度
+    'pdf': Rendition(3508, 'pdf', 90),
+}
+
+# PDF 页面四周留白（pt）
+PDF_PAGE_MARGIN = 20
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+# 写入新渲染件后，两次自动淘汰之间的最短间隔（秒）
+EVICTION_INTERVAL = 600
+
+_eviction_lock = threading.Lock()
+_last_eviction = 0.0
+
+
+def content_hash(source):
+    """
+    原图内容的 SHA-256（分块读取）
+
+    Args:
+        source: 图片文件路径，或可 seek 的文件对象（如 Django 上传文件，读取后回到开头）
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    if hasattr(source, 'chunks'):
+        source.seek(0)
+        for chunk in source.chunks():
+            digest.update(chunk)
+    else:
+        source.seek(0)
+        for chunk in iter(lambda: source.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def _spec_dir(name):
+    """渲染件的缓存子目录，包含渲染参数：参数变化后不会读到旧的渲染件"""
+    spec = RENDITIONS[name]
+    tag = f'{name}-{spec.max_size}-q{spec.quality}'
+    if spec.extension == 'pdf':
+        tag += f'-m{PDF_PAGE_MARGIN}'
+    return tag
+
+
+def _cache_path(digest, name):
+    return os.path.join(
+        str(settings.IMAGE_RENDITION_DIR), _spec_dir(name), digest[:2], f'{digest}.{RENDITIONS[name].extension}'
+    )
+
+
+def _read_cached(path):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        # 刷新修改时间，淘汰时按最近使用排序
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+
+def _write_cached(path, data):
+    """原子写入缓存；写入失败只记录日志，不影响本次结果"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"[图片管线] 写入渲染件缓存失败 {path}: {e}")
+
+
+def _cached_files():
+    """缓存目录中的全部渲染件：[(路径, 大小, 修改时间)]"""
+    files = []
+    for root, _, names in os.walk(str(settings.IMAGE_RENDITION_DIR)):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((path, stat.st_size, stat.st_mtime))
+    return files
+
+
+def evict_renditions(max_bytes=None, max_age_days=None):
+    """
+    淘汰渲染件缓存：删除超过 max_age_days 未使用的，总大小超过 max_bytes 时再从最久未使用的开始删除
+
+    Returns:
+        (删除的文件数, 释放的字节数)
+    """
+    max_bytes = settings.IMAGE_RENDITION_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_days = settings.IMAGE_RENDITION_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    cutoff = time.time() - max_age_days * 86400
+
+    files = sorted(_cached_files(), key=lambda item: item[2])
+    total = sum(size for _, size, _ in files)
+    removed, freed = 0, 0
+    for path, size, mtime in files:
+        if mtime >= cutoff and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        freed += size
+    return removed, freed
+
+
+def _maybe_evict():
+    """写入新渲染件后按 EVICTION_INTERVAL 节流执行淘汰"""
+    global _last_eviction
+    now = time.monotonic()
+    with _eviction_lock:
+        if now - _last_eviction < EVICTION_INTERVAL:
+            return
+        _last_eviction = now
+    try:
+        removed, freed = evict_renditions()
+    except OSError as e:
+        logger.warning(f"[图片管线] 淘汰渲染件缓存失败: {e}")
+        return
+    if removed:
+        logger.info(f"[图片管线] 淘汰 {removed} 个渲染件，释放 {freed} 字节")
+
+
+def purge_renditions(digest):
+    """删除某张原图（按内容 SHA-256）的全部渲染件，包括旧渲染参数下的；返回删除数"""
+    root = str(settings.IMAGE_RENDITION_DIR)
+    try:
+        spec_dirs = os.listdir(root)
+    except OSError:
+        return 0
+    removed = 0
+    for spec_dir in spec_dirs:
+        directory = os.path.join(root, spec_dir, digest[:2])
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            if name.split('.', 1)[0] == digest:
+                try:
+                    os.remove(os.path.join(directory, name))
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
+
+
+def _decode(source, max_size):
+    """
+    解码原图：JPEG 在解码时按整数倍缩小到不小于 max_size，再按 EXIF 方向旋正并转为 RGB
+
+    Returns:
+        PIL.Image.Image（已完全加载，不再引用原文件）
+    """
+    Image = lazy_imports.load('PIL.Image')
+    ImageOps = lazy_imports.load('PIL.ImageOps')
+
+    if not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
+    with Image.open(source) as img:
+        # draft 只对 JPEG 生效；EXIF 旋转前宽高可能互换，按正方形边界请求
+        img.draft('RGB', (max_size, max_size))
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            # 透明背景铺白色，避免转 RGB 后变黑
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        else:
+            img.load()
+    if not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
+    return img
+
+
+def _downscale(img, max_size):
+    """长边缩放到不超过 max_size（不放大）；先按整数倍快速缩小再精细重采样"""
+    if img.width <= max_size and img.height <= max_size:
+        return img
+    Image = lazy_imports.load('PIL.Image')
+    img = img.copy()
+    img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    return img
+
+
+def _encode_jpeg(img, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def _encode_pdf_page(img, quality):
+    """把图片等比缩放后居中放在 A4 页面上"""
+    canvas = lazy_imports.load('reportlab.canvas')
+    A4 = lazy_imports.load('reportlab.A4')
+    ImageReader = lazy_imports.load('reportlab.ImageReader')
+
+    page_width, page_height = A4
+    scale = min(
+        (page_width - 2 * PDF_PAGE_MARGIN) / img.width,
+        (page_height - 2 * PDF_PAGE_MARGIN) / img.height,
+    )
+    scaled_width = img.width * scale
+    scaled_height = img.height * scale
+    x = (page_width - scaled_width) / 2
+    y = (page_height - scaled_height) / 2
+
+    # 以 JPEG 嵌入页面，避免 ReportLab 按无损方式写入整张像素数据
+    packet = io.BytesIO()
+    c = canvas.Canvas(packet, pagesize=A4)
+    c.drawImage(ImageReader(io.BytesIO(_encode_jpeg(img, quality))), x, y, scaled_width, scaled_height)
+    c.save()
+    return packet.getvalue()
+
+
+def render_many(source, names):
+    """
+    生成多个渲染件；已缓存的直接读取，其余共用一次解码
+
+    Args:
+        source: 图片文件路径或文件对象
+        names: RENDITIONS 中的名称
+
+    Returns:
+        dict: 名称 -> 渲染件字节
+    """
+    unknown = [name for name in names if name not in RENDITIONS]
+    if unknown:
+        raise KeyError(f"未知的图片渲染件: {', '.join(unknown)}")
+
+    digest = content_hash(source)
+    results = {}
+    missing = []
+    for name in dict.fromkeys(names):
+        cached = _read_cached(_cache_path(digest, name))
+        if cached is None:
+            missing.append(name)
+        else:
+            results[name] = cached
+    if not missing:
+        return results
+
+    # 由大到小生成，较小的渲染件从上一步缩放后的图片继续缩小
+    missing.sort(key=lambda name: RENDITIONS[name].max_size, reverse=True)
+    img = _decode(source, RENDITIONS[missing[0]].max_size)
+    for name in missing:
+        spec = RENDITIONS[name]
+        img = _downscale(img, spec.max_size)
+        if spec.extension == 'pdf':
+            data = _encode_pdf_page(img, spec.quality)
+        else:
+            data = _encode_jpeg(img, spec.quality)
+        _write_cached(_cache_path(digest, name), data)
+        results[name] = data
+    _maybe_evict()
+    return results
+
+
+def render(source, name):
+    """生成单个渲染件（见 render_many），返回字节"""
+    return render_many(source, [name])[name]
+
+
+# ==================== 原图所属数据删除时清理渲染件 ====================
+
+def record_checkup_sources(checkup_id, sources):
+    """
+    记录体检报告处理时用到的原图（内容 SHA-256），报告删除时据此清理渲染件
+
+    Args:
+        checkup_id: 体检报告ID
+        sources: 原图文件路径或文件对象
+    """
+    try:
+        digests = [content_hash(source) for source in sources]
+    except (OSError, ValueError) as e:
+        logger.warning(f"[图片管线] 计算原图哈希失败 checkup={checkup_id}: {e}")
+        return
+    with transaction.atomic():
+        checkup = HealthCheckup.objects.select_for_update().only('id', 'source_image_hashes').filter(
+            id=checkup_id
+        ).first()
+        if checkup is None:
+            return
+        hashes = list(dict.fromkeys([*(checkup.source_image_hashes or []), *digests]))
+        if hashes != checkup.source_image_hashes:
+            HealthCheckup.objects.filter(id=checkup_id).update(source_image_hashes=hashes)
+
+
+def _purge_field_file(field_file, digest=''):
+    if not field_file:
+        return
+    try:
+        if not digest:
+            with field_file.open('rb') as f:
+                digest = content_hash(f)
+        purge_renditions(digest)
+    except (OSError, ValueError) as e:
+        logger.warning(f"[图片管线] 清理渲染件失败 {field_file.name}: {e}")
+
+
+@receiver(post_delete, sender=HealthCheckup)
+def _purge_checkup_renditions(sender, instance, **kwargs):
+    _purge_field_file(instance.report_file, instance.report_file_hash)
+    for digest in instance.source_image_hashes or []:
+        if digest != instance.report_file_hash:
+            purge_renditions(digest)
+
+
+@receiver(post_delete, sender=MedicationGroup)
+def _purge_medication_group_renditions(sender, instance, **kwargs):
+    _purge_field_file(instance.source_image)
@@ -0,0 +1,223 @@
+"""
+指标单位登记表：单位写法规范化、从检测值中提取单位、换算到指标的标准单位
+- 单位写法：×10⁹/L、10^9/L、G/L 等统一为 ×10^9/L，umol/L 统一为 μmol/L（区分大小写，G/L 与 g/L 不同）
+- 标准单位：本地知识库中收录的指标以其 unit 为标准单位，条目的 convert 给出该指标特有的换算系数
+  （如血糖 mg/dL → mmol/L），与指标无关的换算（g/dL → g/L、mmol/L → μmol/L 等）见 GENERIC_FACTORS；
+  未收录的指标以规范化后的原单位为标准单位
+换算结果写入 HealthIndicator.canonical_value / canonical_unit，趋势与整合直接比较同一单位下的数值。
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+from .report_chunking import canonical_indicator_name
+
+# 标准写法 -> 其它常见写法
+UNIT_SPELLINGS = {
+    '×10^9/L': ['10^9/L', 'x10^9/L', '*10^9/L', '×10⁹/L', '10⁹/L', '10*9/L', 'G/L', '10^3/μL', '10^3/uL', 'K/μL', 'K/uL', '10^3/mm3'],
+    '×10^12/L': ['10^12/L', 'x10^12/L', '*10^12/L', '×10¹²/L', '10¹²/L', '10*12/L', 'T/L', '10^6/μL', '10^6/uL', 'M/μL', 'M/uL'],
+    'g/L': [],
+    'g/dL': ['g/dl'],
+    'mg/L': ['mg/l'],
+    'mg/dL': ['mg/dl', 'mg%'],
+    'mmol/L': ['mmol/l'],
+    'μmol/L': ['umol/L', 'µmol/L', 'umol/l', 'μmol/l'],
+    'nmol/L': ['nmol/l'],
+    'pmol/L': ['pmol/l'],
+    'mmol/mol': [],
+    'mEq/L': ['meq/L', 'mEq/l'],
+    'U/L': ['IU/L', 'u/L', 'U/l', 'IU/l'],
+    'mIU/L': ['μIU/mL', 'uIU/mL', 'µIU/mL', 'mU/L', 'μU/mL', 'uU/mL', 'mIU/l'],
+    'IU/mL': ['U/mL', 'IU/ml', 'U/ml'],
+    'ng/mL': ['ng/ml', 'μg/L', 'ug/L', 'µg/L'],
+    'pg/mL': ['pg/ml', 'ng/L'],
+    'ng/dL': ['ng/dl'],
+    'μg/dL': ['ug/dL', 'µg/dL', 'ug/dl'],
+    'fL': ['fl', 'FL'],
+    'pg': [],
+    '%': [],
+    'mmHg': ['mmhg', 'MMHG'],
+    '次/分': ['次/分钟', '次/min', 'bpm', 'BPM', '/min'],
+    'kg/m²': ['kg/m2', 'kg/㎡'],
+    'mL/min/1.73m²': ['ml/min/1.73m2', 'mL/min/1.73m2', 'ml/min/1.73m²'],
+    'mm/h': ['mm/hr', 'mm/1h'],
+    'kg': ['KG', '公斤'],
+    'cm': ['CM', '厘米'],
+    'mm': ['毫米'],
+    '°C': ['℃'],
+    's': ['秒', 'sec'],
+}
+
+# 与指标无关的换算：(原单位, 标准单位) -> 系数
+GENERIC_FACTORS = {
+    ('g/dL', 'g/L'): 10.0,
+    ('mg/dL', 'mg/L'): 10.0,
+    ('mg/L', 'mg/dL'): 0.1,
+    ('mmol/L', 'μmol/L'): 1000.0,
+    ('μmol/L', 'mmol/L'): 0.001,
+    ('nmol/L', 'pmol/L'): 1000.0,
+    ('pmol/L', 'nmol/L'): 0.001,
+    ('ng/mL', 'pg/mL'): 1000.0,
+    ('pg/mL', 'ng/mL'): 0.001,
+    ('μg/dL', 'ng/mL'): 10.0,
+}
+
+# 检测值中单位的位置：紧跟在数值之后
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def _unit_key(text):
+    """比较用的单位形式：全角转半角、μ/µ 统一、去空白与 ^、× 和 * 统一为 x、去掉开头的 x（区分大小写）"""
+    text = unicodedata.normalize('NFKC', str(text or '')).strip()
+    text = text.replace('µ', 'μ').replace('×', 'x').replace('*', 'x').replace('^', '')
+    text = re.sub(r'\s+', '', text)
+    return text[1:] if text.startswith('x10') else text
+
+
+def _build_tables():
+    exact = {}
+    folded = {}
+    collisions = set()
+    for canonical, variants in UNIT_SPELLINGS.items():
+        for spelling in [canonical, *variants]:
+            key = _unit_key(spelling)
+            exact[key] = canonical
+            folded_key = key.casefold()
+            if folded.get(folded_key, canonical) != canonical:
+                collisions.add(folded_key)
+            folded[folded_key] = canonical
+    # 只有大小写不同的写法对应不同单位（G/L 与 g/L）时不做忽略大小写的匹配
+    for key in collisions:
+        folded.pop(key, None)
+    return exact, folded
+
+
+_EXACT, _FOLDED = _build_tables()
+# 单位提取用的预编译正则（匹配 NFKC 规范化后的检测值）：较长的写法优先，匹配到的写法再经 normalize_unit 区分大小写
+_UNIT_RE = re.compile(
+    '(' + '|'.join(
+        re.escape(spelling)
+        for spelling in sorted(
+            {
+                unicodedata.normalize('NFKC', s)
+                for canonical, variants in UNIT_SPELLINGS.items() for s in [canonical, *variants]
+            },
+            key=len, reverse=True,
+        )
+    ) + r')\s*$',
+    re.IGNORECASE,
+)
+
+# 检测值中没有单位时，按指标名推断
+NAME_DEFAULT_UNITS = (
+    ('血压', 'mmHg'),
+    ('心率', '次/分'),
+    ('脉搏', '次/分'),
+    ('血糖', 'mmol/L'),
+    ('胆固醇', 'mmol/L'),
+    ('体重指数', 'kg/m²'),
+    ('体重', 'kg'),
+    ('身高', 'cm'),
+    ('腰围', 'cm'),
+    ('体温', '°C'),
+)
+
+
+@lru_cache(maxsize=2048)
+def normalize_unit(unit):
+    """单位的标准写法；不认识的单位原样返回（去掉首尾空白）"""
+    if not unit:
+        return ''
+    key = _unit_key(unit)
+    return _EXACT.get(key) or _FOLDED.get(key.casefold()) or str(unit).strip()
+
+
+def split_value_unit(measured_value, indicator_name=''):
+    """
+    从检测值中分离单位
+
+    Returns:
+        (去掉单位后的检测值, 标准写法的单位)；检测值中没有单位时按指标名推断，无法推断时单位为 ''
+    """
+    text = unicodedata.normalize('NFKC', str(measured_value or '')).strip()
+    match = _UNIT_RE.search(text)
+    if match and _NUMBER_RE.search(text[:match.start()]):
+        return text[:match.start()].strip(), normalize_unit(match.group(1))
+    for keyword, unit in NAME_DEFAULT_UNITS:
+        if keyword in (indicator_name or ''):
+            return str(measured_value or '').strip(), unit
+    return str(measured_value or '').strip(), ''
+
+
+@lru_cache(maxsize=4096)
+def conversion(indicator_name, unit):
+    """
+    指标的标准单位与换算系数
+
+    Returns:
+        (系数, 标准单位)；没有单位或无法换算到知识库中的标准单位时为 (1.0, 规范化的原单位)
+    """
+    from .health_knowledge import get_knowledge_base
+
+    unit = normalize_unit(unit)
+    kb = get_knowledge_base()
+    for index in kb.by_alias.get(canonical_indicator_name(indicator_name), ()):
+        entry = kb.entries[index]
+        if entry['category'] != 'indicator' or not entry.get('unit'):
+            continue
+        target = normalize_unit(entry['unit'])
+        if not unit:
+            break
+        if unit == target:
+            return 1.0, target
+        for source, factor in (entry.get('convert') or {}).items():
+            if normalize_unit(source) == unit:
+                return float(factor), target
+        if (unit, target) in GENERIC_FACTORS:
+            return GENERIC_FACTORS[(unit, target)], target
+        break
+    return 1.0, unit
+
+
+def numeric_value(value):
+    """检测值中的单个数值；定性结果、多个数值（如血压 120/80）或无法解析时返回 None"""
+    text = unicodedata.normalize('NFKC', str(value or '')).strip()
+    for mark in ('↑', '↓'):
+        text = text.replace(mark, '')
+    numbers = _NUMBER_RE.findall(text)
+    if len(numbers) != 1 or not (text[:1].isdigit() or text[:1] in '-.'):
+        return None
+    return float(numbers[0])
+
+
+def to_canonical(indicator_name, value, unit):
+    """
+    换算到标准单位
+
+    Returns:
+        (标准单位数值或 None, 标准单位)
+    """
+    factor, target = conversion(indicator_name, unit or '')
+    number = numeric_value(value)
+    if number is None:
+        return None, target
+    return round(number * factor, 6), target
+
+
+def canonicalize_indicators(indicators):
+    """
+    批量填充 HealthIndicator 实例的 canonical_value / canonical_unit（只修改内存中的对象）
+
+    换算系数按（指标名, 单位）缓存，一批指标只查找一次。
+
+    Returns:
+        list: 标准值或标准单位有变化的指标
+    """
+    changed = []
+    for indicator in indicators:
+        canonical = to_canonical(indicator.indicator_name, indicator.value, indicator.unit)
+        if canonical != (indicator.canonical_value, indicator.canonical_unit):
+            indicator.canonical_value, indicator.canonical_unit = canonical
+            changed.append(indicator)
+    return changed
@@ -0,0 +1,494 @@
+"""
+大模型输出的 JSON 提取
+单次线性扫描完成：剥离开头的思考块与 JSON 字符串之外的代码块标记、跳过说明文字定位 JSON 对象、
+修正常见语法错误并修复被截断的对象；支持分块增量输入（流式响应）。
+替代原先多轮正则 + 括号匹配 + 修复的级联尝试（长输出下回溯正则可能退化为平方级）
+"""
+
+import json
+import re
+
+# 思考过程标签与代码块标记（```json / ```）
+_MARKER_RE = re.compile(r'<(/?)(think|thinking|thought)>|```[A-Za-z]*', re.IGNORECASE)
+# 标记最大长度，块末尾可能是被截断的标记，需要留到下一块再判断
+_MARKER_HOLD = len('</thinking>')
+_QUOTE_OR_ESCAPE_RE = re.compile(r'["\\]')
+
+# 自由文本中常见的思考过程前缀行（仅用于非 JSON 的回答文本）
+_PREAMBLE_RE = re.compile(r'(?:思考过程[:：]|分析如下[:：]|分析[:：]|让我先分析)[^\n]*(?=\n)')
+
+_WHITESPACE_RE = re.compile(r'[\s\ufeff]+')
+_BARE_TOKEN_RE = re.compile(r'[^\s,:\[\]{}"\']+')
+_STRING_RUN_RE = {
+    '"': re.compile(r'[^"\\\n\r\t]+'),
+    "'": re.compile(r'[^\'"\\\n\r\t]+'),
+}
+_NUMBER_RE = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_LITERALS = {
+    'true': 'true', 'false': 'false', 'null': 'null',
+    'True': 'true', 'False': 'false', 'None': 'null',
+}
+_CONTROL_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+_VALID_ESCAPES = frozenset('"\\/bfnrtu')
+
+
+class ReasoningFilter:
+    """
+    增量剥离 <think>/<thinking>/<thought> 思考块与 ``` 代码块标记
+
+    思考块只在回答开头识别（之前只有空白或其他思考块），正文中出现的开始标签原样保留；
+    思考块到输入结束仍未闭合时（输出被截断），close() 把其中的内容作为正文返回。
+    fences=True 时按 JSON 输出处理：双引号字符串内的标签与 ``` 原样保留。
+
+    feed() 返回 (text, reset)：reset 为 True 表示遇到了孤立的结束标签
+    （开始标签在提示模板中、模型只输出了结束标签），此前输出的内容都是思考过程，应丢弃
+    """
+
+    def __init__(self, fences=True):
+        self.fences = fences
+        self._pending = ''
+        self._inside = None         # 当前思考块的标签名；None 表示不在思考块中
+        self._hidden = []           # 当前思考块的内容
+        self._started = False       # 是否已输出非空白的正文
+        self._in_string = False     # fences=True 时是否位于 JSON 字符串中
+        self._escape = False
+
+    def feed(self, chunk):
+        text = self._pending + chunk
+        cut = len(text)
+        tail_start = max(cut - _MARKER_HOLD, 0)
+        for marker in '<`':
+            pos = text.find(marker, tail_start)
+            if pos != -1:
+                cut = min(cut, pos)
+        self._pending = text[cut:]
+        return self._scan(text, cut)
+
+    def close(self):
+        text, self._pending = self._pending, ''
+        result, reset = self._scan(text, len(text))
+        if self._inside is not None:
+            # 思考块未闭合：不是完整的思考过程，其中的内容按正文处理
+            hidden = ''.join(self._hidden)
+            self._inside = None
+            self._hidden = []
+            self._started = True
+            result += self._scan(hidden, len(hidden))[0]
+        return result, reset
+
+    def _scan(self, text, end):
+        out = []
+        reset = False
+        pos = 0
+        for match in _MARKER_RE.finditer(text, 0, end):
+            closing, tag = match.group(1), match.group(2)
+            if self._inside is not None:
+                if closing and tag.lower() == self._inside:
+                    self._inside = None
+                    self._hidden = []
+                    pos = match.end()
+                continue
+
+            self._emit(out, text[pos:match.start()])
+            pos = match.end()
+            if self.fences and self._in_string:
+                self._emit(out, match.group())
+            elif tag is None:
+                if not self.fences:
+                    self._emit(out, match.group())
+            elif closing:
+                out.clear()
+                reset = True
+                self._started = False
+                self._in_string = self._escape = False
+            elif not self._started:
+                self._inside = tag.lower()
+                self._hidden = []
+            else:
+                self._emit(out, match.group())
+
+        if self._inside is None:
+            self._emit(out, text[pos:end])
+        else:
+            self._hidden.append(text[pos:end])
+        return ''.join(out), reset
+
+    def _emit(self, out, segment):
+        if not segment:
+            return
+        out.append(segment)
+        if not self._started and not segment.isspace():
+            self._started = True
+        if self.fences:
+            self._track_strings(segment)
+
+    def _track_strings(self, segment):
+        """更新 JSON 双引号字符串状态（字符串内的反斜杠转义下一个字符）"""
+        skip_until = 0
+        if self._escape:
+            self._escape = False
+            skip_until = 1
+        for match in _QUOTE_OR_ESCAPE_RE.finditer(segment):
+            if match.start() < skip_until:
+                continue
+            if match.group() == '"':
+                self._in_string = not self._in_string
+            elif self._in_string:
+                skip_until = match.start() + 2
+        if skip_until > len(segment):
+            self._escape = True
+
+
+def strip_reasoning(text, fences=True, preamble=False):
+    """
+    剥离模型输出中的思考过程
+
+    Args:
+        text: 模型输出
+        fences: 是否同时移除 ``` 代码块标记
+        preamble: 是否移除“思考过程：/分析：”等前缀行（仅用于自由文本回答）
+    """
+    if not text:
+        return ''
+    reasoning_filter = ReasoningFilter(fences=fences)
+    parts = []
+    for piece, reset in (reasoning_filter.feed(text), reasoning_filter.close()):
+        if reset:
+            parts.clear()
+        parts.append(piece)
+    cleaned = ''.join(parts)
+    if preamble:
+        cleaned = _PREAMBLE_RE.sub('', cleaned)
+    return cleaned.strip()
+
+
+class JSONScanner:
+    """
+    增量、容错的 JSON 对象扫描器
+
+    逐块 feed() 输入，每个字符只处理一次：跳过对象之外的说明文字，
+    对象内部修正尾随逗号、缺失逗号、单引号字符串、未加引号的键、Python 字面量等常见错误；
+    close() 时修复被截断的最后一个对象（补齐字符串与括号，丢弃不完整的键值对）。
+    解析完成的顶层对象（dict）依次追加到 objects
+
+    指定 item_key 时，键为 item_key 的数组中每个对象元素一闭合就调用 on_item(dict)，
+    不必等整个响应结束（流式响应中逐条处理指标）；被截断的最后一个元素不会回调。
+    遇到孤立的思考结束标签而丢弃已扫描内容时调用 on_reset()
+    """
+
+    def __init__(self, strip_reasoning=True, item_key=None, on_item=None, on_reset=None):
+        self.objects = []
+        self._filter = ReasoningFilter() if strip_reasoning else None
+        self.item_key = item_key
+        self.on_item = on_item
+        self.on_reset = on_reset
+        self._reset_object()
+
+    def _reset_object(self):
+        self._out = None            # 当前对象的规范化 JSON 片段；None 表示在对象之外
+        self._stack = []            # 未闭合容器的结束符 '}' / ']'
+        self._expect = None         # 'key' / 'colon' / 'value' / 'comma'
+        self._safe = (0, 0)         # 最近一个可截断位置：(片段数, 容器深度)
+        self._quote = None          # 当前字符串的引号；None 表示不在字符串中
+        self._string = []
+        self._string_is_key = False
+        self._escape = False
+        self._token = ''            # 跨块的未加引号的字面量/数字/键
+        self._keys = []             # 每个未闭合容器所属的键（数组元素为 None）
+        self._last_key = None
+        self._item = None           # 当前 item_key 数组元素：(起始片段位置, 容器深度)
+
+    def reset(self):
+        """丢弃已扫描的全部内容"""
+        self.objects = []
+        self._reset_object()
+        if self.on_reset is not None:
+            self.on_reset()
+
+    def feed(self, chunk):
+        if self._filter is not None:
+            chunk, reset = self._filter.feed(chunk)
+            if reset:
+                self.reset()
+        self._scan(chunk)
+        return self.objects
+
+    def close(self):
+        """输入结束：处理剩余内容并修复被截断的对象"""
+        if self._filter is not None:
+            chunk, reset = self._filter.close()
+            if reset:
+                self.reset()
+            self._scan(chunk)
+        if self._out is not None:
+            self._finish_truncated()
+        return self.objects
+
+    # ---------- 扫描 ----------
+
+    def _scan(self, text):
+        i = 0
+        n = len(text)
+        while i < n:
+            if self._out is None:
+                i = text.find('{', i)
+                if i == -1:
+                    return
+                self._start_object()
+                i += 1
+            elif self._quote is not None:
+                i = self._scan_string(text, i, n)
+            elif self._token:
+                match = _BARE_TOKEN_RE.match(text, i)
+                if match:
+                    self._token += match.group()
+                    i = match.end()
+                if i < n:
+                    self._finish_token()
+            else:
+                i = self._scan_structure(text, i, n)
+
+    def _scan_string(self, text, i, n):
+        quote = self._quote
+        run = _STRING_RUN_RE[quote]
+        while i < n:
+            if self._escape:
+                self._escape = False
+                char = text[i]
+                if quote == "'" and char == "'":
+                    self._string.append("'")
+                elif char in _VALID_ESCAPES:
+                    self._string.append('\\' + char)
+                else:
+                    self._string.append('\\\\' + _CONTROL_ESCAPES.get(char, char))
+                i += 1
+                continue
+
+            match = run.match(text, i)
+            if match:
+                self._string.append(match.group())
+                i = match.end()
+                if i >= n:
+                    break
+
+            char = text[i]
+            i += 1
+            if char == quote:
+                self._finish_string()
+                return i
+            if char == '\\':
+                self._escape = True
+            elif char == '"':
+                self._string.append('\\"')
+            else:
+                self._string.append(_CONTROL_ESCAPES[char])
+        return i
+
+    def _scan_structure(self, text, i, n):
+        while i < n and self._out is not None and self._quote is None and not self._token:
+            match = _WHITESPACE_RE.match(text, i)
+            if match:
+                i = match.end()
+                if i >= n:
+                    break
+
+            char = text[i]
+            if char in '"\'':
+                if not self._begin_item():
+                    i += 1
+                    continue
+                self._quote = char
+                self._string = []
+                self._string_is_key = self._expect == 'key'
+                i += 1
+            elif char in '{[':
+                i += 1
+                if self._expect == 'comma':
+                    self._comma()
+                if self._expect != 'value':
+                    if char == '{':
+                        # 不可能出现对象的位置：之前的 { 属于说明文字，从这里重新开始
+                        self._start_object()
+                    continue
+                in_array = self._stack[-1] == ']'
+                if (char == '{' and in_array and self._item is None and self.item_key is not None
+                        and self._keys[-1] == self.item_key):
+                    self._item = (len(self._out), len(self._stack) + 1)
+                self._keys.append(None if in_array else self._last_key)
+                self._out.append(char)
+                self._stack.append('}' if char == '{' else ']')
+                self._expect = 'key' if char == '{' else 'value'
+                self._mark_safe()
+            elif char in '}]':
+                i += 1
+                self._close(char)
+            elif char == ',':
+                i += 1
+                if self._expect == 'comma':
+                    self._comma()
+            elif char == ':':
+                i += 1
+                if self._expect == 'colon':
+                    self._out.append(':')
+                    self._expect = 'value'
+            else:
+                match = _BARE_TOKEN_RE.match(text, i)
+                i = match.end()
+                if self._begin_item():
+                    self._token = match.group()
+                    if i < n:
+                        self._finish_token()
+        return i
+
+    # ---------- 语法单元 ----------
+
+    def _start_object(self):
+        self._reset_object()
+        self._out = ['{']
+        self._stack = ['}']
+        self._keys = [None]
+        self._expect = 'key'
+        self._mark_safe()
+
+    def _begin_item(self):
+        """开始一个键或值；缺失逗号时自动补上。返回当前位置是否可以开始"""
+        if self._expect == 'comma':
+            self._comma()
+        return self._expect in ('key', 'value')
+
+    def _comma(self):
+        self._out.append(',')
+        self._expect = 'key' if self._stack[-1] == '}' else 'value'
+
+    def _finish_string(self):
+        value = '"' + ''.join(self._string) + '"'
+        self._quote = None
+        self._string = []
+        self._out.append(value)
+        if self._string_is_key:
+            self._last_key = json.loads(value)
+            self._expect = 'colon'
+        else:
+            self._expect = 'comma'
+            self._mark_safe()
+
+    def _finish_token(self):
+        token, self._token = self._token, ''
+        if self._expect == 'key':
+            self._out.append(json.dumps(token, ensure_ascii=False))
+            self._last_key = token
+            self._expect = 'colon'
+            return
+        if token in _LITERALS:
+            self._out.append(_LITERALS[token])
+        elif _NUMBER_RE.fullmatch(token):
+            self._out.append(token)
+        else:
+            # 未加引号的文本值（如 120/80、mg/dL），按字符串处理
+            self._out.append(json.dumps(token, ensure_ascii=False))
+        self._expect = 'comma'
+        self._mark_safe()
+
+    def _close(self, closer):
+        if closer not in self._stack:
+            return
+        while True:
+            if self._expect == 'colon':
+                self._out.append(':null')
+            elif self._expect == 'value' and self._out[-1] == ':':
+                self._out.append('null')
+            elif self._out[-1] == ',':
+                self._out.pop()
+            top = self._stack.pop()
+            self._keys.pop()
+            self._out.append(top)
+            self._expect = 'comma'
+            if self._item is not None and len(self._stack) < self._item[1]:
+                self._emit_item()
+            if top == closer:
+                break
+        self._mark_safe()
+        if not self._stack:
+            self._emit(''.join(self._out))
+
+    def _emit_item(self):
+        start, _ = self._item
+        self._item = None
+        try:
+            value = json.loads(''.join(self._out[start:]))
+        except ValueError:
+            return
+        if isinstance(value, dict) and self.on_item is not None:
+            self.on_item(value)
+
+    def _mark_safe(self):
+        self._safe = (len(self._out), len(self._stack))
+
+    def _emit(self, *texts):
+        """依次尝试候选文本，第一个能解析为对象的加入结果"""
+        for text in texts:
+            try:
+                value = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(value, dict):
+                self.objects.append(value)
+            break
+        self._reset_object()
+
+    def _finish_truncated(self):
+        """截断修复：字符串值补齐引号，其余回退到最近的完整键值，再补齐括号"""
+        safe_points = [self._safe]
+        if self._quote is not None and not self._string_is_key:
+            # 截断的字符串值保留已输出部分；若末尾是不完整的转义则退回上一个安全位置
+            self._escape = False
+            self._finish_string()
+            safe_points.insert(0, self._safe)
+        elif self._token:
+            token = self._token
+            if self._expect == 'value' and (token in _LITERALS or _NUMBER_RE.fullmatch(token)):
+                self._finish_token()
+                safe_points.insert(0, self._safe)
+        self._emit(*(
+            ''.join(self._out[:out_len]) + ''.join(reversed(self._stack[:depth]))
+            for out_len, depth in safe_points
+        ))
+
+
+def extract_json_objects(text, strip_reasoning=True):
+    """提取文本中所有顶层 JSON 对象（容错、修复截断），返回 dict 列表"""
+    scanner = JSONScanner(strip_reasoning=strip_reasoning)
+    scanner.feed(text or '')
+    return scanner.close()
+
+
+def extract_json(text, required_key=None):
+    """
+    从模型输出中提取 JSON 对象
+
+    优先返回包含 required_key 的第一个对象；都不包含时返回第一个对象；没有对象时返回 None
+    """
+    if not text:
+        return None
+
+    # 快速路径：输出本身（去掉思考标签与代码块标记后）就是合法 JSON
+    cleaned = strip_reasoning(text)
+    start = cleaned.find('{')
+    if start != -1:
+        try:
+            value, _ = json.JSONDecoder().raw_decode(cleaned, start)
+        except ValueError:
+            value = None
+        if isinstance(value, dict) and (required_key is None or required_key in value):
+            return value
+
+    return select_object(extract_json_objects(cleaned, strip_reasoning=False), required_key)
+
+
+def select_object(objects, required_key=None):
+    """从扫描结果中选取对象：优先包含 required_key 的第一个，否则第一个"""
+    if required_key is not None:
+        for value in objects:
+            if required_key in value:
+                return value
+    return objects[0] if objects else None
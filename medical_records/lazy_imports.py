@@ -0,0 +1,76 @@
+"""
+重量级依赖的延迟加载注册表
+ReportLab、python-docx、PIL、pdf2image、LangChain 等依赖只在首次使用时导入/初始化，
+worker 启动与管理命令不再为用不到的依赖付出导入开销
+"""
+
+import importlib
+import threading
+
+_loaders = {}
+_loaded = {}
+_lock = threading.RLock()
+
+
+def register(name, loader):
+    """注册延迟加载项：loader 为无参函数，首次 load(name) 时调用，结果缓存复用"""
+    _loaders[name] = loader
+
+
+def register_import(name, module_path, attribute=None):
+    """注册延迟导入的模块（或模块中的属性）"""
+    def loader():
+        module = importlib.import_module(module_path)
+        return getattr(module, attribute) if attribute else module
+    register(name, loader)
+
+
+def load(name):
+    """
+    获取延迟加载项，首次调用时执行加载（线程安全）
+
+    Raises:
+        KeyError: 未注册的加载项
+        ImportError: 依赖未安装
+    """
+    try:
+        return _loaded[name]
+    except KeyError:
+        pass
+    with _lock:
+        if name not in _loaded:
+            _loaded[name] = _loaders[name]()
+        return _loaded[name]
+
+
+def is_loaded(name):
+    return name in _loaded
+
+
+_tool_cache = {}
+
+
+def as_tools(functions):
+    """将普通函数包装为 LangChain 工具（首次使用时才导入 langchain.tools），包装结果按函数缓存"""
+    tool = load('langchain.tool')
+    with _lock:
+        for func in functions:
+            if func not in _tool_cache:
+                _tool_cache[func] = tool(func)
+    return [_tool_cache[func] for func in functions]
+
+
+# 图片 / PDF
+register_import('PIL.Image', 'PIL.Image')
+register_import('PIL.ImageOps', 'PIL.ImageOps')
+register_import('reportlab.canvas', 'reportlab.pdfgen.canvas')
+register_import('reportlab.ImageReader', 'reportlab.lib.utils', 'ImageReader')
+register_import('reportlab.A4', 'reportlab.lib.pagesizes', 'A4')
+register_import('pdf2image.convert_from_path', 'pdf2image', 'convert_from_path')
+
+# LangChain 及各模型提供方，按实际使用的提供方分别导入
+register_import('langchain.tool', 'langchain.tools', 'tool')
+register_import('langchain.create_agent', 'langchain.agents', 'create_agent')
+register_import('langchain.ChatOpenAI', 'langchain_openai', 'ChatOpenAI')
+register_import('langchain.ChatAnthropic', 'langchain_anthropic', 'ChatAnthropic')
+register_import('langchain.ChatGoogleGenerativeAI', 'langchain_google_genai', 'ChatGoogleGenerativeAI')
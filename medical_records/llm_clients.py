@@ -0,0 +1,109 @@
+"""
+进程级 LLM 客户端与 Agent 注册表
+ChatOpenAI / ChatAnthropic / ChatGoogleGenerativeAI 客户端（各自持有 HTTP 连接池）与编译好的
+LangGraph Agent 按配置哈希缓存复用；系统设置变更后配置哈希随之变化，下次使用时自动重建。
+用户、对话等请求相关信息在每次调用时传入，不属于缓存的一部分。
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from .lazy_imports import load
+
+# 每类缓存保留的实例数上限（配置频繁切换时淘汰最久未用的）
+MAX_ENTRIES = 16
+
+_registry = OrderedDict()
+_lock = threading.RLock()
+
+
+def config_hash(config):
+    """配置字典的稳定哈希"""
+    payload = json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_or_build(kind, config, builder):
+    """
+    按 (类别, 配置哈希) 取缓存实例，不存在时调用 builder() 构建
+
+    构建失败时抛出异常且不缓存；同一配置并发请求只构建一次
+    """
+    key = (kind, config_hash(config))
+    with _lock:
+        if key in _registry:
+            _registry.move_to_end(key)
+            return _registry[key]
+        instance = builder()
+        _registry[key] = instance
+        same_kind = [k for k in _registry if k[0] == kind]
+        for stale in same_kind[:-MAX_ENTRIES]:
+            del _registry[stale]
+        return instance
+
+
+def clear():
+    """清空注册表（测试或需要强制重建时使用）"""
+    with _lock:
+        _registry.clear()
+
+
+def normalize_base_url(api_url):
+    """OpenAI 兼容地址去掉 /chat/completions 与末尾斜杠（LangChain 会自动拼接）"""
+    base_url = api_url or ''
+    if '/chat/completions' in base_url:
+        base_url = base_url.split('/chat/completions')[0]
+    return base_url.rstrip('/') or None
+
+
+def agent_provider(provider, api_url):
+    """
+    AI医生 Agent 使用的客户端类型
+
+    Agent 只区分 Anthropic 与 OpenAI 兼容格式：配置了服务地址的 anthropic 使用 ChatAnthropic，
+    其余（包括 gemini，按 OpenAI 兼容地址访问）以及未配置服务地址时都使用 ChatOpenAI
+    """
+    return 'anthropic' if provider == 'anthropic' and api_url else 'openai'
+
+
+def get_chat_model(provider, model, api_key=None, api_url=None, temperature=0.7,
+                   max_tokens=None, timeout=300, streaming=False):
+    """
+    获取（复用）聊天模型客户端
+
+    Args:
+        provider: 'gemini' / 'anthropic'，其余按 OpenAI 兼容格式
+        api_url: OpenAI 兼容服务地址，可包含 /chat/completions
+    """
+    config = {
+        'provider': provider if provider in ('gemini', 'anthropic') else 'openai',
+        'model': model,
+        'api_key': api_key,
+        'base_url': normalize_base_url(api_url),
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+        'timeout': timeout,
+        'streaming': streaming,
+    }
+
+    def build():
+        if config['provider'] == 'gemini':
+            return load('langchain.ChatGoogleGenerativeAI')(
+                model=model,
+                google_api_key=api_key,
+                temperature=temperature,
+                timeout=timeout,
+                streaming=streaming
+            )
+        kwargs = {'model': model, 'api_key': api_key, 'temperature': temperature, 'timeout': timeout}
+        if max_tokens:
+            kwargs['max_tokens'] = max_tokens
+        if streaming:
+            kwargs['streaming'] = True
+        if config['provider'] == 'anthropic':
+            return load('langchain.ChatAnthropic')(**kwargs)
+        return load('langchain.ChatOpenAI')(base_url=config['base_url'], **kwargs)
+
+    return get_or_build('chat_model', config, build)
@@ -0,0 +1,90 @@
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from medical_records.agent_tool_cache import bump_data_version
+from medical_records.models import HealthIndicator, UserProfile
+from medical_records.reference_ranges import age_on, apply_reference_status
+
+
+class Command(BaseCommand):
+    help = '按参考范围重新判定已有健康指标的状态（正常/异常/关注）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='指定用户名，如果不指定则处理所有用户'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只统计将要变化的指标，不写入数据库'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='每次批量更新的指标数，默认500'
+        )
+
+    def handle(self, *args, **options):
+        username = options.get('user')
+        dry_run = options.get('dry_run', False)
+        batch_size = options['batch_size']
+
+        if username:
+            users = User.objects.filter(username=username)
+            if not users.exists():
+                self.stdout.write(self.style.ERROR(f'用户 "{username}" 不存在'))
+                return
+        else:
+            users = User.objects.all()
+
+        profiles = {
+            user_id: (gender or None, birth_date)
+            for user_id, gender, birth_date in UserProfile.objects.filter(user__in=users)
+            .values_list('user_id', 'gender', 'birth_date')
+        }
+
+        transitions = Counter()
+        total_checked = 0
+        for user in users.only('id', 'username'):
+            gender, birth_date = profiles.get(user.id, (None, None))
+            indicators = list(
+                HealthIndicator.objects.filter(checkup__user_id=user.id)
+                .select_related('checkup')
+                .only('id', 'indicator_name', 'value', 'unit', 'reference_range', 'status', 'checkup__checkup_date')
+                .order_by('checkup_id')
+            )
+            total_checked += len(indicators)
+
+            # 年龄按体检当天计算，同一份体检报告的指标一起判定
+            changed = []
+            by_checkup = {}
+            for indicator in indicators:
+                by_checkup.setdefault(indicator.checkup_id, []).append(indicator)
+            for group in by_checkup.values():
+                previous = {indicator.id: indicator.status for indicator in group}
+                age = age_on(birth_date, group[0].checkup.checkup_date)
+                for indicator in apply_reference_status(group, gender, age):
+                    transitions[(previous[indicator.id], indicator.status)] += 1
+                    changed.append(indicator)
+
+            if changed and not dry_run:
+                with transaction.atomic():
+                    HealthIndicator.objects.bulk_update(changed, ['status'], batch_size=batch_size)
+                # bulk_update 不触发模型信号，使AI医生工具缓存失效
+                bump_data_version(user.id)
+            if changed:
+                self.stdout.write(f'{user.username}: {len(changed)}/{len(indicators)} 个指标状态变化')
+
+        for (old, new), count in sorted(transitions.items()):
+            self.stdout.write(f'  {old} -> {new}: {count}')
+        changed_total = sum(transitions.values())
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'[预览] 共检查 {total_checked} 个指标，{changed_total} 个将会变化'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'完成，共检查 {total_checked} 个指标，更新 {changed_total} 个'))
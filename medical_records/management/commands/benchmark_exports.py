@@ -0,0 +1,133 @@
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from medical_records.export_utils import (
+    CheckupReportsExporter,
+    HealthTrendsExporter,
+    indicator_table_rows,
+    iter_indicator_groups,
+    write_export,
+)
+from medical_records.models import HealthCheckup, HealthIndicator
+
+
+def _legacy_load(checkups):
+    """旧版加载方式：逐个体检报告查询指标并按类型收集模型实例"""
+    grouped = {}
+    for checkup in checkups:
+        for indicator in checkup.indicators.all().order_by('indicator_type', 'indicator_name'):
+            grouped.setdefault(indicator.indicator_type, []).append(
+                (indicator.checkup.checkup_date, indicator.value, indicator.status)
+            )
+    return sum(len(rows) for rows in grouped.values())
+
+
+def _grouped_load(checkups):
+    """当前加载方式：单次有序查询 + values_list 元组"""
+    count = 0
+    for _, indicator_groups in iter_indicator_groups(HealthIndicator.objects.filter(checkup__in=checkups)):
+        for _, rows in indicator_groups:
+            count += sum(1 for _ in indicator_table_rows(rows))
+    return count
+
+
+class Command(BaseCommand):
+    help = '导出性能基准：统计体检报告/健康趋势导出的查询次数、耗时与内存峰值'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            required=True,
+            help='用于基准测试的用户名（使用其现有体检数据）'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='每项重复次数，取耗时中位数，默认3次'
+        )
+        parser.add_argument(
+            '--formats',
+            type=str,
+            default='pdf,word',
+            help='导出格式，逗号分隔，默认 pdf,word'
+        )
+        parser.add_argument(
+            '--memory',
+            action='store_true',
+            help='额外统计内存峰值（tracemalloc）'
+        )
+
+    def _measure(self, func, repeat):
+        durations = []
+        queries = result = 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                result = func()
+                durations.append(time.perf_counter() - start)
+            queries = len(ctx.captured_queries)
+
+        peak = None
+        if self.trace_memory:
+            # tracemalloc 会显著拖慢执行，单独跑一次只统计内存峰值
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return statistics.median(durations), queries, peak, result
+
+    def _report(self, label, measurement, unit_label):
+        duration, queries, peak, result = measurement
+        memory = f'  内存峰值 {peak / 1024 / 1024:>6.1f} MB' if peak is not None else ''
+        self.stdout.write(
+            f'  {label:<28} {duration * 1000:>9.1f} ms  {queries:>5} 次查询{memory}  {unit_label} {result}'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'用户 "{options["user"]}" 不存在')
+
+        repeat = max(1, options['repeat'])
+        self.trace_memory = options['memory']
+        formats = [fmt.strip() for fmt in options['formats'].split(',') if fmt.strip()]
+        checkups = HealthCheckup.objects.filter(user=user).order_by('-checkup_date')
+        indicator_count = HealthIndicator.objects.filter(checkup__user=user).count()
+
+        self.stdout.write(
+            f'用户 {user.username}：{checkups.count()} 份体检报告，{indicator_count} 项指标，每项重复 {repeat} 次'
+        )
+
+        self.stdout.write('指标加载：')
+        self._report('逐报告查询（旧）', self._measure(lambda: _legacy_load(checkups), repeat), '行数')
+        self._report('单次分组查询', self._measure(lambda: _grouped_load(checkups), repeat), '行数')
+
+        def render(exporter_factory, export_format):
+            def run():
+                with tempfile.TemporaryFile() as output:
+                    write_export(exporter_factory(), export_format, output)
+                    return output.tell()
+            return run
+
+        self.stdout.write('完整导出：')
+        for export_format in formats:
+            self._report(
+                f'体检报告汇总 {export_format}',
+                self._measure(render(lambda: CheckupReportsExporter(checkups), export_format), repeat),
+                '字节',
+            )
+            self._report(
+                f'健康趋势分析 {export_format}',
+                self._measure(render(lambda: HealthTrendsExporter(user), export_format), repeat),
+                '字节',
+            )
@@ -0,0 +1,196 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medical_records.json_extraction import JSONScanner, extract_json, extract_json_objects
+from medical_records.models import DocumentProcessing
+
+SAMPLE_INDICATORS = [
+    {'indicator': '空腹血糖', 'measured_value': '6.3', 'normal_range': '3.9-6.1', 'abnormal': '是'},
+    {'indicator': '总胆固醇', 'measured_value': '5.2', 'normal_range': '<5.2', 'abnormal': '否'},
+    {'indicator': '谷丙转氨酶', 'measured_value': '45', 'normal_range': '9-50', 'abnormal': None},
+    {'indicator': '血压', 'measured_value': '135/85', 'normal_range': None, 'abnormal': '是'},
+    {'indicator': '尿蛋白', 'measured_value': '阴性(-)', 'normal_range': '阴性', 'abnormal': '否'},
+    {'indicator': '超声提示', 'measured_value': '肝脏回声"稍增强"，\n建议复查', 'normal_range': None, 'abnormal': '是'},
+]
+
+# 模型输出中常见的包装形式：(名称, 包装函数)
+WRAPPERS = [
+    ('纯JSON', lambda body: body),
+    ('代码块', lambda body: f'```json\n{body}\n```'),
+    ('前后说明', lambda body: f'以下是提取结果：\n{body}\n以上数据仅供参考。'),
+    ('think标签', lambda body: f'<think>先分析图片 {{区域1}} 中的"指标"…</think>\n{body}'),
+    ('孤立结束标签', lambda body: f'好的，我来分析 {{注意}} 这份报告。\n</think>\n\n```json\n{body}\n```'),
+    ('thinking标签+分析', lambda body: f'<thinking>检查参考范围</thinking>分析：报告共一页\n{body}'),
+]
+
+# 对 JSON 文本做的“模型式”错误注入：(名称, 变换函数)
+MUTATIONS = [
+    ('尾随逗号', lambda body: body.replace('}', ',}').replace(']', ',]')),
+    ('Python字面量', lambda body: body.replace('null', 'None').replace('true', 'True')),
+    ('单引号', lambda body: body.replace("'", '’').replace('"', "'")),
+]
+
+
+def _indicator_payload(count, rng):
+    indicators = [dict(rng.choice(SAMPLE_INDICATORS), indicator=f'指标{i}') for i in range(count)]
+    return {'indicators': indicators}
+
+
+def build_corpus(rng, sizes=(5, 40, 200), db_samples=0):
+    """构造语料：(名称, 模型输出文本, 期望对象)；期望为 None 表示只检查不抛异常"""
+    payloads = [(f'{size}项指标', _indicator_payload(size, rng)) for size in sizes]
+    if db_samples:
+        results = (
+            DocumentProcessing.objects
+            .filter(ai_result__isnull=False)
+            .order_by('-id')
+            .values_list('id', 'ai_result')[:db_samples]
+        )
+        payloads.extend(
+            (f'处理记录{pk}', result) for pk, result in results
+            if isinstance(result, dict) and result.get('indicators')
+        )
+
+    corpus = []
+    for payload_name, payload in payloads:
+        for indent in (None, 2):
+            body = json.dumps(payload, ensure_ascii=False, indent=indent)
+            for wrapper_name, wrap in WRAPPERS:
+                corpus.append((f'{payload_name}/{wrapper_name}/indent={indent}', wrap(body), payload))
+        body = json.dumps(payload, ensure_ascii=False)
+        for mutation_name, mutate in MUTATIONS:
+            corpus.append((f'{payload_name}/{mutation_name}', mutate(body), None))
+    return corpus
+
+
+def load_corpus_file(path):
+    """读取采集的真实模型输出：JSONL，每行 {"name", "text", "expected"(可选)}"""
+    corpus = []
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            corpus.append((item.get('name') or f'{path}:{line_no}', item['text'], item.get('expected')))
+    return corpus
+
+
+def _scan_in_chunks(text, rng, max_chunks=8):
+    cuts = sorted(rng.sample(range(len(text) + 1), min(len(text), rng.randint(1, max_chunks))))
+    scanner = JSONScanner()
+    for start, end in zip([0] + cuts, cuts + [len(text)]):
+        scanner.feed(text[start:end])
+    return scanner.close()
+
+
+class Command(BaseCommand):
+    help = '大模型输出 JSON 提取的模糊测试与性能基准（截断、分块、错误注入、线性扩展性）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corpus',
+            type=str,
+            help='额外的真实模型输出语料（JSONL，每行包含 text，可选 name/expected）'
+        )
+        parser.add_argument(
+            '--db-samples',
+            type=int,
+            default=0,
+            help='从最近的文档处理记录中取若干条提取结果加入语料，默认不取'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='随机种子，默认0'
+        )
+        parser.add_argument(
+            '--truncations',
+            type=int,
+            default=200,
+            help='每条样本随机截断的次数，默认200'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        corpus = build_corpus(rng, db_samples=options['db_samples'])
+        if options['corpus']:
+            corpus.extend(load_corpus_file(options['corpus']))
+
+        failures = []
+        for name, text, expected in corpus:
+            failures.extend(f'{name}: {problem}' for problem in self._fuzz(text, expected, rng, options['truncations']))
+
+        self.stdout.write(f'模糊测试：{len(corpus)} 条样本，{len(failures)} 个问题')
+        for failure in failures[:20]:
+            self.stdout.write(self.style.ERROR(f'  {failure}'))
+
+        self._benchmark(corpus)
+        self._scaling(rng)
+
+        if failures:
+            raise CommandError(f'JSON 提取模糊测试发现 {len(failures)} 个问题')
+
+    def _fuzz(self, text, expected, rng, truncations):
+        problems = []
+        result = extract_json(text, required_key='indicators')
+        if expected is not None and result != expected:
+            problems.append('完整输出提取结果与期望不一致')
+
+        one_shot = extract_json_objects(text)
+        for _ in range(3):
+            if _scan_in_chunks(text, rng) != one_shot:
+                problems.append('分块增量扫描结果与一次性扫描不一致')
+                break
+
+        expected_indicators = (expected or {}).get('indicators')
+        for _ in range(truncations):
+            prefix = text[:rng.randrange(len(text) + 1)]
+            try:
+                partial = extract_json(prefix, required_key='indicators')
+            except Exception as e:
+                problems.append(f'截断到 {len(prefix)} 字符时抛出异常: {e!r}')
+                break
+            if not expected_indicators or not partial or 'indicators' not in partial:
+                continue
+            recovered = partial['indicators']
+            if not isinstance(recovered, list) or len(recovered) > len(expected_indicators):
+                problems.append(f'截断到 {len(prefix)} 字符时 indicators 结构异常')
+                break
+            # 截断修复只会丢弃或缩短末尾内容，已完整输出的指标必须与原文一致
+            complete = max(len(recovered) - 1, 0)
+            if recovered[:complete] != expected_indicators[:complete]:
+                problems.append(f'截断到 {len(prefix)} 字符时修复结果改变了已完整的指标')
+                break
+        return problems
+
+    def _benchmark(self, corpus):
+        total_chars = sum(len(text) for _, text, _ in corpus)
+        repeat = 5
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for _, text, _ in corpus:
+                extract_json(text, required_key='indicators')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'吞吐：{total_chars * repeat / elapsed / 1024 / 1024:.1f} MB/s '
+            f'（{len(corpus)} 条样本 × {repeat} 次，{elapsed * 1000:.0f} ms）'
+        )
+
+    def _scaling(self, rng):
+        """线性扩展性：大段思考文字 + 截断 JSON，输入放大 N 倍时耗时应约为 N 倍"""
+        self.stdout.write('扩展性（思考过程 + 截断的大 JSON）：')
+        base = None
+        for factor in (1, 4, 16):
+            payload = json.dumps(_indicator_payload(50 * factor, rng), ensure_ascii=False)
+            text = '分析：{草稿} ' * (200 * factor) + '\n</think>\n' + payload[:-len(payload) // 7]
+            start = time.perf_counter()
+            extract_json(text, required_key='indicators')
+            elapsed = time.perf_counter() - start
+            base = base or elapsed
+            self.stdout.write(
+                f'  ×{factor:<3} {len(text):>9} 字符  {elapsed * 1000:>8.1f} ms  相对 ×{elapsed / base:.1f}'
+            )
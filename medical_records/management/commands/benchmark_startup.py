@@ -0,0 +1,93 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# python -X importtime 输出格式：import time: self [us] | cumulative | imported package
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+# 这些依赖应在首次使用时才加载，启动阶段出现即视为回退
+LAZY_MODULES = ('reportlab', 'docx', 'PIL', 'pdf2image', 'langchain', 'langchain_openai', 'langchain_anthropic',
+                'langchain_google_genai')
+
+# 模拟 worker 启动：加载 WSGI 应用并解析全部 URL 配置（会导入所有视图模块）
+BOOT_SCRIPT = (
+    'from django.core.wsgi import get_wsgi_application; '
+    'get_wsgi_application(); '
+    'from django.urls import get_resolver; '
+    'get_resolver().url_patterns'
+)
+
+
+def parse_importtime(output):
+    """解析 importtime 输出，返回 {模块名: (自身耗时us, 累计耗时us, 层级)}"""
+    modules = {}
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return modules
+
+
+class Command(BaseCommand):
+    help = '启动性能基准：以 python -X importtime 模拟 worker 启动，统计导入耗时并检查重量级依赖是否被提前加载'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='显示累计耗时最高的模块数量，默认15'
+        )
+        parser.add_argument(
+            '--budget-ms',
+            type=float,
+            default=None,
+            help='导入总耗时上限（毫秒），超出时命令失败'
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+            capture_output=True,
+            text=True,
+            cwd=settings.BASE_DIR,
+            env=env,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'启动脚本执行失败:\n{result.stderr[-2000:]}')
+
+        modules = parse_importtime(result.stderr)
+        if not modules:
+            raise CommandError('未解析到 importtime 输出')
+
+        total_ms = sum(self_us for self_us, _, _ in modules.values()) / 1000
+        self.stdout.write(f'共导入 {len(modules)} 个模块，总耗时 {total_ms:.1f} ms')
+
+        self.stdout.write(f'累计耗时最高的 {options["top"]} 个项目模块/顶层依赖：')
+        top_level = [
+            (name, cumulative_us) for name, (_, cumulative_us, level) in modules.items()
+            if level == 0 or name.startswith('medical_records')
+        ]
+        top_level.sort(key=lambda item: item[1], reverse=True)
+        for name, cumulative_us in top_level[:options['top']]:
+            self.stdout.write(f'  {cumulative_us / 1000:>9.1f} ms  {name}')
+
+        eager = sorted({
+            name.split('.')[0] for name in modules
+            if name.split('.')[0] in LAZY_MODULES
+        })
+        if eager:
+            self.stdout.write(self.style.WARNING(f'启动阶段加载了应延迟导入的依赖: {", ".join(eager)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('重量级依赖均未在启动阶段加载'))
+
+        budget = options['budget_ms']
+        if budget is not None and total_ms > budget:
+            raise CommandError(f'导入总耗时 {total_ms:.1f} ms 超出预算 {budget:.1f} ms')
@@ -0,0 +1,45 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from medical_records.record_index import UserRecordIndex, get_user_index
+
+
+class Command(BaseCommand):
+    help = '构建或增量更新用户健康记录检索索引（AI医生 search_user_records 工具使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='指定用户名，如果不指定则处理所有用户'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='忽略已有索引，全部重新分词'
+        )
+
+    def handle(self, *args, **options):
+        username = options.get('user')
+        rebuild = options.get('rebuild', False)
+
+        if username:
+            users = User.objects.filter(username=username)
+            if not users.exists():
+                self.stdout.write(self.style.ERROR(f'用户 "{username}" 不存在'))
+                return
+        else:
+            users = User.objects.all()
+
+        total_docs = 0
+        for user in users.only('id', 'username'):
+            if rebuild:
+                index = UserRecordIndex(user.id)
+                index.refresh()
+                index.save()
+            else:
+                index = get_user_index(user.id, force_refresh=True)
+            total_docs += len(index.docs)
+            self.stdout.write(f'{user.username}: {len(index.docs)} 条记录')
+
+        self.stdout.write(self.style.SUCCESS(f'索引完成，共 {total_docs} 条记录'))
@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from medical_records.export_artifacts import (
+    EXPORT_ARTIFACT_MAX_AGE_HOURS,
+    artifact_user_ids,
+    delete_user_artifacts,
+    purge_expired_artifacts,
+)
+
+
+class Command(BaseCommand):
+    help = f'清理过期（超过 {EXPORT_ARTIFACT_MAX_AGE_HOURS} 小时）的导出文件，以及已删除用户遗留的导出文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='指定用户名，如果不指定则处理所有用户'
+        )
+
+    def handle(self, *args, **options):
+        username = options.get('user')
+
+        if username:
+            user = User.objects.filter(username=username).only('id').first()
+            if user is None:
+                self.stdout.write(self.style.ERROR(f'用户 "{username}" 不存在'))
+                return
+            user_ids = [user.id]
+        else:
+            user_ids = artifact_user_ids()
+
+        existing = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        expired = 0
+        orphaned = 0
+        for user_id in user_ids:
+            if user_id in existing:
+                expired += purge_expired_artifacts(user_id)
+            else:
+                orphaned += delete_user_artifacts(user_id)
+
+        self.stdout.write(self.style.SUCCESS(f'完成，删除过期导出文件 {expired} 个，已删除用户的导出文件 {orphaned} 个'))
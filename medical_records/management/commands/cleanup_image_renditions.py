@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from medical_records.image_pipeline import evict_renditions
+
+
+class Command(BaseCommand):
+    help = '淘汰图片渲染件缓存：删除长期未使用的渲染件，并把缓存总大小控制在上限以内'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age-days',
+            type=int,
+            default=settings.IMAGE_RENDITION_MAX_AGE_DAYS,
+            help='超过该天数未使用的渲染件被删除，默认取 IMAGE_RENDITION_MAX_AGE_DAYS'
+        )
+        parser.add_argument(
+            '--max-mb',
+            type=int,
+            default=settings.IMAGE_RENDITION_MAX_BYTES // (1024 * 1024),
+            help='缓存总大小上限（MB），默认取 IMAGE_RENDITION_MAX_BYTES'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='清空全部渲染件'
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            removed, freed = evict_renditions(max_bytes=-1, max_age_days=0)
+        else:
+            removed, freed = evict_renditions(
+                max_bytes=options['max_mb'] * 1024 * 1024,
+                max_age_days=options['max_age_days'],
+            )
+        self.stdout.write(self.style.SUCCESS(f'完成，删除 {removed} 个渲染件，释放 {freed / 1024 / 1024:.1f} MB'))
@@ -0,0 +1,68 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from medical_records.agent_tool_cache import bump_data_version
+from medical_records.indicator_units import canonicalize_indicators
+from medical_records.models import HealthIndicator
+
+
+class Command(BaseCommand):
+    help = '换算已有健康指标的标准单位数值（迁移 0028 之后回填一次；单位登记表或知识库换算系数更新后再次运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='指定用户名，如果不指定则处理所有用户'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只统计将要变化的指标，不写入数据库'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='每次批量更新的指标数，默认500'
+        )
+
+    def handle(self, *args, **options):
+        username = options.get('user')
+        dry_run = options.get('dry_run', False)
+        batch_size = options['batch_size']
+
+        if username:
+            users = User.objects.filter(username=username)
+            if not users.exists():
+                self.stdout.write(self.style.ERROR(f'用户 "{username}" 不存在'))
+                return
+        else:
+            users = User.objects.all()
+
+        total_checked = 0
+        total_changed = 0
+        for user in users.only('id', 'username'):
+            indicators = list(
+                HealthIndicator.objects.filter(checkup__user_id=user.id)
+                .only('id', 'indicator_name', 'value', 'unit', 'canonical_value', 'canonical_unit')
+            )
+            changed = canonicalize_indicators(indicators)
+            total_checked += len(indicators)
+            total_changed += len(changed)
+
+            if changed and not dry_run:
+                with transaction.atomic():
+                    HealthIndicator.objects.bulk_update(
+                        changed, ['canonical_value', 'canonical_unit'], batch_size=batch_size
+                    )
+                # bulk_update 不触发模型信号，使AI医生工具缓存失效
+                bump_data_version(user.id)
+            if changed:
+                self.stdout.write(f'{user.username}: {len(changed)}/{len(indicators)} 个指标的标准值变化')
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'[预览] 共检查 {total_checked} 个指标，{total_changed} 个将会变化'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'完成，共检查 {total_checked} 个指标，更新 {total_changed} 个'))
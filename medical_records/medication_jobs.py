@@ -0,0 +1,288 @@
+"""
+药单图片识别
+单张图片的同步识别与多张图片的后台识别任务共用这里的校验、临时文件与建组逻辑。
+后台任务：图片先保存到临时目录，工作线程按系统设置 llm_max_concurrency 并行调用多模态模型，
+每张图片识别完成即创建药单组并写入任务状态，前端轮询任务状态即可逐张拿到结果，不必等待全部完成。
+任务状态保存在 Django 缓存中（多进程部署时需配置共享缓存）。
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.core.files import File
+from django.db import connections
+from django.utils import timezone
+
+from .models import Medication, MedicationGroup, SystemSettings
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_IMAGE_TYPES = ('image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp')
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+# 单个任务最多识别的图片数
+MAX_IMAGES_PER_JOB = 9
+# 任务状态在缓存中的保留时间（秒）
+JOB_TIMEOUT = 24 * 3600
+
+_job_locks = {}
+_job_locks_guard = threading.Lock()
+
+
+class MedicationRecognitionError(ValueError):
+    """上传的图片无效"""
+    status_code = 400
+
+
+def validate_image(image_file):
+    """校验上传图片的类型与大小，无效时抛出 MedicationRecognitionError"""
+    if image_file.content_type not in ALLOWED_IMAGE_TYPES:
+        raise MedicationRecognitionError('只支持 JPG、PNG、GIF、WEBP 格式的图片')
+    if image_file.size > MAX_IMAGE_SIZE:
+        raise MedicationRecognitionError('图片大小不能超过 10MB')
+
+
+def save_upload(image_file, temp_dir):
+    """把上传的图片写入临时目录，返回文件路径"""
+    file_ext = os.path.splitext(image_file.name)[1]
+    path = os.path.join(temp_dir, f"medication_{uuid.uuid4().hex}{file_ext}")
+    with open(path, 'wb') as destination:
+        for chunk in image_file.chunks():
+            destination.write(chunk)
+    return path
+
+
+def _parse_date(value, default):
+    try:
+        if value and value != 'null':
+            return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        pass
+    return default
+
+
+def create_medication_group(user, result, image_path):
+    """
+    根据识别结果创建药单组及其中的药品，并保存原始图片
+
+    Returns:
+        dict: {'group': {...}, 'medications': [...], 'raw_result': 识别结果}；未识别出药物时返回 None
+    """
+    medications_data = result.get('medications', [])
+    if not medications_data:
+        return None
+
+    medication_group = MedicationGroup.objects.create(
+        user=user,
+        name=f"药单组 {timezone.now().strftime('%Y-%m-%d %H:%M')}",
+        ai_summary=result.get('summary', ''),
+        raw_result=result
+    )
+    with open(image_path, 'rb') as f:
+        medication_group.source_image.save(
+            f"medication_{uuid.uuid4().hex}{os.path.splitext(image_path)[1]}",
+            File(f),
+            save=True
+        )
+
+    created_medications = []
+    for med_data in medications_data:
+        medicine_name = (med_data.get('medicine_name') or '').strip()
+        dosage = (med_data.get('dosage') or '').strip()
+        if not medicine_name:
+            continue
+
+        start_date = _parse_date(med_data.get('start_date'), timezone.now().date())
+        end_date = _parse_date(med_data.get('end_date'), start_date + timedelta(days=7))
+        notes = med_data.get('notes', '')
+        if notes == 'null':
+            notes = ''
+
+        medication = Medication.objects.create(
+            user=user,
+            group=medication_group,
+            medicine_name=medicine_name,
+            dosage=dosage or '按医嘱服用',
+            start_date=start_date,
+            end_date=end_date,
+            notes=notes
+        )
+        created_medications.append({
+            'id': medication.id,
+            'medicine_name': medication.medicine_name,
+            'dosage': medication.dosage,
+            'start_date': medication.start_date.strftime('%Y-%m-%d'),
+            'end_date': medication.end_date.strftime('%Y-%m-%d'),
+            'notes': medication.notes,
+            'total_days': medication.total_days,
+        })
+
+    return {
+        'group': {
+            'id': medication_group.id,
+            'name': medication_group.name,
+            'ai_summary': medication_group.ai_summary,
+            'medication_count': len(created_medications),
+            'created_at': medication_group.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'medications': created_medications,
+        'raw_result': result,
+    }
+
+
+def recognize_image(user, image_path, service=None):
+    """
+    识别一张药单图片并建组
+
+    Returns:
+        create_medication_group 的结果；未识别出药物时为 None
+    """
+    from .services import MedicationRecognitionService
+
+    service = service or MedicationRecognitionService()
+    result = service.recognize_medication_image(image_path)
+    return create_medication_group(user, result, image_path)
+
+
+# ==================== 后台识别任务 ====================
+
+def _job_key(user_id, job_id):
+    return f'medication_jobs:{user_id}:{job_id}'
+
+
+def _job_lock(job_id):
+    with _job_locks_guard:
+        return _job_locks.setdefault(job_id, threading.Lock())
+
+
+def _update_item(user_id, job_id, index, **fields):
+    """更新任务中一张图片的状态，并汇总任务进度"""
+    key = _job_key(user_id, job_id)
+    with _job_lock(job_id):
+        job = cache.get(key)
+        if job is None:
+            return
+        job['items'][index].update(fields)
+        finished = [item for item in job['items'] if item['status'] in ('completed', 'failed')]
+        job['completed_count'] = sum(1 for item in finished if item['status'] == 'completed')
+        job['failed_count'] = len(finished) - job['completed_count']
+        job['progress'] = int(len(finished) / len(job['items']) * 100)
+        if len(finished) == len(job['items']):
+            job['status'] = 'completed' if job['completed_count'] else 'failed'
+        else:
+            job['status'] = 'processing'
+        job['updated_at'] = timezone.now().isoformat()
+        cache.set(key, job, JOB_TIMEOUT)
+
+
+def _recognize_item(user, job_id, index, image_path, service):
+    _update_item(user.id, job_id, index, status='processing')
+    try:
+        payload = recognize_image(user, image_path, service)
+        if payload is None:
+            _update_item(user.id, job_id, index, status='failed', error='未能从图片中识别出药物信息')
+        else:
+            _update_item(user.id, job_id, index, status='completed', **payload)
+    except Exception as e:
+        logger.exception(f"[药单识别任务] {job_id} 第{index + 1}张图片识别失败")
+        _update_item(user.id, job_id, index, status='failed', error=f'识别失败: {str(e)}')
+    finally:
+        # 工作线程结束前关闭本线程的数据库连接
+        connections.close_all()
+
+
+def _run_job(user, job_id, image_paths, temp_dir):
+    """并行识别任务中的全部图片；每张完成即写入任务状态"""
+    from .services import MedicationRecognitionService
+
+    try:
+        service = MedicationRecognitionService()
+        workers = max(1, min(int(SystemSettings.get_setting('llm_max_concurrency', '3')), len(image_paths)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_recognize_item, user, job_id, index, path, service)
+                for index, path in enumerate(image_paths)
+            ]
+            for future in as_completed(futures):
+                future.result()
+    except Exception as e:
+        logger.exception(f"[药单识别任务] {job_id} 执行失败")
+        for index in range(len(image_paths)):
+            _update_item(user.id, job_id, index, status='failed', error=f'识别失败: {str(e)}')
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        with _job_locks_guard:
+            _job_locks.pop(job_id, None)
+        connections.close_all()
+
+
+def submit_recognition_job(user, image_files):
+    """
+    提交药单图片识别任务
+
+    Returns:
+        任务信息字典（见 get_recognition_job）
+
+    Raises:
+        MedicationRecognitionError: 没有图片、图片过多或图片无效
+    """
+    if not image_files:
+        raise MedicationRecognitionError('未找到上传的图片')
+    if len(image_files) > MAX_IMAGES_PER_JOB:
+        raise MedicationRecognitionError(f'一次最多识别 {MAX_IMAGES_PER_JOB} 张图片')
+    for image_file in image_files:
+        validate_image(image_file)
+
+    job_id = uuid.uuid4().hex
+    temp_dir = tempfile.mkdtemp(prefix='medication_job_')
+    try:
+        image_paths = [save_upload(image_file, temp_dir) for image_file in image_files]
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    now = timezone.now().isoformat()
+    job = {
+        'job_id': job_id,
+        'status': 'pending',
+        'progress': 0,
+        'total': len(image_paths),
+        'completed_count': 0,
+        'failed_count': 0,
+        'created_at': now,
+        'updated_at': now,
+        'items': [
+            {'index': index, 'file_name': image_file.name, 'status': 'pending'}
+            for index, image_file in enumerate(image_files)
+        ],
+    }
+    cache.set(_job_key(user.id, job_id), job, JOB_TIMEOUT)
+
+    thread = threading.Thread(
+        target=_run_job,
+        args=(user, job_id, image_paths, temp_dir),
+        name=f"MedicationRecognition-{job_id[:8]}",
+        daemon=True,
+    )
+    thread.start()
+    return job
+
+
+def get_recognition_job(user, job_id):
+    """
+    查询识别任务
+
+    Returns:
+        任务信息字典：job_id、status（pending/processing/completed/failed）、progress、total、
+        completed_count、failed_count、items（每张图片的 status，完成后附 group、medications、raw_result，失败时附 error）；
+        任务不存在或已过期时返回 None
+    """
+    if not job_id or not str(job_id).isalnum():
+        return None
+    return cache.get(_job_key(user.id, job_id))
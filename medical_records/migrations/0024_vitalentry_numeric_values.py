@@ -0,0 +1,52 @@
+import re
+
+from django.db import migrations, models
+
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+
+def parse_value(vital_type, value):
+    numbers = NUMBER_PATTERN.findall(str(value or '').replace('，', ','))
+    if not numbers:
+        return None, None
+    secondary = float(numbers[1]) if vital_type == 'blood_pressure' and len(numbers) > 1 else None
+    return float(numbers[0]), secondary
+
+
+def backfill_numeric_values(apps, schema_editor):
+    """解析已有体征日志的数值列"""
+    VitalEntry = apps.get_model('medical_records', 'VitalEntry')
+    batch = []
+    for entry in VitalEntry.objects.only('id', 'vital_type', 'value').iterator(chunk_size=2000):
+        entry.numeric_value, entry.numeric_value_secondary = parse_value(entry.vital_type, entry.value)
+        batch.append(entry)
+        if len(batch) >= 2000:
+            VitalEntry.objects.bulk_update(batch, ['numeric_value', 'numeric_value_secondary'])
+            batch = []
+    if batch:
+        VitalEntry.objects.bulk_update(batch, ['numeric_value', 'numeric_value_secondary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0023_batchdocumentprocessing_userprofile_wechat_openid_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vitalentry',
+            name='numeric_value',
+            field=models.FloatField(blank=True, null=True, verbose_name='数值（解析）'),
+        ),
+        migrations.AddField(
+            model_name='vitalentry',
+            name='numeric_value_secondary',
+            field=models.FloatField(blank=True, null=True, verbose_name='第二数值（解析）'),
+        ),
+        migrations.AddIndex(
+            model_name='vitalentry',
+            index=models.Index(fields=['user', 'vital_type', 'entry_date'], name='medical_rec_user_id_cf0e7f_idx'),
+        ),
+        migrations.RunPython(backfill_numeric_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0025_indicatornamemapping'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthcheckup',
+            name='report_file_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='报告文件哈希'),
+        ),
+    ]
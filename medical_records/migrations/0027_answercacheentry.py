@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0026_healthcheckup_report_file_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope_key', models.CharField(db_index=True, max_length=64, verbose_name='作用域')),
+                ('model_key', models.CharField(max_length=200, verbose_name='模型')),
+                ('question', models.TextField(verbose_name='原始问题')),
+                ('normalized_question', models.CharField(max_length=500, verbose_name='规范化问题')),
+                ('answer', models.TextField(verbose_name='缓存答案')),
+                ('hit_count', models.IntegerField(default=0, verbose_name='命中次数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True, verbose_name='最近命中时间')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='过期时间')),
+            ],
+            options={
+                'verbose_name': '答案缓存',
+                'verbose_name_plural': '答案缓存',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+# 只增加字段；已有指标的标准值用 python manage.py normalize_indicator_units 回填
+# （换算依赖单位登记表与知识库，放在迁移中会随应用代码变化而改变历史迁移的行为）
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0027_answercacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthindicator',
+            name='canonical_value',
+            field=models.FloatField(blank=True, null=True, verbose_name='标准单位数值'),
+        ),
+        migrations.AddField(
+            model_name='healthindicator',
+            name='canonical_unit',
+            field=models.CharField(blank=True, default='', max_length=20, verbose_name='标准单位'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0028_healthindicator_canonical_value'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthcheckup',
+            name='source_image_hashes',
+            field=models.JSONField(blank=True, default=list, verbose_name='原图哈希'),
+        ),
+    ]
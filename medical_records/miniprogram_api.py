@@ -8,6 +8,7 @@ from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.http import JsonResponse
+from django.urls import reverse
 from django.core.files.storage import default_storage
 import json
 import uuid
@@ -18,6 +19,7 @@ from datetime import datetime, timedelta
 
 from .models import HealthCheckup, HealthIndicator, HealthAdvice, SystemSettings, DocumentProcessing, Conversation, CarePlan, CareGoal, CareAction
 from .services import DocumentProcessingService, VisionLanguageModelService, AIService
+from .reference_ranges import STATUS_SOURCE_FIELDS, apply_reference_status, profile_context, reference_status
 from .miniprogram_serializers import (
     UserSerializer, HealthCheckupSerializer, HealthIndicatorSerializer,
     HealthAdviceSerializer, DocumentProcessingSerializer,
@@ -579,31 +581,58 @@ def miniprogram_processing_status(request, processing_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def miniprogram_checkup_list(request):
-    """获取体检记录列表"""
-    try:
-        page = int(request.GET.get('page', 1))
-        page_size = int(request.GET.get('page_size', 10))
+    """
+    获取体检记录列表（游标分页）
+
+    查询参数：
+    - cursor: 上一页返回的 next_cursor（首页不传）
+    - page_size: 每页条数（默认10）
+    - page: 旧版页码参数，仅在未传 cursor 时兼容使用
+    """
+    from django.db.models import Count, Q
+    from .pagination import paginate_queryset, get_page_size, InvalidCursor
 
+    try:
         checkups = HealthCheckup.objects.filter(
             user=request.user
-        ).order_by('-created_at')
+        ).select_related('documentprocessing').annotate(
+            indicators_count=Count('indicators'),
+            abnormal_count=Count('indicators', filter=Q(indicators__status='abnormal')),
+        )
 
-        # 分页
-        start = (page - 1) * page_size
-        end = start + page_size
-        checkups_page = checkups[start:end]
+        params = request.query_params
+        page = params.get('page')
+        if page and not params.get('cursor') and int(page) > 1:
+            # 兼容旧版页码分页
+            page_size = get_page_size(params, default=10)
+            start = (int(page) - 1) * page_size
+            rows = list(checkups.order_by('-created_at', '-id')[start:start + page_size + 1])
+            checkups_page = rows[:page_size]
+            page_info = {'page_size': page_size, 'next_cursor': None, 'has_more': len(rows) > page_size}
+        else:
+            checkups_page, page_info = paginate_queryset(
+                checkups, params, ordering=('-created_at', '-id'), default_page_size=10
+            )
 
         serializer = MiniProgramCheckupListSerializer(checkups_page, many=True)
 
-        return Response({
+        response = {
             'success': True,
             'data': serializer.data,
-            'total': checkups.count(),
-            'page': page,
-            'page_size': page_size,
-            'has_more': end < checkups.count()
-        })
+            'page': int(page) if page else 1,
+            **page_info
+        }
+        # 总数只在首页计算一次，翻页时不再 COUNT
+        if not params.get('cursor') and not (page and int(page) > 1):
+            response['total'] = HealthCheckup.objects.filter(user=request.user).count()
 
+        return Response(response)
+
+    except (InvalidCursor, ValueError) as e:
+        return Response({
+            'success': False,
+            'message': str(e) if isinstance(e, InvalidCursor) else '分页参数错误'
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({
             'success': False,
@@ -986,6 +1015,15 @@ def miniprogram_create_indicator(request):
             user=request.user
         )
 
+        # 未指定状态时按参考范围判定
+        indicator_status = data.get('status')
+        if not indicator_status:
+            gender, age = profile_context(request.user.id, checkup.checkup_date)
+            indicator_status = reference_status(
+                data.get('indicator_name') or '', data.get('value') or '', data.get('unit', ''),
+                data.get('reference_range', ''), gender=gender, age=age
+            ) or 'normal'
+
         # 创建指标
         indicator = HealthIndicator.objects.create(
             checkup=checkup,
@@ -994,7 +1032,7 @@ def miniprogram_create_indicator(request):
             value=data.get('value'),
             unit=data.get('unit', ''),
             reference_range=data.get('reference_range', ''),
-            status=data.get('status', 'normal')
+            status=indicator_status
         )
 
         serializer = HealthIndicatorSerializer(indicator)
@@ -1043,6 +1081,10 @@ def miniprogram_update_indicator(request, indicator_id):
         if 'indicator_type' in data:
             indicator.indicator_type = data['indicator_type']
 
+        # 未指定状态时，名称/值/单位/参考范围变化后按参考范围重新判定
+        if 'status' not in data and any(field in data for field in STATUS_SOURCE_FIELDS):
+            apply_reference_status([indicator], *profile_context(request.user.id, indicator.checkup.checkup_date))
+
         indicator.save()
 
         serializer = HealthIndicatorSerializer(indicator)
@@ -1097,32 +1139,59 @@ def miniprogram_delete_indicator(request, indicator_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def miniprogram_conversations(request):
-    """获取用户的对话列表"""
+    """
+    获取用户的对话列表（游标分页）
+
+    查询参数：
+    - cursor: 上一页返回的 next_cursor（首页不传）
+    - page_size: 每页条数（默认20）
+    """
     try:
+        from django.db.models import Count, OuterRef, Subquery
         from .models import Conversation
+        from .pagination import paginate_queryset, InvalidCursor
+
+        latest_question = HealthAdvice.objects.filter(
+            conversation=OuterRef('pk')
+        ).order_by('-created_at').values('question')[:1]
 
-        conversations = Conversation.get_user_conversations(request.user, limit=20)
+        conversations = Conversation.objects.filter(
+            user=request.user, is_active=True
+        ).annotate(
+            message_count=Count('healthadvice'),
+            latest_question=Subquery(latest_question),
+        ).filter(message_count__gt=0)
+
+        try:
+            conversations_page, page_info = paginate_queryset(
+                conversations, request.query_params, ordering=('-updated_at', '-id'), default_page_size=20
+            )
+        except InvalidCursor as e:
+            return Response({
+                'success': False,
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         conversation_list = []
-        for conv in conversations:
-            latest_message = conv.get_latest_message()
-            message_count = conv.get_message_count()
-
-            if message_count > 0:
-                conversation_list.append({
-                    'id': conv.id,
-                    'title': conv.title,
-                    'created_at': conv.created_at.isoformat(),
-                    'updated_at': conv.updated_at.isoformat(),
-                    'message_count': message_count,
-                    'latest_question': latest_message.question[:100] if latest_message else ''
-                })
+        for conv in conversations_page:
+            conversation_list.append({
+                'id': conv.id,
+                'title': conv.title,
+                'created_at': conv.created_at.isoformat(),
+                'updated_at': conv.updated_at.isoformat(),
+                'message_count': conv.message_count,
+                'latest_question': (conv.latest_question or '')[:100]
+            })
 
-        return Response({
+        response = {
             'success': True,
             'data': conversation_list,
-            'total': len(conversation_list)
-        })
+            **page_info
+        }
+        if not request.query_params.get('cursor'):
+            response['total'] = conversations.count()
+
+        return Response(response)
 
     except Exception as e:
         return Response({
@@ -1724,6 +1793,8 @@ def miniprogram_indicator_trends(request):
                 'date': indicator.checkup.checkup_date.strftime('%Y-%m-%d'),
                 'value': str(indicator.value) if indicator.value else '',
                 'unit': indicator.unit or '',
+                'canonical_value': indicator.canonical_value,
+                'canonical_unit': indicator.canonical_unit,
                 'reference_range': indicator.reference_range or '',
                 'status': indicator.status,
                 'checkup_id': indicator.checkup.id,
@@ -1740,7 +1811,11 @@ def miniprogram_indicator_trends(request):
                 ).first()
                 type_key = indicator_type_key.indicator_type if indicator_type_key else 'other'
                 
-                numeric_values = [extract_numeric_value(r['value']) for r in records]
+                # 优先比较标准单位数值，避免 mg/dL 与 mmol/L 的结果直接相比
+                numeric_values = [
+                    r['canonical_value'] if r['canonical_value'] is not None else extract_numeric_value(r['value'])
+                    for r in records
+                ]
                 numeric_values = [v for v in numeric_values if v is not None]
                 
                 trend = 'stable'
@@ -1792,39 +1867,11 @@ def miniprogram_indicator_trends(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def miniprogram_detect_duplicate_checkups(request):
-    """检测重复的体检报告（相同日期和机构）"""
+    """检测重复的体检报告（文件相同、日期机构相同或指标内容高度相似）"""
     try:
-        from django.db.models import Count, Q
-        from collections import defaultdict
+        from .duplicate_detection import find_duplicate_groups
 
-        # 获取用户所有体检报告
-        user_checkups = HealthCheckup.objects.filter(
-            user=request.user
-        ).order_by('-checkup_date', '-created_at')
-
-        # 按日期和机构分组
-        groups = defaultdict(list)
-        for checkup in user_checkups:
-            key = (checkup.checkup_date, checkup.hospital)
-            groups[key].append({
-                'id': checkup.id,
-                'checkup_date': checkup.checkup_date.strftime('%Y-%m-%d'),
-                'hospital': checkup.hospital,
-                'notes': checkup.notes,
-                'indicators_count': checkup.indicators.count(),
-                'created_at': checkup.created_at.strftime('%Y-%m-%d %H:%M')
-            })
-
-        # 找出重复的报告组（每组超过1个报告）
-        duplicate_groups = []
-        for (date, hospital), checkups_list in groups.items():
-            if len(checkups_list) > 1:
-                duplicate_groups.append({
-                    'date': date,
-                    'hospital': hospital,
-                    'checkups': checkups_list,
-                    'count': len(checkups_list)
-                })
+        duplicate_groups = find_duplicate_groups(request.user)
 
         return Response({
             'success': True,
@@ -1845,11 +1892,7 @@ def miniprogram_detect_duplicate_checkups(request):
 def miniprogram_merge_duplicate_checkups(request):
     """合并重复的体检报告"""
     try:
-        from django.db import transaction
-        import os
-        import zipfile
-        import io
-        from django.core.files.base import ContentFile
+        from .duplicate_detection import merge_checkups
 
         data = request.data
         target_checkup_id = data.get('target_checkup_id')
@@ -1872,89 +1915,21 @@ def miniprogram_merge_duplicate_checkups(request):
                 'message': '目标报告不存在'
             }, status=status.HTTP_404_NOT_FOUND)
 
-        source_checkups = HealthCheckup.objects.filter(
-            id__in=source_checkup_ids,
-            user=request.user
-        )
-
-        if not source_checkups.exists():
+        result = merge_checkups(request.user, target_checkup, source_checkup_ids)
+        merged_count = result['merged_count']
+        if not merged_count:
             return Response({
                 'success': False,
                 'message': '没有找到要合并的源报告'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        merged_count = 0
-        error_messages = []
-        source_checkup_list = list(source_checkups)
-        zip_created = False
-
-        with transaction.atomic():
-            source_files = []
-            
-            if target_checkup.report_file:
-                source_files.append({
-                    'file': target_checkup.report_file,
-                    'name': f"{target_checkup.checkup_date}_{target_checkup.hospital or '未知机构'}_{os.path.basename(target_checkup.report_file.name)}"
-                })
-            
-            for source_checkup in source_checkup_list:
-                try:
-                    if source_checkup.report_file:
-                        source_files.append({
-                            'file': source_checkup.report_file,
-                            'name': f"{source_checkup.checkup_date}_{source_checkup.hospital or '未知机构'}_{os.path.basename(source_checkup.report_file.name)}"
-                        })
-                    
-                    if source_checkup.notes:
-                        if target_checkup.notes:
-                            target_checkup.notes = f"{target_checkup.notes}\n[来自合并] {source_checkup.notes}"
-                        else:
-                            target_checkup.notes = f"[来自合并] {source_checkup.notes}"
-
-                    indicators_moved = source_checkup.indicators.all().update(
-                        checkup=target_checkup
-                    )
-
-                    source_checkup.delete()
-                    merged_count += 1
-
-                except Exception as e:
-                    error_messages.append(f"合并报告 {source_checkup.id} 失败: {str(e)}")
-
-            if source_files:
-                try:
-                    zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                        for sf in source_files:
-                            try:
-                                file_content = sf['file'].read()
-                                safe_name = "".join(c for c in sf['name'] if c.isalnum() or c in '._- ')
-                                zip_file.writestr(safe_name, file_content)
-                            except Exception as e:
-                                error_messages.append(f"读取文件失败: {str(e)}")
-                    
-                    zip_buffer.seek(0)
-                    zip_content = zip_buffer.read()
-                    zip_filename = f"merged_{target_checkup.checkup_date}_{target_checkup.hospital or '整合报告'}.zip"
-                    zip_filename = "".join(c for c in zip_filename if c.isalnum() or c in '._- ')
-                    
-                    target_checkup.report_file.save(
-                        zip_filename,
-                        ContentFile(zip_content),
-                        save=False
-                    )
-                    zip_created = True
-                except Exception as e:
-                    error_messages.append(f"创建ZIP失败: {str(e)}")
-
-            target_checkup.save()
-
+        zip_created = result['zip_created']
         return Response({
             'success': True,
             'message': f'成功合并 {merged_count} 份报告' + ('，源文件已打包' if zip_created else ''),
             'merged_count': merged_count,
             'zip_created': zip_created,
-            'errors': error_messages
+            'errors': result['errors']
         })
 
     except Exception as e:
@@ -2033,7 +2008,7 @@ def test_export_conversation(request, conversation_id):
 def miniprogram_export_conversation_pdf(request, conversation_id):
     """导出对话为PDF"""
     try:
-        from .export_utils import ConversationExporter
+        from .export_jobs import export_download_response
 
         # 验证对话归属
         conversation = Conversation.objects.get(
@@ -2049,8 +2024,7 @@ def miniprogram_export_conversation_pdf(request, conversation_id):
                 'message': '该对话暂无消息内容'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        exporter = ConversationExporter(conversation_id)
-        return exporter.export_to_pdf()
+        return export_download_response(request.user, 'conversation', 'pdf', {'conversation_id': conversation_id})
 
     except Conversation.DoesNotExist:
         return Response({
@@ -2072,7 +2046,7 @@ def miniprogram_export_conversation_pdf(request, conversation_id):
 def miniprogram_export_conversation_word(request, conversation_id):
     """导出对话为Word"""
     try:
-        from .export_utils import ConversationExporter
+        from .export_jobs import export_download_response
 
         # 验证对话归属
         conversation = Conversation.objects.get(
@@ -2088,8 +2062,7 @@ def miniprogram_export_conversation_word(request, conversation_id):
                 'message': '该对话暂无消息内容'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        exporter = ConversationExporter(conversation_id)
-        return exporter.export_to_word()
+        return export_download_response(request.user, 'conversation', 'word', {'conversation_id': conversation_id})
 
     except Conversation.DoesNotExist:
         return Response({
@@ -2112,7 +2085,7 @@ def miniprogram_export_conversation_word(request, conversation_id):
 def miniprogram_export_checkups_pdf(request):
     """小程序专用：批量导出体检报告为PDF"""
     try:
-        from .export_utils import CheckupReportsExporter
+        from .export_jobs import export_download_response
         from .models import HealthCheckup
 
         # 获取请求中的报告ID列表
@@ -2144,9 +2117,8 @@ def miniprogram_export_checkups_pdf(request):
                 'message': '未找到指定的报告'
             }, status=status.HTTP_404_NOT_FOUND)
 
-        # 导出
-        exporter = CheckupReportsExporter(checkups)
-        return exporter.export_to_pdf()
+        # 导出（数据未变化时直接返回已生成的文件）
+        return export_download_response(request.user, 'checkups', 'pdf', {'checkup_ids': checkup_id_list})
 
     except Exception as e:
         import traceback
@@ -2163,7 +2135,7 @@ def miniprogram_export_checkups_pdf(request):
 def miniprogram_export_checkups_word(request):
     """小程序专用：批量导出体检报告为Word"""
     try:
-        from .export_utils import CheckupReportsExporter
+        from .export_jobs import export_download_response
         from .models import HealthCheckup
 
         # 获取请求中的报告ID列表
@@ -2195,9 +2167,8 @@ def miniprogram_export_checkups_word(request):
                 'message': '未找到指定的报告'
             }, status=status.HTTP_404_NOT_FOUND)
 
-        # 导出
-        exporter = CheckupReportsExporter(checkups)
-        return exporter.export_to_word()
+        # 导出（数据未变化时直接返回已生成的文件）
+        return export_download_response(request.user, 'checkups', 'word', {'checkup_ids': checkup_id_list})
 
     except Exception as e:
         import traceback
@@ -2209,6 +2180,87 @@ def miniprogram_export_checkups_word(request):
             'message': f'导出Word失败: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# ==================== 导出任务 ====================
+def _mp_export_job_payload(request, job):
+    """为已完成的导出任务附加下载地址"""
+    if job['status'] == 'completed':
+        job['download_url'] = request.build_absolute_uri(
+            reverse('miniprogram:export_job_download', args=[job['job_id']])
+        )
+    return job
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mp_export_jobs(request):
+    """
+    提交导出任务
+
+    参数：
+    - export_type: checkups / health_trends / conversation / ai_summary / event_summary
+    - format: pdf / word
+    - checkup_ids / conversation_id / event_id: 对应导出类型所需参数
+
+    数据未变化时直接返回已生成的文件（status=completed, cached=true）；
+    否则返回 job_id，轮询 exports/<job_id>/ 直到完成后访问 download_url 下载
+    """
+    from .export_jobs import ExportError, request_export
+
+    data = _get_request_data(request)
+    try:
+        job = request_export(request.user, data.get('export_type'), data.get('format', 'pdf'), data)
+    except ExportError as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=e.status_code)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return Response({
+            'success': False,
+            'message': f'提交导出任务失败: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({
+        'success': True,
+        'job': _mp_export_job_payload(request, job)
+    }, status=status.HTTP_200_OK if job['status'] == 'completed' else status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def mp_export_job_status(request, job_id):
+    """查询导出任务状态"""
+    from .export_jobs import get_export_job
+
+    job = get_export_job(request.user, job_id)
+    if job is None:
+        return Response({
+            'success': False,
+            'message': '导出任务不存在或已过期'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        'success': True,
+        'job': _mp_export_job_payload(request, job)
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def mp_export_job_download(request, job_id):
+    """下载导出文件"""
+    from .export_jobs import export_job_download_response
+
+    response = export_job_download_response(request.user, job_id)
+    if response is None:
+        return Response({
+            'success': False,
+            'message': '导出文件不存在或尚未生成'
+        }, status=status.HTTP_404_NOT_FOUND)
+    return response
+
 # ==================== 完善个人信息 ====================
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -2280,13 +2332,47 @@ def miniprogram_complete_profile(request):
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def miniprogram_medications(request):
-    """获取或创建药单"""
+    """
+    获取或创建药单
+
+    GET 默认返回全部药单；传入 cursor/page_size（药单组）或 standalone_cursor/standalone_page_size
+    （未分组药单）任一参数时改为游标分页
+    """
     from .models import Medication, MedicationRecord, MedicationGroup
 
     if request.method == 'GET':
-        from .models import MedicationGroup
-        
-        groups = MedicationGroup.objects.filter(user=request.user).order_by('-created_at')
+        from .adherence import with_group_medications, with_taken_days
+        from .pagination import paginate_queryset, InvalidCursor
+
+        params = request.query_params
+        ordering = ('-created_at', '-id')
+        groups_qs = with_group_medications(MedicationGroup.objects.filter(user=request.user))
+        standalone_qs = with_taken_days(Medication.objects.filter(user=request.user, group__isnull=True))
+        paginated = any(
+            params.get(name) for name in ('cursor', 'page_size', 'standalone_cursor', 'standalone_page_size')
+        )
+
+        try:
+            if paginated:
+                groups, groups_page_info = paginate_queryset(
+                    groups_qs, params, ordering=ordering, default_page_size=50
+                )
+                standalone_medications, standalone_page_info = paginate_queryset(
+                    standalone_qs, params, ordering=ordering, default_page_size=50,
+                    cursor_param='standalone_cursor', size_param='standalone_page_size'
+                )
+            else:
+                # 旧版调用方不翻页，一次返回全部
+                groups = list(groups_qs.order_by(*ordering))
+                standalone_medications = list(standalone_qs.order_by(*ordering))
+                groups_page_info = {'page_size': len(groups), 'next_cursor': None, 'has_more': False}
+                standalone_page_info = {'next_cursor': None, 'has_more': False}
+        except InvalidCursor as e:
+            return Response({
+                'success': False,
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
         group_list = []
         for group in groups:
             medications_in_group = group.medications.all()
@@ -2315,8 +2401,7 @@ def miniprogram_medications(request):
                 'medication_count': group.medication_count,
                 'medications': med_list,
             })
-        
-        standalone_medications = Medication.objects.filter(user=request.user, group__isnull=True).order_by('-created_at')
+
         standalone_list = []
         for med in standalone_medications:
             standalone_list.append({
@@ -2338,6 +2423,9 @@ def miniprogram_medications(request):
             'success': True,
             'groups': group_list,
             'standalone_medications': standalone_list,
+            **groups_page_info,
+            'standalone_next_cursor': standalone_page_info['next_cursor'],
+            'standalone_has_more': standalone_page_info['has_more'],
         })
 
     elif request.method == 'POST':
@@ -2522,16 +2610,25 @@ def miniprogram_upload_avatar(request):
         avatars_dir = os.path.join(settings.MEDIA_ROOT, 'avatars')
         os.makedirs(avatars_dir, exist_ok=True)
 
+        # 按 EXIF 方向旋正并缩小为缩略图（JPEG）后保存
+        from .image_pipeline import render
+        try:
+            avatar_data = render(avatar_file, 'thumbnail')
+        except Exception as e:
+            print(f"头像图片处理失败: {str(e)}")
+            return Response({
+                'success': False,
+                'message': '无法识别的图片文件'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
         # 生成唯一文件名
         import uuid
-        file_ext = os.path.splitext(avatar_file.name)[1]
-        unique_filename = f"{request.user.id}_{uuid.uuid4().hex[:8]}{file_ext}"
+        unique_filename = f"{request.user.id}_{uuid.uuid4().hex[:8]}.jpg"
         file_path = os.path.join(avatars_dir, unique_filename)
 
         # 保存文件
-        with open(file_path, 'wb+') as destination:
-            for chunk in avatar_file.chunks():
-                destination.write(chunk)
+        with open(file_path, 'wb') as destination:
+            destination.write(avatar_data)
 
         # 构建 URL
         avatar_url = f"{settings.MEDIA_URL}avatars/{unique_filename}"
@@ -2696,6 +2793,43 @@ def miniprogram_medication_records(request, medication_id):
     })
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def mp_medication_adherence(request):
+    """
+    获取服药依从性统计
+
+    查询参数：
+    - start_date / end_date: 统计区间（YYYY-MM-DD，默认最近30天）
+    - medication_id / group_id: 仅统计指定药单或药单组（可选）
+    """
+    from .adherence import compute_adherence
+
+    try:
+        start_date = request.GET.get('start_date')
+        end_date = request.GET.get('end_date')
+        medication_id = request.GET.get('medication_id')
+        group_id = request.GET.get('group_id')
+
+        stats = compute_adherence(
+            request.user,
+            start_date=datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+            end_date=datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None,
+            medication_ids=[int(medication_id)] if medication_id else None,
+            group_ids=[int(group_id)] if group_id else None,
+        )
+    except ValueError:
+        return Response({
+            'success': False,
+            'message': '参数格式错误'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'success': True,
+        **stats
+    })
+
+
 # ==================== 修改密码 ====================
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -2765,6 +2899,10 @@ def miniprogram_change_password(request):
 @permission_classes([IsAuthenticated])
 def miniprogram_recognize_medication_image(request):
     """小程序识别药单图片并创建药单组"""
+    from .medication_jobs import MedicationRecognitionError, recognize_image, save_upload, validate_image
+    import tempfile
+    import shutil
+
     try:
         if 'image' not in request.FILES:
             return Response({
@@ -2773,159 +2911,83 @@ def miniprogram_recognize_medication_image(request):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         image_file = request.FILES['image']
+        validate_image(image_file)
 
-        # 验证文件类型
-        allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp']
-        if image_file.content_type not in allowed_types:
-            return Response({
-                'success': False,
-                'error': '只支持 JPG、PNG、GIF、WEBP 格式的图片'
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        # 验证文件大小（限制为 10MB）
-        max_size = 10 * 1024 * 1024
-        if image_file.size > max_size:
-            return Response({
-                'success': False,
-                'error': '图片大小不能超过 10MB'
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        from django.conf import settings
-        from datetime import timedelta
-        import uuid
-        import tempfile
-        import os
-
-        # 创建临时文件
+        # 保存上传的图片到临时文件并调用药单识别服务
         temp_dir = tempfile.mkdtemp()
-        file_ext = os.path.splitext(image_file.name)[1]
-        temp_file_path = os.path.join(temp_dir, f"medication_{uuid.uuid4().hex}{file_ext}")
-
-        # 保存上传的图片到临时文件
-        with open(temp_file_path, 'wb+') as destination:
-            for chunk in image_file.chunks():
-                destination.write(chunk)
-
-        print(f"[小程序药单识别] 图片已保存到临时文件: {temp_file_path}")
-
-        # 调用药单识别服务
-        from .services import MedicationRecognitionService
-        from .models import MedicationGroup, Medication
-
-        service = MedicationRecognitionService()
-        result = service.recognize_medication_image(temp_file_path)
-
-        # 清理临时文件
         try:
-            os.unlink(temp_file_path)
-            os.rmdir(temp_dir)
-        except:
-            pass
-
-        medications_data = result.get('medications', [])
-        summary = result.get('summary', '')
+            payload = recognize_image(request.user, save_upload(image_file, temp_dir))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
 
-        if not medications_data:
+        if payload is None:
             return Response({
                 'success': False,
                 'error': '未能从图片中识别出药物信息'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # 创建药单组
-        from django.utils import timezone
-        group_name = f"药单组 {timezone.now().strftime('%Y-%m-%d %H:%M')}"
-        medication_group = MedicationGroup.objects.create(
-            user=request.user,
-            name=group_name,
-            ai_summary=summary,
-            raw_result=result
-        )
-
-        # 保存原始图片
-        if image_file:
-            medication_group.source_image.save(
-                f"medication_{uuid.uuid4().hex}{file_ext}",
-                image_file,
-                save=True
-            )
-
-        created_medications = []
-
-        for med_data in medications_data:
-            medicine_name = med_data.get('medicine_name', '').strip()
-            dosage = med_data.get('dosage', '').strip()
-
-            if not medicine_name:
-                continue
-
-            # 解析开始日期
-            start_date_str = med_data.get('start_date')
-            end_date_str = med_data.get('end_date')
-
-            try:
-                if start_date_str and start_date_str != 'null':
-                    start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                else:
-                    start_date = timezone.now().date()
-            except:
-                start_date = timezone.now().date()
-
-            try:
-                if end_date_str and end_date_str != 'null':
-                    end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                else:
-                    end_date = start_date + timedelta(days=7)
-            except:
-                end_date = start_date + timedelta(days=7)
+        print(f"[小程序药单识别] ✓ 识别成功，创建了 {len(payload['medications'])} 个药单")
+        return Response({'success': True, **payload})
 
-            notes = med_data.get('notes', '')
-            if notes == 'null':
-                notes = ''
+    except MedicationRecognitionError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=e.status_code)
+    except Exception as e:
+        import traceback
+        print(f"[小程序药单识别] ✗ 识别失败: {str(e)}")
+        traceback.print_exc()
+        return Response({
+            'success': False,
+            'error': f'识别失败: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            medication = Medication.objects.create(
-                user=request.user,
-                group=medication_group,
-                medicine_name=medicine_name,
-                dosage=dosage or '按医嘱服用',
-                start_date=start_date,
-                end_date=end_date,
-                notes=notes
-            )
 
-            created_medications.append({
-                'id': medication.id,
-                'medicine_name': medication.medicine_name,
-                'dosage': medication.dosage,
-                'start_date': medication.start_date.strftime('%Y-%m-%d'),
-                'end_date': medication.end_date.strftime('%Y-%m-%d'),
-                'notes': medication.notes,
-                'total_days': medication.total_days,
-            })
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mp_medication_recognize_jobs(request):
+    """
+    提交药单图片识别任务（支持多张图片，字段名 images，也兼容单张 image）
 
-        print(f"[小程序药单识别] ✓ 识别成功，创建了 {len(created_medications)} 个药单")
+    立即返回 job_id；轮询 medications/recognize-jobs/<job_id>/，每张图片识别完成后即可在 items 中拿到其药单组
+    """
+    from .medication_jobs import MedicationRecognitionError, submit_recognition_job
 
+    image_files = request.FILES.getlist('images') or request.FILES.getlist('image')
+    try:
+        job = submit_recognition_job(request.user, image_files)
+    except MedicationRecognitionError as e:
         return Response({
-            'success': True,
-            'group': {
-                'id': medication_group.id,
-                'name': medication_group.name,
-                'ai_summary': medication_group.ai_summary,
-                'medication_count': len(created_medications),
-                'created_at': medication_group.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            },
-            'medications': created_medications,
-            'raw_result': result
-        })
-
+            'success': False,
+            'error': str(e)
+        }, status=e.status_code)
     except Exception as e:
         import traceback
-        print(f"[小程序药单识别] ✗ 识别失败: {str(e)}")
         traceback.print_exc()
         return Response({
             'success': False,
-            'error': f'识别失败: {str(e)}'
+            'error': f'提交识别任务失败: {str(e)}'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    return Response({'success': True, 'job': job}, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def mp_medication_recognize_job_status(request, job_id):
+    """查询药单图片识别任务状态与已完成的识别结果"""
+    from .medication_jobs import get_recognition_job
+
+    job = get_recognition_job(request.user, job_id)
+    if job is None:
+        return Response({
+            'success': False,
+            'error': '识别任务不存在或已过期'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({'success': True, 'job': job})
+
 
 # ============================================================================
 # 小程序健康日志API (症状日志 & 体征日志)
@@ -2943,6 +3005,8 @@ def mp_symptom_logs(request):
     from .models import SymptomEntry
 
     if request.method == 'GET':
+        from .pagination import paginate_queryset, InvalidCursor
+
         queryset = SymptomEntry.objects.filter(user=request.user)
 
         # 支持日期范围筛选
@@ -2953,10 +3017,19 @@ def mp_symptom_logs(request):
         if end_date:
             queryset = queryset.filter(entry_date__lte=end_date)
 
-        queryset = queryset.order_by('-entry_date', '-created_at')
+        try:
+            logs_page, page_info = paginate_queryset(
+                queryset, request.query_params,
+                ordering=('-entry_date', '-created_at', '-id'), default_page_size=100
+            )
+        except InvalidCursor as e:
+            return Response({
+                'success': False,
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         logs = []
-        for log in queryset:
+        for log in logs_page:
             logs.append({
                 'id': log.id,
                 'entry_date': log.entry_date.strftime('%Y-%m-%d'),
@@ -2970,7 +3043,8 @@ def mp_symptom_logs(request):
         return Response({
             'success': True,
             'logs': logs,
-            'count': len(logs)
+            'count': len(logs),
+            **page_info
         })
 
     elif request.method == 'POST':
@@ -3090,6 +3164,8 @@ def mp_vital_logs(request):
     from .models import VitalEntry
 
     if request.method == 'GET':
+        from .pagination import paginate_queryset, InvalidCursor
+
         queryset = VitalEntry.objects.filter(user=request.user)
 
         # 支持日期范围筛选
@@ -3105,16 +3181,27 @@ def mp_vital_logs(request):
         if vital_type:
             queryset = queryset.filter(vital_type=vital_type)
 
-        queryset = queryset.order_by('-entry_date', '-created_at')
+        try:
+            logs_page, page_info = paginate_queryset(
+                queryset, request.query_params,
+                ordering=('-entry_date', '-created_at', '-id'), default_page_size=100
+            )
+        except InvalidCursor as e:
+            return Response({
+                'success': False,
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
 
         logs = []
-        for log in queryset:
+        for log in logs_page:
             logs.append({
                 'id': log.id,
                 'entry_date': log.entry_date.strftime('%Y-%m-%d'),
                 'vital_type': log.vital_type,
                 'vital_type_display': log.get_vital_type_display(),
                 'value': log.value,
+                'numeric_value': log.numeric_value,
+                'numeric_value_secondary': log.numeric_value_secondary,
                 'unit': log.unit or '',
                 'notes': log.notes or '',
                 'created_at': log.created_at.strftime('%Y-%m-%d %H:%M:%S'),
@@ -3123,7 +3210,8 @@ def mp_vital_logs(request):
         return Response({
             'success': True,
             'logs': logs,
-            'count': len(logs)
+            'count': len(logs),
+            **page_info
         })
 
     elif request.method == 'POST':
@@ -3165,6 +3253,8 @@ def mp_vital_logs(request):
                 'vital_type': log.vital_type,
                 'vital_type_display': log.get_vital_type_display(),
                 'value': log.value,
+                'numeric_value': log.numeric_value,
+                'numeric_value_secondary': log.numeric_value_secondary,
                 'unit': log.unit or '',
                 'notes': log.notes or '',
             }
@@ -3200,6 +3290,8 @@ def mp_vital_log_detail(request, log_id):
                 'vital_type': log.vital_type,
                 'vital_type_display': log.get_vital_type_display(),
                 'value': log.value,
+                'numeric_value': log.numeric_value,
+                'numeric_value_secondary': log.numeric_value_secondary,
                 'unit': log.unit or '',
                 'notes': log.notes or '',
                 'created_at': log.created_at.strftime('%Y-%m-%d %H:%M:%S'),
@@ -3231,6 +3323,8 @@ def mp_vital_log_detail(request, log_id):
                 'vital_type': log.vital_type,
                 'vital_type_display': log.get_vital_type_display(),
                 'value': log.value,
+                'numeric_value': log.numeric_value,
+                'numeric_value_secondary': log.numeric_value_secondary,
                 'unit': log.unit or '',
                 'notes': log.notes or '',
             }
@@ -3244,6 +3338,49 @@ def mp_vital_log_detail(request, log_id):
         })
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def mp_vital_series(request):
+    """
+    获取降采样后的体征序列（用于图表）
+
+    查询参数：
+    - vital_type: 体征类型（必填）
+    - start_date / end_date: 日期范围（默认最近一年）
+    - max_points: 最多返回点数（默认300）
+    """
+    from .models import VitalEntry
+    from .vitals import get_vital_series
+
+    vital_type = request.query_params.get('vital_type', '').strip()
+    if vital_type not in dict(VitalEntry.VITAL_TYPE_CHOICES):
+        return Response({
+            'success': False,
+            'message': '体征类型无效'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
+        series = get_vital_series(
+            request.user,
+            vital_type,
+            start_date=datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+            end_date=datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None,
+            max_points=request.query_params.get('max_points') or None,
+        )
+    except ValueError:
+        return Response({
+            'success': False,
+            'message': '参数格式错误'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'success': True,
+        **series
+    })
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def mp_vital_types(request):
@@ -3265,6 +3402,55 @@ def mp_vital_types(request):
     })
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mp_health_logs_batch(request):
+    """
+    批量提交症状/体征日志（设备同步用）
+
+    请求参数：
+    - symptoms: 症状日志数组
+    - vitals: 体征日志数组
+    - attach_to_events: 是否挂接到当天的自动事件（默认 true）
+    """
+    from .health_logs import bulk_create_health_logs
+
+    data = _get_request_data(request)
+    symptoms = data.get('symptoms') or []
+    vitals = data.get('vitals') or []
+    if not isinstance(symptoms, list) or not isinstance(vitals, list):
+        return Response({
+            'success': False,
+            'message': 'symptoms 和 vitals 必须为数组'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        results = bulk_create_health_logs(
+            request.user,
+            symptoms=symptoms,
+            vitals=vitals,
+            attach_events=data.get('attach_to_events', True),
+        )
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return Response({
+            'success': False,
+            'message': f'批量创建日志失败: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({
+        'success': True,
+        'message': f"已创建 {results['created_count']} 条日志，失败 {results['failed_count']} 条",
+        **results
+    }, status=status.HTTP_201_CREATED if results['created_count'] else status.HTTP_200_OK)
+
+
 # ============================================================================
 # 小程序药单组API
 # ============================================================================
@@ -3281,11 +3467,13 @@ def mp_medication_groups(request):
     from .models import MedicationGroup, Medication
 
     if request.method == 'GET':
-        groups = MedicationGroup.objects.filter(user=request.user).order_by('-created_at')
+        from .adherence import with_group_medications
+
+        groups = with_group_medications(MedicationGroup.objects.filter(user=request.user).order_by('-created_at'))
 
         group_list = []
         for group in groups:
-            medications = Medication.objects.filter(group=group)
+            medications = group.medications.all()
             medication_list = []
             for med in medications:
                 medication_list.append({
@@ -3389,7 +3577,8 @@ def mp_medication_group_detail(request, group_id):
         }, status=status.HTTP_404_NOT_FOUND)
 
     if request.method == 'GET':
-        medications = Medication.objects.filter(group=group)
+        from .adherence import with_taken_days
+        medications = with_taken_days(Medication.objects.filter(group=group))
         medication_list = []
         for med in medications:
             medication_list.append({
@@ -3495,7 +3684,8 @@ def mp_medication_group_checkin(request, group_id):
     - frequency: 服药频率（可选，默认daily）
     - notes: 备注（可选）
     """
-    from .models import MedicationGroup, Medication, MedicationRecord
+    from .models import MedicationGroup, Medication
+    from .adherence import bulk_checkin
 
     try:
         group = MedicationGroup.objects.get(id=group_id, user=request.user)
@@ -3516,27 +3706,13 @@ def mp_medication_group_checkin(request, group_id):
 
         record_date_obj = datetime.strptime(record_date, '%Y-%m-%d').date()
 
-        medications = Medication.objects.filter(group=group, is_active=True)
-
-        success_count = 0
-        skipped_count = 0
+        medication_ids = Medication.objects.filter(
+            group=group, is_active=True
+        ).values_list('id', flat=True)
 
-        for med in medications:
-            existing = MedicationRecord.objects.filter(
-                medication=med,
-                record_date=record_date_obj
-            ).first()
-
-            if existing:
-                skipped_count += 1
-            else:
-                MedicationRecord.objects.create(
-                    medication=med,
-                    record_date=record_date_obj,
-                    frequency=frequency,
-                    notes=notes
-                )
-                success_count += 1
+        success_count, skipped_count = bulk_checkin(
+            medication_ids, record_date_obj, frequency=frequency, notes=notes, user_id=request.user.id
+        )
 
         return Response({
             'success': True,
@@ -3662,6 +3838,16 @@ def mp_indicator_create(request):
             user=request.user
         )
 
+        # 未指定状态时按参考范围判定
+        indicator_status = data.get('status')
+        if not indicator_status:
+            gender, age = profile_context(request.user.id, checkup.checkup_date)
+            indicator_status = reference_status(
+                data.get('indicator_name', '').strip(), data.get('value', '').strip(),
+                data.get('unit', '').strip(), data.get('reference_range', '').strip(),
+                gender=gender, age=age
+            ) or 'normal'
+
         # 创建指标
         indicator = HealthIndicator.objects.create(
             checkup=checkup,
@@ -3670,7 +3856,7 @@ def mp_indicator_create(request):
             value=data.get('value', '').strip(),
             unit=data.get('unit', '').strip(),
             reference_range=data.get('reference_range', '').strip(),
-            status=data.get('status', 'normal')
+            status=indicator_status
         )
 
         return Response({
@@ -3732,6 +3918,10 @@ def mp_indicator_update(request, indicator_id):
         if 'indicator_type' in data:
             indicator.indicator_type = data['indicator_type']
 
+        # 未指定状态时，名称/值/单位/参考范围变化后按参考范围重新判定
+        if 'status' not in data and any(field in data for field in STATUS_SOURCE_FIELDS):
+            apply_reference_status([indicator], *profile_context(request.user.id, indicator.checkup.checkup_date))
+
         indicator.save()
 
         return Response({
@@ -3829,7 +4019,14 @@ def mp_indicator_batch_create(request):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         created_indicators = []
+        gender, age = profile_context(request.user.id, checkup.checkup_date)
         for indicator_data in indicators_data:
+            # 未指定状态时按参考范围判定
+            indicator_status = indicator_data.get('status') or reference_status(
+                indicator_data.get('indicator_name', '').strip(), indicator_data.get('value', '').strip(),
+                indicator_data.get('unit', '').strip(), indicator_data.get('reference_range', '').strip(),
+                gender=gender, age=age
+            ) or 'normal'
             indicator = HealthIndicator.objects.create(
                 checkup=checkup,
                 indicator_type=indicator_data.get('indicator_type', 'other_exam'),
@@ -3837,7 +4034,7 @@ def mp_indicator_batch_create(request):
                 value=indicator_data.get('value', '').strip(),
                 unit=indicator_data.get('unit', '').strip(),
                 reference_range=indicator_data.get('reference_range', '').strip(),
-                status=indicator_data.get('status', 'normal')
+                status=indicator_status
             )
             created_indicators.append({
                 'id': indicator.id,
@@ -111,21 +111,35 @@ class DocumentProcessingSerializer(serializers.ModelSerializer):
         ]
 
 class MiniProgramCheckupListSerializer(serializers.ModelSerializer):
-    """小程序体检记录列表序列化器"""
+    """小程序体检记录列表序列化器
+
+    查询集应带 indicators_count / abnormal_count 注解并 select_related('documentprocessing')，
+    否则会回退为逐行查询
+    """
     indicators_count = serializers.SerializerMethodField()
+    abnormal_count = serializers.SerializerMethodField()
     status = serializers.SerializerMethodField()
 
     class Meta:
         model = HealthCheckup
         fields = [
             'id', 'checkup_date', 'hospital', 'report_file',
-            'created_at', 'indicators_count', 'status', 'notes'
+            'created_at', 'indicators_count', 'abnormal_count', 'status', 'notes'
         ]
         read_only_fields = ['user']
 
     def get_indicators_count(self, obj):
+        annotated = getattr(obj, 'indicators_count', None)
+        if annotated is not None:
+            return annotated
         return obj.indicators.count()
 
+    def get_abnormal_count(self, obj):
+        annotated = getattr(obj, 'abnormal_count', None)
+        if annotated is not None:
+            return annotated
+        return obj.get_abnormal_count()
+
     def get_status(self, obj):
         """从DocumentProcessing获取处理状态"""
         try:
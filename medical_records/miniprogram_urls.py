@@ -29,6 +29,11 @@ urlpatterns = [
     path('export/checkups/pdf/', miniprogram_api.miniprogram_export_checkups_pdf, name='export_checkups_pdf'),
     path('export/checkups/word/', miniprogram_api.miniprogram_export_checkups_word, name='export_checkups_word'),
 
+    # 导出任务
+    path('exports/', miniprogram_api.mp_export_jobs, name='export_jobs'),
+    path('exports/<str:job_id>/', miniprogram_api.mp_export_job_status, name='export_job_status'),
+    path('exports/<str:job_id>/download/', miniprogram_api.mp_export_job_download, name='export_job_download'),
+
     # 健康指标
     path('indicators/', miniprogram_api.miniprogram_indicators, name='indicators'),
     path('indicators/<int:indicator_id>/', miniprogram_api.mp_indicator_detail, name='indicator_detail'),
@@ -67,7 +72,10 @@ urlpatterns = [
     path('medications/<int:medication_id>/', miniprogram_api.miniprogram_medication_detail, name='medication_detail'),
     path('medications/checkin/', miniprogram_api.miniprogram_medication_checkin, name='medication_checkin'),
     path('medications/<int:medication_id>/records/', miniprogram_api.miniprogram_medication_records, name='medication_records'),
+    path('medications/adherence/', miniprogram_api.mp_medication_adherence, name='medication_adherence'),
     path('medications/recognize-image/', miniprogram_api.miniprogram_recognize_medication_image, name='recognize_medication_image'),
+    path('medications/recognize-jobs/', miniprogram_api.mp_medication_recognize_jobs, name='medication_recognize_jobs'),
+    path('medications/recognize-jobs/<str:job_id>/', miniprogram_api.mp_medication_recognize_job_status, name='medication_recognize_job_status'),
 
     # 药单组管理
     path('medication-groups/', miniprogram_api.mp_medication_groups, name='medication_groups'),
@@ -80,7 +88,9 @@ urlpatterns = [
     path('symptom-logs/<int:log_id>/', miniprogram_api.mp_symptom_log_detail, name='symptom_log_detail'),
     path('vital-logs/', miniprogram_api.mp_vital_logs, name='vital_logs'),
     path('vital-logs/<int:log_id>/', miniprogram_api.mp_vital_log_detail, name='vital_log_detail'),
+    path('vital-logs/series/', miniprogram_api.mp_vital_series, name='vital_series'),
     path('vital-types/', miniprogram_api.mp_vital_types, name='vital_types'),
+    path('health-logs/batch/', miniprogram_api.mp_health_logs_batch, name='health_logs_batch'),
 
     # 健康管理计划
     path('care-plans/', miniprogram_api.mp_care_plans, name='care_plans'),
@@ -1,3 +1,4 @@
+import re
 from django.db import models
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
@@ -5,6 +6,7 @@ from django.contrib.contenttypes.models import ContentType
 from datetime import date, timedelta
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from .clustering import merge_intervals
 
 
 class HealthCheckup(models.Model):
@@ -16,6 +18,10 @@ class HealthCheckup(models.Model):
     notes = models.TextField(blank=True, null=True, verbose_name='备注')
     ai_summary = models.TextField(blank=True, null=True, verbose_name='AI解读总结')
     ai_summary_created_at = models.DateTimeField(blank=True, null=True, verbose_name='AI总结生成时间')
+    # 报告文件内容的 SHA-256，重复报告检测时按需计算并缓存；更换文件后自动清空
+    report_file_hash = models.CharField(max_length=64, blank=True, default='', db_index=True, verbose_name='报告文件哈希')
+    # 处理时生成过渲染件的原图（上传的图片、PDF 转出的页面图片）内容的 SHA-256，删除报告时据此清理渲染件
+    source_image_hashes = models.JSONField(default=list, blank=True, verbose_name='原图哈希')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
 
     class Meta:
@@ -26,6 +32,24 @@ class HealthCheckup(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.checkup_date} - {self.hospital}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'report_file' in field_names:
+            instance._loaded_report_file = instance.report_file.name
+        return instance
+
+    def save(self, *args, **kwargs):
+        if (self.report_file_hash and hasattr(self, '_loaded_report_file')
+                and self.report_file.name != self._loaded_report_file):
+            self.report_file_hash = ''
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'report_file_hash'}
+        super().save(*args, **kwargs)
+        if 'report_file' in self.__dict__:
+            self._loaded_report_file = self.report_file.name
+
     def get_abnormal_count(self):
         """获取异常指标数量"""
         return self.indicators.filter(status='abnormal').count()
@@ -86,6 +110,11 @@ class HealthIndicator(models.Model):
         ('abnormal', '异常'),
         ('attention', '关注'),
     ], default='normal', verbose_name='状态')
+    # 换算到指标标准单位后的数值，供趋势与整合比较不同报告的结果（见 indicator_units）
+    canonical_value = models.FloatField(blank=True, null=True, verbose_name='标准单位数值')
+    canonical_unit = models.CharField(max_length=20, blank=True, default='', verbose_name='标准单位')
+
+    CANONICAL_SOURCE_FIELDS = {'indicator_name', 'value', 'unit'}
 
     class Meta:
         verbose_name = '健康指标'
@@ -94,6 +123,39 @@ class HealthIndicator(models.Model):
     def __str__(self):
         return f"{self.checkup.checkup_date} - {self.indicator_name}: {self.value}"
 
+    def populate_canonical_value(self):
+        """根据指标名、检测值和单位刷新标准单位数值"""
+        from .indicator_units import to_canonical
+
+        self.canonical_value, self.canonical_unit = to_canonical(self.indicator_name, self.value, self.unit)
+
+    def save(self, *args, **kwargs):
+        self.populate_canonical_value()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.CANONICAL_SOURCE_FIELDS & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'canonical_value', 'canonical_unit'}
+        super().save(*args, **kwargs)
+
+
+class IndicatorNameMapping(models.Model):
+    """用户已确认的指标命名映射（数据整合结果被应用时记录，后续整合直接复用，无需再调用大模型）"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='用户', related_name='indicator_name_mappings')
+    # 规范化后的原名称（全角转半角、去空白、忽略大小写），见 report_chunking.canonical_indicator_name
+    source_key = models.CharField(max_length=100, verbose_name='原名称（规范化）')
+    target_name = models.CharField(max_length=100, verbose_name='统一名称')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '指标命名映射'
+        verbose_name_plural = '指标命名映射'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'source_key'], name='unique_indicator_name_mapping'),
+        ]
+
+    def __str__(self):
+        return f"{self.source_key} -> {self.target_name}"
+
 
 class Conversation(models.Model):
     """对话模型"""
@@ -168,6 +230,28 @@ class HealthAdvice(models.Model):
         return cls.objects.filter(user=user, conversation__isnull=True).order_by('-created_at')
 
 
+class AnswerCacheEntry(models.Model):
+    """AI医生通用问题的答案缓存（不含用户体检、用药数据的问题才会写入），见 answer_cache"""
+    # 提示词版本与模型共同决定的作用域哈希：提示词模板、个人信息或模型变化后不再命中旧答案
+    scope_key = models.CharField(max_length=64, db_index=True, verbose_name='作用域')
+    model_key = models.CharField(max_length=200, verbose_name='模型')
+    question = models.TextField(verbose_name='原始问题')
+    normalized_question = models.CharField(max_length=500, verbose_name='规范化问题')
+    answer = models.TextField(verbose_name='缓存答案')
+    hit_count = models.IntegerField(default=0, verbose_name='命中次数')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    last_hit_at = models.DateTimeField(blank=True, null=True, verbose_name='最近命中时间')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='过期时间')
+
+    class Meta:
+        verbose_name = '答案缓存'
+        verbose_name_plural = '答案缓存'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.model_key} - {self.question[:30]}"
+
+
 class DocumentProcessing(models.Model):
     """文档处理状态跟踪"""
     PROCESSING_STATUS = [
@@ -241,6 +325,12 @@ class SystemSettings(models.Model):
         except cls.DoesNotExist:
             return default
 
+    @classmethod
+    def get_settings(cls, defaults):
+        """一次查询获取多个设置值，defaults 为 {键名: 默认值}"""
+        values = dict(cls.objects.filter(key__in=list(defaults), is_active=True).values_list('key', 'value'))
+        return {key: values.get(key, default) for key, default in defaults.items()}
+
     @classmethod
     def set_setting(cls, key, value, name=None, description=''):
         """设置值"""
@@ -394,7 +484,7 @@ class MedicationGroup(models.Model):
 
     @property
     def medication_count(self):
-        """药单数量"""
+        """药单数量（已预取 medications 时直接读取缓存）"""
         return self.medications.count()
 
 
@@ -426,7 +516,10 @@ class Medication(models.Model):
 
     @property
     def days_taken(self):
-        """已服药天数"""
+        """已服药天数（查询集带 taken_days_count 注解时不再查库）"""
+        taken_days_count = getattr(self, 'taken_days_count', None)
+        if taken_days_count is not None:
+            return taken_days_count
         return self.medicationrecord_set.count()
 
     @property
@@ -515,6 +608,9 @@ class VitalEntry(models.Model):
     entry_date = models.DateField(verbose_name='日期', default=date.today)
     vital_type = models.CharField(max_length=50, choices=VITAL_TYPE_CHOICES, verbose_name='体征类型')
     value = models.CharField(max_length=100, verbose_name='数值')
+    # 从 value 解析出的数值列，供范围查询和图表降采样使用；血压为 收缩压/舒张压
+    numeric_value = models.FloatField(blank=True, null=True, verbose_name='数值（解析）')
+    numeric_value_secondary = models.FloatField(blank=True, null=True, verbose_name='第二数值（解析）')
     unit = models.CharField(max_length=20, blank=True, null=True, verbose_name='单位')
     notes = models.TextField(blank=True, null=True, verbose_name='备注')
     related_checkup = models.ForeignKey(HealthCheckup, on_delete=models.SET_NULL, blank=True, null=True, verbose_name='关联体检')
@@ -522,14 +618,44 @@ class VitalEntry(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
 
+    NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
     class Meta:
         verbose_name = '体征日志'
         verbose_name_plural = '体征日志'
         ordering = ['-entry_date', '-created_at']
+        indexes = [
+            models.Index(fields=['user', 'vital_type', 'entry_date']),
+        ]
 
     def __str__(self):
         return f"{self.entry_date} - {self.get_vital_type_display()} {self.value}{self.unit or ''}"
 
+    @classmethod
+    def parse_value(cls, vital_type, value):
+        """
+        解析数值文本，返回 (主数值, 第二数值)
+
+        血压取前两个数字（收缩压、舒张压），其它体征取第一个数字，无法解析时为 None
+        """
+        numbers = cls.NUMBER_PATTERN.findall(str(value or '').replace('，', ','))
+        if not numbers:
+            return None, None
+        primary = float(numbers[0])
+        secondary = float(numbers[1]) if vital_type == 'blood_pressure' and len(numbers) > 1 else None
+        return primary, secondary
+
+    def populate_numeric_values(self):
+        """根据 value 刷新数值列"""
+        self.numeric_value, self.numeric_value_secondary = self.parse_value(self.vital_type, self.value)
+
+    def save(self, *args, **kwargs):
+        self.populate_numeric_values()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'value' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'numeric_value', 'numeric_value_secondary'}
+        super().save(*args, **kwargs)
+
 
 class CarePlan(models.Model):
     """健康管理计划"""
@@ -915,60 +1041,18 @@ class HealthEvent(models.Model):
 
     @classmethod
     def _cluster_medications(cls, medications, threshold_days):
-        """聚类药单（基于时间重叠或相近性）"""
+        """聚类药单（基于时间重叠或相近性，排序扫描合并区间）"""
         if not medications:
             return []
 
-        clusters = []
-        used_indices = set()
-
-        for i, med1 in enumerate(medications):
-            if i in used_indices:
-                continue
-
-            cluster = [med1]
-            used_indices.add(i)
-
-            for j, med2 in enumerate(medications):
-                if j <= i or j in used_indices:
-                    continue
-
-                # 检查时间是否重叠或相近
-                if cls._medications_overlap_or_near(med1, med2, threshold_days):
-                    cluster.append(med2)
-                    used_indices.add(j)
-                    # 更新基准时间范围
-                    med1 = cls._merge_medication_time_range(cluster)
-
-            clusters.append(cluster)
-
-        return clusters
-
-    @classmethod
-    def _medications_overlap_or_near(cls, med1, med2, threshold_days):
-        """检查两个药单是否时间重叠或相近"""
-        # 检查重叠
-        if not (med1.end_date < med2.start_date or med2.end_date < med1.start_date):
-            return True
-
-        # 检查相近性
-        gap = min(abs((med1.end_date - med2.start_date).days),
-                  abs((med2.end_date - med1.start_date).days))
-        return gap <= threshold_days
-
-    @classmethod
-    def _merge_medication_time_range(cls, medications):
-        """合并药单时间范围"""
-        if not medications:
-            return None
-
-        start = min(m.start_date for m in medications)
-        end = max(m.end_date for m in medications)
-
-        # 返回一个虚拟对象用于比较
-        from collections import namedtuple
-        MedicationRange = namedtuple('MedicationRange', ['start_date', 'end_date'])
-        return MedicationRange(start_date=start, end_date=end)
+        return [
+            members for _, _, members in merge_intervals(
+                medications,
+                start_key=lambda m: m.start_date,
+                end_key=lambda m: m.end_date,
+                gap_days=threshold_days,
+            )
+        ]
 
     @classmethod
     def _detect_illness_events(cls, user, threshold_days):
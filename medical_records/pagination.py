@@ -0,0 +1,121 @@
+"""
+游标（keyset）分页
+按排序字段值定位下一页，避免 OFFSET 随翻页深度线性变慢，也不需要每页 COUNT
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        return [_decode_value(v) for v in json.loads(raw)]
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise InvalidCursor('分页游标无效') from e
+
+
+def _keyset_filter(ordering, values):
+    """
+    构造“位于游标之后”的过滤条件
+
+    ordering=('-a', '-id') 时为：a < va OR (a = va AND id < vid)
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        clause = Q(**{f'{name}__{lookup}': values[i]})
+        for prev_field, prev_value in zip(ordering[:i], values[:i]):
+            clause &= Q(**{prev_field.lstrip('-'): prev_value})
+        condition |= clause
+    return condition
+
+
+def get_page_size(params, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        page_size = int(params.get('page_size') or default)
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+
+def paginate_queryset(queryset, params, ordering, default_page_size=DEFAULT_PAGE_SIZE,
+                      cursor_param='cursor', size_param='page_size'):
+    """
+    对查询集做游标分页
+
+    ordering 最后一个字段必须唯一（通常为 id / -id），保证游标位置确定。
+    排序字段不能为空值。
+
+    Args:
+        queryset: 查询集
+        params: 请求参数（request.GET / request.query_params）
+        ordering: 排序字段元组，如 ('-created_at', '-id')
+        default_page_size: 未指定 page_size 时的默认条数
+        cursor_param: 游标参数名
+        size_param: 每页条数参数名
+
+    Returns:
+        (items, page_info)，page_info 包含 page_size、next_cursor、has_more
+
+    Raises:
+        InvalidCursor: 游标无法解析
+    """
+    page_size = get_page_size({'page_size': params.get(size_param)}, default=default_page_size)
+    queryset = queryset.order_by(*ordering)
+
+    cursor = params.get(cursor_param)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(ordering):
+            raise InvalidCursor('分页游标无效')
+        queryset = queryset.filter(_keyset_filter(ordering, values))
+
+    # 多取一条判断是否还有下一页
+    items = list(queryset[:page_size + 1])
+    has_more = len(items) > page_size
+    items = items[:page_size]
+
+    next_cursor = None
+    if has_more and items:
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+
+    return items, {
+        'page_size': page_size,
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    }
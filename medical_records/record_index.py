@@ -0,0 +1,358 @@
+"""
+用户健康记录检索索引（供 AI 医生 Agent 按需检索，而不是把整份报告放进提示词）
+每个用户一个 TF-IDF 索引，覆盖体检指标、体检备注、症状日志、用药备注与以往问答。
+中文按字符二元组、英文与数字按词切分，词项经 CRC32 哈希为整数，不需要保存词表；
+词频以 array 紧凑二进制格式保存在 USER_RECORD_INDEX_DIR 下，IDF 与向量长度在加载时计算。
+每次检索前按记录内容签名增量更新：只对新增或变化的记录重新分词，已删除的记录移出索引。
+用户被删除时删除其索引文件。
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+from array import array
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .agent_tool_cache import data_version
+from .models import HealthAdvice, HealthCheckup, HealthIndicator, Medication, SymptomEntry
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = b'URI1'
+# 以往问答只索引回答的开头部分
+ADVICE_ANSWER_CHARS = 600
+# 数据版本未变化时，两次增量检查的最短间隔（秒）；以往问答不触发数据版本变化，最迟在此时间后进入索引
+REFRESH_INTERVAL = 60
+# 进程内保留的用户索引数
+MAX_LOADED_INDEXES = 32
+
+_TOKEN_RE = re.compile(r'[a-z0-9][a-z0-9.+-]*|[一-鿿]+')
+_loaded = OrderedDict()
+# 只保护 _loaded；索引的更新与保存使用各自的 UserRecordIndex.lock，不同用户互不阻塞
+_lock = threading.RLock()
+
+DOC_KIND_LABELS = {
+    'indicator': '指标',
+    'checkup': '体检备注',
+    'symptom': '症状',
+    'medication': '用药',
+    'advice': '问答',
+}
+
+
+def tokenize(text):
+    """分词：中文连续字符取二元组（单字保留），英文、数字按词"""
+    tokens = []
+    for run in _TOKEN_RE.findall(unicodedata.normalize('NFKC', text or '').casefold()):
+        if run[0] >= '一' and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def _term_counts(text):
+    counts = Counter(zlib.crc32(token.encode('utf-8')) for token in tokenize(text))
+    return sorted(counts.items())
+
+
+def collect_user_documents(user_id):
+    """
+    用户的全部可检索记录
+
+    Returns:
+        list[tuple]: [(键, 日期, 文本)]，键形如 'indicator:12'
+    """
+    documents = []
+    for pk, name, value, unit, status, reference_range, checkup_date, hospital in (
+        HealthIndicator.objects.filter(checkup__user_id=user_id).values_list(
+            'id', 'indicator_name', 'value', 'unit', 'status', 'reference_range',
+            'checkup__checkup_date', 'checkup__hospital'
+        )
+    ):
+        text = f"{hospital} {name}: {value}"
+        if unit:
+            text += f" {unit}"
+        if status == 'abnormal':
+            text += " [异常]"
+        elif status == 'attention':
+            text += " [关注]"
+        if reference_range:
+            text += f" 参考值: {reference_range}"
+        documents.append((f'indicator:{pk}', checkup_date.isoformat(), text))
+
+    for pk, checkup_date, hospital, notes in (
+        HealthCheckup.objects.filter(user_id=user_id).exclude(notes__isnull=True).exclude(notes='')
+        .values_list('id', 'checkup_date', 'hospital', 'notes')
+    ):
+        documents.append((f'checkup:{pk}', checkup_date.isoformat(), f"{hospital} 备注: {notes}"))
+
+    severity_labels = dict(SymptomEntry.SEVERITY_CHOICES)
+    for pk, entry_date, symptom, severity, notes in (
+        SymptomEntry.objects.filter(user_id=user_id).values_list('id', 'entry_date', 'symptom', 'severity', 'notes')
+    ):
+        text = f"{symptom}（{severity_labels.get(severity, severity)}）"
+        if notes:
+            text += f" {notes}"
+        documents.append((f'symptom:{pk}', entry_date.isoformat(), text))
+
+    for pk, medicine_name, dosage, start_date, end_date, notes in (
+        Medication.objects.filter(user_id=user_id).values_list(
+            'id', 'medicine_name', 'dosage', 'start_date', 'end_date', 'notes'
+        )
+    ):
+        text = f"{medicine_name} {dosage}，{start_date} 至 {end_date}"
+        if notes:
+            text += f"，备注: {notes}"
+        documents.append((f'medication:{pk}', start_date.isoformat(), text))
+
+    for pk, created_at, question, answer in (
+        HealthAdvice.objects.filter(user_id=user_id, is_generating=False).exclude(answer='')
+        .values_list('id', 'created_at', 'question', 'answer')
+    ):
+        text = f"问: {question} 答: {answer[:ADVICE_ANSWER_CHARS]}"
+        documents.append((f'advice:{pk}', created_at.date().isoformat(), text))
+
+    return documents
+
+
+class UserRecordIndex:
+    """单个用户的检索索引"""
+
+    def __init__(self, user_id, docs=None, terms=None):
+        self.user_id = user_id
+        self.docs = docs or []          # [{'key', 'sig', 'date', 'text'}]
+        self.terms = terms or []        # 与 docs 对应：[(词项ID array, 词频 array)]
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        self._inverted = None
+
+    # ---------- 持久化 ----------
+
+    @staticmethod
+    def path_for(user_id):
+        return os.path.join(str(settings.USER_RECORD_INDEX_DIR), f'user_{user_id}.bin')
+
+    @classmethod
+    def load(cls, user_id):
+        """从磁盘加载索引；文件不存在或格式不符时返回空索引"""
+        try:
+            with open(cls.path_for(user_id), 'rb') as f:
+                if f.read(4) != INDEX_FORMAT:
+                    return cls(user_id)
+                meta_size, = struct.unpack('<I', f.read(4))
+                docs = json.loads(f.read(meta_size).decode('utf-8'))
+                offsets = _read_array(f, 'I', len(docs) + 1)
+                ids = _read_array(f, 'I', offsets[-1])
+                counts = _read_array(f, 'H', offsets[-1])
+        except (OSError, ValueError, EOFError, struct.error):
+            return cls(user_id)
+        terms = [(ids[offsets[i]:offsets[i + 1]], counts[offsets[i]:offsets[i + 1]]) for i in range(len(docs))]
+        return cls(user_id, docs, terms)
+
+    def save(self):
+        """原子写入磁盘：元数据 JSON + 文档偏移、词项ID、词频三个数组"""
+        offsets = array('I', [0])
+        ids = array('I')
+        counts = array('H')
+        for term_ids, term_counts in self.terms:
+            ids.extend(term_ids)
+            counts.extend(term_counts)
+            offsets.append(len(ids))
+        meta = json.dumps(self.docs, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+        path = self.path_for(self.user_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_FORMAT)
+            f.write(struct.pack('<I', len(meta)))
+            f.write(meta)
+            for values in (offsets, ids, counts):
+                _write_array(f, values)
+        os.replace(tmp_path, path)
+
+    # ---------- 增量更新 ----------
+
+    def refresh(self, documents=None):
+        """
+        与数据库中的记录比对并增量更新
+
+        Returns:
+            int: 新增、变化或删除的记录数（0 表示索引无变化）
+        """
+        if documents is None:
+            documents = collect_user_documents(self.user_id)
+        existing = {doc['key']: (doc, terms) for doc, terms in zip(self.docs, self.terms)}
+
+        docs, terms, changed = [], [], 0
+        for key, doc_date, text in documents:
+            sig = zlib.crc32(text.encode('utf-8'))
+            old = existing.pop(key, None)
+            if old and old[0]['sig'] == sig and old[0]['date'] == doc_date:
+                docs.append(old[0])
+                terms.append(old[1])
+                continue
+            pairs = _term_counts(text)
+            docs.append({'key': key, 'sig': sig, 'date': doc_date, 'text': text})
+            terms.append((array('I', (term for term, _ in pairs)),
+                          array('H', (min(count, 0xFFFF) for _, count in pairs))))
+            changed += 1
+        changed += len(existing)
+
+        if changed:
+            self.docs, self.terms = docs, terms
+            self._inverted = None
+        return changed
+
+    # ---------- 检索 ----------
+
+    def _build_inverted(self):
+        """倒排表：词项 -> [(文档序号, 归一化 TF-IDF 权重)]"""
+        total = len(self.docs)
+        df = Counter()
+        for term_ids, _ in self.terms:
+            df.update(term_ids)
+        idf = {term: math.log((total + 1) / (freq + 1)) + 1 for term, freq in df.items()}
+
+        inverted = defaultdict(list)
+        for doc_index, (term_ids, term_counts) in enumerate(self.terms):
+            weights = [(1 + math.log(count)) * idf[term] for term, count in zip(term_ids, term_counts)]
+            norm = math.sqrt(sum(w * w for w in weights)) or 1.0
+            for term, weight in zip(term_ids, weights):
+                inverted[term].append((doc_index, weight / norm))
+        self._inverted = (inverted, idf)
+        return self._inverted
+
+    def search(self, query, k=5):
+        """
+        检索与 query 最相关的 k 条记录
+
+        Returns:
+            list[dict]: [{'key', 'kind', 'date', 'text', 'score'}]，按相关度降序
+        """
+        if not self.docs:
+            return []
+        inverted, idf = self._inverted or self._build_inverted()
+
+        query_weights = {}
+        for term, count in _term_counts(query):
+            if term in idf:
+                query_weights[term] = (1 + math.log(count)) * idf[term]
+        norm = math.sqrt(sum(w * w for w in query_weights.values()))
+        if not norm:
+            return []
+
+        scores = defaultdict(float)
+        for term, weight in query_weights.items():
+            for doc_index, doc_weight in inverted[term]:
+                scores[doc_index] += weight / norm * doc_weight
+
+        # 相关度相同时较新的记录在前
+        ranked = sorted(scores.items(), key=lambda item: (item[1], self.docs[item[0]]['date']), reverse=True)[:k]
+        results = []
+        for doc_index, score in ranked:
+            doc = self.docs[doc_index]
+            results.append({
+                'key': doc['key'],
+                'kind': doc['key'].split(':', 1)[0],
+                'date': doc['date'],
+                'text': doc['text'],
+                'score': round(score, 3),
+            })
+        return results
+
+
+def _read_array(f, typecode, length):
+    values = array(typecode)
+    values.fromfile(f, length)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _write_array(f, values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    values.tofile(f)
+
+
+def get_user_index(user_id, force_refresh=False):
+    """
+    获取用户的最新检索索引（进程内缓存 + 磁盘持久化，按需增量更新）
+
+    数据版本变化（体检、指标、用药、资料变更）或距上次检查超过 REFRESH_INTERVAL 时才与数据库比对
+    """
+    with _lock:
+        index = _loaded.get(user_id)
+        if index is None:
+            index = UserRecordIndex.load(user_id)
+            _loaded[user_id] = index
+            while len(_loaded) > MAX_LOADED_INDEXES:
+                _loaded.popitem(last=False)
+        else:
+            _loaded.move_to_end(user_id)
+
+    with index.lock:
+        version = data_version(user_id)
+        stale = (
+            force_refresh
+            or index.version != version
+            or time.monotonic() - index.checked_at > REFRESH_INTERVAL
+        )
+        if stale:
+            if index.refresh():
+                index.save()
+            index.version = version
+            index.checked_at = time.monotonic()
+        return index
+
+
+def delete_user_index(user_id):
+    """删除用户的索引（进程内缓存与磁盘文件）"""
+    with _lock:
+        index = _loaded.pop(user_id, None)
+    if index is not None:
+        # 等待进行中的更新保存完成，避免文件删除后又被写回
+        with index.lock:
+            pass
+    try:
+        os.remove(UserRecordIndex.path_for(user_id))
+    except FileNotFoundError:
+        pass
+
+
+@receiver(post_delete, sender=User)
+def _delete_index_of_user(sender, instance, **kwargs):
+    try:
+        delete_user_index(instance.id)
+    except OSError as e:
+        logger.warning(f"[记录检索] user={instance.id} 删除索引失败: {e}")
+
+
+def search_records(user_id, query, k=5):
+    """检索用户记录，返回 UserRecordIndex.search 的结果"""
+    return get_user_index(user_id).search(query, k)
+
+
+def format_search_results(results):
+    """检索结果的文本形式（每条一行，供提示词使用）"""
+    return "\n".join(
+        f"{i}. [{DOC_KIND_LABELS.get(item['kind'], item['kind'])} {item['date']}] {item['text']}"
+        for i, item in enumerate(results, 1)
+    )
@@ -0,0 +1,387 @@
+"""
+参考范围判定：根据检测值与参考范围字符串确定指标状态，不依赖大模型是否标注了异常
+支持的参考范围写法：
+- 区间：3.5-5.5、3.5~5.5、3.5—5.5、3.5至5.5
+- 单侧：<5.2、≤5.2、>60、≥1.0、5.2以下、60以上
+- 分性别、分年龄：男 40-50 女 35-45；男性:130-175；女性:115-150；<50岁 0-20；50岁以上 0-30
+- 双值（血压）：90-139/60-89，对应检测值 120/80
+- 定性：阴性、(-)，对应检测值 阴性 / + / ± 等
+同一参考范围字符串只解析一次（进程内缓存），整批指标按参考范围分组判定。
+报告中没有参考范围时，按指标名精确匹配本地知识库中的通用参考范围（单位能换算时才使用），
+通用范围只用于把"正常"提升为"异常/关注"，不会推翻报告中已标注的异常。
+"""
+
+import re
+import unicodedata
+from collections import namedtuple
+from datetime import date
+from functools import lru_cache
+
+from .report_chunking import canonical_indicator_name
+
+Bound = namedtuple('Bound', 'low high low_inclusive high_inclusive')
+Rule = namedtuple('Rule', 'gender age_min age_max bounds')
+ParsedRange = namedtuple('ParsedRange', 'rules expected')
+
+NEGATIVE = 'negative'
+POSITIVE = 'positive'
+TRACE = 'trace'
+
+_NUM = r'([-+]?\d+(?:\.\d+)?)'
+_DASHES = str.maketrans({'~': '-', '—': '-', '–': '-', '―': '-', '〜': '-'})
+_RANGE_RE = re.compile(_NUM + r'\s*(?:-|至|到)\s*' + _NUM)
+_LESS_RE = re.compile(r'(<=|≤|<|小于等于|小于|低于|不超过)\s*' + _NUM)
+_GREATER_RE = re.compile(r'(>=|≥|>|大于等于|大于|高于|不低于)\s*' + _NUM)
+_BELOW_RE = re.compile(_NUM + r'\s*[^\d\s]*?\s*以下')
+_ABOVE_RE = re.compile(_NUM + r'\s*[^\d\s]*?\s*以上')
+_GENDER_RE = re.compile(r'(男|女)性?')
+_AGE_RANGE_RE = re.compile(r'(\d+)\s*-\s*(\d+)\s*岁')
+_AGE_BELOW_RE = re.compile(r'(?:(<=|≤|<|小于)\s*(\d+)\s*岁|(\d+)\s*岁\s*以下)')
+_AGE_ABOVE_RE = re.compile(r'(?:(>=|≥|>|大于)\s*(\d+)\s*岁|(\d+)\s*岁\s*以上)')
+_SEGMENT_SPLIT_RE = re.compile(r'[;；,，\n]+')
+
+_NEGATIVE_WORDS = ('阴性', '未检出', '未见', 'negative', 'neg', '(-)', '-')
+_TRACE_WORDS = ('±', '+-', '弱阳性', '可疑', '微量', 'trace')
+_ARROW_HIGH = ('↑', '偏高')
+_ARROW_LOW = ('↓', '偏低')
+_CENSORED_RE = re.compile(r'^(<=|≤|<|>=|≥|>)\s*' + _NUM)
+_VALUE_NUM_RE = re.compile(_NUM)
+# 尿常规等的 "+"、"2+"、"(++)" 写法
+_PLUS_RE = re.compile(r'^\(?\d?\++\)?$')
+
+
+def _normalize(text):
+    return unicodedata.normalize('NFKC', str(text or '')).translate(_DASHES).strip()
+
+
+def _parse_bound(text):
+    """从一段文本中取出一个数值区间；没有可识别的区间时返回 None"""
+    match = _RANGE_RE.search(text)
+    if match:
+        low, high = float(match.group(1)), float(match.group(2))
+        if low > high:
+            low, high = high, low
+        return Bound(low, high, True, True)
+    match = _LESS_RE.search(text)
+    if match:
+        return Bound(None, float(match.group(2)), True, match.group(1) in ('<=', '≤', '小于等于', '不超过'))
+    match = _GREATER_RE.search(text)
+    if match:
+        return Bound(float(match.group(2)), None, match.group(1) in ('>=', '≥', '大于等于', '不低于'), True)
+    match = _BELOW_RE.search(text)
+    if match:
+        return Bound(None, float(match.group(1)), True, True)
+    match = _ABOVE_RE.search(text)
+    if match:
+        return Bound(float(match.group(1)), None, True, True)
+    return None
+
+
+def _parse_age(text):
+    """取出分段文本中的年龄条件，返回 (最小年龄, 最大年龄, 去掉年龄条件后的文本)"""
+    match = _AGE_RANGE_RE.search(text)
+    if match:
+        return int(match.group(1)), int(match.group(2)), text[:match.start()] + text[match.end():]
+    match = _AGE_BELOW_RE.search(text)
+    if match:
+        age = int(match.group(2) or match.group(3))
+        # "<50岁" 不含 50 岁
+        age_max = age - 1 if match.group(1) in ('<', '小于') else age
+        return None, age_max, text[:match.start()] + text[match.end():]
+    match = _AGE_ABOVE_RE.search(text)
+    if match:
+        age = int(match.group(2) or match.group(3))
+        age_min = age + 1 if match.group(1) in ('>', '大于') else age
+        return age_min, None, text[:match.start()] + text[match.end():]
+    return None, None, text
+
+
+def _qualitative(text):
+    """定性结果：阴性 / 弱阳性 / 阳性；不是定性写法时返回 None"""
+    text = text.casefold().replace(' ', '')
+    if not text:
+        return None
+    if any(word in text for word in _TRACE_WORDS):
+        return TRACE
+    if text.startswith('阴性') or text in _NEGATIVE_WORDS or '未检出' in text:
+        return NEGATIVE
+    if '阳性' in text or text in ('positive', 'pos') or _PLUS_RE.match(text):
+        return POSITIVE
+    return None
+
+
+@lru_cache(maxsize=4096)
+def parse_reference_range(text):
+    """
+    解析参考范围字符串（结果按字符串缓存）
+
+    Returns:
+        ParsedRange 或 None（无法识别时）：
+        rules 为 [Rule(性别, 最小年龄, 最大年龄, (Bound, ...))]，双值参考范围的 bounds 有两项；
+        expected 为定性参考值（目前只有 'negative'），数值参考范围时为 None
+    """
+    text = _normalize(text)
+    if not text:
+        return None
+    if not any(ch.isdigit() for ch in text):
+        expected = _qualitative(text)
+        return ParsedRange((), expected) if expected == NEGATIVE else None
+
+    # 性别标签前断开，"男 40-50 女 35-45" 与 "男:40-50；女:35-45" 同样处理
+    segments = _SEGMENT_SPLIT_RE.split(_GENDER_RE.sub(lambda m: ';' + m.group(0), text))
+    rules = []
+    for segment in segments:
+        gender_match = _GENDER_RE.search(segment)
+        gender = None
+        if gender_match:
+            gender = 'male' if gender_match.group(1) == '男' else 'female'
+            segment = segment[:gender_match.start()] + segment[gender_match.end():]
+        age_min, age_max, segment = _parse_age(segment)
+
+        parts = segment.split('/')
+        if len(parts) == 2:
+            bounds = (_parse_bound(parts[0]), _parse_bound(parts[1]))
+            if None in bounds:
+                bounds = (_parse_bound(segment),)
+        else:
+            bounds = (_parse_bound(segment),)
+        if None in bounds:
+            continue
+        rules.append(Rule(gender, age_min, age_max, tuple(bounds)))
+    return ParsedRange(tuple(rules), None) if rules else None
+
+
+def parse_value(value):
+    """
+    解析检测值
+
+    Returns:
+        (数值列表, 比较符, 定性结果, 箭头标记)：
+        数值列表如 [120.0, 80.0]；比较符为 '<'/'>' 表示检测值低于/高于检测限；
+        箭头标记为 'high'/'low'/None
+    """
+    text = _normalize(value)
+    arrow = None
+    if any(mark in text for mark in _ARROW_HIGH):
+        arrow = 'high'
+    elif any(mark in text for mark in _ARROW_LOW):
+        arrow = 'low'
+    for mark in _ARROW_HIGH + _ARROW_LOW:
+        text = text.replace(mark, '')
+    text = text.strip()
+
+    censored = _CENSORED_RE.match(text)
+    if censored:
+        comparator = '<' if censored.group(1) in ('<', '<=', '≤') else '>'
+        return [float(censored.group(2))], comparator, None, arrow
+
+    numbers = [float(n) for n in _VALUE_NUM_RE.findall(text)]
+    # 数值与定性混写（如 "阴性(0.1)"）时以定性为准
+    qualitative = _qualitative(text) if not numbers or not text[0].isdigit() or _PLUS_RE.match(text) else None
+    if qualitative:
+        return [], None, qualitative, arrow
+    if not numbers or not (text[0].isdigit() or text[0] in '-.'):
+        return [], None, None, arrow
+    return numbers, None, None, arrow
+
+
+def _within(number, bound):
+    if bound.low is not None and (number < bound.low or (number == bound.low and not bound.low_inclusive)):
+        return False
+    if bound.high is not None and (number > bound.high or (number == bound.high and not bound.high_inclusive)):
+        return False
+    return True
+
+
+def _censored_within(number, comparator, bound):
+    """低于/高于检测限的结果：能确定在范围内返回 True，确定在范围外返回 False，否则 None"""
+    if comparator == '<':
+        if bound.low is not None and number <= bound.low:
+            return False
+        # 下限为 0 或没有下限时，低于检测限即在范围内
+        if (bound.low is None or bound.low <= 0) and (bound.high is None or number <= bound.high):
+            return True
+        return None
+    if bound.high is not None and number >= bound.high:
+        return False
+    if bound.high is None and (bound.low is None or number >= bound.low):
+        return True
+    return None
+
+
+def _rule_status(rule, numbers, comparator):
+    if comparator:
+        if len(rule.bounds) != 1:
+            return None
+        within = _censored_within(numbers[0], comparator, rule.bounds[0])
+    else:
+        if len(numbers) != len(rule.bounds):
+            return None
+        within = all(_within(number, bound) for number, bound in zip(numbers, rule.bounds))
+    if within is None:
+        return None
+    return 'normal' if within else 'abnormal'
+
+
+def _applicable_rules(rules, gender, age):
+    """按性别、年龄筛选规则；有更具体（性别/年龄都对上）的规则时只用最具体的，性别或年龄未知时相应规则都可能适用"""
+    candidates = []
+    for rule in rules:
+        if rule.gender and gender and rule.gender != gender:
+            continue
+        if age is not None:
+            if rule.age_min is not None and age < rule.age_min:
+                continue
+            if rule.age_max is not None and age > rule.age_max:
+                continue
+        specificity = (bool(rule.gender and gender), age is not None and (rule.age_min, rule.age_max) != (None, None))
+        candidates.append((specificity, rule))
+    if not candidates:
+        return []
+    best = max(specificity for specificity, _ in candidates)
+    return [rule for specificity, rule in candidates if specificity == best]
+
+
+def evaluate(value, parsed, gender=None, age=None):
+    """
+    按已解析的参考范围判定检测值
+
+    检测值带有化验单的 ↑↓ 标记时一律判为异常，不会被参考范围改判为正常。
+    性别或年龄未知且多条规则都可能适用时，只有各规则结论一致才给出结果。
+
+    Returns:
+        'normal' / 'abnormal' / 'attention'（定性弱阳性）或 None（无法判定）
+    """
+    numbers, comparator, qualitative, arrow = parse_value(value)
+    if arrow:
+        # 化验单自己的 ↑↓ 标记以实验室判定为准（参考范围可能解析不全或是通用范围）
+        return 'abnormal'
+    if parsed is None:
+        return None
+
+    if parsed.expected:
+        if qualitative is None:
+            return None
+        if qualitative == TRACE:
+            return 'attention'
+        return 'normal' if qualitative == parsed.expected else 'abnormal'
+
+    if not numbers:
+        return None
+    results = {_rule_status(rule, numbers, comparator) for rule in _applicable_rules(parsed.rules, gender, age)}
+    if len(results) != 1:
+        return None
+    return results.pop()
+
+
+# ---------- 本地知识库中的通用参考范围 ----------
+
+@lru_cache(maxsize=4096)
+def knowledge_range(indicator_name, unit):
+    """
+    本地知识库中该指标的通用参考范围（指标名须与知识库别名完全一致）
+
+    数值参考范围要求报告单位能换算到知识库的标准单位（见 indicator_units），
+    范围按换算系数折算回报告单位；定性参考值不比较单位。
+
+    Returns:
+        ParsedRange 或 None
+    """
+    from .health_knowledge import get_knowledge_base
+    from .indicator_units import conversion, normalize_unit
+
+    kb = get_knowledge_base()
+    for index in kb.by_alias.get(canonical_indicator_name(indicator_name), ()):
+        entry = kb.entries[index]
+        if entry['category'] != 'indicator':
+            continue
+        if entry.get('expected') == '阴性':
+            return ParsedRange((), NEGATIVE)
+        ranges = entry.get('range')
+        if not ranges or not unit:
+            return None
+        factor, target = conversion(indicator_name, unit)
+        if target != normalize_unit(entry.get('unit')):
+            return None
+        rules = []
+        for gender, (low, high) in ranges.items():
+            bound = Bound(
+                None if low is None else round(low / factor, 6),
+                None if high is None else round(high / factor, 6),
+                True, True,
+            )
+            rules.append(Rule(None if gender == 'all' else gender, None, None, (bound,)))
+        return ParsedRange(tuple(rules), None)
+    return None
+
+
+# ---------- 批量判定 ----------
+
+def age_on(birth_date, on_date):
+    """某一天的周岁年龄；出生日期未知时返回 None"""
+    if not birth_date or not on_date:
+        return None
+    return on_date.year - birth_date.year - ((on_date.month, on_date.day) < (birth_date.month, birth_date.day))
+
+
+def profile_context(user_id, on_date=None):
+    """
+    用户在体检当天的性别与年龄
+
+    Returns:
+        (gender, age)，未填写时为 None
+    """
+    from .models import UserProfile
+
+    profile = UserProfile.objects.filter(user_id=user_id).only('gender', 'birth_date').first()
+    if profile is None:
+        return None, None
+    return profile.gender or None, age_on(profile.birth_date, on_date or date.today())
+
+
+def reference_status(indicator_name, value, unit, reference_range, current_status='normal', gender=None, age=None):
+    """
+    单个指标的判定结果
+
+    报告自带的参考范围可以判定时以其为准；报告没有参考范围时，知识库通用范围只会把"正常"提升为异常/关注。
+
+    Returns:
+        新状态，或 None（无法判定、保持原状态）
+    """
+    if reference_range:
+        return evaluate(value, parse_reference_range(reference_range), gender, age)
+    if current_status != 'normal':
+        return None
+    status = evaluate(value, knowledge_range(indicator_name, unit or ''), gender, age)
+    return status if status != 'normal' else None
+
+
+# 修改后需要重新判定状态的 HealthIndicator 字段（无参考范围时按指标名查知识库）
+STATUS_SOURCE_FIELDS = frozenset({'indicator_name', 'value', 'unit', 'reference_range'})
+
+
+def apply_reference_status(indicators, gender=None, age=None):
+    """
+    按参考范围批量更新 HealthIndicator 实例的 status（只修改内存中的对象，不保存）
+
+    同一参考范围字符串只解析一次，同一（参考范围, 检测值）只判定一次。
+
+    Returns:
+        list: status 发生变化的指标
+    """
+    changed = []
+    memo = {}
+    for indicator in indicators:
+        key = (indicator.indicator_name if not indicator.reference_range else None,
+               indicator.value, indicator.unit, indicator.reference_range, indicator.status)
+        if key not in memo:
+            memo[key] = reference_status(
+                indicator.indicator_name, indicator.value, indicator.unit,
+                indicator.reference_range, indicator.status, gender, age
+            )
+        status = memo[key]
+        if status and status != indicator.status:
+            indicator.status = status
+            changed.append(indicator)
+    return changed
+
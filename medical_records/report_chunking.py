@@ -0,0 +1,239 @@
+"""
+OCR 报告文本分块与分块结果合并
+按标题/表格切分 MinerU 输出的 Markdown，长报告分块并行提取指标后合并（相邻分块边界处按规范化指标名与测量值去重）。
+表格不会从中间切开（超长表格按行切分并重复表头），每块带上所属章节标题作为上下文
+"""
+
+import re
+import unicodedata
+
+DEFAULT_CHUNK_CHARS = 6000
+
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+_TABLE_ROW_RE = re.compile(r'<tr\b.*?</tr>', re.IGNORECASE | re.DOTALL)
+_WHITESPACE_RE = re.compile(r'\s+')
+_EMPTY_VALUES = (None, '', 'null')
+
+
+def _iter_blocks(markdown):
+    """
+    将 Markdown 拆成块：('heading', 级别, 标题) / ('table', 内容) / ('text', 内容)
+
+    HTML 表格（<table>…</table>）与连续的管道表格行各为一个整体块
+    """
+    lines = markdown.splitlines()
+    paragraph = []
+    i = 0
+    n = len(lines)
+
+    def flush_paragraph():
+        if paragraph:
+            text = '\n'.join(paragraph).strip()
+            paragraph.clear()
+            if text:
+                return ('text', text)
+        return None
+
+    while i < n:
+        line = lines[i]
+        stripped = line.strip()
+
+        heading = _HEADING_RE.match(stripped)
+        if heading:
+            block = flush_paragraph()
+            if block:
+                yield block
+            yield ('heading', len(heading.group(1)), heading.group(2))
+            i += 1
+        elif '<table' in stripped.lower():
+            block = flush_paragraph()
+            if block:
+                yield block
+            table = [line]
+            while '</table>' not in lines[i].lower() and i + 1 < n:
+                i += 1
+                table.append(lines[i])
+            yield ('table', '\n'.join(table).strip())
+            i += 1
+        elif stripped.startswith('|'):
+            block = flush_paragraph()
+            if block:
+                yield block
+            table = []
+            while i < n and lines[i].strip().startswith('|'):
+                table.append(lines[i])
+                i += 1
+            yield ('table', '\n'.join(table))
+        elif not stripped:
+            block = flush_paragraph()
+            if block:
+                yield block
+            i += 1
+        else:
+            paragraph.append(line)
+            i += 1
+
+    block = flush_paragraph()
+    if block:
+        yield block
+
+
+def _split_oversized(kind, text, max_chars):
+    """超长块按行切分；表格每段重复表头"""
+    if kind == 'table' and '<tr' in text.lower():
+        rows = _TABLE_ROW_RE.findall(text)
+        if rows:
+            header, rows = rows[0], rows[1:]
+            prefix, suffix = '<table>' + header, '</table>'
+            return _pack_lines(rows, max_chars - len(prefix) - len(suffix), prefix, suffix, '')
+
+    lines = text.splitlines()
+    if kind == 'table' and len(lines) > 2:
+        header = '\n'.join(lines[:2])
+        return _pack_lines(lines[2:], max_chars - len(header) - 1, header + '\n', '', '\n')
+
+    # 普通段落：按行切分，单行仍然过长则按字符硬切
+    pieces = []
+    for line in lines:
+        while len(line) > max_chars:
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        pieces.append(line)
+    return _pack_lines(pieces, max_chars, '', '', '\n')
+
+
+def _pack_lines(lines, budget, prefix, suffix, separator):
+    budget = max(budget, 1)
+    parts = []
+    current = []
+    size = 0
+    for line in lines:
+        if current and size + len(line) > budget:
+            parts.append(prefix + separator.join(current) + suffix)
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + len(separator)
+    if current:
+        parts.append(prefix + separator.join(current) + suffix)
+    return parts
+
+
+def split_report_sections(markdown, max_chars=DEFAULT_CHUNK_CHARS):
+    """
+    按章节切分 OCR 报告文本
+
+    以标题、表格、段落为最小单位装箱，单块不超过 max_chars（标题上下文除外）；
+    新章节开始且当前块已过半时另起一块。每块开头附上所属章节的标题路径。
+    文本不超过 max_chars 时原样返回一块。
+
+    Returns:
+        list[str]: 各块文本
+    """
+    if not markdown or len(markdown) <= max_chars:
+        return [markdown] if markdown else []
+
+    chunks = []
+    headings = []          # [(级别, 标题)]，当前章节路径
+    current = []
+    size = 0
+    context = ''
+
+    def emit():
+        nonlocal current, size
+        if current:
+            chunks.append('\n\n'.join(current))
+        current, size = [], 0
+
+    def start_chunk():
+        nonlocal size
+        if context:
+            current.append(context)
+            size += len(context)
+
+    for block in _iter_blocks(markdown):
+        if block[0] == 'heading':
+            _, level, title = block
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, title))
+            if size >= max_chars // 2:
+                emit()
+            text = '#' * level + ' ' + title
+            context = '【所属章节：' + ' > '.join(t for _, t in headings) + '】'
+            if not current:
+                start_chunk()
+                # 标题本身已体现在上下文中
+                continue
+            current.append(text)
+            size += len(text) + 2
+            continue
+
+        kind, text = block
+        parts = [text] if len(text) <= max_chars else _split_oversized(kind, text, max_chars)
+        for part in parts:
+            if current and size + len(part) > max_chars:
+                emit()
+            if not current:
+                start_chunk()
+            current.append(part)
+            size += len(part) + 2
+
+    emit()
+    return chunks
+
+
+def canonical_indicator_name(name):
+    """规范化指标名：全角转半角、去空白、忽略大小写（用于合并与去重，不用于展示）"""
+    if name is None:
+        return ''
+    normalized = unicodedata.normalize('NFKC', str(name))
+    return _WHITESPACE_RE.sub('', normalized).casefold().strip(':')
+
+
+def _canonical_value(indicator):
+    value = indicator.get('measured_value', indicator.get('value'))
+    if value in _EMPTY_VALUES:
+        return ''
+    return _WHITESPACE_RE.sub('', unicodedata.normalize('NFKC', str(value))).casefold()
+
+
+def merge_chunk_indicators(chunk_results):
+    """
+    合并各分块提取出的指标
+
+    只在相邻分块的边界处去重：后一块中与前一块某条指标规范化名称相同、测量值相同的视为重复提取，
+    保留前一块的那条，并用重复的一条补齐其空缺字段（如参考范围、异常标记）。
+    同一块内的指标全部保留（如尿常规与便常规中的同名指标），空测量值与非空测量值不视为相同。
+
+    Args:
+        chunk_results: 按原文顺序排列的各块 indicators 列表
+
+    Returns:
+        list[dict]: 合并后的指标，保持原文顺序
+    """
+    merged = []
+    # 前一块中尚未被匹配的指标：(规范化名称, 规范化测量值) -> [指标]
+    previous = {}
+    for indicators in chunk_results:
+        current = {}
+        for indicator in indicators or []:
+            if not isinstance(indicator, dict):
+                continue
+            name = canonical_indicator_name(indicator.get('indicator') or indicator.get('name'))
+            if not name:
+                merged.append(dict(indicator))
+                continue
+
+            key = (name, _canonical_value(indicator))
+            candidates = previous.get(key)
+            if candidates:
+                entry = candidates.pop(0)
+                for field, field_value in indicator.items():
+                    if entry.get(field) in _EMPTY_VALUES and field_value not in _EMPTY_VALUES:
+                        entry[field] = field_value
+            else:
+                entry = dict(indicator)
+                merged.append(entry)
+            current.setdefault(key, []).append(entry)
+        previous = current
+    return merged
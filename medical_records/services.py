@@ -3,9 +3,17 @@ import json
 import time
 import re
 import base64
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from django.conf import settings
+from django.db import transaction
+from . import image_pipeline
 from .models import DocumentProcessing, HealthIndicator, SystemSettings
+from .agent_tool_cache import bump_data_version
+from .json_extraction import extract_json, strip_reasoning
+from .indicator_units import canonicalize_indicators, split_value_unit
+from .reference_ranges import apply_reference_status, profile_context, reference_status
+from .report_chunking import DEFAULT_CHUNK_CHARS, merge_chunk_indicators, split_report_sections
 from .llm_prompts import (
     OCR_EXTRACT_SYSTEM_PROMPT,
     OCR_EXTRACT_USER_PROMPT_TEMPLATE,
@@ -21,6 +29,17 @@ from .llm_prompts import (
     build_data_integration_prompt
 )
 
+
+def encode_image_to_base64(image_path):
+    """发送给多模态模型的图片：image_pipeline 的 vlm 渲染件（JPEG），返回 base64 字符串（不含 data URL 前缀）"""
+    return base64.b64encode(image_pipeline.render(image_path, 'vlm')).decode('ascii')
+
+
+def image_data_url(image_path):
+    """OpenAI 兼容接口使用的图片 data URL（JPEG）"""
+    return f"data:image/jpeg;base64,{encode_image_to_base64(image_path)}"
+
+
 # 个人信息过滤关键词列表
 PERSONAL_INFO_KEYWORDS = [
     '姓名', 'name', '患者姓名', '姓名：',
@@ -71,6 +90,9 @@ class DocumentProcessingService:
         self.llm_timeout = int(SystemSettings.get_setting('llm_timeout', '600'))
         self.ocr_timeout = int(SystemSettings.get_setting('ocr_timeout', '300'))
         self.llm_max_tokens = int(SystemSettings.get_setting('llm_max_tokens', '8000'))
+        # 长报告分块提取：每块最大字符数与并发上限
+        self.llm_chunk_chars = int(SystemSettings.get_setting('llm_chunk_chars', str(DEFAULT_CHUNK_CHARS)))
+        self.llm_max_concurrency = int(SystemSettings.get_setting('llm_max_concurrency', '3'))
 
     def update_progress(self, status, progress, message=None, is_error=False):
         """更新处理进度"""
@@ -205,14 +227,59 @@ class DocumentProcessingService:
             raise
 
     def _call_real_llm(self, ocr_text):
-        """调用本地LLM服务"""
+        """
+        调用本地LLM服务提取指标
+
+        长报告按章节/表格分块，在并发上限内并行提取后按规范化指标名合并：
+        总耗时约为最慢一块的耗时，单块输出也不会因为 max_tokens 被截断而丢失后半部分指标
+        """
+        existing_indicators = self._get_existing_indicator_names()
+        chunks = split_report_sections(ocr_text, self.llm_chunk_chars)
+        if len(chunks) <= 1:
+            return self._request_llm_extraction(ocr_text, existing_indicators)
+
+        workers = max(1, min(self.llm_max_concurrency, len(chunks)))
+        print(f"[LLM] 报告较长（{len(ocr_text)} 字符），分为 {len(chunks)} 块并行提取，并发数 {workers}")
+
+        results = [None] * len(chunks)
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self._request_llm_extraction, chunk, existing_indicators, False): index
+                for index, chunk in enumerate(chunks)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                index = futures[future]
+                try:
+                    results[index] = future.result().get('indicators', [])
+                except Exception as e:
+                    print(f"[失败] 第{index + 1}块提取失败: {str(e)}")
+                    errors.append({'chunk': index + 1, 'error': str(e)})
+                self.update_progress('ai_processing', 50 + int(done / len(chunks) * 20),
+                                     f"AI数据分析中（{done}/{len(chunks)}）...")
+
+        if len(errors) == len(chunks):
+            raise Exception(f"所有分块提取均失败: {errors[0]['error']}")
+
+        structured_data = {'indicators': merge_chunk_indicators(results)}
+        if errors:
+            structured_data['chunk_errors'] = errors
+        print(f"[成功] 分块提取完成，合并后 {len(structured_data['indicators'])} 个指标，失败 {len(errors)} 块")
+        return structured_data
+
+    def _request_llm_extraction(self, ocr_text, existing_indicators, save_debug=True):
+        """
+        单次请求LLM提取指标
+
+        分块并行时在工作线程中调用，save_debug=False：线程内不写数据库
+        """
         print(f"\n{'='*60}")
         print(f"[LLM] [LLM服务] 开始调用大语言模型")
         print(f"[文本] OCR文本长度: {len(ocr_text)} 字符")
         print(f"[文本] OCR文本前200字符: {ocr_text[:200]}...")
 
         # 构建prompt
-        system_prompt, user_prompt = build_ocr_extract_prompt(ocr_text, self._get_existing_indicator_names())
+        system_prompt, user_prompt = build_ocr_extract_prompt(ocr_text, existing_indicators)
         print(f"[信息] 构建完成Prompt，长度: {len(user_prompt)} 字符")
 
         # 准备本地LLM API请求
@@ -304,74 +371,27 @@ class DocumentProcessingService:
                     print(f"API响应长度: {len(ai_result)} 字符")
                     print(f"API响应前500字符: {ai_result[:500]}")
 
-                    # 清理响应，移除可能的代码块标记和thinking标签
-                    cleaned_result = ai_result.strip()
-                    
-                    # 移除markdown代码块标记
-                    if cleaned_result.startswith('```json'):
-                        cleaned_result = cleaned_result[7:]
-                    if cleaned_result.endswith('```'):
-                        cleaned_result = cleaned_result[:-3]
-                    
-                    # 移除thinking标签和思考过程
-                    import re
-                    thinking_patterns = [
-                        (r'<thought>[\s\S]*?</thought>', '', re.IGNORECASE),
-                        (r'<thinking>[\s\S]*?</thinking>', '', re.IGNORECASE),
-                        (r'</think>[\s\S]*?</think>', '', re.IGNORECASE),
-                        (r'思考过程[:：][\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-                        (r'分析[:：][\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-                        (r'让我先分析[\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-                        (r'分析如下[:：][\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-                    ]
-                    
-                    for pattern, replacement, *flags in thinking_patterns:
-                        flags = flags[0] if flags else 0
-                        old_text = cleaned_result
-                        cleaned_result = re.sub(pattern, replacement, cleaned_result, flags=flags)
-                        if old_text != cleaned_result:
-                            print(f"清理thinking标签/思考过程: 移除了 {len(old_text) - len(cleaned_result)} 个字符")
-                    
-                    cleaned_result = cleaned_result.strip()
-
-                    print(f"清理后的响应: {cleaned_result[:100]}...")
-
-                    try:
-                        structured_data = json.loads(cleaned_result)
+                    # 单次扫描：剥离thinking标签与代码块标记、提取JSON对象、修复截断
+                    structured_data = extract_json(ai_result, required_key='indicators')
+                    if structured_data is not None:
                         indicators_count = len(structured_data.get('indicators', []))
                         print(f"[成功] 成功解析JSON，包含 {indicators_count} 个指标")
                         return structured_data
-                    except json.JSONDecodeError as e:
-                        print(f"[失败] JSON解析失败: {str(e)}")
-                        print(f"错误详情: {repr(e)}")
-
-                        # 如果直接解析失败，尝试提取JSON部分
-                        import re
-                        # 手动寻找匹配的JSON对象
-                        json_objects = self._extract_json_objects(cleaned_result)
-                        print(f"找到 {len(json_objects)} 个JSON对象")
-
-                        for i, json_str in enumerate(json_objects):
-                            try:
-                                structured_data = json.loads(json_str)
-                                indicators_count = len(structured_data.get('indicators', []))
-                                print(f"[成功] 第{i+1}个JSON解析成功，包含 {indicators_count} 个指标")
-                                if indicators_count > 0:
-                                    return structured_data
-                            except json.JSONDecodeError as e2:
-                                print(f"第{i+1}个JSON解析失败: {str(e2)}")
-                                continue
-
-                        print("所有JSON匹配都无法解析，保存原始响应用于调试")
-                        # 保存原始响应到数据库，便于调试
-                        self.document_processing.ai_result = {
-                            'error': str(e),
-                            'raw_response': ai_result[:500] + "..." if len(ai_result) > 500 else ai_result,
-                            'cleaned_response': cleaned_result[:500] + "..." if len(cleaned_result) > 500 else cleaned_result
-                        }
-                        self.document_processing.save()
 
-                        raise Exception(f"JSON解析失败，但已保存原始响应到数据库")
+                    if not save_debug:
+                        raise Exception("无法从响应中提取有效的JSON")
+
+                    print("无法从响应中提取JSON，保存原始响应用于调试")
+                    cleaned_result = strip_reasoning(ai_result)
+                    # 保存原始响应到数据库，便于调试
+                    self.document_processing.ai_result = {
+                        'error': '无法从响应中提取有效的JSON',
+                        'raw_response': ai_result[:500] + "..." if len(ai_result) > 500 else ai_result,
+                        'cleaned_response': cleaned_result[:500] + "..." if len(cleaned_result) > 500 else cleaned_result
+                    }
+                    self.document_processing.save()
+
+                    raise Exception(f"JSON解析失败，但已保存原始响应到数据库")
 
                 except json.JSONDecodeError as e:
                     print(f"[失败] API响应JSON解析失败: {str(e)}")
@@ -701,134 +721,9 @@ class DocumentProcessingService:
 
         return 'other'  # 默认归为其他检查
 
-    def _extract_unit_from_value(self, measured_value, indicator_name):
-        """从测量值中提取单位"""
-        import re
-
-        # 常见单位模式
-        unit_patterns = {
-            r'mmHg': 'mmHg',
-            r'次/分|bpm|次': '次/分',
-            r'mmol/L': 'mmol/L',
-            r'kg': 'kg',
-            r'cm': 'cm',
-            r'°C': '°C',
-            r'g/L': 'g/L',
-            r'×10[^/]/L': '×10⁹/L',
-            r'fl': 'fL',
-            r'pg': 'pg',
-            r'%': '%'
-        }
-
-        # 先从测量值中提取单位
-        for pattern, unit in unit_patterns.items():
-            if re.search(pattern, measured_value):
-                return unit
-
-        # 根据指标名称推断单位
-        if '血压' in indicator_name:
-            return 'mmHg'
-        elif '心率' in indicator_name:
-            return '次/分'
-        elif '血糖' in indicator_name or '胆固醇' in indicator_name:
-            return 'mmol/L'
-        elif '体重' in indicator_name:
-            return 'kg'
-        elif '身高' in indicator_name:
-            return 'cm'
-        elif '体温' in indicator_name:
-            return '°C'
-
-        return ''
-
-    def _clean_measured_value(self, measured_value, unit):
-        """清理测量值，移除单位"""
-        if unit:
-            # 移除单位部分
-            import re
-            cleaned = re.sub(r'\s*' + re.escape(unit) + r'\s*$', '', str(measured_value))
-            return cleaned.strip()
-        return str(measured_value).strip()
-
-    def _extract_json_objects(self, text):
-        """从文本中提取完整的JSON对象，支持修复截断的JSON"""
-        import json
-
-        json_objects = []
-        start_idx = 0
-
-        while start_idx < len(text):
-            # 查找下一个 {
-            start_pos = text.find('{', start_idx)
-            if start_pos == -1:
-                break
-
-            # 寻找匹配的 }
-            brace_count = 0
-            end_pos = start_pos
-            in_string = False
-            escape_char = False
-
-            for i in range(start_pos, len(text)):
-                char = text[i]
-
-                if escape_char:
-                    escape_char = False
-                    continue
-
-                if char == '\\':
-                    escape_char = True
-                    continue
-
-                if char == '"' and not escape_char:
-                    in_string = not in_string
-                    continue
-
-                if in_string:
-                    continue
-
-                if char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-
-                if brace_count == 0:
-                    end_pos = i
-                    break
-
-            # 如果找到匹配的括号
-            if brace_count == 0:
-                json_str = text[start_pos:end_pos + 1]
-                # 验证这是否是有效的JSON
-                try:
-                    parsed = json.loads(json_str)
-                    if 'indicators' in parsed:
-                        json_objects.append(json_str)
-                except json.JSONDecodeError:
-                    # 尝试修复后再次解析
-                    repaired = self._fix_truncated_json(json_str)
-                    try:
-                        parsed = json.loads(repaired)
-                        if 'indicators' in parsed:
-                            json_objects.append(repaired)
-                            print(f"[修复] 成功修复并提取截断的JSON对象")
-                    except json.JSONDecodeError:
-                        pass
-                start_idx = end_pos + 1
-            else:
-                # JSON可能被截断了，尝试修复
-                json_str = text[start_pos:]
-                repaired = self._fix_truncated_json(json_str)
-                try:
-                    parsed = json.loads(repaired)
-                    if 'indicators' in parsed:
-                        json_objects.append(repaired)
-                        print(f"[修复] 成功修复并提取截断的JSON对象（文件末尾）")
-                except json.JSONDecodeError:
-                    pass
-                break
-
-        return json_objects
+    def _split_measured_value(self, measured_value, indicator_name):
+        """从测量值中分离单位，返回 (去掉单位的测量值, 标准写法的单位)"""
+        return split_value_unit(measured_value, indicator_name)
 
     def _get_existing_indicator_names(self):
         """获取数据库中现有的标准指标名称"""
@@ -888,106 +783,142 @@ class DocumentProcessingService:
 请严格按照JSON格式返回，不要添加任何解释。切记不要编造报告中不存在的参考范围和异常状态。
 """
 
-    def save_health_indicators(self, structured_data):
-        """保存健康指标到数据库"""
-        try:
-            self.update_progress('saving_data', 80, "保存健康指标数据...")
+    def _build_health_indicator(self, idx, indicator_data):
+        """将一条LLM指标数据转换为未保存的 HealthIndicator；无效或需过滤的数据返回 None"""
+        # 跳过无效的indicator_data
+        if not isinstance(indicator_data, dict) or not indicator_data:
+            print(f"[警告]  跳过无效的指标数据 (索引{idx}): 不是字典或为空")
+            return None
 
-            indicators = structured_data.get('indicators', [])
-            if not indicators:
-                print("[警告]  没有指标数据需要保存")
-                return
+        # 处理新的LLM响应格式，处理None/null值
+        indicator_name = indicator_data.get('indicator') or indicator_data.get('name') or ''
+        measured_value = indicator_data.get('measured_value') or indicator_data.get('value') or ''
+        normal_range = indicator_data.get('normal_range') or indicator_data.get('reference_range') or ''
+        is_abnormal = indicator_data.get('abnormal')
 
-            saved_count = 0
-            skipped_count = 0
+        # 跳过没有指标名称的数据
+        if not indicator_name or indicator_name == 'null' or not str(indicator_name).strip():
+            print(f"[跳过] 无效指标 (索引{idx}): 缺少指标名称")
+            return None
 
-            for idx, indicator_data in enumerate(indicators):
-                try:
-                    # 跳过无效的indicator_data
-                    if not isinstance(indicator_data, dict) or not indicator_data:
-                        print(f"[警告]  跳过无效的指标数据 (索引{idx}): 不是字典或为空")
-                        skipped_count += 1
-                        continue
+        # 过滤个人信息字段
+        if is_personal_info_indicator(indicator_name):
+            print(f"[过滤] 个人信息字段 (索引{idx}): {indicator_name}")
+            return None
 
-                    # 处理新的LLM响应格式，处理None/null值
-                    indicator_name = indicator_data.get('indicator') or indicator_data.get('name') or ''
-                    measured_value = indicator_data.get('measured_value') or indicator_data.get('value') or ''
-                    normal_range = indicator_data.get('normal_range') or indicator_data.get('reference_range') or ''
-                    is_abnormal = indicator_data.get('abnormal')
+        # 转换为字符串并清理
+        indicator_name = str(indicator_name).strip()
+        measured_value = str(measured_value).strip() if measured_value else ''
+        normal_range = str(normal_range).strip() if normal_range and normal_range != 'null' else ''
+
+        # 处理 null 值
+        if not normal_range or normal_range == 'null':
+            normal_range = ''
+
+        # 转换异常状态
+        if is_abnormal is None or is_abnormal == 'null':
+            # 如果 LLM 没有明确标注异常（报告中没有参考范围），则不判断状态
+            # 由于数据库字段不允许NULL且有default='normal'，这里留空会使用默认值
+            status = None  # 使用模型默认值
+        elif isinstance(is_abnormal, str):
+            if is_abnormal.lower() in ['是', 'yes', '异常', 'true', 'positive', '阳性']:
+                status = 'abnormal'
+            elif is_abnormal.lower() in ['否', 'no', '正常', 'false', 'negative', '阴性']:
+                status = 'normal'
+            else:
+                # 无法识别的字符串，不判断状态
+                status = None  # 使用模型默认值
+        elif isinstance(is_abnormal, bool):
+            status = 'abnormal' if is_abnormal else 'normal'
+        else:
+            status = None  # 使用模型默认值
+
+        # 确定指标类型
+        indicator_type = self._get_indicator_type_from_name(indicator_name)
+
+        # 确定单位并清理测量值（移除单位）
+        clean_value, unit = self._split_measured_value(measured_value, indicator_name)
+
+        return HealthIndicator(
+            checkup=self.document_processing.health_checkup,
+            indicator_type=indicator_type,
+            indicator_name=indicator_name,
+            value=clean_value,
+            unit=unit,
+            reference_range=normal_range or '',  # 确保 None 转为空字符串
+            status=status or 'normal'  # 传入状态，如果为None则使用normal
+        )
 
-                    # 跳过没有指标名称的数据
-                    if not indicator_name or indicator_name == 'null' or not str(indicator_name).strip():
-                        print(f"[跳过] 无效指标 (索引{idx}): 缺少指标名称")
-                        skipped_count += 1
-                        continue
+    def _reference_context(self):
+        """参考范围判定用的性别与体检当天年龄（每次处理只查询一次）"""
+        if not hasattr(self, '_reference_profile'):
+            checkup = self.document_processing.health_checkup
+            self._reference_profile = profile_context(
+                self.document_processing.user_id, checkup.checkup_date if checkup else None
+            )
+        return self._reference_profile
 
-                    # 过滤个人信息字段
-                    if is_personal_info_indicator(indicator_name):
-                        print(f"[过滤] 个人信息字段 (索引{idx}): {indicator_name}")
-                        filtered_count += 1
-                        skipped_count += 1
-                        continue
+    def save_indicator_batch(self, indicators, start_index=0):
+        """
+        批量保存一批LLM指标数据（一次 bulk_create）
 
-                    # 转换为字符串并清理
-                    indicator_name = str(indicator_name).strip()
-                    measured_value = str(measured_value).strip() if measured_value else ''
-                    normal_range = str(normal_range).strip() if normal_range and normal_range != 'null' else ''
+        整批写入失败时逐条重试，单个指标失败不影响其他指标。
 
-                    # 处理 null 值
-                    if not normal_range or normal_range == 'null':
-                        normal_range = ''
+        Returns:
+            list: 已保存的 HealthIndicator
+        """
+        pending = []
+        for offset, indicator_data in enumerate(indicators):
+            try:
+                indicator = self._build_health_indicator(start_index + offset, indicator_data)
+            except Exception as e:
+                print(f"[错误] 解析指标失败 (索引{start_index + offset}): {str(e)}")
+                print(f"   指标数据: {indicator_data}")
+                continue
+            if indicator is not None:
+                pending.append(indicator)
 
-                    # 转换异常状态
-                    if is_abnormal is None or is_abnormal == 'null':
-                        # 如果 LLM 没有明确标注异常（报告中没有参考范围），则不判断状态
-                        # 由于数据库字段不允许NULL且有default='normal'，这里留空会使用默认值
-                        status = None  # 使用模型默认值
-                    elif isinstance(is_abnormal, str):
-                        if is_abnormal.lower() in ['是', 'yes', '异常', 'true', 'positive', '阳性']:
-                            status = 'abnormal'
-                        elif is_abnormal.lower() in ['否', 'no', '正常', 'false', 'negative', '阴性']:
-                            status = 'normal'
-                        else:
-                            # 无法识别的字符串，不判断状态
-                            status = None  # 使用模型默认值
-                    elif isinstance(is_abnormal, bool):
-                        status = 'abnormal' if is_abnormal else 'normal'
-                    else:
-                        status = None  # 使用模型默认值
+        if not pending:
+            return []
 
-                    # 确定指标类型
-                    indicator_type = self._get_indicator_type_from_name(indicator_name)
+        # 按参考范围确定状态（不依赖大模型是否标注了异常）
+        gender, age = self._reference_context()
+        apply_reference_status(pending, gender, age)
+        # bulk_create 不调用 save()，在这里换算标准单位
+        canonicalize_indicators(pending)
 
-                    # 确定单位
-                    unit = self._extract_unit_from_value(measured_value, indicator_name)
+        try:
+            with transaction.atomic():
+                saved = HealthIndicator.objects.bulk_create(pending)
+            # bulk_create 不触发模型信号，使AI医生工具缓存失效
+            bump_data_version(self.document_processing.user_id)
+            return saved
+        except Exception as e:
+            print(f"[警告] 批量保存指标失败，改为逐条保存: {str(e)}")
 
-                    # 清理测量值（移除单位）
-                    clean_value = self._clean_measured_value(measured_value, unit)
+        saved = []
+        for indicator in pending:
+            try:
+                with transaction.atomic():
+                    indicator.save()
+                saved.append(indicator)
+            except Exception as e:
+                # 单个指标保存失败时，继续处理下一个
+                print(f"[错误] 保存指标失败: {indicator.indicator_name}: {str(e)}")
+        return saved
 
-                    # 创建健康指标
-                    indicator = HealthIndicator.objects.create(
-                        checkup=self.document_processing.health_checkup,
-                        indicator_type=indicator_type,
-                        indicator_name=indicator_name,
-                        value=clean_value,
-                        unit=unit,
-                        reference_range=normal_range or '',  # 确保 None 转为空字符串
-                        status=status or 'normal'  # 传入状态，如果为None则使用normal
-                    )
-                    saved_count += 1
-                    status_display = status if status else 'normal(默认)'
-                    print(f"已保存指标 {saved_count}: {indicator_name} = {clean_value} {unit} (参考范围:{normal_range or '空'}, 状态:{status_display})")
+    def save_health_indicators(self, structured_data):
+        """保存健康指标到数据库"""
+        try:
+            self.update_progress('saving_data', 80, "保存健康指标数据...")
 
-                    # 更新进度
-                    progress = 80 + int((saved_count / len(indicators)) * 15)
-                    self.update_progress('saving_data', progress, f"已保存 {saved_count}/{len(indicators)} 项指标")
+            indicators = structured_data.get('indicators', [])
+            if not indicators:
+                print("[警告]  没有指标数据需要保存")
+                return
 
-                except Exception as e:
-                    # 单个指标保存失败时，继续处理下一个
-                    print(f"[错误] 保存指标失败 (索引{idx}): {str(e)}")
-                    print(f"   指标数据: {indicator_data}")
-                    skipped_count += 1
-                    continue
+            saved_count = len(self.save_indicator_batch(indicators))
+            skipped_count = len(indicators) - saved_count
 
             # 打印保存总结
             total_count = len(indicators)
@@ -1229,6 +1160,9 @@ class VisionLanguageModelService:
                 print(f"[图片]  检测到图片文件，直接处理")
                 self.update_progress('ai_processing', 40, "检测到图片文件，直接处理")
 
+            # 记录原图，删除报告时清理这些图片的渲染件
+            image_pipeline.record_checkup_sources(self.document_processing.health_checkup_id, images)
+
             all_indicators = []
             total_images = len(images)
             print(f"[统计] 总共需要处理 {total_images} 页/张图片")
@@ -1281,9 +1215,11 @@ class VisionLanguageModelService:
     def _convert_pdf_to_images(self, pdf_path):
         """将PDF转换为图片"""
         try:
-            from pdf2image import convert_from_path
+            from .lazy_imports import load
             import tempfile
             import os
+
+            convert_from_path = load('pdf2image.convert_from_path')
             
             # 尝试使用poppler路径（Windows常见路径）
             poppler_path = None
@@ -1441,24 +1377,8 @@ class VisionLanguageModelService:
                 result = response.json()
                 content = result['candidates'][0]['content']['parts'][0]['text']
 
-                # 清理thinking标签和思考过程
-                import re
-                cleaned_content = content.strip()
-                
-                thinking_patterns = [
-                    (r'<thought>[\s\S]*?</thought>', '', re.IGNORECASE),
-                    (r'<thinking>[\s\S]*?</thinking>', '', re.IGNORECASE),
-                    (r'</think>[\s\S]*?</think>', '', re.IGNORECASE),
-                    (r'思考过程[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'分析[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'让我先分析[\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'分析如下[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                ]
-                
-                for pattern, replacement, *flags in thinking_patterns:
-                    flags = flags[0] if flags else 0
-                    old_text = cleaned_content
-                    cleaned_content = re.sub(pattern, replacement, cleaned_content, flags=flags)
+                # 清理thinking标签与代码块标记（内容随后按JSON解析）
+                cleaned_content = strip_reasoning(content)
 
                 print(f"[成功] Gemini API调用成功!")
                 print(f"[数据] 返回内容长度: {len(cleaned_content)} 字符")
@@ -1504,7 +1424,7 @@ class VisionLanguageModelService:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": self._encode_image_to_base64(image_path),
+                                    "url": image_data_url(image_path),
                                     "detail": "high"
                                 }
                             }
@@ -1572,24 +1492,8 @@ class VisionLanguageModelService:
                 result = response.json()
                 content = result['choices'][0]['message']['content']
 
-                # 清理thinking标签和思考过程
-                import re
-                cleaned_content = content.strip()
-                
-                thinking_patterns = [
-                    (r'<thought>[\s\S]*?</thought>', '', re.IGNORECASE),
-                    (r'<thinking>[\s\S]*?</thinking>', '', re.IGNORECASE),
-                    (r'</think>[\s\S]*?</think>', '', re.IGNORECASE),
-                    (r'思考过程[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'分析[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'让我先分析[\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'分析如下[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                ]
-                
-                for pattern, replacement, *flags in thinking_patterns:
-                    flags = flags[0] if flags else 0
-                    old_text = cleaned_content
-                    cleaned_content = re.sub(pattern, replacement, cleaned_content, flags=flags)
+                # 清理thinking标签与代码块标记（内容随后按JSON解析）
+                cleaned_content = strip_reasoning(content)
 
                 print(f"[成功] API调用成功!")
                 print(f"[数据] 返回内容长度: {len(cleaned_content)} 字符")
@@ -1614,35 +1518,6 @@ class VisionLanguageModelService:
             print(f"[失败] OpenAI Vision API调用失败: {str(e)}")
             raise
 
-    def _encode_image_to_base64(self, image_path):
-        """将图片编码为base64"""
-        import base64
-
-        # 读取图片并调整大小（如果太大）
-        from PIL import Image
-        import io
-
-        with Image.open(image_path) as img:
-            # 限制最大尺寸为1024x1024
-            max_size = 1024
-            if img.width > max_size or img.height > max_size:
-                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-
-            # 转换为RGB模式（如果不是）
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            # 保存到内存
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=85)
-            buffer.seek(0)
-
-            # 编码为base64
-            image_data = buffer.read()
-            base64_data = base64.b64encode(image_data).decode('utf-8')
-
-        return f"data:image/jpeg;base64,{base64_data}"
-
     def _build_vision_prompt(self, page_num, total_pages):
         """构建视觉模型的prompt"""
         return f"""
@@ -1688,251 +1563,15 @@ class VisionLanguageModelService:
 """
 
     def _extract_json_from_text(self, text):
-        """智能提取和清理JSON内容"""
-        print(f"[配置] 开始智能JSON提取和清理...")
+        """提取和清理JSON内容（单次扫描，容错并修复截断）"""
+        print(f"[配置] 开始JSON提取...")
         print(f"[数据] 原始文本长度: {len(text)} 字符")
         print(f"[数据] 原始文本前300字符: {text[:300]}...")
 
-        # 方法1: 尝试直接解析（如果文本本身就是纯净的JSON）
-        try:
-            result = json.loads(text.strip())
-            print(f"[成功] 方法1成功: 直接解析JSON")
-            return result
-        except json.JSONDecodeError:
-            print(f"[失败] 方法1失败: 无法直接解析JSON")
-
-        # 方法2: 清理常见的代码块标记和thinking标签
-        cleaned_patterns = [
-            # 移除thinking标签和思考过程
-            (r'<thought>[\s\S]*?</thought>', '', re.IGNORECASE),
-            (r'<thinking>[\s\S]*?</thinking>', '', re.IGNORECASE),
-            (r'</think>[\s\S]*?</think>', '', re.IGNORECASE),
-            (r'思考过程[:：][\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-            (r'分析[:：][\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-            (r'让我先分析[\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-            (r'分析如下[:：][\s\S]*?(?=\n\s*\{)', '', re.IGNORECASE),
-            # 移除代码块标记
-            (r'```json\s*', ''),
-            (r'```\s*', ''),
-            # 移除可能的前导文字说明
-            (r'^.*?(?=\s*\{)', '', re.DOTALL),
-            # 移除可能的尾部文字说明
-            (r'\}[^}]*$', '}'),
-            # 移除常见的前缀文字
-            (r'^(?:以下是|Here is|The result is|输出|返回|Result)[:：\s]*', '', re.IGNORECASE),
-        ]
-
-        cleaned_text = text
-        for pattern, replacement, *flags in cleaned_patterns:
-            flags = flags[0] if flags else 0
-            old_text = cleaned_text
-            cleaned_text = re.sub(pattern, replacement, cleaned_text, flags=flags)
-            if old_text != cleaned_text:
-                print(f"[清理] 清理模式应用: 移除了 {len(old_text) - len(cleaned_text)} 个字符")
-
-        cleaned_text = cleaned_text.strip()
-        print(f"[清理] 基础清理后长度: {len(cleaned_text)} 字符")
-
-        # 尝试解析清理后的文本
-        try:
-            result = json.loads(cleaned_text)
-            print(f"[成功] 方法2成功: 基础清理后解析成功")
-            return result
-        except json.JSONDecodeError as e:
-            print(f"[失败] 方法2失败: {str(e)}")
-
-        # 方法3: 使用正则表达式提取JSON对象
-        print(f"[解析] 方法3: 使用正则表达式提取JSON对象...")
-
-        # 多种JSON提取模式
-        json_patterns = [
-            # 标准JSON对象（支持嵌套）
-            (r'\{(?:[^{}]|(?R))*\}', re.DOTALL),
-            # 更宽松的JSON匹配
-            (r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', re.DOTALL),
-            # 简化匹配（寻找包含"indicators"的对象）
-            (r'\{[^}]*"indicators"[^}]*\}', re.DOTALL),
-        ]
-
-        for i, (pattern, flags) in enumerate(json_patterns, 1):
-            try:
-                # 使用更强大的递归正则表达式
-                matches = self._extract_json_objects_recursive(text)
-                print(f"[解析] 模式{i}: 找到 {len(matches)} 个潜在JSON对象")
-
-                for j, json_str in enumerate(matches):
-                    print(f"   尝试对象 {j+1}: 长度 {len(json_str)} 字符")
-                    try:
-                        result = json.loads(json_str)
-                        if 'indicators' in result:
-                            print(f"[成功] 方法3.{i}.{j+1}成功: 找到包含indicators的JSON对象")
-                            return result
-                    except json.JSONDecodeError as e:
-                        print(f"   对象 {j+1} 解析失败: {str(e)[:100]}...")
-                        continue
-
-            except Exception as e:
-                print(f"[失败] 方法3.{i}失败: {str(e)}")
-                continue
-
-        # 方法4: 括号匹配法
-        print(f"[解析] 方法4: 括号匹配法...")
-        json_candidates = self._extract_by_bracket_matching(text)
-        for i, candidate in enumerate(json_candidates):
-            try:
-                result = json.loads(candidate)
-                if 'indicators' in result:
-                    print(f"[成功] 方法4.{i+1}成功: 括号匹配找到有效JSON")
-                    return result
-            except json.JSONDecodeError:
-                continue
-
-        # 方法5: 最后尝试 - 修复常见的JSON错误
-        print(f"[配置] 方法5: 尝试修复常见JSON错误...")
-        try:
-            repaired_json = self._repair_json_syntax(cleaned_text)
-            if repaired_json:
-                result = json.loads(repaired_json)
-                print(f"[成功] 方法5成功: JSON修复后解析成功")
-                return result
-        except Exception as e:
-            print(f"[失败] 方法5失败: {str(e)}")
-
-        print(f"[失败] 所有JSON提取方法都失败了")
-        return None
-
-    def _extract_json_objects_recursive(self, text):
-        """递归提取所有JSON对象"""
-        json_objects = []
-        start_idx = 0
-        bracket_count = 0
-        in_string = False
-        escape_char = False
-        start_pos = -1
-
-        for i, char in enumerate(text):
-            if escape_char:
-                escape_char = False
-                continue
-
-            if char == '\\':
-                escape_char = True
-                continue
-
-            if char == '"' and not escape_char:
-                in_string = not in_string
-                continue
-
-            if in_string:
-                continue
-
-            if char == '{':
-                if bracket_count == 0:
-                    start_pos = i
-                bracket_count += 1
-            elif char == '}':
-                bracket_count -= 1
-                if bracket_count == 0 and start_pos != -1:
-                    json_str = text[start_pos:i+1]
-                    json_objects.append(json_str)
-                    start_pos = -1
-
-        return json_objects
-
-    def _extract_by_bracket_matching(self, text):
-        """使用括号匹配提取JSON对象"""
-        candidates = []
-        for i, char in enumerate(text):
-            if char == '{':
-                bracket_count = 0
-                in_string = False
-                escape_char = False
-
-                for j in range(i, len(text)):
-                    char_j = text[j]
-
-                    if escape_char:
-                        escape_char = False
-                        continue
-
-                    if char_j == '\\':
-                        escape_char = True
-                        continue
-
-                    if char_j == '"' and not escape_char:
-                        in_string = not in_string
-                        continue
-
-                    if in_string:
-                        continue
-
-                    if char_j == '{':
-                        bracket_count += 1
-                    elif char_j == '}':
-                        bracket_count -= 1
-                        if bracket_count == 0:
-                            candidates.append(text[i:j+1])
-                            break
-
-        return candidates
-
-    def _repair_json_syntax(self, text):
-        """尝试修复常见的JSON语法错误，包括截断的JSON"""
-        if not text:
-            return None
-
-        # 基础清理
-        repaired = text.strip()
-
-        # 移除多余的逗号
-        repaired = re.sub(r',(\s*[}\]])', r'\1', repaired)
-
-        # 确保字符串被正确引用
-        repaired = re.sub(r'(\w+):', r'"\1":', repaired)
-
-        # 修复常见的引号问题
-        repaired = re.sub(r"'([^']*)'", r'"\1"', repaired)
-
-        # 修复截断的JSON - 处理未闭合的字符串
-        repaired = self._fix_truncated_json(repaired)
-
-        return repaired if repaired != text else None
-
-    def _fix_truncated_json(self, text):
-        """修复可能被截断的JSON"""
-        repaired = text
-
-        # 计算括号匹配情况
-        open_braces = repaired.count('{') - repaired.count('}')
-        open_brackets = repaired.count('[') - repaired.count(']')
-        open_quotes = repaired.count('"') % 2  # 奇数表示有未闭合的引号
-
-        # 修复未闭合的字符串（引号未配对）
-        if open_quotes > 0:
-            # 找到最后一个未闭合的引号并添加闭合引号
-            last_quote_pos = repaired.rfind('"')
-            if last_quote_pos > 0 and repaired[last_quote_pos:].count('"') % 2 == 1:
-                repaired = repaired + '"'
-
-        # 修复未闭合的对象
-        while open_braces > 0:
-            repaired = repaired + '}'
-            open_braces -= 1
-
-        # 修复未闭合的数组
-        while open_brackets > 0:
-            repaired = repaired + ']'
-            open_brackets -= 1
-
-        # 处理尾部逗号问题
-        repaired = re.sub(r',(\s*})$', r'\1', repaired)
-        repaired = re.sub(r',(\s*])$', r'\1', repaired)
-
-        # 处理属性值缺失的情况（如 "key": } 改为 "key": null }）
-        repaired = re.sub(r':\s*}', ': null }', repaired)
-        repaired = re.sub(r':\s*,', ': null,', repaired)
-
-        return repaired
+        result = extract_json(text, required_key='indicators')
+        if result is None:
+            print(f"[失败] 未能从文本中提取JSON对象")
+        return result
 
     def _parse_vision_response(self, content):
         """解析视觉模型的响应"""
@@ -2046,6 +1685,8 @@ class VisionLanguageModelService:
 
             saved_count = 0
             skipped_count = 0
+            # 指标类型、单位与参考范围判定共用一个服务实例
+            service = DocumentProcessingService(self.document_processing)
 
             for idx, indicator_data in enumerate(indicators):
                 try:
@@ -2095,14 +1736,16 @@ class VisionLanguageModelService:
                         status = None  # 使用模型默认值
 
                     # 确定指标类型
-                    service = DocumentProcessingService(self.document_processing)
                     indicator_type = service._get_indicator_type_from_name(indicator_name)
 
-                    # 确定单位
-                    unit = service._extract_unit_from_value(measured_value, indicator_name)
+                    # 确定单位并清理测量值
+                    clean_value, unit = service._split_measured_value(measured_value, indicator_name)
 
-                    # 清理测量值
-                    clean_value = service._clean_measured_value(measured_value, unit)
+                    # 按参考范围确定状态
+                    gender, age = service._reference_context()
+                    status = reference_status(
+                        indicator_name, clean_value, unit, normal_range, status or 'normal', gender, age
+                    ) or status
 
                     # 创建健康指标
                     indicator = HealthIndicator.objects.create(
@@ -2258,25 +1901,9 @@ class AIService:
                 advice = result['choices'][0]['message']['content']
                 
                 # 清理thinking标签和思考过程
-                import re
-                cleaned_advice = advice.strip()
-                
-                thinking_patterns = [
-                    (r'<thought>[\s\S]*?</thought>', '', re.IGNORECASE),
-                    (r'<thinking>[\s\S]*?</thinking>', '', re.IGNORECASE),
-                    (r'</think>[\s\S]*?</think>', '', re.IGNORECASE),
-                    (r'思考过程[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'分析[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'让我先分析[\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'分析如下[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                ]
-                
-                for pattern, replacement, *flags in thinking_patterns:
-                    flags = flags[0] if flags else 0
-                    old_text = cleaned_advice
-                    cleaned_advice = re.sub(pattern, replacement, cleaned_advice, flags=flags)
+                cleaned_advice = strip_reasoning(advice, fences=False, preamble=True)
                 
-                return cleaned_advice.strip()
+                return cleaned_advice
             else:
                 raise Exception(f"AI建议生成失败: {response.status_code} - {response.text}")
 
@@ -2384,24 +2011,8 @@ def call_llm_for_integration(system_prompt, user_prompt, timeout=120):
             result = response.json()
             content = result['choices'][0]['message']['content']
             
-            # 清理thinking标签和思考过程
-            import re
-            cleaned_content = content.strip()
-            
-            thinking_patterns = [
-                (r'<thought>[\s\S]*?</thought>', '', re.IGNORECASE),
-                (r'<thinking>[\s\S]*?</thinking>', '', re.IGNORECASE),
-                (r'</think>[\s\S]*?</think>', '', re.IGNORECASE),
-                (r'思考过程[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                (r'分析[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                (r'让我先分析[\s\S]*?(?=\n)', '', re.IGNORECASE),
-                (r'分析如下[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-            ]
-            
-            for pattern, replacement, *flags in thinking_patterns:
-                flags = flags[0] if flags else 0
-                old_text = cleaned_content
-                cleaned_content = re.sub(pattern, replacement, cleaned_content, flags=flags)
+            # 清理thinking标签与代码块标记（内容随后按JSON解析）
+            cleaned_content = strip_reasoning(content)
             
             print(f"[数据整合 LLM调用] [OK] 成功获取响应")
             print(f"[数据整合 LLM调用] 响应内容前500字符:")
@@ -2505,23 +2116,7 @@ def call_gemini_api(prompt, system_message=None, timeout=300):
                 content = result['candidates'][0]['content']['parts'][0]['text']
                 
                 # 清理thinking标签和思考过程
-                import re
-                cleaned_content = content.strip()
-                
-                thinking_patterns = [
-                    (r'<thought>[\s\S]*?</thought>', '', re.IGNORECASE),
-                    (r'<thinking>[\s\S]*?</thinking>', '', re.IGNORECASE),
-                    (r'</think>[\s\S]*?</think>', '', re.IGNORECASE),
-                    (r'思考过程[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'分析[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'让我先分析[\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'分析如下[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                ]
-                
-                for pattern, replacement, *flags in thinking_patterns:
-                    flags = flags[0] if flags else 0
-                    old_text = cleaned_content
-                    cleaned_content = re.sub(pattern, replacement, cleaned_content, flags=flags)
+                cleaned_content = strip_reasoning(content, fences=False, preamble=True)
                 
                 print(f"[Gemini API调用] [OK] 成功获取响应")
                 print(f"[Gemini API调用] 响应长度: {len(cleaned_content)} 字符")
@@ -2622,23 +2217,7 @@ def call_gemini_vision_api(image_base64, prompt, timeout=300):
                 content = result['candidates'][0]['content']['parts'][0]['text']
                 
                 # 清理thinking标签和思考过程
-                import re
-                cleaned_content = content.strip()
-                
-                thinking_patterns = [
-                    (r'<thought>[\s\S]*?</thought>', '', re.IGNORECASE),
-                    (r'<thinking>[\s\S]*?</thinking>', '', re.IGNORECASE),
-                    (r'</think>[\s\S]*?</think>', '', re.IGNORECASE),
-                    (r'思考过程[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'分析[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'让我先分析[\s\S]*?(?=\n)', '', re.IGNORECASE),
-                    (r'分析如下[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                ]
-                
-                for pattern, replacement, *flags in thinking_patterns:
-                    flags = flags[0] if flags else 0
-                    old_text = cleaned_content
-                    cleaned_content = re.sub(pattern, replacement, cleaned_content, flags=flags)
+                cleaned_content = strip_reasoning(content, fences=False, preamble=True)
                 
                 print(f"[Gemini Vision API调用] [OK] 成功获取响应")
                 return cleaned_content
@@ -2745,8 +2324,8 @@ class MedicationRecognitionService:
             if not api_key:
                 raise Exception("Gemini API密钥未配置")
 
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
+            # 与 OpenAI 兼容接口相同的缩放与 JPEG 编码（原图可能是 PNG/WEBP，声明的类型为 image/jpeg）
+            image_data = encode_image_to_base64(image_path)
 
             request_data = {
                 "contents": [{
@@ -2801,7 +2380,7 @@ class MedicationRecognitionService:
     def _call_openai_for_medication(self, image_path):
         """使用 OpenAI 兼容 API 识别药单"""
         try:
-            image_base64 = self._encode_image_to_base64(image_path)
+            image_url = image_data_url(image_path)
 
             request_data = {
                 "model": self.vl_model_name,
@@ -2816,7 +2395,7 @@ class MedicationRecognitionService:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": image_base64,
+                                    "url": image_url,
                                     "detail": "high"
                                 }
                             }
@@ -2874,60 +2453,15 @@ class MedicationRecognitionService:
             print(f"[药单识别] OpenAI调用失败: {str(e)}")
             raise
 
-    def _encode_image_to_base64(self, image_path):
-        """将图片编码为base64"""
-        from PIL import Image
-        import io
-
-        with Image.open(image_path) as img:
-            max_size = 1024
-            if img.width > max_size or img.height > max_size:
-                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=85)
-            buffer.seek(0)
-
-            image_data = buffer.read()
-            base64_data = base64.b64encode(image_data).decode('utf-8')
-
-        return f"data:image/jpeg;base64,{base64_data}"
-
     def _clean_thinking_tags(self, content):
         """清理思考标签"""
-        cleaned_content = content.strip()
-        
-        thinking_patterns = [
-            (r'<thought>[\s\S]*?</thought>', '', re.IGNORECASE),
-            (r'<thinking>[\s\S]*?</thinking>', '', re.IGNORECASE),
-            (r'```json\s*', ''),
-            (r'```\s*', ''),
-        ]
-        
-        for pattern, replacement, *flags in thinking_patterns:
-            flags = flags[0] if flags else 0
-            cleaned_content = re.sub(pattern, replacement, cleaned_content, flags=flags)
-        
-        return cleaned_content.strip()
+        return strip_reasoning(content)
 
     def _parse_medication_response(self, content):
         """解析药单识别响应"""
-        try:
-            result = json.loads(content)
-            if 'medications' in result:
-                return result
-            else:
-                raise Exception("响应格式不正确：缺少 medications 字段")
-        except json.JSONDecodeError:
-            json_match = re.search(r'\{[\s\S]*\}', content)
-            if json_match:
-                try:
-                    result = json.loads(json_match.group())
-                    if 'medications' in result:
-                        return result
-                except:
-                    pass
+        result = extract_json(content, required_key='medications')
+        if result is None:
             raise Exception("无法解析API响应为JSON格式")
+        if 'medications' not in result:
+            raise Exception("响应格式不正确：缺少 medications 字段")
+        return result
@@ -0,0 +1,193 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .answer_cache import AnswerCache, normalize_question
+from .clustering import merge_intervals
+from .data_integration import LOCAL_FORMAT_REASON, plan_integration
+from .json_extraction import JSONScanner, extract_json, strip_reasoning
+from .reference_ranges import reference_status
+from .report_chunking import merge_chunk_indicators
+
+
+def _indicator(indicator_id, name, unit='mmol/L', indicator_type='biochemistry'):
+    return SimpleNamespace(
+        id=indicator_id,
+        indicator_name=name,
+        value='1.0',
+        unit=unit,
+        reference_range='',
+        status='normal',
+        indicator_type=indicator_type,
+    )
+
+
+class PlanIntegrationTests(SimpleTestCase):
+    def _plan(self, indicators, mappings):
+        with mock.patch('medical_records.data_integration.load_name_mappings', return_value=mappings):
+            return plan_integration(None, indicators)
+
+    def test_distinct_confirmed_names_are_sent_to_llm(self):
+        mappings = {
+            '高密度脂蛋白胆固醇': '高密度脂蛋白胆固醇',
+            '低密度脂蛋白胆固醇': '低密度脂蛋白胆固醇',
+        }
+        indicators = [
+            _indicator(1, '低密度脂蛋白胆固醇'),
+            _indicator(2, '低密度脂蛋白胆固醇'),
+            _indicator(3, '高密度脂蛋白胆固醇'),
+        ]
+        plan = self._plan(indicators, mappings)
+
+        self.assertEqual(plan.local_changes, [])
+        self.assertEqual(plan.ambiguous_count, 1)
+        self.assertEqual(plan.llm_indicator_count, 3)
+
+    def test_spellings_of_one_name_are_unified_locally(self):
+        indicators = [
+            _indicator(1, '空腹血糖'),
+            _indicator(2, '空腹血糖'),
+            _indicator(3, '空腹 血糖'),
+        ]
+        plan = self._plan(indicators, {})
+
+        self.assertEqual(plan.ambiguous_count, 0)
+        self.assertEqual(plan.local_changes, [
+            {'indicator_id': 3, 'indicator_name': '空腹血糖', 'reason': LOCAL_FORMAT_REASON},
+        ])
+
+
+class AnswerCacheMatchingTests(SimpleTestCase):
+    ANTONYM_PAIRS = [
+        ('高血压患者每天可以吃多少阿司匹林比较合适', '低血压患者每天可以吃多少阿司匹林比较合适'),
+        ('血糖偏高应该注意什么', '血糖偏低应该注意什么'),
+        ('孕妇感冒可以吃布洛芬吗', '儿童感冒可以吃布洛芬吗'),
+        ('糖尿病患者能吃西瓜吗', '糖尿病患者不能吃西瓜吗'),
+    ]
+
+    def _lookup(self, question, cached_questions):
+        """模拟缓存表：按 filter 的 normalized_question 精确匹配"""
+        cached = {normalize_question(q): f'answer:{q}' for q in cached_questions}
+
+        def filter_entries(**kwargs):
+            answer = cached.get(kwargs.get('normalized_question'))
+            queryset = mock.MagicMock()
+            queryset.order_by.return_value.values_list.return_value.first.return_value = (
+                (1, answer) if answer else None
+            )
+            return queryset
+
+        with mock.patch('medical_records.answer_cache.AnswerCacheEntry') as entry_model:
+            entry_model.objects.filter.side_effect = filter_entries
+            return AnswerCache('scope', 'model', question, ttl_hours=1).lookup()
+
+    def test_antonym_questions_do_not_share_answers(self):
+        for cached_question, question in self.ANTONYM_PAIRS:
+            with self.subTest(question=question):
+                self.assertNotEqual(normalize_question(cached_question), normalize_question(question))
+                self.assertIsNone(self._lookup(question, [cached_question]))
+
+    def test_same_question_with_different_wording_hits(self):
+        result = self._lookup('医生你好，请问高血压患者每天可以吃多少阿司匹林比较合适？', [self.ANTONYM_PAIRS[0][0]])
+        self.assertEqual(result, (f'answer:{self.ANTONYM_PAIRS[0][0]}', 1.0))
+
+
+class ReferenceStatusTests(SimpleTestCase):
+    def test_report_range(self):
+        self.assertEqual(reference_status('谷丙转氨酶', '35', 'U/L', '0-40'), 'normal')
+        self.assertEqual(reference_status('谷丙转氨酶', '52', 'U/L', '0-40'), 'abnormal')
+
+    def test_lab_arrow_is_abnormal_even_when_range_says_normal(self):
+        self.assertEqual(reference_status('谷丙转氨酶', '35↑', 'U/L', '0-40'), 'abnormal')
+        self.assertEqual(reference_status('血红蛋白', '140↓', 'g/L', '130-175'), 'abnormal')
+
+    def test_lab_arrow_is_abnormal_with_knowledge_base_range(self):
+        self.assertEqual(reference_status('谷丙转氨酶', '45↑', 'U/L', '', gender='male'), 'abnormal')
+
+    def test_range_with_explicit_plus_sign(self):
+        self.assertEqual(reference_status('碱剩余', '2.5', 'mmol/L', '-3~+3'), 'normal')
+        self.assertEqual(reference_status('碱剩余', '-4.1', 'mmol/L', '-3~+3'), 'abnormal')
+
+
+class MergeChunkIndicatorsTests(SimpleTestCase):
+    def test_rows_within_one_chunk_are_kept(self):
+        chunk = [
+            {'indicator': '红细胞', 'value': '阴性', 'indicator_type': 'urine'},
+            {'indicator': '红细胞', 'value': '阴性', 'indicator_type': 'stool'},
+            {'indicator': '白细胞', 'value': '阴性'},
+            {'indicator': '白细胞', 'value': ''},
+        ]
+        self.assertEqual(merge_chunk_indicators([chunk]), chunk)
+
+    def test_duplicate_across_boundary_fills_missing_fields(self):
+        merged = merge_chunk_indicators([
+            [{'indicator': '空腹血糖', 'value': '5.1', 'reference_range': ''}],
+            [{'indicator': '空腹 血糖', 'value': '5.1', 'reference_range': '3.9-6.1'}],
+        ])
+        self.assertEqual(merged, [{'indicator': '空腹血糖', 'value': '5.1', 'reference_range': '3.9-6.1'}])
+
+    def test_empty_value_does_not_match_measured_value(self):
+        merged = merge_chunk_indicators([
+            [{'indicator': '白细胞', 'value': '阴性'}],
+            [{'indicator': '白细胞', 'value': ''}],
+        ])
+        self.assertEqual(len(merged), 2)
+
+    def test_only_adjacent_chunks_are_deduplicated(self):
+        row = {'indicator': '尿糖', 'value': '阴性'}
+        merged = merge_chunk_indicators([[row], [{'indicator': '总胆固醇', 'value': '4.2'}], [row]])
+        self.assertEqual(len(merged), 3)
+
+
+class MergeIntervalsTests(SimpleTestCase):
+    START = date(2024, 1, 1)
+
+    def _days(self, clusters):
+        return [[(day - self.START).days for day in members] for _, _, members in clusters]
+
+    def test_start_anchor_does_not_chain(self):
+        days = [self.START + timedelta(days=n) for n in (0, 3, 6, 9)]
+        clusters = merge_intervals(days, start_key=lambda d: d, gap_days=3, anchor='start')
+        self.assertEqual(self._days(clusters), [[0, 3], [6, 9]])
+
+    def test_end_anchor_chains_adjacent_records(self):
+        days = [self.START + timedelta(days=n) for n in (9, 0, 6, 3)]
+        clusters = merge_intervals(days, start_key=lambda d: d, gap_days=3)
+        self.assertEqual(self._days(clusters), [[0, 3, 6, 9]])
+        self.assertEqual(clusters[0][:2], (self.START, self.START + timedelta(days=9)))
+
+
+class JSONExtractionTests(SimpleTestCase):
+    def _scan(self, text, chunk_size):
+        scanner = JSONScanner()
+        for i in range(0, len(text), chunk_size):
+            scanner.feed(text[i:i + chunk_size])
+        return scanner.close()
+
+    def test_tags_inside_json_strings_are_kept(self):
+        text = '{"indicators":[{"name":"a","note":"see <think> x"}]}'
+        self.assertEqual(extract_json(text), {'indicators': [{'name': 'a', 'note': 'see <think> x'}]})
+        self.assertEqual(extract_json('{"note":"a </think> b ```c```"}'), {'note': 'a </think> b ```c```'})
+
+    def test_leading_reasoning_and_fences_are_stripped(self):
+        text = '<think>先看 {"x": 1}</think>\n```json\n{"indicators": [], "note": "\\"<think>\\""}\n```'
+        self.assertEqual(extract_json(text, required_key='indicators'), {'indicators': [], 'note': '"<think>"'})
+
+    def test_orphan_closing_tag_discards_reasoning(self):
+        self.assertEqual(extract_json('分析 {"a": 0} 完毕</think>{"a": 1}'), {'a': 1})
+
+    def test_unclosed_reasoning_is_kept(self):
+        self.assertEqual(extract_json('<think>{"a": 1, "b": "x'), {'a': 1, 'b': 'x'})
+        self.assertEqual(strip_reasoning('<think>建议多喝水', fences=False), '建议多喝水')
+
+    def test_tag_after_answer_text_is_literal(self):
+        self.assertEqual(strip_reasoning('回答 <think> 正文', fences=False), '回答 <think> 正文')
+
+    def test_streamed_chunks_match_whole_input(self):
+        text = '<think>推理</think>说明 {"items": [{"v": "a\\\\"}, {"v": "```<thought>"}], "n": 2}'
+        expected = [{'items': [{'v': 'a\\'}, {'v': '```<thought>'}], 'n': 2}]
+        for chunk_size in (1, 3, 7, len(text)):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self._scan(text, chunk_size), expected)
@@ -40,6 +40,7 @@ urlpatterns = [
     path('api/conversations/<int:conversation_id>/resources/', api_views.api_conversation_resources, name='api_conversation_resources'),
     path('api/conversations/<int:conversation_id>/', api_views.get_conversation_messages, name='api_conversation_messages'),
     path('api/conversations/<int:conversation_id>/delete/', api_views.delete_conversation, name='api_delete_conversation'),
+    path('api/conversations/<int:conversation_id>/tool-stats/', api_views.get_conversation_tool_stats, name='api_conversation_tool_stats'),
     path('api/user-advices/', api_views.get_user_advices, name='api_user_advices'),
     path('api/hospitals/common/', api_views.get_common_hospitals, name='api_common_hospitals'),
     path('api/check-services/', api_views.check_services_status, name='api_check_services'),
@@ -85,7 +86,10 @@ urlpatterns = [
     path('api/medications/<int:medication_id>/', api_views.api_medication_detail, name='api_medication_detail'),
     path('api/medications/checkin/', api_views.api_medication_checkin, name='api_medication_checkin'),
     path('api/medications/<int:medication_id>/records/', api_views.api_medication_records, name='api_medication_records'),
+    path('api/medications/adherence/', api_views.api_medication_adherence, name='api_medication_adherence'),
     path('api/medications/recognize-image/', api_views.api_medication_recognize_image, name='api_medication_recognize_image'),
+    path('api/medications/recognize-jobs/', api_views.api_medication_recognize_jobs, name='api_medication_recognize_jobs'),
+    path('api/medications/recognize-jobs/<str:job_id>/', api_views.api_medication_recognize_job_status, name='api_medication_recognize_job_status'),
     path('api/medication-groups/', api_views.api_medication_groups, name='api_medication_groups'),
     path('api/medication-groups/<int:group_id>/', api_views.api_medication_group_detail, name='api_medication_group_detail'),
     path('api/medication-groups/create/', api_views.api_medication_group_create, name='api_medication_group_create'),
@@ -123,7 +127,14 @@ urlpatterns = [
     path('api/symptom-logs/<int:log_id>/', api_views.api_symptom_log_detail, name='api_symptom_log_detail'),
     path('api/vital-logs/', api_views.api_vital_logs, name='api_vital_logs'),
     path('api/vital-logs/<int:log_id>/', api_views.api_vital_log_detail, name='api_vital_log_detail'),
+    path('api/vital-logs/series/', api_views.api_vital_series, name='api_vital_series'),
     path('api/vital-types/', api_views.api_vital_types, name='api_vital_types'),
+    path('api/health-logs/batch/', api_views.api_health_logs_batch, name='api_health_logs_batch'),
+
+    # 导出任务API
+    path('api/exports/', api_views.api_export_jobs, name='api_export_jobs'),
+    path('api/exports/<str:job_id>/', api_views.api_export_job_status, name='api_export_job_status'),
+    path('api/exports/<str:job_id>/download/', api_views.api_export_job_download, name='api_export_job_download'),
 
     # TODO: Advanced features - to be implemented later
     # # 批量操作
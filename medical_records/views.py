@@ -47,6 +47,8 @@ from .forms import (
     CaregiverAccessForm,
 )
 from .llm_prompts import AI_DOCTOR_SYSTEM_PROMPT
+from .adherence import with_taken_days, with_group_medications
+from .reference_ranges import STATUS_SOURCE_FIELDS, apply_reference_status, profile_context
 
 
 def register(request):
@@ -157,14 +159,23 @@ def dashboard(request):
 
             for indicator in indicators_by_checkup.get(checkup.id, []):
                 # 提取数值用于排序和计算（保留原始value字符串用于显示）
-                numeric_value = extract_numeric_value(indicator.value)
+                # 优先使用换算到标准单位的数值，不同报告的单位不同也能放在同一条曲线上
+                if indicator.canonical_value is not None:
+                    numeric_value = indicator.canonical_value
+                    unit = indicator.canonical_unit or indicator.unit or ''
+                else:
+                    numeric_value = extract_numeric_value(indicator.value)
+                    unit = indicator.unit or ''
+                value_display = str(indicator.value)
+                if indicator.unit and unit != indicator.unit:
+                    value_display = f"{value_display} {indicator.unit}"
 
                 # 保留所有数据，无论是否能提取数值
                 all_data[indicator.indicator_name].append({
                     'date': checkup_date,
                     'value': numeric_value,  # 用于计算的数值
-                    'value_display': str(indicator.value),  # 用于显示的原始值
-                    'unit': indicator.unit or '',
+                    'value_display': value_display,  # 用于显示的原始值
+                    'unit': unit,
                     'status': indicator.status,
                     'indicator_name': indicator.indicator_name,
                     'indicator_type': indicator.indicator_type
@@ -240,21 +251,22 @@ def dashboard(request):
 
     # 用药提醒 - 获取当前需要服药的药单
     today = timezone.now().date()
-    medication_reminders = Medication.objects.filter(
+    medication_reminders = with_taken_days(Medication.objects.filter(
         user=user,
         is_active=True,
         start_date__lte=today,
         end_date__gte=today
-    ).order_by('start_date')
+    ).order_by('start_date'))
+
+    # 一次查询今天已服药的药单
+    taken_today_ids = set(MedicationRecord.objects.filter(
+        medication__in=medication_reminders,
+        record_date=today
+    ).values_list('medication_id', flat=True))
 
-    # 为每个药单检查今天是否已服药
     medication_reminders_with_status = []
     for med in medication_reminders:
-        # 检查今天是否已有服药记录
-        taken_today = MedicationRecord.objects.filter(
-            medication=med,
-            record_date=today
-        ).exists()
+        taken_today = med.id in taken_today_ids
 
         medication_reminders_with_status.append({
             'medication': med,
@@ -531,24 +543,8 @@ def dashboard(request):
 
 def attach_entry_to_daily_event(user, entry_date, entry_obj):
     """将症状/体征日志挂接到当天的自动事件，便于时间线展示"""
-    event, _ = HealthEvent.objects.get_or_create(
-        user=user,
-        start_date=entry_date,
-        end_date=entry_date,
-        event_type='wellness',
-        is_auto_generated=True,
-        defaults={
-            'name': f"{entry_date} 日志",
-            'description': '自动创建：症状/体征日志'
-        }
-    )
-
-    EventItem.objects.get_or_create(
-        event=event,
-        content_type=ContentType.objects.get_for_model(entry_obj),
-        object_id=entry_obj.id,
-        defaults={'added_by': 'auto'}
-    )
+    from .health_logs import attach_entries_to_daily_events
+    attach_entries_to_daily_events(user, [entry_obj])
 
 
 def _get_key_indicators_summary(user):
@@ -993,8 +989,8 @@ def ai_health_advice(request):
         })
 
     # 获取用户的药单和药单组
-    medications = Medication.objects.filter(user=request.user, is_active=True, group__isnull=True).order_by('-created_at')
-    medication_groups = MedicationGroup.objects.filter(user=request.user).order_by('-created_at')
+    medications = with_taken_days(Medication.objects.filter(user=request.user, is_active=True, group__isnull=True).order_by('-created_at'))
+    medication_groups = with_group_medications(MedicationGroup.objects.filter(user=request.user).order_by('-created_at'))
     
     # 获取用户的健康事件
     events = HealthEvent.objects.filter(user=request.user).order_by('-start_date')
@@ -1584,23 +1580,8 @@ def call_ai_doctor_api(question, health_data, user, conversation_context=None, m
             answer = result['choices'][0]['message']['content']
             
             # 清理thinking标签和思考过程
-            import re
-            cleaned_answer = answer.strip()
-            
-            thinking_patterns = [
-                (r'<thought>[\s\S]*?</thought>', '', re.IGNORECASE),
-                (r'<thinking>[\s\S]*?</thinking>', '', re.IGNORECASE),
-                (r'</think>[\s\S]*?</think>', '', re.IGNORECASE),
-                (r'思考过程[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                (r'分析[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-                (r'让我先分析[\s\S]*?(?=\n)', '', re.IGNORECASE),
-                (r'分析如下[:：][\s\S]*?(?=\n)', '', re.IGNORECASE),
-            ]
-            
-            for pattern, replacement, *flags in thinking_patterns:
-                flags = flags[0] if flags else 0
-                old_text = cleaned_answer
-                cleaned_answer = re.sub(pattern, replacement, cleaned_answer, flags=flags)
+            from .json_extraction import strip_reasoning
+            cleaned_answer = strip_reasoning(answer, fences=False, preamble=True)
             
             print(f"AI医生API调用成功，回答长度: {len(cleaned_answer)} 字符")
             return cleaned_answer, None
@@ -2248,6 +2229,10 @@ def update_indicator(request, indicator_id):
         indicator.reference_range = data.get('reference_range', indicator.reference_range)
         indicator.status = data.get('status', indicator.status)
 
+        # 未指定状态时，名称/值/单位/参考范围变化后按参考范围重新判定
+        if 'status' not in data and any(field in data for field in STATUS_SOURCE_FIELDS):
+            apply_reference_status([indicator], *profile_context(request.user.id, indicator.checkup.checkup_date))
+
         # 保存更改
         indicator.save()
 
@@ -2278,7 +2263,7 @@ def update_indicator(request, indicator_id):
 def export_conversation_pdf(request, conversation_id):
     """导出对话为PDF"""
     try:
-        from .export_utils import ConversationExporter
+        from .export_jobs import export_download_response
 
         conversation = get_object_or_404(
             Conversation,
@@ -2286,8 +2271,7 @@ def export_conversation_pdf(request, conversation_id):
             user=request.user
         )
 
-        exporter = ConversationExporter(conversation_id)
-        return exporter.export_to_pdf()
+        return export_download_response(request.user, 'conversation', 'pdf', {'conversation_id': conversation_id})
 
     except Exception as e:
         messages.error(request, f'导出PDF失败: {str(e)}')
@@ -2298,7 +2282,7 @@ def export_conversation_pdf(request, conversation_id):
 def export_conversation_word(request, conversation_id):
     """导出对话为Word"""
     try:
-        from .export_utils import ConversationExporter
+        from .export_jobs import export_download_response
 
         conversation = get_object_or_404(
             Conversation,
@@ -2306,8 +2290,7 @@ def export_conversation_word(request, conversation_id):
             user=request.user
         )
 
-        exporter = ConversationExporter(conversation_id)
-        return exporter.export_to_word()
+        return export_download_response(request.user, 'conversation', 'word', {'conversation_id': conversation_id})
 
     except Exception as e:
         messages.error(request, f'导出Word失败: {str(e)}')
@@ -2318,7 +2301,7 @@ def export_conversation_word(request, conversation_id):
 def export_ai_summary_pdf(request, conversation_id):
     """导出AI总结为PDF"""
     try:
-        from .export_utils import AISummaryExporter
+        from .export_jobs import export_download_response
 
         conversation = get_object_or_404(
             Conversation,
@@ -2330,8 +2313,7 @@ def export_ai_summary_pdf(request, conversation_id):
             messages.error(request, '该对话暂无AI总结，请先生成AI总结')
             return redirect('medical_records:ai_health_advice')
 
-        exporter = AISummaryExporter(conversation_id)
-        return exporter.export_to_pdf()
+        return export_download_response(request.user, 'ai_summary', 'pdf', {'conversation_id': conversation_id})
 
     except Exception as e:
         messages.error(request, f'导出PDF失败: {str(e)}')
@@ -2342,7 +2324,7 @@ def export_ai_summary_pdf(request, conversation_id):
 def export_ai_summary_word(request, conversation_id):
     """导出AI总结为Word"""
     try:
-        from .export_utils import AISummaryExporter
+        from .export_jobs import export_download_response
 
         conversation = get_object_or_404(
             Conversation,
@@ -2354,8 +2336,7 @@ def export_ai_summary_word(request, conversation_id):
             messages.error(request, '该对话暂无AI总结，请先生成AI总结')
             return redirect('medical_records:ai_health_advice')
 
-        exporter = AISummaryExporter(conversation_id)
-        return exporter.export_to_word()
+        return export_download_response(request.user, 'ai_summary', 'word', {'conversation_id': conversation_id})
 
     except Exception as e:
         messages.error(request, f'导出Word失败: {str(e)}')
@@ -2366,7 +2347,7 @@ def export_ai_summary_word(request, conversation_id):
 def export_event_ai_summary_pdf(request, event_id):
     """导出事件AI分析为PDF"""
     try:
-        from .export_utils import EventAiSummaryExporter
+        from .export_jobs import export_download_response
         from .models import HealthEvent
 
         event = get_object_or_404(
@@ -2379,8 +2360,7 @@ def export_event_ai_summary_pdf(request, event_id):
             messages.error(request, '该事件暂无AI分析，请先生成AI分析')
             return redirect('medical_records:dashboard')
 
-        exporter = EventAiSummaryExporter(event_id)
-        return exporter.export_to_pdf()
+        return export_download_response(request.user, 'event_summary', 'pdf', {'event_id': event_id})
 
     except Exception as e:
         messages.error(request, f'导出PDF失败: {str(e)}')
@@ -2391,7 +2371,7 @@ def export_event_ai_summary_pdf(request, event_id):
 def export_event_ai_summary_word(request, event_id):
     """导出事件AI分析为Word"""
     try:
-        from .export_utils import EventAiSummaryExporter
+        from .export_jobs import export_download_response
         from .models import HealthEvent
 
         event = get_object_or_404(
@@ -2404,8 +2384,7 @@ def export_event_ai_summary_word(request, event_id):
             messages.error(request, '该事件暂无AI分析，请先生成AI分析')
             return redirect('medical_records:dashboard')
 
-        exporter = EventAiSummaryExporter(event_id)
-        return exporter.export_to_word()
+        return export_download_response(request.user, 'event_summary', 'word', {'event_id': event_id})
 
     except Exception as e:
         messages.error(request, f'导出Word失败: {str(e)}')
@@ -2417,10 +2396,9 @@ def export_event_ai_summary_word(request, event_id):
 def export_health_trends_pdf(request):
     """导出健康趋势为PDF"""
     try:
-        from .export_utils import HealthTrendsExporter
+        from .export_jobs import export_download_response
 
-        exporter = HealthTrendsExporter(request.user)
-        return exporter.export_to_pdf()
+        return export_download_response(request.user, 'health_trends', 'pdf')
 
     except Exception as e:
         messages.error(request, f'导出PDF失败: {str(e)}')
@@ -2431,10 +2409,9 @@ def export_health_trends_pdf(request):
 def export_health_trends_word(request):
     """导出健康趋势为Word"""
     try:
-        from .export_utils import HealthTrendsExporter
+        from .export_jobs import export_download_response
 
-        exporter = HealthTrendsExporter(request.user)
-        return exporter.export_to_word()
+        return export_download_response(request.user, 'health_trends', 'word')
 
     except Exception as e:
         messages.error(request, f'导出Word失败: {str(e)}')
@@ -2445,6 +2422,7 @@ def export_health_trends_word(request):
 def export_checkups_pdf(request):
     """批量导出体检报告为PDF"""
     from .export_utils import CheckupReportsExporter
+    from .export_jobs import export_download_response
 
     try:
         # 获取请求中的报告ID列表
@@ -2477,7 +2455,9 @@ def export_checkups_pdf(request):
             messages.error(request, '未找到指定的报告')
             return redirect('medical_records:data_integration')
 
-        # 导出
+        # 导出自己的报告时使用缓存的导出文件，管理员导出他人报告时直接生成
+        if not is_admin or not checkups.exclude(user=request.user).exists():
+            return export_download_response(request.user, 'checkups', 'pdf', {'checkup_ids': checkup_id_list})
         exporter = CheckupReportsExporter(checkups)
         return exporter.export_to_pdf()
 
@@ -2490,6 +2470,7 @@ def export_checkups_pdf(request):
 def export_checkups_word(request):
     """批量导出体检报告为Word"""
     from .export_utils import CheckupReportsExporter
+    from .export_jobs import export_download_response
 
     try:
         # 获取请求中的报告ID列表
@@ -2522,7 +2503,9 @@ def export_checkups_word(request):
             messages.error(request, '未找到指定的报告')
             return redirect('medical_records:data_integration')
 
-        # 导出
+        # 导出自己的报告时使用缓存的导出文件，管理员导出他人报告时直接生成
+        if not is_admin or not checkups.exclude(user=request.user).exists():
+            return export_download_response(request.user, 'checkups', 'word', {'checkup_ids': checkup_id_list})
         exporter = CheckupReportsExporter(checkups)
         return exporter.export_to_word()
 
@@ -2631,8 +2614,8 @@ def health_management(request, default_tab='medications'):
     symptoms = SymptomEntry.objects.filter(user=request.user).order_by('-entry_date', '-created_at')[:20]
     vitals = VitalEntry.objects.filter(user=request.user).order_by('-entry_date', '-created_at')[:20]
     plans = CarePlan.objects.filter(user=request.user).prefetch_related('goals__actions')
-    medications = Medication.objects.filter(user=request.user, group__isnull=True).order_by('-created_at')
-    medication_groups = MedicationGroup.objects.filter(user=request.user).prefetch_related('medications').order_by('-created_at')
+    medications = with_taken_days(Medication.objects.filter(user=request.user, group__isnull=True).order_by('-created_at'))
+    medication_groups = with_group_medications(MedicationGroup.objects.filter(user=request.user).order_by('-created_at'))
 
     context = {
         'active_tab': active_tab,
@@ -2755,7 +2738,7 @@ def shared_medications(request, owner_id):
         messages.error(request, '您没有查看药单的权限')
         return redirect('medical_records:shared_access')
 
-    medications = Medication.objects.filter(user_id=owner_id, is_active=True).order_by('-start_date')
+    medications = with_taken_days(Medication.objects.filter(user_id=owner_id, is_active=True).order_by('-start_date'))
     context = {
         'medications': medications,
         'shared_user': access.owner,
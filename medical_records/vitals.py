@@ -0,0 +1,116 @@
+"""
+体征数据序列查询
+基于 (user, vital_type, entry_date) 索引按天聚合，再在服务端降采样为固定点数的 min/max/mean 序列
+"""
+
+import math
+from datetime import date, timedelta
+
+from django.db.models import Avg, Count, Max, Min
+
+from .models import VitalEntry
+
+# 默认最多返回的点数
+DEFAULT_MAX_POINTS = 300
+MAX_POINTS_LIMIT = 2000
+
+
+def _merge_stats(rows, prefix):
+    """合并若干按天聚合的行，返回 (min, max, mean)；mean 按每天的记录数加权"""
+    mins = [row[f'{prefix}_min'] for row in rows if row[f'{prefix}_min'] is not None]
+    maxs = [row[f'{prefix}_max'] for row in rows if row[f'{prefix}_max'] is not None]
+    weighted = [(row[f'{prefix}_avg'], row[f'{prefix}_count']) for row in rows
+                if row[f'{prefix}_avg'] is not None and row[f'{prefix}_count']]
+    if not mins:
+        return None
+    total = sum(count for _, count in weighted)
+    mean = sum(avg * count for avg, count in weighted) / total if total else None
+    return {
+        'min': min(mins),
+        'max': max(maxs),
+        'mean': round(mean, 2) if mean is not None else None,
+    }
+
+
+def get_vital_series(user, vital_type, start_date=None, end_date=None, max_points=DEFAULT_MAX_POINTS):
+    """
+    获取降采样后的体征序列
+
+    数据库侧先按天聚合（一年最多 366 行），再按 bucket_days 合并为不超过 max_points 个点，
+    无论原始记录有多少条，返回的数据量只与时间跨度和 max_points 有关。
+
+    Args:
+        user: 用户对象
+        vital_type: 体征类型
+        start_date: 开始日期（默认一年前）
+        end_date: 结束日期（默认今天）
+        max_points: 最多返回的点数
+
+    Returns:
+        {'vital_type', 'start_date', 'end_date', 'bucket_days', 'unit', 'points': [...]}
+    """
+    end_date = end_date or date.today()
+    start_date = start_date or (end_date - timedelta(days=365))
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+    max_points = max(1, min(int(max_points or DEFAULT_MAX_POINTS), MAX_POINTS_LIMIT))
+
+    queryset = VitalEntry.objects.filter(
+        user=user,
+        vital_type=vital_type,
+        entry_date__range=(start_date, end_date),
+    )
+
+    daily_rows = list(
+        queryset.filter(numeric_value__isnull=False)
+        .values('entry_date')
+        .annotate(
+            primary_min=Min('numeric_value'),
+            primary_max=Max('numeric_value'),
+            primary_avg=Avg('numeric_value'),
+            primary_count=Count('numeric_value'),
+            secondary_min=Min('numeric_value_secondary'),
+            secondary_max=Max('numeric_value_secondary'),
+            secondary_avg=Avg('numeric_value_secondary'),
+            secondary_count=Count('numeric_value_secondary'),
+        )
+        .order_by('entry_date')
+    )
+
+    unit = (
+        queryset.exclude(unit__isnull=True).exclude(unit='')
+        .order_by('-entry_date').values_list('unit', flat=True).first()
+    )
+
+    span_days = (end_date - start_date).days + 1
+    bucket_days = max(1, math.ceil(span_days / max_points))
+
+    buckets = {}
+    for row in daily_rows:
+        bucket_index = (row['entry_date'] - start_date).days // bucket_days
+        buckets.setdefault(bucket_index, []).append(row)
+
+    points = []
+    for bucket_index in sorted(buckets):
+        rows = buckets[bucket_index]
+        bucket_start = start_date + timedelta(days=bucket_index * bucket_days)
+        bucket_end = min(bucket_start + timedelta(days=bucket_days - 1), end_date)
+        point = {
+            'start_date': bucket_start.strftime('%Y-%m-%d'),
+            'end_date': bucket_end.strftime('%Y-%m-%d'),
+            'count': sum(row['primary_count'] for row in rows),
+            **_merge_stats(rows, 'primary'),
+        }
+        secondary = _merge_stats(rows, 'secondary')
+        if secondary:
+            point['secondary'] = secondary
+        points.append(point)
+
+    return {
+        'vital_type': vital_type,
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': end_date.strftime('%Y-%m-%d'),
+        'bucket_days': bucket_days,
+        'unit': unit or '',
+        'points': points,
+    }
@@ -4,7 +4,7 @@ const util = require('../../utils/util.js')
 Page({
   data: {
     checkups: [],
-    page: 1,
+    nextCursor: null, // 下一页游标
     hasMore: true,
     isSelectMode: false, // 是否处于选择模式
     selectedIds: [], // 已选择的报告ID
@@ -18,43 +18,23 @@ Page({
     util.showLoading()
 
     try {
-      const res = await api.getCheckups({ page: this.data.page, page_size: 20 })
+      const params = { page_size: 20 }
+      if (this.data.nextCursor) params.cursor = this.data.nextCursor
+      const res = await api.getCheckups(params)
       const checkups = res.data || []
 
-      // 为每个报告计算异常指标数量
-      const processedCheckups = await Promise.all(checkups.map(async (checkup) => {
-        try {
-          // 获取该报告的指标列表
-          const indicatorsRes = await api.getIndicators({ checkup_id: checkup.id, page_size: 500 })
-          const indicators = indicatorsRes.data || indicatorsRes.results || []
-
-          // 计算异常数量
-          const abnormalCount = indicators.filter(indicator => {
-            const status = indicator.status
-            return status === 'abnormal' || status === 'abnormal_high' || status === 'abnormal_low'
-          }).length
-
-          return {
-            ...checkup,
-            abnormal_count: abnormalCount,
-            indicators_count: indicators.length,
-            selected: false // 添加选中状态
-          }
-        } catch (err) {
-          console.error('获取报告指标失败:', err)
-          return {
-            ...checkup,
-            abnormal_count: 0,
-            indicators_count: checkup.indicator_count || checkup.indicators_count || 0,
-            selected: false
-          }
-        }
+      // 指标总数与异常数量由列表接口直接返回
+      const processedCheckups = checkups.map(checkup => ({
+        ...checkup,
+        abnormal_count: checkup.abnormal_count || 0,
+        indicators_count: checkup.indicators_count || 0,
+        selected: false // 添加选中状态
       }))
 
       this.setData({
         checkups: [...this.data.checkups, ...processedCheckups],
         hasMore: res.has_more !== undefined ? res.has_more : checkups.length >= 20,
-        page: this.data.page + 1
+        nextCursor: res.next_cursor || null
       })
     } catch (err) {
       console.error('加载失败:', err)
@@ -195,7 +175,7 @@ Page({
       // 重新加载列表以确保数据正确
       this.setData({
         checkups: [],
-        page: 1,
+        nextCursor: null,
         hasMore: true
       })
       await this.loadCheckups()